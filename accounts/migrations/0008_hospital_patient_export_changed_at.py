@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:14
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Greatest
+
+
+def backfill_export_changed_at(apps, schema_editor):
+    """Start every relationship at the later of its own and its patient's last change"""
+    HospitalPatient = apps.get_model('accounts', 'HospitalPatient')
+    EnhancedPatient = apps.get_model('accounts', 'EnhancedPatient')
+    patient_updated_at = EnhancedPatient.objects.filter(pk=OuterRef('patient_id')).values('updated_at')
+    HospitalPatient.objects.update(export_changed_at=Greatest('updated_at', Subquery(patient_updated_at)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_export_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='enhancedpatient',
+            name='patient_updated_idx',
+        ),
+        migrations.AddField(
+            model_name='hospitalpatient',
+            name='export_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Last save of this relationship or its patient; the partner patient export is keyed on it'),
+        ),
+        migrations.RunPython(backfill_export_changed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='hospitalpatient',
+            index=models.Index(fields=['hospital', 'export_changed_at', 'patient'], name='hospital_patient_export_idx'),
+        ),
+    ]
@@ -224,6 +224,10 @@ class HospitalPatient(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    export_changed_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Last save of this relationship or its patient; the partner patient export is keyed on it"
+    )
     
     class Meta:
         db_table = 'hospital_patients'
@@ -237,11 +241,21 @@ class HospitalPatient(models.Model):
             models.Index(fields=['first_visit_date']),
             models.Index(fields=['last_visit_date']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['hospital', 'export_changed_at', 'patient'], name='hospital_patient_export_idx'),
         ]
     
     def __str__(self):
         return f"{self.patient.user.full_name} at {self.hospital.name}"
     
+    def save(self, *args, **kwargs):
+        # Moves with updated_at, which auto_now bumps whenever it is saved
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'updated_at' in update_fields:
+            self.export_changed_at = timezone.now()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'export_changed_at'}
+        super().save(*args, **kwargs)
+    
     @property
     def is_active(self):
         """Check if this patient relationship is currently active"""
@@ -486,6 +500,10 @@ class EnhancedPatient(models.Model):
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'updated_at' in update_fields:
+            # The partner export orders patients by their hospital relationships
+            self.hospital_relationships.update(export_changed_at=self.updated_at)
     
     # Emergency Contact Management Methods
     def get_all_emergency_contacts(self):
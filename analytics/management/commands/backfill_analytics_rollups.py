@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from analytics.rollups import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild analytics rollup buckets for past days (run once after deploying the rollup tables)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Number of past days to rebuild, ending today (default: 365)',
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=31,
+            help='Days rebuilt per transaction (default: 31)',
+        )
+
+    def handle(self, *args, **options):
+        days = max(1, options['days'])
+        chunk_days = max(1, options['chunk_days'])
+        end = timezone.now().date()
+        start = end - timedelta(days=days - 1)
+
+        self.stdout.write(f"Backfilling analytics rollups from {start} to {end}")
+
+        totals = {}
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+            result = reconcile_rollups(chunk_start, chunk_end)
+            for key, count in result.items():
+                totals[key] = totals.get(key, 0) + count
+            self.stdout.write(f"  {chunk_start} to {chunk_end}: {result}")
+            chunk_start = chunk_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfill complete: {totals}"))
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_alter_hospital_hospital_type'),
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='appointmentanalytics',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='revenueanalytics',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='appointmentanalytics',
+            name='hospital',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='appointment_analytics', to='accounts.hospital'),
+        ),
+        migrations.AddField(
+            model_name='appointmentanalytics',
+            name='provider',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='appointment_analytics', to='accounts.enhancedstaffprofile'),
+        ),
+        migrations.AddField(
+            model_name='appointmentanalytics',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='revenueanalytics',
+            name='hospital',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='revenue_analytics', to='accounts.hospital'),
+        ),
+        migrations.AddField(
+            model_name='revenueanalytics',
+            name='paid_invoices',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='revenueanalytics',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='appointmentanalytics',
+            unique_together={('date', 'hospital', 'department', 'provider')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='revenueanalytics',
+            unique_together={('date', 'hospital', 'department')},
+        ),
+        migrations.AddIndex(
+            model_name='appointmentanalytics',
+            index=models.Index(fields=['date'], name='analytics_a_date_a9f1d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentanalytics',
+            index=models.Index(fields=['hospital', 'date'], name='analytics_a_hospita_152dcf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentanalytics',
+            index=models.Index(fields=['provider', 'date'], name='analytics_a_provide_09737b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='revenueanalytics',
+            index=models.Index(fields=['date'], name='analytics_r_date_687314_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='revenueanalytics',
+            index=models.Index(fields=['hospital', 'date'], name='analytics_r_hospita_1ee20d_idx'),
+        ),
+    ]
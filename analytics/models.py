@@ -65,7 +65,15 @@ class AppointmentAnalytics(models.Model):
     ]
     
     date = models.DateField()
+    hospital = models.ForeignKey(
+        'accounts.Hospital', on_delete=models.CASCADE, null=True, blank=True,
+        related_name='appointment_analytics'
+    )
     department = models.CharField(max_length=50, choices=DEPARTMENT_CHOICES)
+    provider = models.ForeignKey(
+        'accounts.EnhancedStaffProfile', on_delete=models.CASCADE, null=True, blank=True,
+        related_name='appointment_analytics'
+    )
     total_appointments = models.IntegerField(default=0)
     completed_appointments = models.IntegerField(default=0)
     no_show_appointments = models.IntegerField(default=0)
@@ -73,10 +81,16 @@ class AppointmentAnalytics(models.Model):
     average_duration = models.DurationField(null=True, blank=True)
     peak_hour = models.TimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ['date', 'department']
+        unique_together = ['date', 'hospital', 'department', 'provider']
         ordering = ['-date', 'department']
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['hospital', 'date']),
+            models.Index(fields=['provider', 'date']),
+        ]
         verbose_name = 'Appointment Analytics'
         verbose_name_plural = 'Appointment Analytics'
 
@@ -87,7 +101,12 @@ class AppointmentAnalytics(models.Model):
 class RevenueAnalytics(models.Model):
     """Track revenue and financial metrics"""
     date = models.DateField()
+    hospital = models.ForeignKey(
+        'accounts.Hospital', on_delete=models.CASCADE, null=True, blank=True,
+        related_name='revenue_analytics'
+    )
     department = models.CharField(max_length=50, choices=AppointmentAnalytics.DEPARTMENT_CHOICES)
+    paid_invoices = models.IntegerField(default=0)
     total_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     consultation_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     procedure_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -97,10 +116,15 @@ class RevenueAnalytics(models.Model):
     payment_method_card = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     payment_method_insurance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ['date', 'department']
+        unique_together = ['date', 'hospital', 'department']
         ordering = ['-date', 'department']
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['hospital', 'date']),
+        ]
         verbose_name = 'Revenue Analytics'
         verbose_name_plural = 'Revenue Analytics'
 
@@ -0,0 +1,243 @@
+"""
+Incremental daily rollups for the analytics models.
+
+Appointment and invoice saves mark the daily buckets they touch as dirty and
+those buckets are recomputed from the source rows once the transaction
+commits (see analytics.signals). Recomputing a whole bucket instead of
+applying +1/-1 deltas keeps rollups exact across status changes, moves and
+deletes. The reconcile task rebuilds every bucket in a date range in a few
+set-based queries, which both repairs drift (bulk updates bypass signals) and
+backfills history.
+
+Buckets:
+    AppointmentAnalytics  (date, hospital, department, provider)
+    RevenueAnalytics      (date, hospital, department)
+    SystemMetrics         (date) - registrations and appointment totals
+"""
+
+import logging
+from collections import Counter, defaultdict
+from datetime import time, timedelta
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+
+from appointments.models import Appointment
+from billing.models import Invoice
+from .models import AppointmentAnalytics, RevenueAnalytics, SystemMetrics
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+DEFAULT_DEPARTMENT = 'general'
+RECONCILE_BATCH_SIZE = 1000
+OUTSTANDING_INVOICE_STATUSES = ('pending', 'overdue')
+
+
+def department_key(value):
+    """Rollup department for a provider department (free text on the profile)."""
+    return (value or DEFAULT_DEPARTMENT).strip().lower()[:50] or DEFAULT_DEPARTMENT
+
+
+def _any_of(filters):
+    return reduce(or_, filters) if filters else None
+
+
+# Appointments
+
+def _appointment_rows(source):
+    """Grouped appointment metrics keyed by (date, hospital_id, department, provider_id)."""
+    rows = source.values(
+        'appointment_date', 'hospital_id', 'provider_id', 'provider__department'
+    ).annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+        no_show=Count('id', filter=Q(status='no_show')),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        average_minutes=Avg('duration'),
+    ).order_by()
+
+    hours = defaultdict(Counter)
+    for row in source.values('appointment_date', 'provider_id').annotate(
+        hour=ExtractHour('start_time'), count=Count('id')
+    ).order_by():
+        hours[(row['appointment_date'], row['provider_id'])][row['hour']] += row['count']
+
+    buckets = {}
+    for row in rows:
+        key = (
+            row['appointment_date'], row['hospital_id'],
+            department_key(row['provider__department']), row['provider_id'],
+        )
+        bucket = buckets.setdefault(key, Counter())
+        bucket.update({
+            'total_appointments': row['total'],
+            'completed_appointments': row['completed'],
+            'no_show_appointments': row['no_show'],
+            'cancelled_appointments': row['cancelled'],
+            'duration_minutes': (row['average_minutes'] or 0) * row['total'],
+        })
+
+    objects = []
+    for (day, hospital_id, department, provider_id), bucket in buckets.items():
+        peak = hours.get((day, provider_id))
+        total = bucket['total_appointments']
+        objects.append(AppointmentAnalytics(
+            date=day,
+            hospital_id=hospital_id,
+            department=department,
+            provider_id=provider_id,
+            total_appointments=total,
+            completed_appointments=bucket['completed_appointments'],
+            no_show_appointments=bucket['no_show_appointments'],
+            cancelled_appointments=bucket['cancelled_appointments'],
+            average_duration=timedelta(minutes=bucket['duration_minutes'] / total) if total else None,
+            peak_hour=time(peak.most_common(1)[0][0]) if peak else None,
+        ))
+    return objects
+
+
+def refresh_appointment_rollups(pairs):
+    """Recompute the AppointmentAnalytics buckets for (provider_id, date) pairs."""
+    pairs = {(provider_id, day) for provider_id, day in pairs if provider_id and day}
+    if not pairs:
+        return 0
+
+    source = Appointment.objects.filter(_any_of([
+        Q(provider_id=provider_id, appointment_date=day) for provider_id, day in pairs
+    ]))
+    stale = _any_of([Q(provider_id=provider_id, date=day) for provider_id, day in pairs])
+    return _replace(AppointmentAnalytics, stale, _appointment_rows(source))
+
+
+# Revenue
+
+def _revenue_rows(source):
+    """Grouped invoice metrics keyed by (date, hospital_id, department)."""
+    rows = source.values(
+        'invoice_date', 'appointment__hospital_id', 'appointment__provider__department'
+    ).annotate(
+        paid=Count('id', filter=Q(status='paid')),
+        revenue=Sum('total_amount', filter=Q(status='paid')),
+        outstanding=Sum('total_amount', filter=Q(status__in=OUTSTANDING_INVOICE_STATUSES)),
+    ).order_by()
+
+    buckets = {}
+    for row in rows:
+        key = (
+            row['invoice_date'], row['appointment__hospital_id'],
+            department_key(row['appointment__provider__department']),
+        )
+        bucket = buckets.setdefault(key, Counter())
+        bucket['paid_invoices'] += row['paid']
+        bucket['total_revenue'] += row['revenue'] or 0
+        bucket['outstanding_payments'] += row['outstanding'] or 0
+
+    return [
+        RevenueAnalytics(date=day, hospital_id=hospital_id, department=department, **bucket)
+        for (day, hospital_id, department), bucket in buckets.items()
+    ]
+
+
+def refresh_revenue_rollups(pairs):
+    """Recompute the RevenueAnalytics buckets for (hospital_id, date) pairs."""
+    pairs = {(hospital_id, day) for hospital_id, day in pairs if day}
+    if not pairs:
+        return 0
+
+    source = Invoice.objects.filter(_any_of([
+        Q(appointment__hospital_id=hospital_id, invoice_date=day) if hospital_id
+        else Q(appointment__hospital__isnull=True, invoice_date=day)
+        for hospital_id, day in pairs
+    ]))
+    stale = _any_of([
+        Q(hospital_id=hospital_id, date=day) if hospital_id else Q(hospital__isnull=True, date=day)
+        for hospital_id, day in pairs
+    ])
+    return _replace(RevenueAnalytics, stale, _revenue_rows(source))
+
+
+# System metrics
+
+def refresh_system_metrics(days):
+    """Recompute the SystemMetrics rows for a set of dates."""
+    days = sorted({day for day in days if day})
+    if not days:
+        return 0
+
+    registrations = dict(
+        User.objects.filter(date_joined__date__in=days).annotate(
+            day=TruncDate('date_joined')
+        ).values_list('day').annotate(count=Count('id')).order_by()
+    )
+    appointments = {
+        row['appointment_date']: row
+        for row in Appointment.objects.filter(appointment_date__in=days).values('appointment_date').annotate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(status='completed')),
+            cancelled=Count('id', filter=Q(status='cancelled')),
+        ).order_by()
+    }
+    revenue = dict(
+        Invoice.objects.filter(invoice_date__in=days, status='paid').values_list('invoice_date').annotate(
+            total=Sum('total_amount')
+        ).order_by()
+    )
+
+    objects = [
+        SystemMetrics(
+            date=day,
+            new_registrations=registrations.get(day, 0),
+            total_appointments=appointments.get(day, {}).get('total', 0),
+            completed_appointments=appointments.get(day, {}).get('completed', 0),
+            cancelled_appointments=appointments.get(day, {}).get('cancelled', 0),
+            total_revenue=revenue.get(day) or 0,
+        )
+        for day in days
+    ]
+    SystemMetrics.objects.bulk_create(
+        objects,
+        batch_size=RECONCILE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['date'],
+        update_fields=[
+            'new_registrations', 'total_appointments', 'completed_appointments',
+            'cancelled_appointments', 'total_revenue', 'updated_at',
+        ],
+    )
+    return len(objects)
+
+
+def _replace(model, stale, objects):
+    """Swap the rows matching ``stale`` for freshly computed ``objects``."""
+    with transaction.atomic():
+        model.objects.filter(stale).delete()
+        model.objects.bulk_create(objects, batch_size=RECONCILE_BATCH_SIZE)
+    return len(objects)
+
+
+def reconcile_rollups(start_date, end_date):
+    """
+    Rebuild every rollup bucket between two dates (inclusive).
+
+    Used by the periodic reconcile task and for backfilling history; each
+    model is rebuilt with one grouped query over the source table.
+    """
+    appointments = Appointment.objects.filter(appointment_date__range=(start_date, end_date))
+    invoices = Invoice.objects.filter(invoice_date__range=(start_date, end_date))
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+    return {
+        'appointment_buckets': _replace(
+            AppointmentAnalytics, Q(date__range=(start_date, end_date)), _appointment_rows(appointments)
+        ),
+        'revenue_buckets': _replace(
+            RevenueAnalytics, Q(date__range=(start_date, end_date)), _revenue_rows(invoices)
+        ),
+        'system_metrics': refresh_system_metrics(days),
+    }
@@ -0,0 +1,94 @@
+"""
+Keep the analytics rollups current as appointments, invoices and users change.
+
+Each save records the buckets it touched (before and after the change) and
+the buckets are recomputed once the surrounding transaction commits, so a
+request that saves the same appointment several times refreshes it once.
+"""
+
+import logging
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from appointments.models import Appointment
+from billing.models import Invoice
+from .rollups import refresh_appointment_rollups, refresh_revenue_rollups, refresh_system_metrics
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def _schedule_refresh(refresh, keys):
+    """Run ``refresh(keys)`` after commit; failures are left for the reconcile task."""
+    keys = {key for key in keys if all(part is not None for part in key[1:])}
+    if not keys:
+        return
+
+    def run():
+        try:
+            refresh(keys)
+        except Exception as e:
+            logger.error(f"Error refreshing analytics rollups via {refresh.__name__}: {str(e)}")
+
+    transaction.on_commit(run)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def refresh_appointment_analytics(sender, instance, **kwargs):
+    """Recompute the provider-day buckets this appointment belongs to, before and after the change."""
+    previous_provider_id = getattr(instance, '_previous_provider_id', None)
+    previous_date = getattr(instance, '_previous_date', None)
+
+    _schedule_refresh(refresh_appointment_rollups, [
+        (instance.provider_id, instance.appointment_date),
+        (previous_provider_id, previous_date),
+    ])
+    _schedule_refresh(lambda keys: refresh_system_metrics(day for (day,) in keys), [
+        (instance.appointment_date,),
+        (previous_date,),
+    ])
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_bucket(sender, instance, **kwargs):
+    """Remember the revenue bucket an invoice was in so a moved invoice refreshes both."""
+    instance._previous_revenue_bucket = None
+    if instance.pk:
+        previous = Invoice.objects.filter(pk=instance.pk).values(
+            'appointment__hospital_id', 'invoice_date'
+        ).first()
+        if previous:
+            instance._previous_revenue_bucket = (previous['appointment__hospital_id'], previous['invoice_date'])
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def refresh_revenue_analytics(sender, instance, **kwargs):
+    """Recompute the hospital-day revenue buckets this invoice belongs to."""
+    hospital_id = None
+    if instance.appointment_id:
+        hospital_id = Appointment.objects.filter(pk=instance.appointment_id).values_list(
+            'hospital_id', flat=True
+        ).first()
+
+    buckets = [(hospital_id, instance.invoice_date)]
+    previous = getattr(instance, '_previous_revenue_bucket', None)
+    if previous:
+        buckets.append(previous)
+
+    _schedule_refresh(refresh_revenue_rollups, buckets)
+    _schedule_refresh(lambda keys: refresh_system_metrics(day for (_, day) in keys), buckets)
+
+
+@receiver(post_save, sender=User)
+def refresh_registration_metrics(sender, instance, created, **kwargs):
+    """Count new registrations towards the day they joined."""
+    if created and instance.date_joined:
+        _schedule_refresh(
+            lambda keys: refresh_system_metrics(day for (day,) in keys),
+            [(instance.date_joined.date(),)]
+        )
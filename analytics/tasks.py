@@ -0,0 +1,35 @@
+"""
+Celery tasks for maintaining the analytics rollups.
+"""
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from .rollups import reconcile_rollups
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def reconcile_analytics_rollups(days=3, start_date=None, end_date=None):
+    """
+    Periodic task that rebuilds the rollup buckets for recent days.
+
+    Signals keep buckets current as rows change; this repairs anything they
+    missed (bulk updates, failed refreshes). Pass ISO ``start_date`` and
+    ``end_date`` to backfill a historical range. History older than ``days``
+    is filled once after deploy with ``manage.py backfill_analytics_rollups``.
+    """
+    try:
+        today = timezone.now().date()
+        end = timezone.datetime.fromisoformat(end_date).date() if end_date else today + timedelta(days=days)
+        start = timezone.datetime.fromisoformat(start_date).date() if start_date else today - timedelta(days=days)
+
+        result = reconcile_rollups(start, end)
+        logger.info(f"Reconciled analytics rollups from {start} to {end}: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Failed to reconcile analytics rollups: {e}")
+        raise
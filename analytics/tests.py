@@ -1,3 +1,250 @@
+from datetime import date, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import EnhancedPatient, EnhancedStaffProfile, Hospital
+from appointments.models import Appointment, AppointmentType
+from .models import AppointmentAnalytics, SystemMetrics
+
+User = get_user_model()
+
+
+class AnalyticsTestDataMixin:
+    """Shared hospital, doctor, patient and appointment type for analytics tests"""
+    
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        
+        self.hospital = Hospital.objects.create(
+            name='Dashboard Hospital',
+            slug='dashboard-hospital',
+            email='admin@dashboard.test',
+            phone='+254700000200',
+            address_line_1='1 Test Road',
+            city='Nairobi',
+            state='Nairobi',
+            postal_code='00100'
+        )
+        doctor_user = User.objects.create_user(
+            username='dashboard_doctor',
+            email='dashboard_doctor@test.com',
+            password='testpass123',
+            full_name='Dr. Dashboard',
+            role='doctor'
+        )
+        self.provider = EnhancedStaffProfile.objects.create(
+            user=doctor_user,
+            hospital=self.hospital,
+            job_title='Physician',
+            hire_date=date(2020, 1, 1)
+        )
+        patient_user = User.objects.create_user(
+            username='dashboard_patient',
+            email='dashboard_patient@test.com',
+            password='testpass123',
+            full_name='Dashboard Patient',
+            role='patient'
+        )
+        self.patient = EnhancedPatient.objects.create(
+            user=patient_user,
+            date_of_birth=date(1990, 1, 1),
+            gender='F',
+            phone='+254700000201',
+            address_line1='2 Test Road',
+            city='Nairobi',
+            state='Nairobi',
+            zip_code='00100',
+            emergency_contact_name='Contact',
+            emergency_contact_relationship='Sibling',
+            emergency_contact_phone='+254700000202'
+        )
+        self.appointment_type = AppointmentType.objects.create(
+            hospital=self.hospital,
+            name='Dashboard Consultation',
+            code='DBC',
+            default_duration=30
+        )
+        
+        self.client = APIClient()
+        self.client.force_authenticate(user=doctor_user)
+    
+    def _book(self, day, hour, status='scheduled'):
+        return Appointment.objects.create(
+            patient=self.patient,
+            provider=self.provider,
+            hospital=self.hospital,
+            appointment_type=self.appointment_type,
+            appointment_date=day,
+            start_time=time(hour, 0),
+            end_time=time(hour, 30),
+            duration=30,
+            status=status,
+            reason='Dashboard test'
+        )
+    
+
+
+class DashboardOverviewTestCase(AnalyticsTestDataMixin, TestCase):
+    """Test cases for the hospital dashboard overview"""
+    
+    def _dashboard(self):
+        return self.client.get(reverse('analytics:dashboard_overview'), secure=True)
+    
+    def test_dashboard_counts_and_trends(self):
+        """Counts and the zero-filled 7 day trend reflect the hospital's appointments"""
+        today = date.today()
+        self._book(today, 9, status='completed')
+        self._book(today - timedelta(days=2), 10)
+        self._book(today + timedelta(days=3), 11)
+        
+        response = self._dashboard()
+        
+        self.assertEqual(response.status_code, 200)
+        overview = response.data['overview']
+        self.assertEqual(overview['total_appointments'], 3)
+        self.assertEqual(overview['appointments_today'], 1)
+        self.assertEqual(overview['completed_appointments'], 1)
+        self.assertEqual(overview['pending_appointments'], 1)
+        trends = response.data['activity_trends']
+        self.assertEqual(len(trends), 7)
+        self.assertEqual(trends[0]['date'], today.strftime('%Y-%m-%d'))
+        self.assertEqual([t['appointments'] for t in trends], [1, 0, 1, 0, 0, 0, 0])
+    
+    def test_dashboard_query_count_is_constant(self):
+        """The dashboard makes the same number of queries however many appointments exist, and none once cached"""
+        today = date.today()
+        with CaptureQueriesContext(connection) as few:
+            self._dashboard()
+        
+        for offset in range(6):
+            self._book(today - timedelta(days=offset), 9)
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            self._dashboard()
+        
+        self.assertEqual(len(few), len(many))
+        self.assertLessEqual(len(many), 10)
+        
+        with CaptureQueriesContext(connection) as cached:
+            response = self._dashboard()
+        self.assertEqual(response.data['overview']['total_appointments'], 6)
+        self.assertLessEqual(len(cached), len(many) - 7)
+    
+    def test_dashboard_cache_invalidated_by_appointment(self):
+        """A new appointment is visible immediately despite the cache"""
+        self.assertEqual(self._dashboard().data['overview']['total_appointments'], 0)
+        
+        self._book(date.today(), 9)
+        
+        self.assertEqual(self._dashboard().data['overview']['total_appointments'], 1)
+
 
-# Create your tests here.
+class AnalyticsRollupTestCase(AnalyticsTestDataMixin, TestCase):
+    """Test cases for the incremental analytics rollups"""
+    
+    def _book_committed(self, day, hour, status='scheduled'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self._book(day, hour, status=status)
+    
+    def _bucket(self, day):
+        return AppointmentAnalytics.objects.get(provider=self.provider, date=day)
+    
+    def test_appointment_save_updates_bucket(self):
+        """Saving appointments refreshes the provider-day bucket after commit"""
+        day = date.today() + timedelta(days=2)
+        self._book_committed(day, 9)
+        appointment = self._book_committed(day, 10)
+        
+        bucket = self._bucket(day)
+        self.assertEqual(bucket.total_appointments, 2)
+        self.assertEqual(bucket.hospital, self.hospital)
+        self.assertEqual(bucket.department, 'general')
+        self.assertEqual(bucket.average_duration, timedelta(minutes=30))
+        
+        appointment.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        
+        bucket = self._bucket(day)
+        self.assertEqual(bucket.total_appointments, 2)
+        self.assertEqual(bucket.cancelled_appointments, 1)
+        self.assertEqual(SystemMetrics.objects.get(date=day).cancelled_appointments, 1)
+    
+    def test_moved_and_deleted_appointments_leave_no_stale_buckets(self):
+        """Moving an appointment refreshes both days and deleting it clears the bucket"""
+        day = date.today() + timedelta(days=2)
+        new_day = day + timedelta(days=1)
+        appointment = self._book_committed(day, 9)
+        
+        appointment.appointment_date = new_day
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        
+        self.assertFalse(AppointmentAnalytics.objects.filter(date=day).exists())
+        self.assertEqual(self._bucket(new_day).total_appointments, 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+        
+        self.assertFalse(AppointmentAnalytics.objects.exists())
+    
+    def test_reconcile_rebuilds_rollups(self):
+        """The reconcile task rebuilds buckets that signals missed"""
+        from .tasks import reconcile_analytics_rollups
+        
+        today = date.today()
+        self._book(today, 9, status='completed')
+        self._book(today - timedelta(days=1), 9)
+        AppointmentAnalytics.objects.all().delete()
+        
+        result = reconcile_analytics_rollups(days=3)
+        
+        self.assertEqual(result['appointment_buckets'], 2)
+        self.assertEqual(self._bucket(today).completed_appointments, 1)
+        self.assertEqual(self._bucket(today).peak_hour, time(9, 0))
+    
+    def test_backfill_command_rebuilds_history(self):
+        """The backfill command fills buckets older than the reconcile window"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        today = date.today()
+        for offset in (10, 80):
+            self._book(today - timedelta(days=offset), 9)
+        AppointmentAnalytics.objects.all().delete()
+        
+        call_command('backfill_analytics_rollups', days=60, chunk_days=7, stdout=StringIO())
+        
+        self.assertEqual(self._bucket(today - timedelta(days=10)).total_appointments, 1)
+        self.assertFalse(AppointmentAnalytics.objects.filter(date=today - timedelta(days=80)).exists())
+        
+        call_command('backfill_analytics_rollups', days=90, stdout=StringIO())
+        self.assertEqual(AppointmentAnalytics.objects.count(), 2)
+    
+    def test_appointment_analytics_reads_rollups(self):
+        """A year-long chart costs the same queries as a month and reads the rollup table"""
+        from .rollups import reconcile_rollups
+        
+        today = date.today()
+        for offset in (1, 40, 200):
+            self._book(today - timedelta(days=offset), 9)
+        reconcile_rollups(today - timedelta(days=365), today)
+        
+        url = reverse('analytics:appointment_analytics')
+        with CaptureQueriesContext(connection) as month:
+            self.client.get(url, {'days': 30}, secure=True)
+        with CaptureQueriesContext(connection) as year:
+            response = self.client.get(url, {'days': 365}, secure=True)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(month), len(year))
+        self.assertEqual(len(response.data['daily_trends']), 365)
+        self.assertEqual(sum(day['appointments'] for day in response.data['daily_trends']), 3)
+        self.assertEqual(response.data['department_performance'][0]['total'], 3)
@@ -1,5 +1,6 @@
 from django.shortcuts import render
 from django.db.models import Count, Sum, Avg, Q, F
+from django.db.models.functions import ExtractHour
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import api_view, permission_classes
@@ -11,7 +12,8 @@ from collections import defaultdict
 
 # Import models from other apps
 from appointments.models import Appointment
-from billing.models import Invoice
+from appointments.stats import SCOPE_HOSPITAL, appointment_counts, cached_stats, daily_series
+from billing.models import Invoice, Payment
 from medical_records.models import MedicalRecord
 from prescriptions.models import Prescription
 from .models import (
@@ -40,119 +42,25 @@ def dashboard_overview(request):
         hospital = staff_profile.hospital
         
         today = timezone.now().date()
-        last_30_days = today - timedelta(days=30)
-        last_7_days = today - timedelta(days=7)
-        
-        # User Statistics - filtered by hospital
-        hospital_users = User.objects.filter(staff_profile__hospital__pk=hospital.pk)
-        total_users = hospital_users.count()
-        active_users_30d = hospital_users.filter(
-            last_login__gte=timezone.now() - timedelta(days=30)
-        ).count()
-        new_users_7d = hospital_users.filter(
-            date_joined__gte=timezone.now() - timedelta(days=7)
-        ).count()
-        
-        # Appointment Statistics - filtered by hospital
-        hospital_appointments = Appointment.objects.filter(hospital__pk=hospital.pk)
-        total_appointments = hospital_appointments.count()
-        appointments_today = hospital_appointments.filter(
-            appointment_date=today
-        ).count()
-        appointments_this_week = hospital_appointments.filter(
-            appointment_date__gte=last_7_days
-        ).count()
-        
-        completed_appointments = hospital_appointments.filter(
-            status='completed'
-        ).count()
-        
-        pending_appointments = hospital_appointments.filter(
-            status='scheduled',
-            appointment_date__gte=today
-        ).count()
-        
-        # Revenue Statistics (if billing app exists) - filtered by hospital
-        try:
-            # Filter invoices by hospital through appointment relationship
-            hospital_invoices = Invoice.objects.filter(
-                appointment__hospital__pk=hospital.pk
-            )
-            total_revenue = hospital_invoices.filter(
-                status='paid'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
-            revenue_this_month = hospital_invoices.filter(
-                status='paid',
-                created_at__month=today.month,
-                created_at__year=today.year
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
-            outstanding_payments = hospital_invoices.filter(
-                status__in=['pending', 'overdue']
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-        except:
-            total_revenue = 0
-            revenue_this_month = 0
-            outstanding_payments = 0
-        
-        # Department-wise appointment distribution - filtered by hospital
-        department_stats = hospital_appointments.values('provider__department').annotate(
-            count=Count('id'),
-            completed=Count('id', filter=Q(status='completed')),
-            pending=Count('id', filter=Q(status='scheduled'))
-        ).order_by('-count')[:6]
-        
-        # Recent activity trends (last 7 days) - filtered by hospital
-        activity_trends = []
-        for i in range(7):
-            date = today - timedelta(days=i)
-            appointments_count = hospital_appointments.filter(
-                appointment_date=date
-            ).count()
-            
-            new_users_count = hospital_users.filter(
-                date_joined__date=date
-            ).count()
-            
-            activity_trends.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'appointments': appointments_count,
-                'new_users': new_users_count
-            })
-        
-        # Top services/treatments - filtered by hospital
-        popular_services = hospital_appointments.values('appointment_type__name').annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
+        dashboard_stats = cached_stats(
+            SCOPE_HOSPITAL, hospital.pk, 'dashboard_overview',
+            lambda: _hospital_dashboard_stats(hospital, today),
+            today=today
+        )
         
         # System health indicators - filtered by hospital
         system_health = {
             'database_status': 'healthy',
             'api_response_time': '< 200ms',
             'uptime': '99.9%',
-            'active_sessions': hospital_users.filter(
-                last_login__gte=timezone.now() - timedelta(hours=1)
-            ).count()
+            'active_sessions': dashboard_stats['active_sessions']
         }
         
         dashboard_data = {
-            'overview': {
-                'total_users': total_users,
-                'active_users_30d': active_users_30d,
-                'new_users_7d': new_users_7d,
-                'total_appointments': total_appointments,
-                'appointments_today': appointments_today,
-                'appointments_this_week': appointments_this_week,
-                'completed_appointments': completed_appointments,
-                'pending_appointments': pending_appointments,
-                'total_revenue': float(total_revenue),
-                'revenue_this_month': float(revenue_this_month),
-                'outstanding_payments': float(outstanding_payments)
-            },
-            'department_stats': list(department_stats),
-            'activity_trends': activity_trends,
-            'popular_services': list(popular_services),
+            'overview': dashboard_stats['overview'],
+            'department_stats': dashboard_stats['department_stats'],
+            'activity_trends': dashboard_stats['activity_trends'],
+            'popular_services': dashboard_stats['popular_services'],
             'system_health': system_health,
             'last_updated': timezone.now().isoformat()
         }
@@ -166,6 +74,87 @@ def dashboard_overview(request):
         )
 
 
+def _hospital_dashboard_stats(hospital, today):
+    """
+    Dashboard metrics for one hospital in a fixed number of queries: one
+    conditional aggregate each for users, appointments and invoices, and one
+    group-by per breakdown or time series.
+    """
+    now = timezone.now()
+    last_7_days = today - timedelta(days=6)
+    
+    # User Statistics - filtered by hospital
+    hospital_users = User.objects.filter(staff_profile__hospital__pk=hospital.pk)
+    user_counts = hospital_users.aggregate(
+        total_users=Count('id'),
+        active_users_30d=Count('id', filter=Q(last_login__gte=now - timedelta(days=30))),
+        new_users_7d=Count('id', filter=Q(date_joined__gte=now - timedelta(days=7))),
+        active_sessions=Count('id', filter=Q(last_login__gte=now - timedelta(hours=1))),
+    )
+    
+    # Appointment Statistics - filtered by hospital
+    hospital_appointments = Appointment.objects.filter(hospital__pk=hospital.pk)
+    appointment_stats = appointment_counts(hospital_appointments, today)
+    
+    # Revenue Statistics (if billing app exists) - filtered by hospital
+    try:
+        revenue = Invoice.objects.filter(
+            appointment__hospital__pk=hospital.pk
+        ).aggregate(
+            total_revenue=Sum('total_amount', filter=Q(status='paid')),
+            revenue_this_month=Sum('total_amount', filter=Q(
+                status='paid', created_at__month=today.month, created_at__year=today.year
+            )),
+            outstanding_payments=Sum('total_amount', filter=Q(status__in=['pending', 'overdue'])),
+        )
+    except Exception:
+        revenue = {}
+    
+    # Department-wise appointment distribution - filtered by hospital
+    department_stats = hospital_appointments.values('provider__department').annotate(
+        count=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+        pending=Count('id', filter=Q(status='scheduled'))
+    ).order_by('-count')[:6]
+    
+    # Recent activity trends (last 7 days, newest first) - filtered by hospital
+    appointment_series = daily_series(hospital_appointments, 'appointment_date', last_7_days, today)
+    user_series = dict(daily_series(hospital_users, 'date_joined', last_7_days, today))
+    activity_trends = [
+        {
+            'date': day.strftime('%Y-%m-%d'),
+            'appointments': appointments_count,
+            'new_users': user_series[day]
+        }
+        for day, appointments_count in reversed(appointment_series)
+    ]
+    
+    # Top services/treatments - filtered by hospital
+    popular_services = hospital_appointments.values('appointment_type__name').annotate(
+        count=Count('id')
+    ).order_by('-count')[:5]
+    
+    return {
+        'overview': {
+            'total_users': user_counts['total_users'],
+            'active_users_30d': user_counts['active_users_30d'],
+            'new_users_7d': user_counts['new_users_7d'],
+            'total_appointments': appointment_stats['total_appointments'],
+            'appointments_today': appointment_stats['today_appointments'],
+            'appointments_this_week': appointment_stats['this_week_appointments'],
+            'completed_appointments': appointment_stats['completed_appointments'],
+            'pending_appointments': appointment_stats['scheduled_upcoming_appointments'],
+            'total_revenue': float(revenue.get('total_revenue') or 0),
+            'revenue_this_month': float(revenue.get('revenue_this_month') or 0),
+            'outstanding_payments': float(revenue.get('outstanding_payments') or 0)
+        },
+        'department_stats': list(department_stats),
+        'activity_trends': activity_trends,
+        'popular_services': list(popular_services),
+        'active_sessions': user_counts['active_sessions'],
+    }
+
+
 @api_view(['GET', 'OPTIONS'])
 @permission_classes([IsAuthenticated])
 def appointment_analytics(request):
@@ -181,39 +170,43 @@ def appointment_analytics(request):
             appointment_date__range=[start_date, end_date]
         ).values('status').annotate(count=Count('id'))
         
-        # Daily appointment trends
-        daily_trends = []
-        for i in range(days):
-            date = start_date + timedelta(days=i)
-            daily_count = Appointment.objects.filter(
-                appointment_date=date
-            ).count()
-            daily_trends.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'appointments': daily_count
-            })
+        # Daily trends and department performance come from the daily rollups
+        rollups = AppointmentAnalytics.objects.filter(date__range=[start_date, end_date])
+        daily_trends = [
+            {'date': date.strftime('%Y-%m-%d'), 'appointments': daily_count}
+            for date, daily_count in daily_series(
+                rollups, 'date', start_date, end_date - timedelta(days=1), value=Sum('total_appointments')
+            )
+        ]
         
         # Department performance
-        department_performance = Appointment.objects.filter(
-            appointment_date__range=[start_date, end_date]
-        ).values('provider__department').annotate(
-            total=Count('id'),
-            completed=Count('id', filter=Q(status='completed')),
-            cancelled=Count('id', filter=Q(status='cancelled')),
-            no_show=Count('id', filter=Q(status='no_show'))
-        ).order_by('-total')
+        department_performance = [
+            {
+                'provider__department': row['department'],
+                'total': row['total'],
+                'completed': row['completed'],
+                'cancelled': row['cancelled'],
+                'no_show': row['no_show']
+            }
+            for row in rollups.values('department').annotate(
+                total=Sum('total_appointments'),
+                completed=Sum('completed_appointments'),
+                cancelled=Sum('cancelled_appointments'),
+                no_show=Sum('no_show_appointments')
+            ).order_by('-total')
+        ]
         
         # Peak hours analysis
         hourly_distribution = Appointment.objects.filter(
             appointment_date__range=[start_date, end_date]
-        ).extra(
-            select={'hour': 'EXTRACT(hour FROM appointment_time)'}
+        ).annotate(
+            hour=ExtractHour('start_time')
         ).values('hour').annotate(count=Count('id')).order_by('hour')
         
         analytics_data = {
             'status_distribution': list(status_distribution),
             'daily_trends': daily_trends,
-            'department_performance': list(department_performance),
+            'department_performance': department_performance,
             'hourly_distribution': list(hourly_distribution),
             'date_range': {
                 'start': start_date.strftime('%Y-%m-%d'),
@@ -240,37 +233,36 @@ def revenue_analytics(request):
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=days)
         
-        # Revenue trends
-        revenue_trends = []
-        for i in range(days):
-            date = start_date + timedelta(days=i)
-            daily_revenue = Invoice.objects.filter(
-                created_at__date=date,
-                status='paid'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
-            revenue_trends.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'revenue': float(daily_revenue)
-            })
+        # Revenue trends and department revenue come from the daily rollups
+        rollups = RevenueAnalytics.objects.filter(date__range=[start_date, end_date])
+        revenue_trends = [
+            {'date': date.strftime('%Y-%m-%d'), 'revenue': float(daily_revenue)}
+            for date, daily_revenue in daily_series(
+                rollups, 'date', start_date, end_date - timedelta(days=1), value=Sum('total_revenue')
+            )
+        ]
         
         # Payment method distribution
-        payment_methods = Invoice.objects.filter(
-            created_at__date__range=[start_date, end_date],
-            status='paid'
+        payment_methods = Payment.objects.filter(
+            payment_date__date__range=[start_date, end_date],
+            status='completed'
         ).values('payment_method').annotate(
             count=Count('id'),
-            total_amount=Sum('total_amount')
+            total_amount=Sum('amount')
         )
         
         # Department revenue
-        department_revenue = Invoice.objects.filter(
-            created_at__date__range=[start_date, end_date],
-            status='paid'
-        ).values('appointment__provider__department').annotate(
-            revenue=Sum('total_amount'),
-            count=Count('id')
-        ).order_by('-revenue')
+        department_revenue = [
+            {
+                'appointment__provider__department': row['department'],
+                'revenue': row['revenue'],
+                'count': row['count']
+            }
+            for row in rollups.values('department').annotate(
+                revenue=Sum('total_revenue'),
+                count=Sum('paid_invoices')
+            ).filter(count__gt=0).order_by('-revenue')
+        ]
         
         # Outstanding payments
         outstanding = Invoice.objects.filter(
@@ -283,7 +275,7 @@ def revenue_analytics(request):
         revenue_data = {
             'revenue_trends': revenue_trends,
             'payment_methods': list(payment_methods),
-            'department_revenue': list(department_revenue),
+            'department_revenue': department_revenue,
             'outstanding_payments': {
                 'total': float(outstanding['total'] or 0),
                 'count': outstanding['count']
@@ -314,17 +306,13 @@ def user_analytics(request):
         start_date = end_date - timedelta(days=days)
         
         # User registration trends
-        registration_trends = []
-        for i in range(days):
-            date = start_date + timedelta(days=i)
-            daily_registrations = User.objects.filter(
-                date_joined__date=date
-            ).count()
-            
-            registration_trends.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'registrations': daily_registrations
-            })
+        registration_trends = [
+            {'date': date.strftime('%Y-%m-%d'), 'registrations': daily_registrations}
+            for date, daily_registrations in daily_series(
+                SystemMetrics.objects.all(), 'date', start_date, end_date - timedelta(days=1),
+                value=Sum('new_registrations')
+            )
+        ]
         
         # User activity patterns
         active_users = User.objects.filter(
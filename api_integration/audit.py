@@ -0,0 +1,457 @@
+"""
+Buffered audit logging for partner API requests.
+
+Requests append APILog rows to an in-process buffer instead of writing them;
+a background writer thread flushes the buffer with one bulk insert per batch.
+Every record is first appended to a write-ahead journal on local disk, so the
+buffer is never the only copy:
+
+- ``log()`` serializes the record as one NDJSON line into this process's
+  active journal segment (API_AUDIT_JOURNAL_DIR) and flushes it to the
+  operating system before queueing it. A process killed without running exit
+  handlers (SIGKILL, the OOM killer) loses nothing; a kernel crash or power
+  loss can lose the lines not yet synced by the OS.
+- A batch leaves the buffer only after its insert commits, and a segment is
+  deleted only once all of its records are written. A failed insert puts the
+  batch back at the front and the writer retries it after a backoff that
+  doubles per consecutive failure, up to MAX_RETRY_INTERVAL_SECONDS.
+- Rows carry their primary key and request_id from the moment they are
+  built, so a retried or replayed batch that was in fact written is ignored
+  rather than duplicated.
+- When the buffer is full and the database is healthy, the request that
+  overflowed it flushes synchronously. While the writer is backing off after
+  a failure, the oldest records are evicted from memory only (counted in
+  ``evicted``); their segments are replayed from disk once the database is
+  back.
+- Each process holds an exclusive ``flock`` on its own segments. Segments
+  whose lock is free belong to a process that died, and the next flush of
+  any process in the same directory replays them.
+- When the journal cannot be written, or holds more than MAX_JOURNAL_BYTES,
+  the record is written to the database synchronously; if that fails too
+  the request fails with AuditLogUnavailable (503) rather than go unaudited.
+- Rows the database rejects outright (e.g. their integration was deleted
+  before a replay) are moved to ``rejected.ndjson`` in the journal directory
+  and logged, so one bad row cannot block the rest.
+
+``last_accessed`` on an integration is coalesced the same way but is not
+journaled: it is written at most once per LAST_ACCESSED_INTERVAL per
+integration, by the writer, and is not an audit record.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import serializers
+from django.core.serializers.base import DeserializationError
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import APILog, HospitalIntegration
+
+try:
+    import fcntl
+except ImportError:  # Windows: segments are not locked and orphans are not recovered
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = 1.0
+BATCH_SIZE = 500
+MAX_BUFFERED_RECORDS = 10000
+MAX_RETRY_INTERVAL_SECONDS = 30.0
+LAST_ACCESSED_INTERVAL = timedelta(minutes=1)
+SEGMENT_BYTES = 8 * 1024 * 1024
+MAX_JOURNAL_BYTES = 512 * 1024 * 1024
+SEGMENT_PREFIX = 'audit-'
+SEGMENT_SUFFIX = '.ndjson'
+REJECTED_FILE = 'rejected.ndjson'
+
+
+class AuditLogUnavailable(APIException):
+    """Neither the audit journal nor the database accepted a record."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Audit logging is unavailable, please retry later.'
+    default_code = 'audit_log_unavailable'
+
+
+def get_client_ip(request):
+    """Get client IP address"""
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0]
+    return request.META.get('REMOTE_ADDR')
+
+
+def build_api_log(request, integration, status_code, message, **fields):
+    """Unsaved APILog for a request; fields override the request-derived defaults."""
+    values = {
+        'integration': integration,
+        'method': request.method,
+        'endpoint': request.path,
+        'status_code': status_code,
+        'response_time_ms': 0,
+        'ip_address': get_client_ip(request),
+        'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+        'auth_status': 'success' if status_code < 400 else 'failed',
+        'message': message,
+    }
+    values.update(fields)
+    return APILog(**values)
+
+
+class _Segment:
+    """A journal file; ``pending`` counts its records still in the buffer."""
+
+    def __init__(self, path, handle):
+        self.path = path
+        self.handle = handle
+        self.size = handle.seek(0, os.SEEK_END)
+        self.pending = 0
+        self.replay = False  # Some records are on disk only; write the file itself
+
+
+class AuditLogWriter:
+    """APILog buffer backed by an on-disk journal and drained by a background thread."""
+
+    def __init__(self, batch_size=BATCH_SIZE, max_records=MAX_BUFFERED_RECORDS,
+                 flush_interval=FLUSH_INTERVAL_SECONDS, journal_dir=None,
+                 segment_bytes=SEGMENT_BYTES, max_journal_bytes=MAX_JOURNAL_BYTES, autostart=True):
+        self.batch_size = batch_size
+        self.max_records = max_records
+        self.flush_interval = flush_interval
+        self.journal_dir = journal_dir  # None: settings.API_AUDIT_JOURNAL_DIR
+        self.segment_bytes = segment_bytes
+        self.max_journal_bytes = max_journal_bytes
+        self.autostart = autostart
+        self.records = deque()  # (segment, APILog)
+        self.last_accessed = {}  # integration id -> latest access time not yet written
+        self.evicted = 0
+        self.rejected = 0
+        self._segments = deque()
+        self._active = None
+        self._journal_bytes = 0
+        self._failures = 0
+        self._retry_at = 0.0  # monotonic time before which the database is not retried
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def log(self, record):
+        """
+        Journal and queue an APILog row. Writes to the database only when the
+        buffer is full and the writer is not backing off after a failed write,
+        or when the journal cannot take the record.
+        """
+        line = serializers.serialize('jsonl', [record]).encode()
+        with self._lock:
+            segment = self._append(line)
+            if segment is not None:
+                self.records.append((segment, record))
+                segment.pending += 1
+                overflow = len(self.records) >= self.max_records
+                if overflow and self._backing_off():
+                    self._evict_overflow()
+                    overflow = False
+                if len(self.records) >= self.batch_size:
+                    self._wakeup.set()
+        if segment is None:
+            self._write_through(record)
+            return
+        self._ensure_started()
+        if overflow:
+            logger.warning("Audit log buffer full, flushing synchronously")
+            self.flush()
+
+    def touch(self, integration, now=None):
+        """Record an access; ``last_accessed`` is written at most once a minute per integration."""
+        now = now or timezone.now()
+        if integration.last_accessed and now - integration.last_accessed < LAST_ACCESSED_INTERVAL:
+            return
+        with self._lock:
+            previous = self.last_accessed.get(integration.pk)
+            if previous and now - previous < LAST_ACCESSED_INTERVAL:
+                return
+            self.last_accessed[integration.pk] = now
+        integration.last_accessed = now
+        self._ensure_started()
+
+    def flush(self):
+        """
+        Write journals left by stopped processes, segments with evicted
+        records, then everything buffered so far. Returns the number of log
+        rows written.
+        """
+        written = 0
+        with self._flush_lock:
+            self._adopt_orphans()
+            while True:
+                with self._lock:
+                    segment = next((s for s in self._segments if s.replay), None)
+                    if segment is self._active:
+                        self._active = None  # Stop appending to a file that is being replayed
+                if segment is None:
+                    break
+                try:
+                    written += self._replay(segment)
+                except Exception as e:
+                    self._back_off(e)
+                    return written
+                with self._lock:
+                    self._recovered()
+                    self.records = deque(entry for entry in self.records if entry[0] is not segment)
+                    self._release(segment)
+
+            while True:
+                with self._lock:
+                    batch = [self.records.popleft() for _ in range(min(self.batch_size, len(self.records)))]
+                    accessed, self.last_accessed = self.last_accessed, {}
+                if not batch and not accessed:
+                    return written
+                try:
+                    self._write([record for _, record in batch])
+                    if accessed:
+                        HospitalIntegration.objects.bulk_update(
+                            [HospitalIntegration(pk=pk, last_accessed=at) for pk, at in accessed.items()],
+                            ['last_accessed']
+                        )
+                except Exception as e:
+                    with self._lock:
+                        self.records.extendleft(reversed(batch))
+                        self._evict_overflow()
+                        for pk, at in accessed.items():
+                            self.last_accessed[pk] = max(at, self.last_accessed.get(pk, at))
+                    self._back_off(e)
+                    return written
+                with self._lock:
+                    self._recovered()
+                    for segment, _ in batch:
+                        segment.pending -= 1
+                    for segment in {segment for segment, _ in batch}:
+                        if not segment.pending and not segment.replay:
+                            self._release(segment)
+                written += len(batch)
+
+    def pending(self):
+        """Number of buffered log rows."""
+        with self._lock:
+            return len(self.records)
+
+    def _backing_off(self):
+        return time.monotonic() < self._retry_at
+
+    def _back_off(self, error):
+        with self._lock:
+            self._failures += 1
+            delay = min(self.flush_interval * 2 ** self._failures, MAX_RETRY_INTERVAL_SECONDS)
+            self._retry_at = time.monotonic() + delay
+        logger.error(f"Error writing audit logs, retrying in {delay:.0f}s: {error}")
+
+    def _recovered(self):
+        """Reset the backoff after a successful write; the caller holds the lock."""
+        if self._failures:
+            logger.warning("Audit log writer recovered")
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _evict_overflow(self):
+        """Evict the oldest records beyond max_records from memory; the caller holds the lock."""
+        excess = len(self.records) - self.max_records
+        if excess <= 0:
+            return
+        for _ in range(excess):
+            segment, _ = self.records.popleft()
+            segment.pending -= 1
+            segment.replay = True
+        if not self.evicted:
+            logger.warning("Audit log buffer full while the database is unavailable, "
+                           "keeping the oldest records in the journal only until it recovers")
+        self.evicted += excess
+
+    def _write(self, records):
+        """Insert records; rows the database rejects on their own are set aside."""
+        try:
+            APILog.objects.bulk_create(records, ignore_conflicts=True)
+        except IntegrityError:
+            for record in records:
+                try:
+                    with transaction.atomic():
+                        APILog.objects.bulk_create([record], ignore_conflicts=True)
+                except IntegrityError as e:
+                    self._reject(record, e)
+
+    def _write_through(self, record):
+        """Write one record synchronously; the request fails if the database is down too."""
+        try:
+            self._write([record])
+        except Exception as e:
+            logger.error(f"Audit journal and database both unavailable: {e}")
+            raise AuditLogUnavailable() from e
+
+    def _reject(self, record, error):
+        self.rejected += 1
+        logger.error(f"Audit log record {record.request_id} rejected by the database: {error}")
+        path = os.path.join(self._journal_dir(), REJECTED_FILE)
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(serializers.serialize('jsonl', [record]))
+        except OSError as e:
+            logger.error(f"Could not set aside rejected audit log record {record.request_id}: {e}")
+
+    def _journal_dir(self):
+        return self.journal_dir or settings.API_AUDIT_JOURNAL_DIR
+
+    def _append(self, line):
+        """Append a journal line; returns its segment, or None if the journal cannot take it."""
+        if self._journal_bytes + len(line) > self.max_journal_bytes:
+            logger.error("Audit journal full, writing audit logs synchronously")
+            return None
+        try:
+            if self._active is None or self._active.size >= self.segment_bytes:
+                self._rotate()
+            self._active.handle.write(line)
+            self._active.handle.flush()
+        except OSError as e:
+            logger.error(f"Cannot write audit journal, writing audit logs synchronously: {e}")
+            return None
+        self._active.size += len(line)
+        self._journal_bytes += len(line)
+        return self._active
+
+    def _rotate(self):
+        """Start a new active segment; the caller holds the lock."""
+        previous = self._active
+        directory = self._journal_dir()
+        os.makedirs(directory, exist_ok=True)
+        name = f'{SEGMENT_PREFIX}{os.getpid()}-{uuid.uuid4().hex}{SEGMENT_SUFFIX}'
+        # Lock under a name other processes ignore, so none adopts it before it is ours
+        temporary = os.path.join(directory, f'.{name}')
+        handle = open(temporary, 'ab+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(temporary, os.path.join(directory, name))
+        except OSError:
+            handle.close()
+            raise
+        self._active = _Segment(os.path.join(directory, name), handle)
+        self._segments.append(self._active)
+        if previous is not None and not previous.pending and not previous.replay:
+            self._release(previous)
+
+    def _release(self, segment):
+        """Delete a fully written segment; the caller holds the lock."""
+        self._segments.remove(segment)
+        if segment is self._active:
+            self._active = None
+        self._journal_bytes -= segment.size
+        try:
+            os.remove(segment.path)
+        except FileNotFoundError:
+            pass  # Already replayed by a process that adopted it first
+        except OSError as e:
+            logger.error(f"Could not remove audit journal {segment.path}: {e}")
+        segment.handle.close()
+
+    def _replay(self, segment):
+        """Write every record in a segment file. Returns the number of rows written."""
+        written = 0
+        batch = []
+        with open(segment.path, 'rb') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    batch.extend(item.object for item in serializers.deserialize('jsonl', line))
+                except DeserializationError:
+                    # The last line of a process killed mid-write
+                    logger.warning(f"Skipping unreadable line {number} of audit journal {segment.path}")
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    written += len(batch)
+                    batch = []
+        if batch:
+            self._write(batch)
+            written += len(batch)
+        return written
+
+    def _adopt_orphans(self):
+        """Take over segments whose owning process is gone; they are replayed by this flush."""
+        if fcntl is None:
+            return
+        directory = self._journal_dir()
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return
+        with self._lock:
+            own = {segment.path for segment in self._segments}
+        for name in names:
+            path = os.path.join(directory, name)
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)) or path in own:
+                continue
+            try:
+                handle = open(path, 'ab+')
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()  # Its process is still running
+                continue
+            segment = _Segment(path, handle)
+            segment.replay = True
+            logger.warning(f"Recovering audit journal {name} left by a stopped process")
+            with self._lock:
+                self._segments.appendleft(segment)
+                self._journal_bytes += segment.size
+
+    def close(self):
+        """Flush pending records; called at interpreter exit."""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing audit logs at shutdown: {e}")
+
+    def _ensure_started(self):
+        if not self.autostart or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='api-audit-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._backing_off():
+                continue
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Audit log writer error: {e}")
+
+
+# Global instance for use throughout the application
+audit_log_writer = AuditLogWriter()
+atexit.register(audit_log_writer.close)
+
+
+def log_api_request(request, integration, status_code, message, **fields):
+    """Queue an audit record for a partner API request."""
+    try:
+        audit_log_writer.log(build_api_log(request, integration, status_code, message, **fields))
+    except AuditLogUnavailable:
+        raise
+    except Exception as e:
+        # Don't fail the request if logging fails
+        logger.error(f"Error queueing API audit log: {e}")
@@ -0,0 +1,226 @@
+"""
+Cached authorization context for partner API requests.
+
+Authenticating a partner request needs the integration (with its hospital),
+the consents it holds and its allowed endpoints. These change rarely but are
+read on every request, so they are cached as a PartnerAuthContext, keyed by
+the SHA-256 of the API key (the key itself is never used as a cache key):
+
+- In process, for LOCAL_TTL_SECONDS, so a hit takes no queries and no
+  network round trip.
+- In Redis, for REDIS_TTL_SECONDS, shared by all workers. The payload is
+  encrypted with DataEncryption, since it includes the integration's secrets.
+
+Entries are versioned. Saving or deleting an integration, consent or hospital
+bumps a global version in Redis (see signals), which makes every entry stale:
+immediately in the process that made the change, and in other processes once
+their local entry is LOCAL_TTL_SECONDS old and is re-checked against the
+version. Without Redis there is no version to check, so an entry older than
+LOCAL_TTL_SECONDS is reloaded from the database. Rotating an API key saves the integration, so the old key stops
+resolving the same way.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.core import serializers
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DataProcessingConsent, HospitalIntegration
+from .security import DataEncryption
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TTL_SECONDS = 5
+REDIS_TTL_SECONDS = 300
+MAX_LOCAL_ENTRIES = 1024
+REDIS_RETRY_SECONDS = 30
+VERSION_KEY = 'partner_auth:version'
+ENTRY_KEY = 'partner_auth:{}'
+
+
+def hash_api_key(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+@dataclass
+class PartnerAuthContext:
+    """An integration and what it is authorized for, as of when it was cached."""
+    integration: HospitalIntegration
+    consents: dict = field(default_factory=dict)  # consent type -> expiry (None for no expiry)
+    allowed_endpoints: list = field(default_factory=list)
+
+    def has_consent(self, consent_type, now=None):
+        """Whether a granted, unexpired consent of this type is held"""
+        if consent_type not in self.consents:
+            return False
+        expires_at = self.consents[consent_type]
+        return expires_at is None or expires_at > (now or timezone.now())
+
+    def is_endpoint_allowed(self, path):
+        if not self.allowed_endpoints:
+            return True  # No restrictions
+        return any(path.startswith(endpoint) for endpoint in self.allowed_endpoints)
+
+    def to_payload(self):
+        return json.dumps({
+            'objects': serializers.serialize('json', [self.integration, self.integration.hospital]),
+            'consents': {
+                consent_type: expires_at.isoformat() if expires_at else None
+                for consent_type, expires_at in self.consents.items()
+            },
+        })
+
+    @classmethod
+    def from_payload(cls, payload):
+        data = json.loads(payload)
+        integration, hospital = [
+            deserialized.object for deserialized in serializers.deserialize('json', data['objects'])
+        ]
+        for instance in (integration, hospital):
+            instance._state.adding = False
+            instance._state.db = DEFAULT_DB_ALIAS
+        integration.hospital = hospital
+        return cls(
+            integration=integration,
+            consents={
+                consent_type: parse_datetime(expires_at) if expires_at else None
+                for consent_type, expires_at in data['consents'].items()
+            },
+            allowed_endpoints=integration.allowed_endpoints or [],
+        )
+
+
+def load_auth_context(api_key):
+    """Build the context from the database (two queries); None if the key is unknown."""
+    integration = HospitalIntegration.objects.select_related('hospital').filter(api_key=api_key).first()
+    if integration is None:
+        return None
+
+    consents = {}
+    granted = DataProcessingConsent.objects.filter(
+        integration=integration, status='granted'
+    ).values_list('consent_type', 'expires_at')
+    for consent_type, expires_at in granted:
+        # Several grants of one type: the longest-lived one counts
+        if consent_type not in consents:
+            consents[consent_type] = expires_at
+        elif consents[consent_type] is not None:
+            consents[consent_type] = None if expires_at is None else max(consents[consent_type], expires_at)
+    return PartnerAuthContext(integration, consents, integration.allowed_endpoints or [])
+
+
+class PartnerAuthCache:
+    """Two-level (process, Redis) cache of PartnerAuthContext by API key hash."""
+
+    def __init__(self, redis_client=None, encryption=None):
+        self.redis = redis_client
+        self.encryption = encryption or DataEncryption()
+        self.local = {}  # key hash -> (version, checked_at, context)
+        self.version = None  # last version seen in Redis
+        self._lock = threading.Lock()
+        self._redis_retry_at = 0
+
+    def get(self, api_key):
+        """The context for an API key, or None if no integration has that key."""
+        key_hash = hash_api_key(api_key)
+        now = time.monotonic()
+
+        entry = self.local.get(key_hash)
+        if entry and entry[0] == self.version and now - entry[1] < LOCAL_TTL_SECONDS:
+            return entry[2]
+
+        version, cached = self._redis_get(key_hash)
+        if entry and version is not None and entry[0] == version:
+            self._store_local(key_hash, version, now, entry[2])
+            return entry[2]
+        if cached is not None:
+            self._store_local(key_hash, version, now, cached)
+            return cached
+
+        # Without a version from Redis nothing can confirm an expired local
+        # entry, so it is reloaded from the database
+        context = load_auth_context(api_key)
+        if context is not None:
+            self._store_local(key_hash, self.version if version is None else version, now, context)
+            self._redis_set(key_hash, version, context)
+        return context
+
+    def invalidate(self):
+        """Make every cached entry stale, in this process and (via Redis) in all others."""
+        with self._lock:
+            self.local.clear()
+            self.version = None
+        if self._redis_available():
+            try:
+                self.redis.incr(VERSION_KEY)
+            except Exception as e:
+                self._redis_failed(e)
+
+    def _store_local(self, key_hash, version, now, context):
+        with self._lock:
+            if len(self.local) >= MAX_LOCAL_ENTRIES and key_hash not in self.local:
+                self.local.pop(next(iter(self.local)))
+            self.local[key_hash] = (version, now, context)
+            self.version = version
+
+    def _redis_available(self):
+        return self.redis is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error):
+        logger.warning(f"Redis unavailable for partner auth cache, using local cache: {error}")
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def _redis_get(self, key_hash):
+        """(current version, cached context) from Redis in one round trip; (None, None) without Redis"""
+        if not self._redis_available():
+            return None, None
+        try:
+            version, raw = self.redis.mget(VERSION_KEY, ENTRY_KEY.format(key_hash))
+        except Exception as e:
+            self._redis_failed(e)
+            return None, None
+
+        version = int(version or 0)
+        if not raw:
+            return version, None
+        try:
+            entry = json.loads(self.encryption.decrypt_data(raw))
+            if entry['version'] != version:
+                return version, None
+            return version, PartnerAuthContext.from_payload(entry['context'])
+        except Exception as e:
+            logger.warning(f"Discarding unreadable partner auth cache entry: {e}")
+            return version, None
+
+    def _redis_set(self, key_hash, version, context):
+        if version is None or not self._redis_available():
+            return
+        try:
+            entry = json.dumps({'version': version, 'context': context.to_payload()})
+            self.redis.set(ENTRY_KEY.format(key_hash), self.encryption.encrypt_data(entry), ex=REDIS_TTL_SECONDS)
+        except Exception as e:
+            self._redis_failed(e)
+
+
+_partner_auth_cache = None
+
+
+def get_partner_auth_cache() -> PartnerAuthCache:
+    """Process-wide partner auth cache on the shared Redis connection pool"""
+    global _partner_auth_cache
+    if _partner_auth_cache is None:
+        try:
+            from redis_pool_config import get_redis_connection
+            redis_client = get_redis_connection()
+        except Exception as e:
+            logger.warning(f"Redis connection pool unavailable for partner auth cache: {e}")
+            redis_client = None
+        _partner_auth_cache = PartnerAuthCache(redis_client)
+    return _partner_auth_cache
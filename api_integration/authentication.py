@@ -1,90 +1,94 @@
 from rest_framework import authentication, exceptions
-from django.utils import timezone
 from django.contrib.auth import get_user_model
-from .models import HospitalIntegration, APILog
-from .security import RequestSignature, RateLimiter
-import redis
+from .models import HospitalIntegration
+from .security import RequestSignature, RATE_LIMIT_WINDOWS, get_partner_rate_limiter
+from .audit import AuditLogUnavailable, audit_log_writer, build_api_log
+from .auth_cache import PartnerAuthContext, get_partner_auth_cache
 import json
 
 User = get_user_model()
 
+# Failed signature attempts allowed per API key and client IP
+FAILED_SIGNATURE_LIMITS = [
+    ('per_minute', 10, RATE_LIMIT_WINDOWS['per_minute']),
+    ('per_hour', 100, RATE_LIMIT_WINDOWS['per_hour']),
+]
+
 class HospitalAPIAuthentication(authentication.BaseAuthentication):
     """Custom authentication for hospital API integrations"""
     
     def __init__(self):
-        try:
-            self.redis_client = redis.Redis(host='localhost', port=6379, db=0)
-            self.rate_limiter = RateLimiter(self.redis_client)
-        except:
-            self.redis_client = None
-            self.rate_limiter = RateLimiter(None)
+        # Shared per process: DRF builds a new authenticator for every request
+        self.rate_limiter = get_partner_rate_limiter()
+        self.auth_cache = get_partner_auth_cache()
     
     def authenticate(self, request):
-        """Authenticate the request using API key and signature"""
+        """
+        Authenticate the request using API key and signature.
+        
+        Returns the integration as ``request.user`` and its cached
+        PartnerAuthContext (consents, allowed endpoints) as ``request.auth``.
+        """
         
         # Get API key from header
         api_key = request.META.get('HTTP_X_API_KEY')
         if not api_key:
             raise exceptions.AuthenticationFailed('API key required')
         
-        # Get integration details
-        try:
-            integration = HospitalIntegration.objects.select_related('hospital').get(
-                api_key=api_key,
-                status='active'
-            )
-        except HospitalIntegration.DoesNotExist:
+        # Get integration details (cached; no queries on a hit)
+        context = self.auth_cache.get(api_key)
+        if context is None or context.integration.status != 'active':
             raise exceptions.AuthenticationFailed('Invalid API key')
+        integration = context.integration
         
-        # Check rate limiting
-        if self.is_rate_limited(integration, request):
-            raise exceptions.AuthenticationFailed('Rate limit exceeded')
+        # Throttle failed signatures per key and client IP, so guessing
+        # cannot be used to spend the partner's own quota
+        failure_identity = f"{integration.id}:{self.get_client_ip(request)}:signature_failures"
+        failures = self.rate_limiter.check(failure_identity, FAILED_SIGNATURE_LIMITS, consume=False)
+        if not failures.allowed:
+            raise exceptions.Throttled(wait=failures.retry_after, detail='Too many failed signatures')
         
         # Verify request signature
         signature = request.META.get('HTTP_X_SIGNATURE')
         timestamp = request.META.get('HTTP_X_TIMESTAMP')
         
-        if not signature or not timestamp:
-            raise exceptions.AuthenticationFailed('Signature and timestamp required')
-        
-        # Get request body for signature verification
-        body = request.body.decode('utf-8') if request.body else ''
+        # Sign the raw body so compressed batch uploads verify too
+        body = request.body or b''
         
-        if not RequestSignature.verify_signature(
+        if not signature or not timestamp or not RequestSignature.verify_signature(
             integration.api_secret, body, timestamp, signature
         ):
+            self.rate_limiter.check(failure_identity, FAILED_SIGNATURE_LIMITS)
+            if not signature or not timestamp:
+                raise exceptions.AuthenticationFailed('Signature and timestamp required')
             raise exceptions.AuthenticationFailed('Invalid signature')
         
-        # Update last accessed time
-        integration.last_accessed = timezone.now()
-        integration.save(update_fields=['last_accessed'])
+        # Charge the partner's quota only for verified requests (all windows in one atomic check)
+        rate_limit = self.check_rate_limit(integration)
+        request.rate_limit = rate_limit
+        if not rate_limit.allowed:
+            raise exceptions.Throttled(wait=rate_limit.retry_after, detail='Rate limit exceeded')
+        
+        # Update last accessed time (coalesced, written by the audit writer)
+        audit_log_writer.touch(integration)
         
         # Log authentication success
         self.log_api_request(request, integration, 200, 'Authentication successful')
         
-        return (integration, None)
+        return (integration, context)
     
-    def is_rate_limited(self, integration, request):
-        """Check if request is rate limited"""
-        client_ip = self.get_client_ip(request)
-        
-        # Check different rate limits
+    def check_rate_limit(self, integration):
+        """Check the per-minute, per-hour and per-day limits of an API key"""
         limits = [
-            ('per_minute', integration.rate_limit_per_minute, 60),
-            ('per_hour', integration.rate_limit_per_hour, 3600),
-            ('per_day', integration.rate_limit_per_day, 86400)
+            ('per_minute', integration.rate_limit_per_minute, RATE_LIMIT_WINDOWS['per_minute']),
+            ('per_hour', integration.rate_limit_per_hour, RATE_LIMIT_WINDOWS['per_hour']),
+            ('per_day', integration.rate_limit_per_day, RATE_LIMIT_WINDOWS['per_day'])
         ]
-        
-        for limit_type, limit, window in limits:
-            if self.rate_limiter.is_rate_limited(
-                f"{integration.id}:{client_ip}", 
-                limit_type, 
-                limit, 
-                window
-            ):
-                return True
-        
-        return False
+        return self.rate_limiter.check(str(integration.id), limits)
+    
+    def is_rate_limited(self, integration, request):
+        """Check if request is rate limited"""
+        return not self.check_rate_limit(integration).allowed
     
     def get_client_ip(self, request):
         """Get client IP address"""
@@ -96,31 +100,26 @@ class HospitalAPIAuthentication(authentication.BaseAuthentication):
         return ip
     
     def log_api_request(self, request, integration, status_code, message, **kwargs):
-        """Log API request for audit purposes"""
+        """Queue API request log for audit purposes (written by the background audit writer)"""
         try:
-            # Get request details
-            endpoint = request.path
-            method = request.method
-            ip_address = self.get_client_ip(request)
-            user_agent = request.META.get('HTTP_USER_AGENT', '')
-            
-            # Create log entry
-            APILog.objects.create(
-                integration=integration,
-                method=method,
-                endpoint=endpoint,
-                status_code=status_code,
-                response_time_ms=kwargs.get('response_time_ms', 0),
-                ip_address=ip_address,
-                user_agent=user_agent,
-                auth_status='success' if status_code == 200 else 'failed',
-                message=message,
-                **kwargs
-            )
+            audit_log_writer.log(build_api_log(request, integration, status_code, message, **kwargs))
+        except AuditLogUnavailable:
+            raise
         except Exception as e:
             # Don't fail the request if logging fails
             pass
 
+class RateLimitHeadersMixin:
+    """Adds X-RateLimit-* headers from HospitalAPIAuthentication to responses"""
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            for header, value in rate_limit.headers().items():
+                response[header] = value
+        return response
+
 class HospitalAPIPermission:
     """Custom permission class for hospital API"""
     
@@ -152,12 +151,11 @@ class HospitalAPIPermission:
     
     def has_valid_consent(self, integration, request):
         """Check if integration has valid consent for the operation"""
-        from .models import DataProcessingConsent
-        
         # Map request path to consent type
         consent_type_map = {
             '/api/integration/patients/': 'patient_data',
             '/api/integration/appointments/': 'appointment_reminders',
+            '/api/integration/reminders/': 'appointment_reminders',
             '/api/integration/emergency/': 'emergency_contact',
             '/api/integration/analytics/': 'analytics',
         }
@@ -171,26 +169,19 @@ class HospitalAPIPermission:
         if not consent_type:
             return True  # No specific consent required
         
-        try:
-            consent = DataProcessingConsent.objects.get(
-                integration=integration,
-                consent_type=consent_type,
-                status='granted'
-            )
-            return consent.is_valid()
-        except DataProcessingConsent.DoesNotExist:
-            return False
+        return get_auth_context(request).has_consent(consent_type)
     
     def is_endpoint_allowed(self, integration, request):
         """Check if endpoint is in the allowed list"""
-        allowed_endpoints = integration.allowed_endpoints or []
-        
-        if not allowed_endpoints:
-            return True  # No restrictions
-        
-        # Check if any allowed endpoint matches the request path
-        for allowed_endpoint in allowed_endpoints:
-            if request.path.startswith(allowed_endpoint):
-                return True
-        
-        return False
\ No newline at end of file
+        return get_auth_context(request).is_endpoint_allowed(request.path)
+
+
+def get_auth_context(request):
+    """
+    The PartnerAuthContext of an authenticated partner request. Falls back to
+    the database when the request was authenticated some other way.
+    """
+    if isinstance(request.auth, PartnerAuthContext):
+        return request.auth
+    from .auth_cache import load_auth_context
+    return load_auth_context(request.user.api_key)
@@ -0,0 +1,227 @@
+"""
+Keyset-paginated and streaming partner data exports.
+
+Exports are ordered by (changed_at, id), where ``changed_at`` is the row's
+``updated_at`` unless the export queryset annotates its own change time (the
+patient export uses the hospital relationship's ``export_changed_at``, which
+also counts changes to the patient). A page
+continues from the previous page's last row with a range condition instead of
+an OFFSET, and ``updated_since`` lets integrators pull only rows changed since
+their last sync.
+
+Removals: with ``updated_since`` the patient export also returns patients
+whose relationship with the hospital is no longer active, with their
+``relationship_status``; integrators should drop those. Appointments are
+cancelled, not deleted, except by the data retention purge, which hard-deletes
+appointments older than the integration's retention period. Those deletions
+do not appear in deltas; apply the same retention period locally or run a
+full export to reconcile.
+
+NDJSON mode (``?format=ndjson`` or ``Accept: application/x-ndjson``)
+streams every matching row through ``.iterator(chunk_size=...)``, so memory
+use does not grow with hospital size; its last line carries the cursor to
+resume from.
+"""
+
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.renderers import BaseRenderer
+
+EXPORT_CHUNK_SIZE = 500
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+def encode_cursor(updated_at, pk):
+    """Opaque cursor for the last row returned."""
+    payload = json.dumps({'t': updated_at.isoformat(), 'i': str(pk)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        updated_at = datetime.fromisoformat(payload['t'])
+        pk = uuid.UUID(payload['i'])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return updated_at, pk
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Selects streaming exports through content negotiation.
+
+    Export rows are streamed by ndjson_response; this renderer only renders
+    the non-streamed responses (errors) of a request that asked for NDJSON.
+    """
+    media_type = NDJSON_CONTENT_TYPE
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode()
+
+
+def parse_export_params(query_params):
+    """
+    Export options from query parameters.
+
+    ``cursor`` resumes after a previous page, ``updated_since`` (ISO 8601)
+    limits the export to rows changed since then and ``limit`` sets the page
+    size. Raises ValueError for invalid values.
+    """
+    params = {
+        'after': None,
+        'updated_since': None,
+        'limit': DEFAULT_PAGE_SIZE,
+    }
+
+    cursor = query_params.get('cursor')
+    if cursor:
+        params['after'] = decode_cursor(cursor)
+
+    updated_since = query_params.get('updated_since')
+    if updated_since:
+        parsed = parse_datetime(updated_since)
+        if parsed is None:
+            raise ValueError("updated_since must be an ISO 8601 datetime")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        params['updated_since'] = parsed
+
+    limit = query_params.get('limit')
+    if limit:
+        try:
+            params['limit'] = max(1, min(int(limit), MAX_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+
+    return params
+
+
+def keyset_queryset(queryset, updated_since=None, after=None):
+    """Order by (changed_at, pk) and skip to rows after a cursor position."""
+    if 'changed_at' not in queryset.query.annotations:
+        queryset = queryset.annotate(changed_at=F('updated_at'))
+    if updated_since:
+        queryset = queryset.filter(changed_at__gte=updated_since)
+    if after:
+        changed_at, pk = after
+        queryset = queryset.filter(Q(changed_at__gt=changed_at) | Q(changed_at=changed_at, pk__gt=pk))
+    return queryset.order_by('changed_at', 'pk')
+
+
+def export_page(queryset, serialize, limit):
+    """One page of serialized rows and the cursor for the next page (None on the last)."""
+    rows = list(queryset[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].changed_at, rows[-1].pk) if has_more else None
+    return [serialize(row) for row in rows], next_cursor
+
+
+def ndjson_lines(queryset, serialize, cursor=None, on_finish=None):
+    """
+    Yield one JSON line per row, then a trailer line with ``next_cursor``
+    (the position after the last row) and the row count.
+
+    ``on_finish(count)`` is called with the number of rows sent once the
+    stream ends, including when the client disconnects part way through.
+    """
+    count = 0
+    last = None
+    try:
+        for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield json.dumps(serialize(row), cls=DjangoJSONEncoder) + '\n'
+            last = row
+            count += 1
+
+        if last is not None:
+            cursor = encode_cursor(last.changed_at, last.pk)
+        yield json.dumps({'next_cursor': cursor, 'count': count}) + '\n'
+    finally:
+        if on_finish is not None:
+            on_finish(count)
+
+
+def ndjson_response(queryset, serialize, cursor=None, on_finish=None):
+    return StreamingHttpResponse(
+        ndjson_lines(queryset, serialize, cursor, on_finish), content_type=NDJSON_CONTENT_TYPE
+    )
+
+
+# Export querysets and row formats
+
+def patient_export_queryset(hospital, include_inactive=False):
+    """
+    Patients with an active relationship to the hospital, or with any
+    relationship if ``include_inactive`` (delta exports, to expose unlinks).
+
+    ``changed_at`` is the relationship's ``export_changed_at``, which saves
+    of either the relationship or the patient move forward, so linking,
+    reactivating or unlinking a patient, or editing it, puts the patient back
+    into ``updated_since`` deltas. Pages are served in order from the
+    (hospital, export_changed_at, patient) index.
+    """
+    from accounts.models import EnhancedPatient
+    relationship = {'hospital_relationships__hospital': hospital}
+    if not include_inactive:
+        relationship['hospital_relationships__status'] = 'active'
+    # A single filter() call so the annotations below reuse the same join
+    return EnhancedPatient.objects.filter(**relationship).annotate(
+        changed_at=F('hospital_relationships__export_changed_at'),
+        relationship_status=F('hospital_relationships__status'),
+    ).select_related('user')
+
+
+def patient_export_row(patient):
+    return {
+        'id': str(patient.id),
+        'name': patient.user.full_name,
+        'email': patient.user.email,
+        'phone': patient.phone,
+        'date_of_birth': patient.date_of_birth,
+        'gender': patient.gender,
+        'blood_type': patient.blood_type,
+        'is_active': patient.is_active,
+        'relationship_status': patient.relationship_status,
+        'updated_at': patient.changed_at,
+    }
+
+
+def appointment_export_queryset(hospital):
+    from appointments.models import Appointment
+    return Appointment.objects.filter(hospital=hospital).select_related(
+        'provider__user', 'appointment_type'
+    )
+
+
+def appointment_export_row(appointment):
+    return {
+        'id': str(appointment.id),
+        'patient_id': str(appointment.patient_id),
+        'provider_id': str(appointment.provider_id),
+        'provider_name': appointment.provider.user.full_name,
+        'appointment_type': appointment.appointment_type.name if appointment.appointment_type else None,
+        'appointment_date': appointment.appointment_date,
+        'start_time': appointment.start_time,
+        'end_time': appointment.end_time,
+        'duration': appointment.duration,
+        'status': appointment.status,
+        'priority': appointment.priority,
+        'updated_at': appointment.updated_at,
+    }
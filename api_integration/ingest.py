@@ -0,0 +1,209 @@
+"""
+Bulk ingest of partner patient and appointment records.
+
+A batch is a JSON body (``{"records": [...]}`` or a bare list) or an NDJSON
+body, optionally gzip-compressed. Every record is validated with the
+single-record serializer, duplicates within the batch are rejected, and the
+valid records are encrypted with one DataEncryption instance and upserted on
+the hospital's own record ID with ``bulk_create(update_conflicts=True)``: one
+query to tell inserts from updates and one insert per INSERT_BATCH_SIZE rows,
+however many records arrive. Results are reported per record, in input order.
+
+Ingested records are staged in PartnerPatientRecord and
+PartnerAppointmentRecord only: they are not applied to MediRemind patients or
+appointments, do not schedule reminders, and are not returned by the export
+endpoints. Responses say so with ``"staged": true``.
+
+The request body is capped by Django's DATA_UPLOAD_MAX_MEMORY_SIZE (2.5 MB by
+default), which is enforced before the body is parsed; larger batches must be
+sent gzip-compressed, and decompress to at most MAX_BATCH_BYTES.
+"""
+
+import json
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import PartnerAppointmentRecord, PartnerPatientRecord
+from .security import DataEncryption
+from .serializers import AppointmentDataSerializer, PatientDataSerializer
+
+MAX_BATCH_RECORDS = 1000
+MAX_BATCH_BYTES = 20 * 1024 * 1024  # decompressed
+INSERT_BATCH_SIZE = 500
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl')
+
+PATIENT_ENCRYPTED_FIELDS = ('phone', 'email', 'national_id', 'emergency_contact_phone')
+PATIENT_UPDATE_FIELDS = [
+    'national_id', 'name', 'phone', 'email', 'date_of_birth', 'gender', 'address',
+    'blood_type', 'allergies', 'medical_conditions',
+    'emergency_contact_name', 'emergency_contact_phone', 'emergency_contact_relationship',
+    'consent_given', 'consent_date', 'consent_version', 'updated_at',
+]
+APPOINTMENT_UPDATE_FIELDS = [
+    'patient_id', 'doctor_name', 'doctor_specialty', 'appointment_date', 'duration_minutes',
+    'appointment_type', 'specialty', 'department', 'room_number', 'status',
+    'reminder_enabled', 'reminder_time_minutes', 'notes', 'updated_at',
+]
+
+
+class BatchError(ValueError):
+    """The batch as a whole cannot be read; ``status_code`` is the HTTP status to return."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def body_too_large():
+    """BatchError for a body over DATA_UPLOAD_MAX_MEMORY_SIZE, which Django refuses to read."""
+    return BatchError(
+        f"Request body exceeds {settings.DATA_UPLOAD_MAX_MEMORY_SIZE} bytes; send larger batches "
+        f"gzip-compressed (up to {MAX_BATCH_BYTES} bytes decompressed)",
+        status_code=413
+    )
+
+
+def _decompress(body):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_BATCH_BYTES)
+    except zlib.error:
+        raise BatchError("Body is not valid gzip")
+    if decompressor.unconsumed_tail:
+        raise BatchError(f"Batch exceeds {MAX_BATCH_BYTES} bytes", status_code=413)
+    return data
+
+
+def parse_batch(body, content_type='', content_encoding=''):
+    """Records of a batch request body, raising BatchError if it cannot be read."""
+    if 'gzip' in content_encoding or content_type.startswith('application/gzip'):
+        body = _decompress(body)
+    elif len(body) > MAX_BATCH_BYTES:
+        raise BatchError(f"Batch exceeds {MAX_BATCH_BYTES} bytes", status_code=413)
+
+    try:
+        text = body.decode('utf-8')
+        if content_type.startswith(NDJSON_CONTENT_TYPES) or 'ndjson' in content_type:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            records = json.loads(text) if text.strip() else []
+            if isinstance(records, dict):
+                records = records.get('records')
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise BatchError(f"Malformed batch: {e}")
+
+    if not isinstance(records, list):
+        raise BatchError("Batch must be a list of records")
+    if not records:
+        raise BatchError("Batch contains no records")
+    if len(records) > MAX_BATCH_RECORDS:
+        raise BatchError(f"Batch exceeds {MAX_BATCH_RECORDS} records", status_code=413)
+    return records
+
+
+def _validate(records, serializer_class, key):
+    """
+    Validate records; returns (results, valid) where ``valid`` maps a record
+    key to (index, validated data). A key seen earlier in the batch is an error.
+    """
+    results = [None] * len(records)
+    valid = {}
+    for index, record in enumerate(records):
+        serializer = serializer_class(data=record) if isinstance(record, dict) else None
+        if serializer is None or not serializer.is_valid():
+            errors = serializer.errors if serializer is not None else {'non_field_errors': ['Record must be an object']}
+            results[index] = {'index': index, key: record.get(key) if isinstance(record, dict) else None,
+                              'status': 'error', 'errors': errors}
+            continue
+        data = serializer.validated_data
+        if data[key] in valid:
+            results[index] = {'index': index, key: data[key], 'status': 'error',
+                              'errors': {key: [f"Duplicate {key} in batch"]}}
+            continue
+        valid[data[key]] = (index, data)
+    return results, valid
+
+
+def _upsert(model, hospital, key, rows, update_fields):
+    """Upsert rows on (hospital, key); returns the set of keys that already existed."""
+    with transaction.atomic():
+        existing = set(
+            model.objects.filter(hospital=hospital, **{f'{key}__in': [getattr(row, key) for row in rows]})
+            .values_list(key, flat=True)
+        )
+        model.objects.bulk_create(
+            rows,
+            batch_size=INSERT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['hospital', key],
+            update_fields=update_fields,
+        )
+    return existing
+
+
+def _finish(results, valid, key, existing):
+    for record_key, (index, _) in valid.items():
+        results[index] = {'index': index, key: record_key,
+                          'status': 'updated' if record_key in existing else 'created'}
+    return results
+
+
+def ingest_patients(integration, records):
+    """Validate, encrypt and upsert patient records; returns per-record results in input order."""
+    results, valid = _validate(records, PatientDataSerializer, 'patient_id')
+    if not valid:
+        return results
+
+    encryption = DataEncryption() if integration.encryption_enabled else None
+    rows = []
+    for _, data in valid.values():
+        if encryption:
+            for field in PATIENT_ENCRYPTED_FIELDS:
+                if data.get(field):
+                    data[field] = encryption.encrypt_data(data[field])
+        rows.append(PartnerPatientRecord(hospital=integration.hospital, **data))
+
+    existing = _upsert(PartnerPatientRecord, integration.hospital, 'patient_id', rows, PATIENT_UPDATE_FIELDS)
+    return _finish(results, valid, 'patient_id', existing)
+
+
+def ingest_appointments(integration, records):
+    """
+    Validate and upsert appointment records; returns per-record results in input order.
+
+    An appointment must reference a patient already ingested for the hospital
+    (checked for the whole batch in one query).
+    """
+    results, valid = _validate(records, AppointmentDataSerializer, 'appointment_id')
+
+    known_patients = set(
+        PartnerPatientRecord.objects.filter(
+            hospital=integration.hospital,
+            patient_id__in={data['patient_id'] for _, data in valid.values()},
+        ).values_list('patient_id', flat=True)
+    ) if valid else set()
+    for appointment_id, (index, data) in list(valid.items()):
+        if data['patient_id'] not in known_patients:
+            results[index] = {'index': index, 'appointment_id': appointment_id, 'status': 'error',
+                              'errors': {'patient_id': ["Unknown patient_id"]}}
+            del valid[appointment_id]
+    if not valid:
+        return results
+
+    rows = [
+        PartnerAppointmentRecord(hospital=integration.hospital, **data)
+        for _, data in valid.values()
+    ]
+    existing = _upsert(PartnerAppointmentRecord, integration.hospital, 'appointment_id', rows,
+                       APPOINTMENT_UPDATE_FIELDS)
+    return _finish(results, valid, 'appointment_id', existing)
+
+
+def summarize(results):
+    """Counts of created, updated and failed records."""
+    summary = {'created': 0, 'updated': 0, 'failed': 0}
+    for result in results:
+        summary['failed' if result['status'] == 'error' else result['status']] += 1
+    return summary
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_integration', '0002_alter_hospitalintegration_api_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apilog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
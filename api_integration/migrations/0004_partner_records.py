@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:24
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_export_keyset_index'),
+        ('api_integration', '0003_apilog_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartnerAppointmentRecord',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('appointment_id', models.CharField(help_text="Appointment ID in the hospital's system", max_length=100)),
+                ('patient_id', models.CharField(help_text="Patient ID in the hospital's system", max_length=100)),
+                ('doctor_name', models.CharField(max_length=255)),
+                ('doctor_specialty', models.CharField(blank=True, max_length=100)),
+                ('appointment_date', models.DateTimeField()),
+                ('duration_minutes', models.PositiveIntegerField()),
+                ('appointment_type', models.CharField(max_length=20)),
+                ('specialty', models.CharField(blank=True, max_length=100)),
+                ('department', models.CharField(blank=True, max_length=100)),
+                ('room_number', models.CharField(blank=True, max_length=20)),
+                ('status', models.CharField(default='scheduled', max_length=20)),
+                ('reminder_enabled', models.BooleanField(default=True)),
+                ('reminder_time_minutes', models.IntegerField(default=60)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='partner_appointments', to='accounts.hospital')),
+            ],
+            options={
+                'verbose_name': 'Partner Appointment Record',
+                'verbose_name_plural': 'Partner Appointment Records',
+                'db_table': 'partner_appointment_records',
+                'indexes': [models.Index(fields=['hospital', 'patient_id'], name='partner_app_hospita_cc62ff_idx'), models.Index(fields=['hospital', 'appointment_date'], name='partner_app_hospita_aa9872_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hospital', 'appointment_id'), name='partner_appointment_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PartnerPatientRecord',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('patient_id', models.CharField(help_text="Patient ID in the hospital's system", max_length=100)),
+                ('national_id', models.TextField(blank=True)),
+                ('name', models.CharField(max_length=255)),
+                ('phone', models.TextField()),
+                ('email', models.TextField(blank=True)),
+                ('date_of_birth', models.DateField(blank=True, null=True)),
+                ('gender', models.CharField(blank=True, max_length=1)),
+                ('address', models.TextField(blank=True)),
+                ('blood_type', models.CharField(blank=True, max_length=10)),
+                ('allergies', models.JSONField(default=list)),
+                ('medical_conditions', models.JSONField(default=list)),
+                ('emergency_contact_name', models.CharField(blank=True, max_length=255)),
+                ('emergency_contact_phone', models.TextField(blank=True)),
+                ('emergency_contact_relationship', models.CharField(blank=True, max_length=100)),
+                ('consent_given', models.BooleanField(default=True)),
+                ('consent_date', models.DateTimeField(blank=True, null=True)),
+                ('consent_version', models.CharField(default='1.0', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='partner_patients', to='accounts.hospital')),
+            ],
+            options={
+                'verbose_name': 'Partner Patient Record',
+                'verbose_name_plural': 'Partner Patient Records',
+                'db_table': 'partner_patient_records',
+                'constraints': [models.UniqueConstraint(fields=('hospital', 'patient_id'), name='partner_patient_unique')],
+            },
+        ),
+    ]
@@ -119,8 +119,8 @@ class APILog(models.Model):
     message = models.TextField()
     error_details = models.TextField(blank=True)
     
-    # Timestamps
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Timestamps (set when the request is logged, not when the buffered row is written)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         db_table = 'api_logs'
@@ -263,4 +263,102 @@ class SecurityIncident(models.Model):
     
     def requires_odpc_notification(self):
         """Check if incident requires notification to ODPC within 72 hours"""
-        return self.severity in ['high', 'critical'] and self.affected_data_subjects > 0
\ No newline at end of file
+        return self.severity in ['high', 'critical'] and self.affected_data_subjects > 0
+
+class PartnerPatientRecord(models.Model):
+    """
+    Patient record pushed by a hospital's HMS, keyed by the hospital's own patient ID.
+
+    Staged only: nothing applies these rows to EnhancedPatient yet.
+
+    Contact and identity fields hold DataEncryption ciphertext when the
+    integration has encryption enabled.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    hospital = models.ForeignKey('accounts.Hospital', on_delete=models.CASCADE, related_name='partner_patients')
+    patient_id = models.CharField(max_length=100, help_text="Patient ID in the hospital's system")
+    
+    national_id = models.TextField(blank=True)
+    name = models.CharField(max_length=255)
+    phone = models.TextField()
+    email = models.TextField(blank=True)
+    date_of_birth = models.DateField(null=True, blank=True)
+    gender = models.CharField(max_length=1, blank=True)
+    address = models.TextField(blank=True)
+    
+    # Medical information
+    blood_type = models.CharField(max_length=10, blank=True)
+    allergies = models.JSONField(default=list)
+    medical_conditions = models.JSONField(default=list)
+    
+    # Emergency contact
+    emergency_contact_name = models.CharField(max_length=255, blank=True)
+    emergency_contact_phone = models.TextField(blank=True)
+    emergency_contact_relationship = models.CharField(max_length=100, blank=True)
+    
+    # Consent information
+    consent_given = models.BooleanField(default=True)
+    consent_date = models.DateTimeField(null=True, blank=True)
+    consent_version = models.CharField(max_length=20, default='1.0')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'partner_patient_records'
+        verbose_name = 'Partner Patient Record'
+        verbose_name_plural = 'Partner Patient Records'
+        constraints = [
+            models.UniqueConstraint(fields=['hospital', 'patient_id'], name='partner_patient_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.hospital.name} - patient {self.patient_id}"
+
+
+class PartnerAppointmentRecord(models.Model):
+    """
+    Appointment pushed by a hospital's HMS, keyed by the hospital's own appointment ID.
+
+    Staged only: nothing applies these rows to Appointment or schedules reminders for them yet.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    hospital = models.ForeignKey('accounts.Hospital', on_delete=models.CASCADE, related_name='partner_appointments')
+    appointment_id = models.CharField(max_length=100, help_text="Appointment ID in the hospital's system")
+    patient_id = models.CharField(max_length=100, help_text="Patient ID in the hospital's system")
+    
+    doctor_name = models.CharField(max_length=255)
+    doctor_specialty = models.CharField(max_length=100, blank=True)
+    appointment_date = models.DateTimeField()
+    duration_minutes = models.PositiveIntegerField()
+    appointment_type = models.CharField(max_length=20)
+    specialty = models.CharField(max_length=100, blank=True)
+    
+    # Location
+    department = models.CharField(max_length=100, blank=True)
+    room_number = models.CharField(max_length=20, blank=True)
+    
+    status = models.CharField(max_length=20, default='scheduled')
+    reminder_enabled = models.BooleanField(default=True)
+    reminder_time_minutes = models.IntegerField(default=60)
+    notes = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'partner_appointment_records'
+        verbose_name = 'Partner Appointment Record'
+        verbose_name_plural = 'Partner Appointment Records'
+        constraints = [
+            models.UniqueConstraint(fields=['hospital', 'appointment_id'], name='partner_appointment_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['hospital', 'patient_id']),
+            models.Index(fields=['hospital', 'appointment_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.hospital.name} - appointment {self.appointment_id}"
@@ -1,7 +1,12 @@
 import hashlib
 import hmac
+import logging
+import math
 import secrets
 import json
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from django.conf import settings
@@ -9,6 +14,8 @@ from django.utils import timezone
 from cryptography.fernet import Fernet
 import base64
 
+logger = logging.getLogger(__name__)
+
 class APIKeyGenerator:
     """Secure API key generation and management"""
     
@@ -67,23 +74,25 @@ class RequestSignature:
     """HMAC signature verification for API requests"""
     
     @staticmethod
-    def generate_signature(secret: str, payload: str, timestamp: str) -> str:
-        """Generate HMAC signature"""
-        message = f"{timestamp}:{payload}"
+    def generate_signature(secret: str, payload, timestamp: str) -> str:
+        """Generate HMAC signature; payload may be str or raw bytes (e.g. a gzip body)"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        message = f"{timestamp}:".encode() + payload
         signature = hmac.new(
             secret.encode(),
-            message.encode(),
+            message,
             hashlib.sha256
         ).hexdigest()
         return signature
     
     @staticmethod
-    def verify_signature(secret: str, payload: str, timestamp: str, signature: str, 
+    def verify_signature(secret: str, payload, timestamp: str, signature: str, 
                         max_age: int = 300) -> bool:
         """Verify HMAC signature and timestamp"""
         # Check timestamp to prevent replay attacks
         try:
-            request_time = datetime.fromtimestamp(int(timestamp))
+            request_time = timezone.make_aware(datetime.fromtimestamp(int(timestamp)))
             current_time = timezone.now()
             
             if abs((current_time - request_time).total_seconds()) > max_age:
@@ -95,40 +104,206 @@ class RequestSignature:
         expected_signature = RequestSignature.generate_signature(secret, payload, timestamp)
         return hmac.compare_digest(expected_signature, signature)
 
+# GCRA over several windows in one atomic round trip. Each key holds the
+# window's theoretical arrival time (TAT) in milliseconds. A request is allowed
+# only if every window allows it, and only then are the TATs advanced, so a
+# rejected request does not use up quota. Time comes from the Redis server so
+# application clocks do not need to agree.
+#   KEYS: one TAT key per window
+#   ARGV: consume flag (1/0), then a limit and a period in ms for each key
+#   Returns: allowed flag, then remaining, reset ms and retry-after ms per key
+RATE_LIMIT_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local consume = tonumber(ARGV[1]) == 1
+local allowed = 1
+local tats = {}
+local result = {}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local period = tonumber(ARGV[i * 2 + 1])
+    local interval = period / limit
+    local tat = math.max(tonumber(redis.call('GET', key) or now), now)
+    local new_tat = tat + interval
+    local remaining, reset, retry_after
+    if new_tat - now > period then
+        allowed = 0
+        remaining = 0
+        reset = tat - now
+        retry_after = new_tat - now - period
+    else
+        remaining = math.floor((period - (new_tat - now)) / interval)
+        reset = new_tat - now
+        retry_after = 0
+    end
+    tats[i] = new_tat
+    table.insert(result, remaining)
+    table.insert(result, math.ceil(reset))
+    table.insert(result, math.ceil(retry_after))
+end
+if allowed == 1 and consume then
+    for i, key in ipairs(KEYS) do
+        redis.call('SET', key, tostring(tats[i]), 'PX', math.max(1, math.ceil(tats[i] - now)))
+    end
+end
+table.insert(result, 1, allowed)
+return result
+"""
+
+RATE_LIMIT_WINDOWS = {
+    'per_minute': 60,
+    'per_hour': 3600,
+    'per_day': 86400,
+}
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of a rate limit check for the most restrictive window"""
+    allowed: bool
+    window: str
+    limit: int
+    remaining: int
+    reset_seconds: int
+    retry_after: int = 0
+    
+    def headers(self) -> Dict[str, str]:
+        """X-RateLimit-* response headers"""
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(self.reset_seconds),
+            'X-RateLimit-Window': self.window,
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+
 class RateLimiter:
-    """Rate limiting utilities"""
+    """
+    GCRA rate limiter checking several windows atomically.
+    
+    Uses a Lua script on Redis (one round trip per check). When Redis is not
+    configured or unreachable, the same algorithm runs in process so limits
+    still apply per worker; Redis is retried after REDIS_RETRY_SECONDS.
+    """
+    
+    REDIS_RETRY_SECONDS = 30
     
     def __init__(self, redis_client=None):
         self.redis_client = redis_client
+        self._script = None
+        self._redis_down_until = 0.0
+        self._local_tats = {}
+        self._local_lock = threading.Lock()
     
-    def is_rate_limited(self, api_key: str, limit_type: str, limit: int, 
-                       window_seconds: int = 3600) -> bool:
-        """Check if request is rate limited"""
-        if not self.redis_client:
-            return False
-        
-        key = f"rate_limit:{api_key}:{limit_type}"
-        current_count = self.redis_client.get(key) or 0
+    def check(self, identity: str, limits, consume: bool = True) -> RateLimitResult:
+        """
+        Check and (if allowed) count a request against every window.
         
-        if int(current_count) >= limit:
-            return True
+        ``limits`` is a list of ``(window_name, limit, period_seconds)``.
+        """
+        limits = [(name, int(limit), int(period)) for name, limit, period in limits if limit and limit > 0]
+        if not limits:
+            return RateLimitResult(True, '', 0, 0, 0)
         
-        # Increment counter
-        pipe = self.redis_client.pipeline()
-        pipe.incr(key)
-        pipe.expire(key, window_seconds)
-        pipe.execute()
+        keys = [f"rate_limit:{{{identity}}}:{name}" for name, _, _ in limits]
+        args = [1 if consume else 0]
+        for _, limit, period in limits:
+            args.extend([limit, period * 1000])
         
-        return False
+        raw = self._check_redis(keys, args)
+        if raw is None:
+            raw = self._check_local(keys, args)
+        return self._result(limits, raw)
+    
+    def is_rate_limited(self, api_key: str, limit_type: str, limit: int,
+                       window_seconds: int = 3600) -> bool:
+        """Check if request is rate limited"""
+        return not self.check(api_key, [(limit_type, limit, window_seconds)]).allowed
     
-    def get_remaining_requests(self, api_key: str, limit_type: str, limit: int) -> int:
+    def get_remaining_requests(self, api_key: str, limit_type: str, limit: int,
+                               window_seconds: int = None) -> int:
         """Get remaining requests for rate limit"""
-        if not self.redis_client:
-            return limit
-        
-        key = f"rate_limit:{api_key}:{limit_type}"
-        current_count = self.redis_client.get(key) or 0
-        return max(0, limit - int(current_count))
+        window_seconds = window_seconds or RATE_LIMIT_WINDOWS.get(limit_type, 3600)
+        result = self.check(api_key, [(limit_type, limit, window_seconds)], consume=False)
+        # A non-consuming check reports what would remain after one more request
+        return result.remaining + 1 if result.allowed else 0
+    
+    def _check_redis(self, keys, args):
+        if not self.redis_client or time.monotonic() < self._redis_down_until:
+            return None
+        try:
+            if self._script is None:
+                self._script = self.redis_client.register_script(RATE_LIMIT_SCRIPT)
+            return [int(value) for value in self._script(keys=keys, args=args)]
+        except Exception as e:
+            logger.warning(f"Redis rate limiting unavailable, using in-process limits: {e}")
+            self._redis_down_until = time.monotonic() + self.REDIS_RETRY_SECONDS
+            return None
+    
+    def _check_local(self, keys, args):
+        """In-process equivalent of RATE_LIMIT_SCRIPT"""
+        now = time.time() * 1000
+        consume = args[0] == 1
+        allowed = 1
+        tats = []
+        result = []
+        with self._local_lock:
+            for i, key in enumerate(keys):
+                limit, period = args[1 + i * 2], args[2 + i * 2]
+                interval = period / limit
+                tat = max(self._local_tats.get(key, now), now)
+                new_tat = tat + interval
+                if new_tat - now > period:
+                    allowed = 0
+                    result.extend([0, math.ceil(tat - now), math.ceil(new_tat - now - period)])
+                else:
+                    result.extend([math.floor((period - (new_tat - now)) / interval), math.ceil(new_tat - now), 0])
+                tats.append(new_tat)
+            if allowed and consume:
+                for key, tat in zip(keys, tats):
+                    self._local_tats[key] = tat
+        return [allowed] + result
+    
+    def _result(self, limits, raw):
+        allowed = raw[0] == 1
+        windows = [
+            RateLimitResult(
+                allowed=raw[1 + i * 3 + 2] == 0,
+                window=name,
+                limit=limit,
+                remaining=raw[1 + i * 3],
+                reset_seconds=math.ceil(raw[1 + i * 3 + 1] / 1000),
+                retry_after=math.ceil(raw[1 + i * 3 + 2] / 1000),
+            )
+            for i, (name, limit, _) in enumerate(limits)
+        ]
+        if allowed:
+            tightest = min(windows, key=lambda window: (window.remaining, -window.reset_seconds))
+        else:
+            tightest = max((window for window in windows if not window.allowed),
+                           key=lambda window: window.retry_after)
+        tightest.allowed = allowed
+        return tightest
+
+
+_partner_rate_limiter = None
+
+
+def get_partner_rate_limiter() -> RateLimiter:
+    """Process-wide partner API rate limiter on the shared Redis connection pool"""
+    global _partner_rate_limiter
+    if _partner_rate_limiter is None:
+        try:
+            from redis_pool_config import get_redis_connection
+            redis_client = get_redis_connection()
+        except Exception as e:
+            logger.warning(f"Redis connection pool unavailable for rate limiting: {e}")
+            redis_client = None
+        _partner_rate_limiter = RateLimiter(redis_client)
+    return _partner_rate_limiter
 
 class DataValidator:
     """Data validation utilities for healthcare data"""
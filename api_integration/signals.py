@@ -1,7 +1,10 @@
 import logging
 from django.db.models.signals import post_save, post_delete, post_init
+from django.db import transaction
 from django.dispatch import receiver
 from django.utils import timezone
+from accounts.models import Hospital
+from .auth_cache import get_partner_auth_cache
 from .models import HospitalIntegration, DataProcessingConsent, SecurityIncident
 
 logger = logging.getLogger(__name__)
@@ -46,4 +49,17 @@ def log_consent_changes(sender, instance, created, **kwargs):
                     severity="medium",
                     incident_type="consent_withdrawal",
                     source="user"
-                )
\ No newline at end of file
+                )
+
+@receiver(post_save, sender=HospitalIntegration)
+@receiver(post_delete, sender=HospitalIntegration)
+@receiver(post_save, sender=DataProcessingConsent)
+@receiver(post_delete, sender=DataProcessingConsent)
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+def invalidate_partner_auth_cache(sender, **kwargs):
+    """Drop cached partner auth contexts when integrations, keys, consents or hospitals change"""
+    cache = get_partner_auth_cache()
+    cache.invalidate()
+    # Again after commit, in case a request re-cached the old rows in between
+    transaction.on_commit(cache.invalidate)
@@ -3,17 +3,52 @@
 import json
 import hmac
 import hashlib
+import os
+import shutil
+import tempfile
 import time
-from django.test import TransactionTestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 from rest_framework import status
 from rest_framework.test import APITestCase
 
 from accounts.models import Hospital
 from .models import HospitalIntegration, DataProcessingConsent, APILog, SecurityIncident
 from .security import APIKeyGenerator, DataEncryption, RequestSignature
+from .auth_cache import PartnerAuthCache
+
+journal_settings = None
+writer_patches = []
+audit_writer = None
+
+
+def setUpModule():
+    """
+    Route audit logs of test requests to a private writer journaling to a
+    temporary directory. It has no background thread, so rows reach the
+    database only when a test flushes them (a background flush racing a
+    TransactionTestCase teardown locks sqlite), and nothing is left for the
+    global writer to flush at exit, after the test database is gone.
+    """
+    from unittest import mock
+    from .audit import AuditLogWriter
+    global journal_settings, audit_writer
+    journal_settings = override_settings(API_AUDIT_JOURNAL_DIR=tempfile.mkdtemp())
+    journal_settings.enable()
+    audit_writer = AuditLogWriter(autostart=False)
+    for target in ('api_integration.audit.audit_log_writer', 'api_integration.authentication.audit_log_writer'):
+        patcher = mock.patch(target, audit_writer)
+        patcher.start()
+        writer_patches.append(patcher)
+
+
+def tearDownModule():
+    while writer_patches:
+        writer_patches.pop().stop()
+    shutil.rmtree(journal_settings.options['API_AUDIT_JOURNAL_DIR'], ignore_errors=True)
+    journal_settings.disable()
 
 class HospitalIntegrationTestCase(TransactionTestCase):
     """Test cases for hospital integration API"""
@@ -37,7 +72,8 @@ class HospitalIntegrationTestCase(TransactionTestCase):
             api_secret=APIKeyGenerator.generate_api_key(),  # Use same function for secret
             status="active",
             data_retention_days=2555,
-            encryption_enabled=True
+            encryption_enabled=True,
+            data_processing_agreement_signed=True
         )
         
         # Force save to ensure it's committed to database
@@ -259,15 +295,20 @@ class HospitalIntegrationTestCase(TransactionTestCase):
         response = self.client.get(url, **headers)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
-        # Check that log was created
-        self.assertEqual(APILog.objects.count(), initial_log_count + 1)
+        # Audit logs are buffered until the writer flushes them
+        self.assertEqual(APILog.objects.count(), initial_log_count)
+        audit_writer.flush()
         
-        # Verify log details
-        log = APILog.objects.latest('created_at')
-        self.assertEqual(log.integration, self.integration)
-        self.assertEqual(log.method, 'GET')
-        self.assertEqual(log.status_code, 200)
-        self.assertEqual(log.auth_status, 'success')
+        # Authentication and the view each log the request
+        logs = APILog.objects.order_by('created_at')[initial_log_count:]
+        self.assertEqual(
+            [log.message for log in logs], ['Authentication successful', 'Patient data accessed']
+        )
+        for log in logs:
+            self.assertEqual(log.integration, self.integration)
+            self.assertEqual(log.method, 'GET')
+            self.assertEqual(log.status_code, 200)
+            self.assertEqual(log.auth_status, 'success')
     
     def test_rate_limiting(self):
         """Test rate limiting functionality"""
@@ -410,4 +451,760 @@ class DataRetentionTestCase(TransactionTestCase):
         expected_date = timezone.now() - timedelta(days=expected_days)
         
         # Should be approximately equal (within 1 minute)
-        self.assertLess(abs((retention_date - expected_date).total_seconds()), 60)
\ No newline at end of file
+        self.assertLess(abs((retention_date - expected_date).total_seconds()), 60)
+
+class AuditLogWriterTestCase(TestCase):
+    """Test cases for the buffered audit log writer"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.hospital = Hospital.objects.create(
+            name="Test Hospital",
+            hospital_type="private",
+            email="admin@testhospital.co.ke",
+            phone="+254700123456"
+        )
+        self.integration = HospitalIntegration.objects.create(
+            hospital=self.hospital,
+            api_key=APIKeyGenerator.generate_api_key(),
+            api_secret=APIKeyGenerator.generate_api_key(),
+            status="active"
+        )
+        self.request = RequestFactory().get('/api/integration/patients/', REMOTE_ADDR='10.0.0.1')
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir, ignore_errors=True)
+    
+    def _writer(self, **kwargs):
+        from .audit import AuditLogWriter
+        return AuditLogWriter(autostart=False, journal_dir=self.journal_dir, **kwargs)
+    
+    def _journal(self):
+        return sorted(name for name in os.listdir(self.journal_dir) if name.startswith('audit-'))
+    
+    def _log(self, writer, count=1):
+        from .audit import build_api_log
+        for i in range(count):
+            writer.log(build_api_log(self.request, self.integration, 200, f'Request {i}'))
+    
+    def test_logs_buffered_until_flush(self):
+        """Logging does not touch the database; a flush writes the batch in one insert"""
+        writer = self._writer()
+        logged_at = timezone.now()
+        with self.assertNumQueries(0):
+            self._log(writer, 3)
+        self.assertEqual(len(self._journal()), 1)
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(writer.flush(), 3)
+        
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(self._journal(), [])
+        log = APILog.objects.order_by('created_at').first()
+        self.assertEqual(log.endpoint, '/api/integration/patients/')
+        self.assertEqual(log.ip_address, '10.0.0.1')
+        self.assertLess(abs((log.created_at - logged_at).total_seconds()), 1)
+    
+    def test_failed_flush_is_retried_without_duplicates(self):
+        """A failed write keeps the batch; retrying an already written batch does not duplicate it"""
+        from unittest import mock
+        writer = self._writer()
+        self._log(writer, 2)
+        
+        bulk_create = APILog.objects.bulk_create
+        
+        def write_then_fail(*args, **kwargs):
+            bulk_create(*args, **kwargs)
+            raise Exception('connection lost before the commit was acknowledged')
+        
+        with mock.patch.object(APILog.objects, 'bulk_create', side_effect=write_then_fail):
+            self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.pending(), 2)
+        
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(APILog.objects.count(), 2)
+    
+    def test_full_buffer_flushes_synchronously(self):
+        """Overflowing the buffer writes records instead of dropping them"""
+        writer = self._writer(max_records=5)
+        self._log(writer, 5)
+        
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(APILog.objects.count(), 5)
+    
+    def test_outage_caps_buffer_without_losing_records(self):
+        """While the database is down, requests neither retry the write nor grow the buffer past its cap"""
+        from unittest import mock
+        writer = self._writer(max_records=5, batch_size=2)
+        self._log(writer, 4)
+        
+        with mock.patch.object(APILog.objects, 'bulk_create', side_effect=Exception('db down')) as bulk_create:
+            self.assertEqual(writer.flush(), 0)
+            self._log(writer, 10)
+        
+        self.assertEqual(bulk_create.call_count, 1)
+        self.assertEqual(writer.pending(), 5)
+        self.assertEqual(writer.evicted, 9)
+        self.assertEqual([r.message for _, r in writer.records], [f'Request {i}' for i in range(5, 10)])
+        
+        self.assertEqual(writer.flush(), 14)
+        self.assertFalse(writer._backing_off())
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(APILog.objects.count(), 14)
+        self.assertEqual(self._journal(), [])
+    
+    def test_journal_of_killed_process_is_replayed(self):
+        """Records buffered by a process that died are written by the next flush in any process"""
+        writer = self._writer()
+        self._log(writer, 3)
+        survivor = self._writer()
+        
+        self.assertEqual(survivor.flush(), 0)  # The owner still holds its journal
+        self.assertEqual(len(self._journal()), 1)
+        
+        for segment in writer._segments:
+            segment.handle.close()  # What SIGKILL leaves behind: the file, unlocked
+        with open(os.path.join(self.journal_dir, self._journal()[0]), 'ab') as f:
+            f.write(b'{"model": "api_integration.apilog", "pk"')  # Cut short mid-write
+        
+        self.assertEqual(survivor.flush(), 3)
+        self.assertEqual(sorted(APILog.objects.values_list('message', flat=True)),
+                         ['Request 0', 'Request 1', 'Request 2'])
+        self.assertEqual(self._journal(), [])
+    
+    def test_request_fails_when_journal_and_database_are_unavailable(self):
+        """Without a journal a record is written synchronously, and a failed write fails the request"""
+        from unittest import mock
+        from .audit import AuditLogUnavailable
+        writer = self._writer(max_journal_bytes=0)
+        self._log(writer)
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(APILog.objects.count(), 1)
+        
+        with mock.patch.object(APILog.objects, 'bulk_create', side_effect=Exception('db down')):
+            with self.assertRaises(AuditLogUnavailable):
+                self._log(writer)
+    
+    def test_last_accessed_written_at_most_once_a_minute(self):
+        """Repeated accesses within a minute produce a single last_accessed write"""
+        writer = self._writer()
+        now = timezone.now()
+        
+        writer.touch(self.integration, now)
+        writer.touch(self.integration, now + timedelta(seconds=30))
+        with self.assertNumQueries(1):
+            writer.flush()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.last_accessed, now)
+        
+        writer.touch(self.integration, now + timedelta(seconds=45))
+        self.assertEqual(writer.last_accessed, {})
+        writer.touch(self.integration, now + timedelta(seconds=61))
+        writer.flush()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.last_accessed, now + timedelta(seconds=61))
+
+
+class FakeRateLimitScript:
+    """Stands in for a registered Redis script, returning a canned reply"""
+    
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+    
+    def __call__(self, keys, args):
+        self.calls.append((keys, args))
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+class FakeRedis:
+    def __init__(self, reply):
+        self.script = FakeRateLimitScript(reply)
+    
+    def register_script(self, source):
+        return self.script
+
+
+class RateLimiterTestCase(TestCase):
+    """Test cases for the GCRA rate limiter"""
+    
+    def test_limit_enforced_with_remaining_quota(self):
+        """Requests are allowed up to the limit, then rejected with a retry time"""
+        from .security import RateLimiter
+        limiter = RateLimiter(None)
+        limits = [('per_minute', 3, 60)]
+        
+        remaining = [limiter.check('key', limits).remaining for _ in range(3)]
+        rejected = limiter.check('key', limits)
+        
+        self.assertEqual(remaining, [2, 1, 0])
+        self.assertFalse(rejected.allowed)
+        self.assertGreater(rejected.retry_after, 0)
+        self.assertLessEqual(rejected.retry_after, 20)
+        self.assertEqual(rejected.headers()['Retry-After'], str(rejected.retry_after))
+        self.assertTrue(limiter.check('other-key', limits).allowed)
+    
+    def test_rejected_request_does_not_consume_other_windows(self):
+        """A request rejected by one window leaves the other windows untouched"""
+        from .security import RateLimiter
+        limiter = RateLimiter(None)
+        limits = [('per_minute', 2, 60), ('per_hour', 5, 3600)]
+        
+        results = [limiter.check('key', limits) for _ in range(4)]
+        
+        self.assertEqual([result.allowed for result in results], [True, True, False, False])
+        self.assertEqual(results[1].window, 'per_minute')
+        self.assertEqual(results[2].window, 'per_minute')
+        self.assertEqual(limiter.get_remaining_requests('key', 'per_hour', 5), 3)
+    
+    def test_redis_checks_all_windows_in_one_call(self):
+        """All windows go to Redis in a single script call"""
+        from .security import RateLimiter
+        redis_client = FakeRedis([1, 4, 15000, 0, 99, 3600000, 0])
+        limiter = RateLimiter(redis_client)
+        
+        result = limiter.check('integration-1', [('per_minute', 5, 60), ('per_hour', 100, 3600)])
+        
+        keys, args = redis_client.script.calls[0]
+        self.assertEqual(len(redis_client.script.calls), 1)
+        self.assertEqual(keys, ['rate_limit:{integration-1}:per_minute', 'rate_limit:{integration-1}:per_hour'])
+        self.assertEqual(args, [1, 5, 60000, 100, 3600000])
+        self.assertEqual(result.headers(), {
+            'X-RateLimit-Limit': '5',
+            'X-RateLimit-Remaining': '4',
+            'X-RateLimit-Reset': '15',
+            'X-RateLimit-Window': 'per_minute',
+        })
+    
+    def test_redis_failure_falls_back_to_local_limits(self):
+        """Limits still apply in process while Redis is unreachable"""
+        from .security import RateLimiter
+        redis_client = FakeRedis(ConnectionError('unreachable'))
+        limiter = RateLimiter(redis_client)
+        limits = [('per_minute', 1, 60)]
+        
+        self.assertTrue(limiter.check('key', limits).allowed)
+        self.assertFalse(limiter.check('key', limits).allowed)
+        self.assertEqual(len(redis_client.script.calls), 1)
+    
+    def test_partner_requests_get_rate_limit_headers(self):
+        """Partner responses carry X-RateLimit-* headers and over-limit requests get 429"""
+        from unittest import mock
+        from rest_framework.test import APIClient
+        from .audit import AuditLogWriter
+        from .security import RateLimiter
+        
+        hospital = Hospital.objects.create(
+            name="Test Hospital",
+            hospital_type="private",
+            email="admin@testhospital.co.ke",
+            phone="+254700123456"
+        )
+        integration = HospitalIntegration.objects.create(
+            hospital=hospital,
+            api_key=APIKeyGenerator.generate_api_key(),
+            api_secret=APIKeyGenerator.generate_api_key(),
+            status="active",
+            rate_limit_per_minute=1
+        )
+        client = APIClient()
+        url = reverse('api_integration:patient-data')
+        
+        def get():
+            timestamp = str(int(time.time()))
+            signature = RequestSignature.generate_signature(integration.api_secret, '', timestamp)
+            return client.get(url, secure=True, HTTP_X_API_KEY=integration.api_key,
+                              HTTP_X_TIMESTAMP=timestamp, HTTP_X_SIGNATURE=signature)
+        
+        with mock.patch('api_integration.authentication.get_partner_rate_limiter',
+                        return_value=RateLimiter(None)), \
+             mock.patch('api_integration.authentication.get_partner_auth_cache',
+                        return_value=PartnerAuthCache(None)), \
+             mock.patch('api_integration.authentication.audit_log_writer', AuditLogWriter(autostart=False)):
+            first = get()
+            second = get()
+        
+        self.assertEqual(first['X-RateLimit-Limit'], '1')
+        self.assertEqual(first['X-RateLimit-Remaining'], '0')
+        self.assertEqual(second.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', second)
+    
+    def test_unsigned_requests_do_not_spend_partner_quota(self):
+        """Requests without a valid signature are throttled per IP, not charged to the partner"""
+        from unittest import mock
+        from rest_framework.test import APIClient
+        from .audit import AuditLogWriter
+        from .authentication import FAILED_SIGNATURE_LIMITS
+        from .security import RateLimiter
+        
+        hospital = Hospital.objects.create(
+            name="Test Hospital",
+            hospital_type="private",
+            email="admin@testhospital.co.ke",
+            phone="+254700123456"
+        )
+        integration = HospitalIntegration.objects.create(
+            hospital=hospital,
+            api_key=APIKeyGenerator.generate_api_key(),
+            api_secret=APIKeyGenerator.generate_api_key(),
+            status="active",
+            rate_limit_per_minute=2
+        )
+        client = APIClient()
+        url = reverse('api_integration:patient-data')
+        
+        def get(ip, signed=True):
+            timestamp = str(int(time.time()))
+            secret = integration.api_secret if signed else 'guessed'
+            signature = RequestSignature.generate_signature(secret, '', timestamp)
+            return client.get(url, secure=True, REMOTE_ADDR=ip, HTTP_X_API_KEY=integration.api_key,
+                              HTTP_X_TIMESTAMP=timestamp, HTTP_X_SIGNATURE=signature)
+        
+        with mock.patch('api_integration.authentication.get_partner_rate_limiter',
+                        return_value=RateLimiter(None)), \
+             mock.patch('api_integration.authentication.get_partner_auth_cache',
+                        return_value=PartnerAuthCache(None)), \
+             mock.patch('api_integration.authentication.audit_log_writer', AuditLogWriter(autostart=False)):
+            attempts = FAILED_SIGNATURE_LIMITS[0][1]
+            rejected = [get('203.0.113.9', signed=False).status_code for _ in range(attempts + 1)]
+            partner = get('198.51.100.7')
+        
+        self.assertEqual(rejected[:attempts], [status.HTTP_403_FORBIDDEN] * attempts)
+        self.assertEqual(rejected[-1], status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertNotEqual(partner.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(partner['X-RateLimit-Remaining'], '1')
+
+
+class PartnerExportTestCase(TestCase):
+    """Test keyset-paginated and streaming partner exports"""
+    
+    def setUp(self):
+        self.hospitals = [
+            Hospital.objects.create(
+                name=f"Export Hospital {i}",
+                slug=f"export-hospital-{i}",
+                hospital_type="private",
+                email=f"admin{i}@testhospital.co.ke",
+                phone="+254700123456"
+            )
+            for i in range(5)
+        ]
+        # Two rows share a timestamp so the id tiebreak is exercised
+        base = timezone.now() - timedelta(hours=1)
+        for i, hospital in enumerate(self.hospitals):
+            Hospital.objects.filter(pk=hospital.pk).update(updated_at=base + timedelta(minutes=max(i, 1)))
+    
+    def _serialize(self, hospital):
+        return {'id': str(hospital.id), 'updated_at': hospital.updated_at}
+    
+    def test_cursor_pages_cover_every_row_once(self):
+        """Following next_cursor returns every row exactly once, in order"""
+        from .exports import decode_cursor, export_page, keyset_queryset
+        
+        seen = []
+        after = None
+        while True:
+            rows, next_cursor = export_page(keyset_queryset(Hospital.objects.all(), after=after), self._serialize, 2)
+            seen.extend(row['id'] for row in rows)
+            if next_cursor is None:
+                break
+            after = decode_cursor(next_cursor)
+        
+        expected = [str(pk) for pk in Hospital.objects.order_by('updated_at', 'pk').values_list('pk', flat=True)]
+        self.assertEqual(seen, expected)
+    
+    def test_updated_since_returns_only_changes(self):
+        """updated_since limits the export to rows changed at or after it"""
+        from .exports import keyset_queryset, parse_export_params
+        
+        since = Hospital.objects.order_by('updated_at').values_list('updated_at', flat=True)[3]
+        params = parse_export_params({'updated_since': since.isoformat()})
+        
+        self.assertEqual(keyset_queryset(Hospital.objects.all(), params['updated_since']).count(), 2)
+    
+    def test_ndjson_stream_ends_with_resume_cursor(self):
+        """The NDJSON stream yields one line per row and a trailer to resume from"""
+        from .exports import decode_cursor, keyset_queryset, ndjson_lines
+        
+        finished = []
+        lines = [
+            json.loads(line)
+            for line in ndjson_lines(keyset_queryset(Hospital.objects.all()), self._serialize,
+                                     on_finish=finished.append)
+        ]
+        
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[-1]['count'], 5)
+        self.assertEqual(finished, [5])
+        last = Hospital.objects.order_by('updated_at', 'pk').last()
+        self.assertEqual(decode_cursor(lines[-1]['next_cursor']), (last.updated_at, last.pk))
+    
+    def test_patient_delta_follows_relationship_changes(self):
+        """Linking, unlinking or editing a patient puts it in the delta; the relationship carries the export position"""
+        from accounts.models import EnhancedPatient, HospitalPatient
+        from authentication.models import User
+        from .exports import keyset_queryset, patient_export_queryset, patient_export_row
+        
+        hospital = self.hospitals[0]
+        long_ago = timezone.now() - timedelta(days=30)
+        since = timezone.now() - timedelta(minutes=5)
+        statuses = {}
+        for name, status_value in [('linked', 'active'), ('unlinked', 'inactive'), ('untouched', 'active')]:
+            user = User.objects.create_user(username=name, email=f'{name}@example.com', password='x')
+            patient = EnhancedPatient.objects.create(
+                user=user, phone='+254700000000', date_of_birth=date(1990, 1, 1)
+            )
+            EnhancedPatient.objects.filter(pk=patient.pk).update(updated_at=long_ago)
+            HospitalPatient.objects.create(hospital=hospital, patient=patient, status=status_value)
+            if name == 'untouched':
+                HospitalPatient.objects.filter(patient=patient).update(
+                    updated_at=long_ago, export_changed_at=long_ago
+                )
+            statuses[str(patient.pk)] = (name, status_value)
+        
+        delta = keyset_queryset(patient_export_queryset(hospital, include_inactive=True), since)
+        rows = {statuses[row['id']][0]: row for row in map(patient_export_row, delta)}
+        full = keyset_queryset(patient_export_queryset(hospital))
+        
+        self.assertEqual(set(rows), {'linked', 'unlinked'})
+        self.assertEqual(rows['unlinked']['relationship_status'], 'inactive')
+        self.assertGreaterEqual(rows['linked']['updated_at'], since)
+        self.assertEqual(sorted(statuses[str(p.pk)][0] for p in full), ['linked', 'untouched'])
+        
+        untouched = EnhancedPatient.objects.get(user__username='untouched')
+        untouched.save()
+        delta = keyset_queryset(patient_export_queryset(hospital, include_inactive=True), since)
+        self.assertIn(str(untouched.pk), [row['id'] for row in map(patient_export_row, delta)])
+    
+    def test_invalid_export_params_rejected(self):
+        """Malformed cursors and timestamps raise ValueError"""
+        from .exports import parse_export_params
+        
+        with self.assertRaises(ValueError):
+            parse_export_params({'cursor': 'not-a-cursor'})
+        with self.assertRaises(ValueError):
+            parse_export_params({'updated_since': 'yesterday'})
+        self.assertEqual(parse_export_params({'limit': '999999'})['limit'], 1000)
+    
+    def test_patient_export_streams_ndjson(self):
+        """format=ndjson returns a streaming NDJSON response"""
+        from unittest import mock
+        from rest_framework.test import APIClient
+        from .audit import AuditLogWriter
+        from .security import RateLimiter
+        
+        integration = HospitalIntegration.objects.create(
+            hospital=self.hospitals[0],
+            api_key=APIKeyGenerator.generate_api_key(),
+            api_secret=APIKeyGenerator.generate_api_key(),
+            status="active",
+            data_processing_agreement_signed=True
+        )
+        DataProcessingConsent.objects.create(
+            integration=integration,
+            consent_type="patient_data",
+            status="granted",
+            consent_text="I consent to the processing of patient data",
+            ip_address="127.0.0.1"
+        )
+        timestamp = str(int(time.time()))
+        signature = RequestSignature.generate_signature(integration.api_secret, '', timestamp)
+        
+        with mock.patch('api_integration.authentication.get_partner_rate_limiter',
+                        return_value=RateLimiter(None)), \
+             mock.patch('api_integration.authentication.get_partner_auth_cache',
+                        return_value=PartnerAuthCache(None)), \
+             mock.patch('api_integration.audit.audit_log_writer', AuditLogWriter(autostart=False)), \
+             mock.patch('api_integration.authentication.audit_log_writer', AuditLogWriter(autostart=False)):
+            response = APIClient().get(
+                reverse('api_integration:patient-data'), {'format': 'ndjson'}, secure=True,
+                HTTP_X_API_KEY=integration.api_key, HTTP_X_TIMESTAMP=timestamp, HTTP_X_SIGNATURE=signature
+            )
+            body = b''.join(response.streaming_content).decode()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(json.loads(body.splitlines()[-1]), {'next_cursor': None, 'count': 0})
+
+
+class BatchIngestTestCase(TestCase):
+    """Test bulk ingest of partner patient and appointment records"""
+    
+    def setUp(self):
+        self.hospital = Hospital.objects.create(
+            name="Batch Hospital",
+            slug="batch-hospital",
+            hospital_type="private",
+            email="admin@batchhospital.co.ke",
+            phone="+254700123456"
+        )
+        self.integration = HospitalIntegration.objects.create(
+            hospital=self.hospital,
+            api_key=APIKeyGenerator.generate_api_key(),
+            api_secret=APIKeyGenerator.generate_api_key(),
+            status="active",
+            encryption_enabled=True,
+            data_processing_agreement_signed=True
+        )
+    
+    def patient(self, patient_id, **fields):
+        record = {
+            'patient_id': patient_id,
+            'name': f'Patient {patient_id}',
+            'phone': '+254712345678',
+            'email': f'{patient_id}@example.com',
+        }
+        record.update(fields)
+        return record
+    
+    def test_patients_upserted_with_per_record_results(self):
+        """New records are created, known ones updated and invalid ones reported in place"""
+        from .ingest import ingest_patients, summarize
+        from .models import PartnerPatientRecord
+        
+        ingest_patients(self.integration, [self.patient('P1')])
+        results = ingest_patients(self.integration, [
+            self.patient('P1', name='Renamed'),
+            self.patient('P2'),
+            self.patient('P3', phone='not-a-phone'),
+            self.patient('P2'),
+        ])
+        
+        self.assertEqual([r['status'] for r in results], ['updated', 'created', 'error', 'error'])
+        self.assertIn('phone', results[2]['errors'])
+        self.assertEqual(summarize(results), {'created': 1, 'updated': 1, 'failed': 2})
+        self.assertEqual(PartnerPatientRecord.objects.count(), 2)
+        
+        record = PartnerPatientRecord.objects.get(patient_id='P1')
+        self.assertEqual(record.name, 'Renamed')
+        self.assertEqual(DataEncryption().decrypt_data(record.phone), '+254712345678')
+    
+    def test_batch_uses_constant_queries(self):
+        """A batch is validated and upserted in a fixed number of queries"""
+        from .ingest import ingest_patients
+        
+        # Savepoint, existing-key lookup, one upsert, release
+        with self.assertNumQueries(4):
+            ingest_patients(self.integration, [self.patient(f'P{i}') for i in range(20)])
+    
+    def test_appointments_require_known_patient(self):
+        """Appointments referencing unknown patients are rejected per record"""
+        from .ingest import ingest_appointments, ingest_patients
+        
+        ingest_patients(self.integration, [self.patient('P1')])
+        appointment = {
+            'patient_id': 'P1',
+            'doctor_name': 'Dr. Otieno',
+            'appointment_date': '2026-11-02T09:00:00Z',
+            'duration_minutes': 30,
+            'appointment_type': 'consultation',
+        }
+        results = ingest_appointments(self.integration, [
+            dict(appointment, appointment_id='A1'),
+            dict(appointment, appointment_id='A2', patient_id='P9'),
+        ])
+        
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertEqual(results[1]['errors'], {'patient_id': ['Unknown patient_id']})
+    
+    def test_gzip_ndjson_batch_endpoint(self):
+        """The batch endpoint accepts gzip NDJSON and writes one audit entry"""
+        import gzip
+        from unittest import mock
+        from rest_framework.test import APIClient
+        from .audit import AuditLogWriter
+        from .security import RateLimiter
+        
+        DataProcessingConsent.objects.create(
+            integration=self.integration,
+            consent_type="patient_data",
+            status="granted",
+            consent_text="I consent to the processing of patient data",
+            ip_address="127.0.0.1"
+        )
+        body = gzip.compress(
+            '\n'.join(json.dumps(self.patient(f'P{i}')) for i in range(3)).encode()
+        )
+        timestamp = str(int(time.time()))
+        signature = RequestSignature.generate_signature(self.integration.api_secret, body, timestamp)
+        writer = AuditLogWriter(autostart=False)
+        
+        with mock.patch('api_integration.authentication.get_partner_rate_limiter',
+                        return_value=RateLimiter(None)), \
+             mock.patch('api_integration.authentication.get_partner_auth_cache',
+                        return_value=PartnerAuthCache(None)), \
+             mock.patch('api_integration.audit.audit_log_writer', writer), \
+             mock.patch('api_integration.authentication.audit_log_writer', AuditLogWriter(autostart=False)):
+            response = APIClient().generic(
+                'POST', reverse('api_integration:patient-batch'), body,
+                content_type='application/x-ndjson', secure=True,
+                HTTP_CONTENT_ENCODING='gzip', HTTP_X_API_KEY=self.integration.api_key,
+                HTTP_X_TIMESTAMP=timestamp, HTTP_X_SIGNATURE=signature
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 3)
+        self.assertTrue(response.data['staged'])
+        self.assertEqual(writer.pending(), 1)
+        self.assertEqual(writer.records[0][1].data_subjects_affected, 3)
+    
+    def test_body_over_upload_limit_rejected_with_413(self):
+        """A body Django refuses to read gets a 413 that points to gzip"""
+        from unittest import mock
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        from .security import RateLimiter
+        
+        body = json.dumps([self.patient(f'P{i}') for i in range(20)]).encode()
+        timestamp = str(int(time.time()))
+        signature = RequestSignature.generate_signature(self.integration.api_secret, body, timestamp)
+        
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=len(body) - 1), \
+             mock.patch('api_integration.authentication.get_partner_rate_limiter',
+                        return_value=RateLimiter(None)), \
+             mock.patch('api_integration.authentication.get_partner_auth_cache',
+                        return_value=PartnerAuthCache(None)):
+            response = APIClient().generic(
+                'POST', reverse('api_integration:patient-batch'), body,
+                content_type='application/json', secure=True, HTTP_X_API_KEY=self.integration.api_key,
+                HTTP_X_TIMESTAMP=timestamp, HTTP_X_SIGNATURE=signature
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertIn('gzip', response.data['error'])
+
+
+class FakeCacheRedis:
+    """Dict-backed stand-in for the Redis commands the auth cache uses"""
+    
+    def __init__(self):
+        self.data = {}
+        self.down = False
+    
+    def mget(self, *keys):
+        if self.down:
+            raise ConnectionError('unreachable')
+        return [self.data.get(key) for key in keys]
+    
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+    
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+
+class PartnerAuthCacheTestCase(TestCase):
+    """Test the cached partner authorization context"""
+    
+    def setUp(self):
+        self.hospital = Hospital.objects.create(
+            name="Cache Hospital",
+            slug="cache-hospital",
+            hospital_type="private",
+            email="admin@cachehospital.co.ke",
+            phone="+254700123456"
+        )
+        self.integration = HospitalIntegration.objects.create(
+            hospital=self.hospital,
+            api_key=APIKeyGenerator.generate_api_key(),
+            api_secret=APIKeyGenerator.generate_api_key(),
+            status="active",
+            allowed_endpoints=['/api/integration/patients/']
+        )
+        DataProcessingConsent.objects.create(
+            integration=self.integration,
+            consent_type="patient_data",
+            status="granted",
+            consent_text="I consent to the processing of patient data",
+            ip_address="127.0.0.1"
+        )
+    
+    def test_cache_hit_takes_no_queries(self):
+        """A cached context answers integration, consent and endpoint checks without queries"""
+        cache = PartnerAuthCache(None)
+        cache.get(self.integration.api_key)
+        
+        with self.assertNumQueries(0):
+            context = cache.get(self.integration.api_key)
+            self.assertEqual(context.integration.hospital.name, "Cache Hospital")
+            self.assertTrue(context.has_consent('patient_data'))
+            self.assertFalse(context.has_consent('analytics'))
+            self.assertFalse(context.is_endpoint_allowed('/api/integration/appointments/'))
+    
+    def test_redis_entry_shared_between_processes(self):
+        """A second process reads the encrypted Redis entry instead of the database"""
+        redis_client = FakeCacheRedis()
+        PartnerAuthCache(redis_client).get(self.integration.api_key)
+        self.assertNotIn(self.integration.api_key, ''.join(redis_client.data.values()))
+        
+        with self.assertNumQueries(0):
+            context = PartnerAuthCache(redis_client).get(self.integration.api_key)
+        self.assertEqual(context.integration.pk, self.integration.pk)
+        self.assertEqual(context.integration.api_secret, self.integration.api_secret)
+    
+    def test_consent_change_invalidates_other_processes(self):
+        """Saving a consent bumps the shared version so other processes reload"""
+        from unittest import mock
+        from . import auth_cache
+        
+        redis_client = FakeCacheRedis()
+        writer, reader = PartnerAuthCache(redis_client), PartnerAuthCache(redis_client)
+        self.assertFalse(reader.get(self.integration.api_key).has_consent('analytics'))
+        
+        with mock.patch('api_integration.signals.get_partner_auth_cache', return_value=writer):
+            DataProcessingConsent.objects.create(
+                integration=self.integration,
+                consent_type="analytics",
+                status="granted",
+                consent_text="I consent to analytics",
+                ip_address="127.0.0.1"
+            )
+        
+        with mock.patch.object(auth_cache, 'LOCAL_TTL_SECONDS', 0):
+            self.assertTrue(reader.get(self.integration.api_key).has_consent('analytics'))
+    
+    def test_rotated_key_stops_resolving(self):
+        """After key rotation the old key no longer authenticates"""
+        from unittest import mock
+        
+        cache = PartnerAuthCache(None)
+        old_key = self.integration.api_key
+        self.assertIsNotNone(cache.get(old_key))
+        
+        with mock.patch('api_integration.signals.get_partner_auth_cache', return_value=cache):
+            self.integration.api_key = APIKeyGenerator.generate_api_key()
+            self.integration.save()
+        
+        self.assertIsNone(cache.get(old_key))
+        self.assertIsNotNone(cache.get(self.integration.api_key))
+    
+    def test_expired_entry_reloaded_without_redis(self):
+        """Without Redis to confirm the version, an expired local entry is reloaded from the database"""
+        from unittest import mock
+        from . import auth_cache
+        
+        cache = PartnerAuthCache(None)
+        self.assertFalse(cache.get(self.integration.api_key).has_consent('analytics'))
+        # A change made by another process: no signal reaches this cache
+        DataProcessingConsent.objects.filter(integration=self.integration).update(consent_type='analytics')
+        
+        with self.assertNumQueries(0):
+            self.assertFalse(cache.get(self.integration.api_key).has_consent('analytics'))
+        with mock.patch.object(auth_cache, 'LOCAL_TTL_SECONDS', 0), self.assertNumQueries(2):
+            self.assertTrue(cache.get(self.integration.api_key).has_consent('analytics'))
+    
+    def test_expired_entry_reloaded_when_redis_goes_down(self):
+        """A version seen before Redis went down does not keep revalidating a local entry"""
+        from unittest import mock
+        from . import auth_cache
+        
+        redis_client = FakeCacheRedis()
+        cache = PartnerAuthCache(redis_client)
+        cache.get(self.integration.api_key)
+        redis_client.down = True
+        DataProcessingConsent.objects.filter(integration=self.integration).update(consent_type='analytics')
+        
+        with mock.patch.object(auth_cache, 'LOCAL_TTL_SECONDS', 0):
+            self.assertTrue(cache.get(self.integration.api_key).has_consent('analytics'))
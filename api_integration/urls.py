@@ -17,7 +17,9 @@ urlpatterns = [
     
     # Data processing endpoints
     path('patients/', views.PatientDataView.as_view(), name='patient-data'),
+    path('patients/batch/', views.PatientBatchView.as_view(), name='patient-batch'),
     path('appointments/', views.AppointmentDataView.as_view(), name='appointment-data'),
+    path('appointments/batch/', views.AppointmentBatchView.as_view(), name='appointment-batch'),
     path('reminders/', views.ReminderDataView.as_view(), name='reminder-data'),
     
     # Consent management endpoints
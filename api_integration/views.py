@@ -3,8 +3,11 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
+from django.core.exceptions import RequestDataTooBig
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
 import logging
 
@@ -12,12 +15,19 @@ from .models import HospitalIntegration, DataProcessingConsent, APILog, Security
 from .serializers import (
     HospitalIntegrationSerializer, DataProcessingConsentSerializer, 
     APILogSerializer, SecurityIncidentSerializer,
-    HospitalIntegrationSetupSerializer, PatientDataSerializer,
-    AppointmentDataSerializer, ReminderDataSerializer
+    HospitalIntegrationSetupSerializer, ReminderDataSerializer
 )
-from .authentication import HospitalAPIAuthentication, HospitalAPIPermission
-from .security import RequestSignature, RateLimiter, DataEncryption
+from .authentication import (
+    HospitalAPIAuthentication, HospitalAPIPermission, RateLimitHeadersMixin, get_auth_context
+)
+from .security import RequestSignature
 from .compliance import ComplianceReporter
+from .audit import log_api_request
+from .exports import (
+    NDJSONRenderer, appointment_export_queryset, appointment_export_row, export_page, keyset_queryset,
+    ndjson_response, parse_export_params, patient_export_queryset, patient_export_row
+)
+from .ingest import BatchError, body_too_large, ingest_appointments, ingest_patients, parse_batch, summarize
 
 logger = logging.getLogger(__name__)
 
@@ -44,14 +54,10 @@ class HospitalIntegrationViewSet(viewsets.ModelViewSet):
         integration.save()
         
         # Log the suspension
-        APILog.objects.create(
-            integration=integration,
+        log_api_request(
+            request, integration, 200, 'Integration suspended',
             method='POST',
             endpoint=f'/api/integration/hospitals/{pk}/suspend/',
-            status_code=200,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message='Integration suspended',
             data_categories=['integration_data']
         )
         
@@ -70,14 +76,10 @@ class HospitalIntegrationViewSet(viewsets.ModelViewSet):
         integration.save()
         
         # Log the reactivation
-        APILog.objects.create(
-            integration=integration,
+        log_api_request(
+            request, integration, 200, 'Integration reactivated',
             method='POST',
             endpoint=f'/api/integration/hospitals/{pk}/reactivate/',
-            status_code=200,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message='Integration reactivated',
             data_categories=['integration_data']
         )
         
@@ -202,14 +204,10 @@ class RotateAPIKeyView(APIView):
             integration.save()
             
             # Log the key rotation
-            APILog.objects.create(
-                integration=integration,
+            log_api_request(
+                request, integration, 200, 'API key rotated',
                 method='POST',
                 endpoint='/api/integration/auth/rotate-key/',
-                status_code=200,
-                ip_address=self.get_client_ip(request),
-                auth_status='success',
-                message='API key rotated',
                 data_categories=['integration_data']
             )
             
@@ -231,110 +229,101 @@ class RotateAPIKeyView(APIView):
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
-class PatientDataView(APIView):
+def has_valid_consent(request, consent_type):
+    """Whether the request's integration holds a granted, unexpired consent of this type"""
+    return get_auth_context(request).has_consent(consent_type)
+
+class PatientDataView(RateLimitHeadersMixin, APIView):
     """API endpoint for patient data operations"""
     authentication_classes = [HospitalAPIAuthentication]
     permission_classes = [HospitalAPIPermission]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
     
     def get(self, request):
-        """Get patient data"""
+        """
+        Export patient data, oldest change first.
+
+        Pages are keyset-paginated: pass the returned ``next_cursor`` as
+        ``cursor`` to continue, and ``updated_since`` to pull only changes.
+        Deltas also return unlinked patients, whose ``relationship_status``
+        is not 'active'. ``format=ndjson`` streams the whole export instead.
+        """
         integration = request.user  # Set by authentication
         
-        # Validate consent
-        from .models import DataProcessingConsent
-        consent = DataProcessingConsent.objects.filter(
-            integration=integration,
-            consent_type='patient_data',
-            status='active'
-        ).first()
-        
-        if not consent:
+        if not has_valid_consent(request, 'patient_data'):
             return Response({'error': 'No valid consent for patient data processing'}, status=403)
         
-        # Get patients for this hospital
-        from appointments.models import Patient
-        patients = Patient.objects.filter(hospital=integration.hospital, is_archived=False)
+        try:
+            params = parse_export_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        patients = patient_export_queryset(
+            integration.hospital, include_inactive=params['updated_since'] is not None
+        )
         
         # Apply filters if provided
         patient_id = request.query_params.get('patient_id')
         if patient_id:
-            patients = patients.filter(patient_id=patient_id)
+            patients = patients.filter(id=patient_id)
         
-        # Serialize data
-        serializer = PatientDataSerializer(patients, many=True)
+        patients = keyset_queryset(patients, params['updated_since'], params['after'])
+        
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            def log_export(count):
+                log_api_request(
+                    request, integration, 200, 'Patient data exported',
+                    method='GET',
+                    endpoint='/api/integration/patients/',
+                    data_categories=['patient_data'],
+                    data_subjects_affected=count
+                )
+            return ndjson_response(patients, patient_export_row, request.query_params.get('cursor'), log_export)
+        
+        rows, next_cursor = export_page(patients, patient_export_row, params['limit'])
         
         # Log the access
-        APILog.objects.create(
-            integration=integration,
+        log_api_request(
+            request, integration, 200, 'Patient data accessed',
             method='GET',
             endpoint='/api/integration/patients/',
-            status_code=200,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message='Patient data accessed',
-            data_categories=['patient_data']
+            data_categories=['patient_data'],
+            data_subjects_affected=len(rows)
         )
         
         return Response({
             'status': 'success',
-            'count': len(serializer.data),
-            'patients': serializer.data
+            'count': len(rows),
+            'next_cursor': next_cursor,
+            'patients': rows
         })
     
     def post(self, request):
-        """Create or update patient data"""
+        """Stage patient data; staged records are not applied to MediRemind patients"""
         integration = request.user  # Set by authentication
         
-        # Validate consent
-        from .models import DataProcessingConsent
-        consent = DataProcessingConsent.objects.filter(
-            integration=integration,
-            consent_type='patient_data',
-            status='active'
-        ).first()
-        
-        if not consent:
+        if not has_valid_consent(request, 'patient_data'):
             return Response({'error': 'No valid consent for patient data processing'}, status=403)
         
-        # Validate data
-        serializer = PatientDataSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=400)
-        
-        # Process data
-        patient_data = serializer.validated_data
-        
-        # Encrypt sensitive data if enabled
-        if integration.encryption_enabled:
-            encryption = DataEncryption()
-            patient_data['phone'] = encryption.encrypt_data(patient_data['phone'])
-            if 'email' in patient_data:
-                patient_data['email'] = encryption.encrypt_data(patient_data['email'])
-        
-        # Create or update patient
-        from appointments.models import Patient
-        patient, created = Patient.objects.update_or_create(
-            hospital=integration.hospital,
-            patient_id=patient_data['patient_id'],
-            defaults=patient_data
-        )
+        result = ingest_patients(integration, [request.data])[0]
+        if result['status'] == 'error':
+            return Response(result['errors'], status=400)
+        created = result['status'] == 'created'
         
         # Log the operation
-        APILog.objects.create(
-            integration=integration,
+        log_api_request(
+            request, integration, 201 if created else 200, f'Patient data {result["status"]}',
             method='POST',
             endpoint='/api/integration/patients/',
-            status_code=201 if created else 200,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message=f'Patient data {"created" if created else "updated"}',
-            data_categories=['patient_data']
+            data_categories=['patient_data'],
+            data_subjects_affected=1
         )
         
         return Response({
             'status': 'success',
-            'action': 'created' if created else 'updated',
-            'patient_id': patient.patient_id
+            'action': result['status'],
+            'patient_id': result['patient_id'],
+            'staged': True
         }, status=201 if created else 200)
     
     def get_client_ip(self, request):
@@ -346,29 +335,25 @@ class PatientDataView(APIView):
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
-class AppointmentDataView(APIView):
+class AppointmentDataView(RateLimitHeadersMixin, APIView):
     """API endpoint for appointment data operations"""
     authentication_classes = [HospitalAPIAuthentication]
     permission_classes = [HospitalAPIPermission]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
     
     def get(self, request):
-        """Get appointment data"""
+        """Export appointment data, keyset-paginated or streamed like PatientDataView"""
         integration = request.user  # Set by authentication
         
-        # Validate consent
-        from .models import DataProcessingConsent
-        consent = DataProcessingConsent.objects.filter(
-            integration=integration,
-            consent_type='appointment_data',
-            status='active'
-        ).first()
-        
-        if not consent:
+        if not has_valid_consent(request, 'appointment_reminders'):
             return Response({'error': 'No valid consent for appointment data processing'}, status=403)
         
-        # Get appointments for this hospital
-        from appointments.models import Appointment
-        appointments = Appointment.objects.filter(hospital=integration.hospital)
+        try:
+            params = parse_export_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        appointments = appointment_export_queryset(integration.hospital)
         
         # Apply date filters
         start_date = request.query_params.get('start_date')
@@ -379,72 +364,66 @@ class AppointmentDataView(APIView):
         if end_date:
             appointments = appointments.filter(appointment_date__lte=end_date)
         
-        # Serialize data
-        serializer = AppointmentDataSerializer(appointments, many=True)
+        appointments = keyset_queryset(appointments, params['updated_since'], params['after'])
+        
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            def log_export(count):
+                log_api_request(
+                    request, integration, 200, 'Appointment data exported',
+                    method='GET',
+                    endpoint='/api/integration/appointments/',
+                    data_categories=['appointment_data'],
+                    data_subjects_affected=count
+                )
+            return ndjson_response(
+                appointments, appointment_export_row, request.query_params.get('cursor'), log_export
+            )
+        
+        rows, next_cursor = export_page(appointments, appointment_export_row, params['limit'])
         
         # Log the access
-        APILog.objects.create(
-            integration=integration,
+        log_api_request(
+            request, integration, 200, 'Appointment data accessed',
             method='GET',
             endpoint='/api/integration/appointments/',
-            status_code=200,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message='Appointment data accessed',
-            data_categories=['appointment_data']
+            data_categories=['appointment_data'],
+            data_subjects_affected=len(rows)
         )
         
         return Response({
             'status': 'success',
-            'count': len(serializer.data),
-            'appointments': serializer.data
+            'count': len(rows),
+            'next_cursor': next_cursor,
+            'appointments': rows
         })
     
     def post(self, request):
-        """Create appointment data"""
+        """Stage appointment data; staged records are not applied and schedule no reminders"""
         integration = request.user  # Set by authentication
         
-        # Validate consent
-        from .models import DataProcessingConsent
-        consent = DataProcessingConsent.objects.filter(
-            integration=integration,
-            consent_type='appointment_data',
-            status='active'
-        ).first()
-        
-        if not consent:
+        if not has_valid_consent(request, 'appointment_reminders'):
             return Response({'error': 'No valid consent for appointment data processing'}, status=403)
         
-        # Validate data
-        serializer = AppointmentDataSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=400)
-        
-        # Process data
-        appointment_data = serializer.validated_data
-        appointment_data['hospital'] = integration.hospital
+        result = ingest_appointments(integration, [request.data])[0]
+        if result['status'] == 'error':
+            return Response(result['errors'], status=400)
+        created = result['status'] == 'created'
         
-        # Create appointment
-        from appointments.models import Appointment
-        appointment = Appointment.objects.create(**appointment_data)
-        
-        # Log the creation
-        APILog.objects.create(
-            integration=integration,
+        # Log the operation
+        log_api_request(
+            request, integration, 201 if created else 200, f'Appointment {result["status"]}',
             method='POST',
             endpoint='/api/integration/appointments/',
-            status_code=201,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message='Appointment created',
-            data_categories=['appointment_data']
+            data_categories=['appointment_data'],
+            data_subjects_affected=1
         )
         
         return Response({
             'status': 'success',
-            'appointment_id': appointment.id,
-            'reminder_scheduled': appointment.send_reminder
-        }, status=201)
+            'action': result['status'],
+            'appointment_id': result['appointment_id'],
+            'staged': True
+        }, status=201 if created else 200)
     
     def get_client_ip(self, request):
         """Get client IP address"""
@@ -455,7 +434,92 @@ class AppointmentDataView(APIView):
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
-class ReminderDataView(APIView):
+class BatchIngestView(RateLimitHeadersMixin, APIView, ABC):
+    """
+    Base view for bulk ingest: one request carries up to MAX_BATCH_RECORDS
+    records as JSON, NDJSON or gzip (Content-Encoding: gzip), and gets back a
+    result per record. The batch is audited as a single log entry.
+
+    Bodies over DATA_UPLOAD_MAX_MEMORY_SIZE are rejected with 413 when
+    authentication first reads them.
+    """
+    authentication_classes = [HospitalAPIAuthentication]
+    permission_classes = [HospitalAPIPermission]
+    
+    consent_type = None
+    data_category = None
+    endpoint = None
+    label = None
+    
+    @abstractmethod
+    def ingest(self, integration, records):
+        """Ingest the parsed records; returns one result per record, in input order."""
+        pass
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, RequestDataTooBig):
+            return Response({'error': str(body_too_large())}, status=413)
+        return super().handle_exception(exc)
+    
+    def post(self, request):
+        integration = request.user  # Set by authentication
+        
+        if not has_valid_consent(request, self.consent_type):
+            return Response({'error': f'No valid consent for {self.label} data processing'}, status=403)
+        
+        try:
+            records = parse_batch(
+                request.body,
+                request.META.get('CONTENT_TYPE', ''),
+                request.META.get('HTTP_CONTENT_ENCODING', '')
+            )
+        except BatchError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        
+        results = self.ingest(integration, records)
+        summary = summarize(results)
+        
+        # One audit entry for the whole batch
+        log_api_request(
+            request, integration, 200,
+            f'{self.label.capitalize()} batch ingested: {summary["created"]} created, '
+            f'{summary["updated"]} updated, {summary["failed"]} failed',
+            method='POST',
+            endpoint=self.endpoint,
+            data_categories=[self.data_category],
+            data_subjects_affected=summary['created'] + summary['updated'],
+            personal_data_processed=True
+        )
+        
+        return Response({
+            'status': 'success' if not summary['failed'] else 'partial',
+            'count': len(results),
+            **summary,
+            'staged': True,
+            'results': results
+        })
+
+class PatientBatchView(BatchIngestView):
+    """Bulk create or update patient data"""
+    consent_type = 'patient_data'
+    data_category = 'patient_data'
+    endpoint = '/api/integration/patients/batch/'
+    label = 'patient'
+    
+    def ingest(self, integration, records):
+        return ingest_patients(integration, records)
+
+class AppointmentBatchView(BatchIngestView):
+    """Bulk create or update appointment data"""
+    consent_type = 'appointment_reminders'
+    data_category = 'appointment_data'
+    endpoint = '/api/integration/appointments/batch/'
+    label = 'appointment'
+    
+    def ingest(self, integration, records):
+        return ingest_appointments(integration, records)
+
+class ReminderDataView(RateLimitHeadersMixin, APIView):
     """API endpoint for reminder data operations"""
     authentication_classes = [HospitalAPIAuthentication]
     permission_classes = [HospitalAPIPermission]
@@ -464,15 +528,7 @@ class ReminderDataView(APIView):
         """Get reminder data"""
         integration = request.user  # Set by authentication
         
-        # Validate consent
-        from .models import DataProcessingConsent
-        consent = DataProcessingConsent.objects.filter(
-            integration=integration,
-            consent_type='reminder_data',
-            status='active'
-        ).first()
-        
-        if not consent:
+        if not has_valid_consent(request, 'appointment_reminders'):
             return Response({'error': 'No valid consent for reminder data processing'}, status=403)
         
         # Get reminders for this hospital
@@ -488,14 +544,10 @@ class ReminderDataView(APIView):
         serializer = ReminderDataSerializer(reminders, many=True)
         
         # Log the access
-        APILog.objects.create(
-            integration=integration,
+        log_api_request(
+            request, integration, 200, 'Reminder data accessed',
             method='GET',
             endpoint='/api/integration/reminders/',
-            status_code=200,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message='Reminder data accessed',
             data_categories=['reminder_data']
         )
         
@@ -514,7 +566,7 @@ class ReminderDataView(APIView):
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
-class RequestConsentView(APIView):
+class RequestConsentView(RateLimitHeadersMixin, APIView):
     """API endpoint for requesting data processing consent"""
     authentication_classes = [HospitalAPIAuthentication]
     permission_classes = [HospitalAPIPermission]
@@ -552,14 +604,10 @@ class RequestConsentView(APIView):
         )
         
         # Log the request
-        APILog.objects.create(
-            integration=integration,
+        log_api_request(
+            request, integration, 201, f'Consent requested for {consent_type}',
             method='POST',
             endpoint='/api/integration/consents/request/',
-            status_code=201,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message=f'Consent requested for {consent_type}',
             data_categories=['consent_data']
         )
         
@@ -579,7 +627,7 @@ class RequestConsentView(APIView):
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
-class VerifyConsentView(APIView):
+class VerifyConsentView(RateLimitHeadersMixin, APIView):
     """API endpoint for verifying consent status"""
     authentication_classes = [HospitalAPIAuthentication]
     permission_classes = [HospitalAPIPermission]
@@ -608,7 +656,7 @@ class VerifyConsentView(APIView):
             'is_valid': consent.status == 'active' and consent.expires_at > timezone.now()
         })
 
-class WithdrawConsentView(APIView):
+class WithdrawConsentView(RateLimitHeadersMixin, APIView):
     """API endpoint for withdrawing consent"""
     authentication_classes = [HospitalAPIAuthentication]
     permission_classes = [HospitalAPIPermission]
@@ -637,14 +685,10 @@ class WithdrawConsentView(APIView):
         consent.save()
         
         # Log the withdrawal
-        APILog.objects.create(
-            integration=integration,
+        log_api_request(
+            request, integration, 200, f'Consent withdrawn for {consent_type}',
             method='POST',
             endpoint='/api/integration/consents/withdraw/',
-            status_code=200,
-            ip_address=self.get_client_ip(request),
-            auth_status='success',
-            message=f'Consent withdrawn for {consent_type}',
             data_categories=['consent_data']
         )
         
@@ -662,7 +706,7 @@ class WithdrawConsentView(APIView):
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
-class ComplianceStatusView(APIView):
+class ComplianceStatusView(RateLimitHeadersMixin, APIView):
     """API endpoint for checking compliance status"""
     authentication_classes = [HospitalAPIAuthentication]
     permission_classes = [HospitalAPIPermission]
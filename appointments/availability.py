@@ -0,0 +1,651 @@
+"""
+Availability engine for appointment scheduling.
+
+Each provider-day is represented as a minute-resolution NumPy bitmap built
+from the hospital's operating hours, the provider's default schedule, booked
+appointments and external calendar busy blocks. Feasible start times for a
+given duration are found with a vectorized sliding-window sum over all
+requested provider-days at once, instead of checking every slot against
+every appointment.
+"""
+
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from time import time_ns
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from .datetime_utils import hospital_timezone
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+# Statuses that occupy a provider's time
+ACTIVE_APPOINTMENT_STATUSES = ('scheduled', 'confirmed', 'pending', 'checked_in', 'in_progress')
+
+# Used when neither the hospital nor the provider has configured hours
+DEFAULT_WORKING_HOURS = (time(8, 0), time(18, 0))
+
+WEEKDAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+UNAVAILABLE_REASONS = (
+    None,
+    'Outside working hours',
+    'Conflicts with existing appointment',
+    'Busy in external calendar',
+    'Required room or equipment unavailable',
+    'Time has passed',
+)
+PAST_REASON = 5
+
+CACHE_KEY_PREFIX = 'availability:provider_day'
+CACHE_TIMEOUT = 300  # seconds; schedule and calendar changes invalidate explicitly
+
+
+def _to_minute(value):
+    """Convert a time, 'HH:MM' string or minute count into minutes since midnight."""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return max(0, min(MINUTES_PER_DAY, value))
+    if isinstance(value, datetime):
+        value = value.time()
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    if isinstance(value, str):
+        value = value.strip()
+        if value in ('24:00', '23:59:59'):
+            return MINUTES_PER_DAY
+        for fmt in ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p'):
+            try:
+                parsed = datetime.strptime(value, fmt).time()
+                return parsed.hour * 60 + parsed.minute
+            except ValueError:
+                continue
+    return None
+
+
+def minute_to_time(minute):
+    """Convert minutes since midnight back into a time (24:00 maps to 23:59)."""
+    minute = min(minute, MINUTES_PER_DAY - 1)
+    return time(minute // 60, minute % 60)
+
+
+def _parse_day_hours(spec):
+    """
+    Parse one day's hours into a list of (start_minute, end_minute) blocks.
+
+    Accepts the shapes used across the staff portal and admin:
+    {"start": "08:00", "end": "17:00"}, {"open": ..., "close": ...},
+    {"closed": true}, "08:00-17:00", ["08:00", "17:00"] or a list of
+    any of these for split shifts.
+    """
+    if not spec:
+        return []
+
+    if isinstance(spec, str):
+        if '-' not in spec:
+            return []
+        start, end = spec.split('-', 1)
+        return _parse_day_hours({'start': start, 'end': end})
+
+    if isinstance(spec, (list, tuple)):
+        if len(spec) == 2 and all(isinstance(part, str) and '-' not in part for part in spec):
+            return _parse_day_hours({'start': spec[0], 'end': spec[1]})
+        blocks = []
+        for item in spec:
+            blocks.extend(_parse_day_hours(item))
+        return blocks
+
+    if isinstance(spec, dict):
+        if spec.get('closed') or spec.get('is_closed'):
+            return []
+        if spec.get('enabled') is False or spec.get('is_open') is False or spec.get('available') is False:
+            return []
+        for nested_key in ('blocks', 'slots', 'intervals', 'shifts', 'hours'):
+            if isinstance(spec.get(nested_key), (list, tuple)):
+                return _parse_day_hours(spec[nested_key])
+
+        start = _to_minute(spec.get('start') or spec.get('open') or spec.get('start_time') or spec.get('from'))
+        end = _to_minute(spec.get('end') or spec.get('close') or spec.get('end_time') or spec.get('to'))
+        if start is None or end is None or end <= start:
+            return []
+        return [(start, end)]
+
+    return []
+
+
+def _day_spec(schedule, weekday):
+    """Look up a weekday entry in a weekly schedule dict, tolerating key styles."""
+    if not isinstance(schedule, dict):
+        return None
+    if isinstance(schedule.get('days'), dict):
+        schedule = schedule['days']
+
+    name = WEEKDAY_NAMES[weekday]
+    for key in (name, name.capitalize(), name[:3], name[:3].capitalize(), str(weekday), weekday):
+        if key in schedule:
+            return schedule[key]
+    return None
+
+
+def schedule_mask(schedule, day, default_hours=None):
+    """
+    Build a boolean working-hours mask for a given day from a weekly schedule.
+
+    An empty or missing schedule falls back to ``default_hours``; when that is
+    also None the whole day is considered open (the schedule imposes no limit).
+    """
+    mask = np.zeros(MINUTES_PER_DAY, dtype=bool)
+
+    if not schedule or not isinstance(schedule, dict):
+        if default_hours is None:
+            mask[:] = True
+        else:
+            mask[_to_minute(default_hours[0]):_to_minute(default_hours[1])] = True
+        return mask
+
+    for start, end in _parse_day_hours(_day_spec(schedule, day.weekday())):
+        mask[start:end] = True
+    return mask
+
+
+def _fill_intervals(row, intervals, value=True):
+    """Set [start, end) minute ranges in a bitmap row."""
+    for start, end in intervals:
+        if end > start:
+            row[start:end] = value
+
+
+def _count_intervals(intervals):
+    """Return a per-minute occupancy count for a list of [start, end) ranges."""
+    diff = np.zeros(MINUTES_PER_DAY + 1, dtype=np.int16)
+    if intervals:
+        bounds = np.asarray(intervals, dtype=np.int32)
+        np.add.at(diff, bounds[:, 0], 1)
+        np.add.at(diff, bounds[:, 1], -1)
+    return np.minimum(np.cumsum(diff[:-1]), 255).astype(np.uint8)
+
+
+def _appointment_interval(start_time, end_time, duration):
+    """Minute interval occupied by an appointment, tolerating a missing end_time."""
+    start = _to_minute(start_time)
+    end = _to_minute(end_time) if end_time else None
+    if end is None or end <= start:
+        end = min(MINUTES_PER_DAY, start + (duration or 0))
+    return start, end
+
+
+def _clip_to_day(start_dt, end_dt, day, tz):
+    """Clip an aware datetime range to a local calendar day as minute offsets."""
+    day_start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    day_end = day_start + timedelta(days=1)
+    start_dt = max(start_dt, day_start)
+    end_dt = min(end_dt, day_end)
+    if end_dt <= start_dt:
+        return None
+    start = int((start_dt - day_start).total_seconds() // 60)
+    end = int(-(-(end_dt - day_start).total_seconds() // 60))
+    return start, min(end, MINUTES_PER_DAY)
+
+
+def provider_now(provider, now=None):
+    """The current time (or ``now``) on the clock of the provider's hospital."""
+    return timezone.localtime(now or timezone.now(), hospital_timezone(provider.hospital))
+
+
+def _version_key(provider_id):
+    return f"{CACHE_KEY_PREFIX}:version:{provider_id}"
+
+
+def _provider_versions(provider_ids):
+    """Current cache version per provider; bumping one orphans all its days."""
+    keys = {provider_id: _version_key(provider_id) for provider_id in provider_ids}
+    found = cache.get_many(list(keys.values()))
+    return {provider_id: found.get(key, 0) for provider_id, key in keys.items()}
+
+
+def _cache_key(provider_id, day, version=0):
+    return f"{CACHE_KEY_PREFIX}:{provider_id}:{version}:{day.isoformat()}"
+
+
+def invalidate_provider_day(provider_id, day):
+    """Drop the cached bitmap for a provider-day."""
+    invalidate_provider_days([(provider_id, day)])
+
+
+def invalidate_provider_days(pairs):
+    """Drop cached bitmaps for an iterable of (provider_id, day) pairs."""
+    pairs = [(provider_id, day) for provider_id, day in pairs if provider_id and day]
+    if pairs:
+        versions = _provider_versions({provider_id for provider_id, _ in pairs})
+        cache.delete_many([_cache_key(provider_id, day, versions[provider_id]) for provider_id, day in pairs])
+
+
+def invalidate_providers(provider_ids):
+    """Drop every cached bitmap for the given providers, whatever the day."""
+    provider_ids = {provider_id for provider_id in provider_ids if provider_id}
+    if provider_ids:
+        cache.set_many({_version_key(provider_id): time_ns() for provider_id in provider_ids}, None)
+
+
+def invalidate_hospital_availability(hospital_id):
+    """Drop cached bitmaps for every provider of a hospital (operating hours or timezone changed)."""
+    from accounts.models import EnhancedStaffProfile
+
+    if hospital_id:
+        invalidate_providers(EnhancedStaffProfile.objects.filter(hospital_id=hospital_id).values_list('id', flat=True))
+
+
+def invalidate_user_availability(user_ids):
+    """Drop cached bitmaps for the providers behind these users' external calendars."""
+    from accounts.models import EnhancedStaffProfile
+
+    user_ids = [user_id for user_id in user_ids if user_id]
+    if user_ids:
+        invalidate_providers(EnhancedStaffProfile.objects.filter(user_id__in=user_ids).values_list('id', flat=True))
+
+
+@dataclass
+class ProviderDay:
+    """Minute-resolution availability layers for one provider on one date."""
+    provider_id: str
+    date: date
+    working: np.ndarray   # bool: inside operating hours and the provider's schedule
+    booked: np.ndarray    # uint8: number of active appointments covering each minute
+    external: np.ndarray  # bool: busy in a connected external calendar
+
+    @property
+    def free(self):
+        return self.working & (self.booked == 0) & ~self.external
+
+    def working_hours(self):
+        """First and last working minute, or None if the provider is off."""
+        minutes = np.flatnonzero(self.working)
+        if minutes.size == 0:
+            return None
+        return int(minutes[0]), int(minutes[-1]) + 1
+
+    def to_cache(self):
+        return {
+            'working': np.packbits(self.working),
+            'booked': self.booked,
+            'external': np.packbits(self.external),
+        }
+
+    @classmethod
+    def from_cache(cls, provider_id, day, payload):
+        return cls(
+            provider_id=provider_id,
+            date=day,
+            working=np.unpackbits(payload['working'])[:MINUTES_PER_DAY].astype(bool),
+            booked=payload['booked'].copy(),
+            external=np.unpackbits(payload['external'])[:MINUTES_PER_DAY].astype(bool),
+        )
+
+
+@dataclass(frozen=True)
+class Slot:
+    """A feasible appointment slot."""
+    provider_id: str
+    date: date
+    start_minute: int
+    end_minute: int
+
+    @property
+    def start_time(self):
+        return minute_to_time(self.start_minute)
+
+    @property
+    def end_time(self):
+        return minute_to_time(self.end_minute)
+
+    def to_dict(self):
+        return {
+            'provider_id': str(self.provider_id),
+            'date': self.date.isoformat(),
+            'time': self.start_time.strftime('%H:%M'),
+            'end_time': self.end_time.strftime('%H:%M'),
+            'duration': self.end_minute - self.start_minute,
+        }
+
+
+def sliding_window_starts(free_rows, duration):
+    """
+    Vectorized feasibility test for every start minute of every row.
+
+    ``free_rows`` is an (n, 1440) boolean matrix. Returns an (n, 1441 - duration)
+    boolean matrix where entry [r, m] is True if minutes m..m+duration-1 of row r
+    are all free.
+    """
+    free_rows = np.atleast_2d(free_rows)
+    if duration <= 0 or duration > MINUTES_PER_DAY:
+        return np.zeros((free_rows.shape[0], 0), dtype=bool)
+    blocked = np.zeros((free_rows.shape[0], MINUTES_PER_DAY + 1), dtype=np.int32)
+    np.cumsum(~free_rows, axis=1, out=blocked[:, 1:])
+    return (blocked[:, duration:] - blocked[:, :-duration]) == 0
+
+
+class AvailabilityEngine:
+    """
+    Computes provider availability for one or many providers over one or many days.
+
+    Bitmaps for each provider-day are loaded in bulk (a fixed number of queries
+    regardless of how many providers or days are requested) and cached until
+    an appointment, schedule, operating hours or external calendar behind that
+    provider-day changes.
+    """
+
+    def __init__(self, slot_interval=15, use_cache=True):
+        self.slot_interval = max(1, int(slot_interval))
+        self.use_cache = use_cache
+
+    # ------------------------------------------------------------------
+    # Bitmap construction
+    # ------------------------------------------------------------------
+
+    def get_provider_days(self, providers, dates, exclude_appointment_id=None):
+        """
+        Return {(provider_id, date): ProviderDay} for every provider and date.
+
+        ``providers`` must be EnhancedStaffProfile instances (with ``hospital``
+        and ``user`` loaded to avoid extra queries).
+        """
+        providers = list(providers)
+        dates = sorted(set(dates))
+        result = {}
+        missing = []
+
+        if self.use_cache:
+            versions = _provider_versions([p.id for p in providers])
+            keys = {_cache_key(p.id, d, versions[p.id]): (p, d) for p in providers for d in dates}
+            cached = cache.get_many(list(keys.keys()))
+            for key, (provider, day) in keys.items():
+                payload = cached.get(key)
+                if payload is not None:
+                    result[(provider.id, day)] = ProviderDay.from_cache(provider.id, day, payload)
+                else:
+                    missing.append((provider, day))
+        else:
+            missing = [(p, d) for p in providers for d in dates]
+
+        if missing:
+            built = self._build_provider_days(missing)
+            result.update(built)
+            if self.use_cache:
+                cache.set_many(
+                    {_cache_key(pid, day, versions[pid]): pday.to_cache() for (pid, day), pday in built.items()},
+                    CACHE_TIMEOUT,
+                )
+
+        if exclude_appointment_id:
+            self._release_appointment(result, exclude_appointment_id)
+
+        return result
+
+    def _build_provider_days(self, pairs):
+        """Build bitmaps for (provider, date) pairs with a constant number of queries."""
+        providers = {p.id: p for p, _ in pairs}
+        dates = sorted({d for _, d in pairs})
+        start_date, end_date = dates[0], dates[-1]
+
+        appointment_rows = Appointment.objects.filter(
+            provider_id__in=list(providers.keys()),
+            appointment_date__gte=start_date,
+            appointment_date__lte=end_date,
+            status__in=ACTIVE_APPOINTMENT_STATUSES,
+        ).values_list('provider_id', 'appointment_date', 'start_time', 'end_time', 'duration')
+
+        booked_intervals = defaultdict(list)
+        for provider_id, day, start_time, end_time, duration in appointment_rows:
+            booked_intervals[(provider_id, day)].append(_appointment_interval(start_time, end_time, duration))
+
+        external_intervals = self._load_external_busy(providers, start_date, end_date)
+
+        result = {}
+        for provider, day in pairs:
+            hospital = provider.hospital
+            working = schedule_mask(
+                getattr(hospital, 'operating_hours', None), day, default_hours=DEFAULT_WORKING_HOURS
+            ) & schedule_mask(provider.default_schedule, day)
+
+            external = np.zeros(MINUTES_PER_DAY, dtype=bool)
+            _fill_intervals(external, external_intervals.get((provider.id, day), []))
+
+            result[(provider.id, day)] = ProviderDay(
+                provider_id=provider.id,
+                date=day,
+                working=working,
+                booked=_count_intervals(booked_intervals.get((provider.id, day), [])),
+                external=external,
+            )
+        return result
+
+    def _load_external_busy(self, providers, start_date, end_date):
+        """Busy blocks from synced external calendars, keyed by (provider_id, date)."""
+        from calendar_integrations.models import CalendarAvailability, ExternalCalendarEvent
+
+        user_to_provider = {p.user_id: p for p in providers.values()}
+        intervals = defaultdict(list)
+
+        busy_slots = CalendarAvailability.objects.filter(
+            integration__user_id__in=list(user_to_provider.keys()),
+            date__gte=start_date,
+            date__lte=end_date,
+            is_available=False,
+        ).order_by().values_list('integration__user_id', 'date', 'start_time', 'end_time')
+        for user_id, day, start_time, end_time in busy_slots:
+            provider = user_to_provider[user_id]
+            intervals[(provider.id, day)].append((_to_minute(start_time), _to_minute(end_time) or MINUTES_PER_DAY))
+
+        window_start = timezone.make_aware(datetime.combine(start_date, time.min)) - timedelta(days=1)
+        window_end = timezone.make_aware(datetime.combine(end_date, time.min)) + timedelta(days=2)
+        events = ExternalCalendarEvent.objects.filter(
+            integration__user_id__in=list(user_to_provider.keys()),
+            integration__status='active',
+            start_time__lt=window_end,
+            end_time__gt=window_start,
+        ).order_by().values_list('integration__user_id', 'start_time', 'end_time')
+
+        for user_id, start_dt, end_dt in events:
+            provider = user_to_provider[user_id]
+            tz = hospital_timezone(provider.hospital)
+            local_start = timezone.localtime(start_dt, tz).date()
+            local_end = timezone.localtime(end_dt, tz).date()
+            day = max(local_start, start_date)
+            while day <= min(local_end, end_date):
+                clipped = _clip_to_day(start_dt, end_dt, day, tz)
+                if clipped:
+                    intervals[(provider.id, day)].append(clipped)
+                day += timedelta(days=1)
+
+        return intervals
+
+    def _release_appointment(self, provider_days, appointment_id):
+        """Remove one appointment from the booked layer (used when rescheduling it)."""
+        row = Appointment.objects.filter(id=appointment_id).values_list(
+            'provider_id', 'appointment_date', 'start_time', 'end_time', 'duration', 'status'
+        ).first()
+        if not row:
+            return
+        provider_id, day, start_time, end_time, duration, status = row
+        pday = provider_days.get((provider_id, day))
+        if pday is None or status not in ACTIVE_APPOINTMENT_STATUSES:
+            return
+        start, end = _appointment_interval(start_time, end_time, duration)
+        segment = pday.booked[start:end]
+        pday.booked[start:end] = np.where(segment > 0, segment - 1, 0)
+
+    def resource_mask(self, dates, room=None, equipment=None, exclude_appointment_id=None):
+        """
+        Per-date masks of minutes where the required room and equipment are free.
+
+        Returns {date: bool ndarray}, or None when no resource is required.
+        """
+        equipment = list(equipment or [])
+        if room is None and not equipment:
+            return None
+
+        dates = sorted(set(dates))
+        masks = {day: np.ones(MINUTES_PER_DAY, dtype=bool) for day in dates}
+
+        unusable = (room is not None and not (room.is_active and room.is_available)) or any(
+            not item.is_available for item in equipment
+        )
+        if unusable:
+            for mask in masks.values():
+                mask[:] = False
+            return masks
+
+        resource_filter = Appointment.objects.none()
+        if room is not None:
+            resource_filter = Appointment.objects.filter(room=room)
+        if equipment:
+            resource_filter = resource_filter | Appointment.objects.filter(equipment_needed__in=equipment)
+
+        rows = resource_filter.filter(
+            appointment_date__gte=dates[0],
+            appointment_date__lte=dates[-1],
+            status__in=ACTIVE_APPOINTMENT_STATUSES,
+        )
+        if exclude_appointment_id:
+            rows = rows.exclude(id=exclude_appointment_id)
+
+        for day, start_time, end_time, duration in rows.distinct().values_list(
+            'appointment_date', 'start_time', 'end_time', 'duration'
+        ):
+            if day in masks:
+                start, end = _appointment_interval(start_time, end_time, duration)
+                masks[day][start:end] = False
+        return masks
+
+    # ------------------------------------------------------------------
+    # Slot queries
+    # ------------------------------------------------------------------
+
+    def _start_mask(self, day, duration, now=None):
+        """
+        Start minutes that are aligned to the slot interval and not in the past.
+
+        ``now`` is a local time on the provider's hospital clock (see provider_now).
+        """
+        starts = np.arange(MINUTES_PER_DAY + 1 - duration)
+        mask = (starts % self.slot_interval) == 0
+        now = now or timezone.localtime()
+        if day < now.date():
+            mask[:] = False
+        elif day == now.date():
+            mask &= starts > (now.hour * 60 + now.minute)
+        return mask
+
+    def free_matrix(self, providers, dates, room=None, equipment=None, exclude_appointment_id=None):
+        """
+        Stack free-minute bitmaps for every (provider, date) pair, date-major.
+
+        Returns (keys, free, provider_days) where ``free`` is an (n, 1440)
+        boolean matrix whose rows line up with ``keys``.
+        """
+        provider_days = self.get_provider_days(providers, dates, exclude_appointment_id)
+        resources = self.resource_mask(dates, room, equipment, exclude_appointment_id)
+
+        keys = [(p.id, d) for d in dates for p in providers]
+        free = np.stack([provider_days[key].free for key in keys])
+        if resources is not None:
+            free &= np.stack([resources[d] for _, d in keys])
+        return keys, free, provider_days
+
+    def find_slots(self, providers, dates, duration, room=None, equipment=None,
+                   exclude_appointment_id=None, limit=None, now=None):
+        """
+        Return every feasible Slot of ``duration`` minutes, ordered by date,
+        start time and provider.
+        """
+        providers = list(providers)
+        dates = sorted(set(dates))
+        duration = int(duration)
+        if not providers or not dates or duration <= 0 or duration > MINUTES_PER_DAY:
+            return []
+
+        keys, free, _ = self.free_matrix(providers, dates, room, equipment, exclude_appointment_id)
+
+        feasible = sliding_window_starts(free, duration)
+        # Providers may sit in different timezones; mask the past on each one's own clock
+        local_nows = {
+            p.id: provider_now(p, now).replace(tzinfo=None, second=0, microsecond=0) for p in providers
+        }
+        start_masks = {
+            (d, local_now): self._start_mask(d, duration, local_now)
+            for d, local_now in {(d, local_nows[pid]) for pid, d in keys}
+        }
+        feasible &= np.stack([start_masks[(d, local_nows[pid])] for pid, d in keys])
+
+        rows, starts = np.nonzero(feasible)
+        # np.nonzero walks row-major; re-sort so providers interleave by start time within a day
+        date_positions = {d: i for i, d in enumerate(dates)}
+        row_dates = np.array([date_positions[d] for _, d in keys], dtype=np.int32)
+        order = np.lexsort((rows, starts, row_dates[rows]))
+
+        slots = []
+        for idx in order:
+            provider_id, day = keys[rows[idx]]
+            start = int(starts[idx])
+            slots.append(Slot(provider_id, day, start, start + duration))
+            if limit and len(slots) >= limit:
+                break
+        return slots
+
+    def day_slots(self, provider, day, duration, room=None, equipment=None,
+                  exclude_appointment_id=None, now=None):
+        """
+        Available and unavailable slots for a single provider-day, with reasons.
+
+        Returns (available, unavailable, working_hours) where the slot lists hold
+        dicts shaped like the time-slots API response.
+        """
+        duration = int(duration)
+        pday = self.get_provider_days([provider], [day], exclude_appointment_id)[(provider.id, day)]
+        resources = self.resource_mask([day], room, equipment, exclude_appointment_id)
+
+        hours = pday.working_hours()
+        if hours is None or duration <= 0 or duration > MINUTES_PER_DAY:
+            return [], [], hours
+
+        starts = np.arange(MINUTES_PER_DAY + 1 - duration)
+        candidate = (starts % self.slot_interval == 0) & (starts >= hours[0]) & (starts + duration <= hours[1])
+
+        # Reason codes index into UNAVAILABLE_REASONS; the first blocking layer wins
+        layers = [~pday.working, pday.booked > 0, pday.external]
+        if resources is not None:
+            layers.append(~resources[day])
+
+        reasons = np.zeros(starts.shape, dtype=np.int8)
+        for code, blocked in enumerate(layers, start=1):
+            hit = ~sliding_window_starts(~blocked, duration)[0]
+            reasons[hit & (reasons == 0)] = code
+
+        now = provider_now(provider, now)
+        if day < now.date():
+            reasons[:] = PAST_REASON
+        elif day == now.date():
+            reasons[starts <= now.hour * 60 + now.minute] = PAST_REASON
+
+        available, unavailable = [], []
+        for start in np.flatnonzero(candidate):
+            slot = Slot(provider.id, day, int(start), int(start) + duration).to_dict()
+            del slot['provider_id'], slot['date']
+            slot['available'] = bool(reasons[start] == 0)
+            if slot['available']:
+                available.append(slot)
+            else:
+                slot['reason'] = UNAVAILABLE_REASONS[reasons[start]]
+                unavailable.append(slot)
+        return available, unavailable, hours
+
+
+availability_engine = AvailabilityEngine()
@@ -0,0 +1,232 @@
+"""
+Interval-based appointment conflict detection.
+
+An appointment occupies the absolute range [starts_at, ends_at). A booking
+conflicts with every active appointment whose range overlaps it and that
+shares its provider, patient or room. On PostgreSQL the same rule is enforced
+by GiST exclusion constraints (migration 0004), which closes the race between
+checking and inserting; on other databases the check runs while holding row
+locks on the provider and patient.
+"""
+
+import logging
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
+
+from .availability import ACTIVE_APPOINTMENT_STATUSES
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+EXCLUSION_CONSTRAINT_NAMES = (
+    'appointments_provider_no_overlap',
+    'appointments_patient_no_overlap',
+    'appointments_room_no_overlap',
+)
+
+RESOURCE_FIELDS = ('provider_id', 'patient_id', 'room_id')
+
+
+class AppointmentConflictError(Exception):
+    """Raised when a booking overlaps existing appointments"""
+
+    def __init__(self, conflicts, message="Appointment conflicts with existing bookings"):
+        super().__init__(message)
+        self.message = message
+        self.conflicts = conflicts
+
+
+def _pk(value):
+    """Accept either a model instance or a primary key"""
+    return getattr(value, 'pk', value)
+
+
+def _conflict_dict(row, conflict_on):
+    return {
+        'appointment_id': str(row['id']) if row.get('id') else None,
+        'conflict_on': conflict_on,
+        'start': row['starts_at'].isoformat(),
+        'end': row['ends_at'].isoformat(),
+        'status': row.get('status'),
+    }
+
+
+def conflict_message(conflicts):
+    """Human readable summary of what a booking clashes with"""
+    resources = {resource for conflict in conflicts for resource in conflict['conflict_on']}
+    if 'provider' in resources:
+        return "Provider is already booked at this time"
+    if 'patient' in resources:
+        return "Patient already has an appointment at this time"
+    return "Room is already booked at this time"
+
+
+def booking_from_data(data, instance=None):
+    """
+    Build find_conflicts() arguments from serializer data, falling back to the
+    instance being updated for fields that were not supplied. Returns None when
+    there is nothing to check: the booking has no time yet, or it is (or is
+    being changed to) an inactive status such as cancelled, which never holds
+    its slot.
+    """
+    def value(field):
+        if field in data:
+            return data[field]
+        return getattr(instance, field, None) if instance else None
+
+    status = value('status') or Appointment._meta.get_field('status').get_default()
+    if status not in ACTIVE_APPOINTMENT_STATUSES:
+        return None
+
+    appointment_date = value('appointment_date')
+    start_time = value('start_time')
+    if not (appointment_date and start_time):
+        return None
+
+    duration = value('duration')
+    appointment_type = value('appointment_type')
+    if not duration and appointment_type:
+        duration = appointment_type.default_duration
+
+    provider = value('provider')
+    starts_at, ends_at = Appointment.compute_scheduled_range(
+        appointment_date, start_time, duration, None if duration else value('end_time'),
+        value('hospital') or getattr(provider, 'hospital', None)
+    )
+    return {
+        'starts_at': starts_at,
+        'ends_at': ends_at,
+        'provider': provider,
+        'patient': value('patient'),
+        'room': value('room'),
+        'exclude_ids': [instance.pk] if instance and instance.pk else None,
+    }
+
+
+def find_conflicts(starts_at, ends_at, provider=None, patient=None, room=None, exclude_ids=None):
+    """
+    Active appointments overlapping [starts_at, ends_at) on the same provider,
+    patient or room, in one indexed query.
+    """
+    resources = {
+        'provider_id': _pk(provider),
+        'patient_id': _pk(patient),
+        'room_id': _pk(room),
+    }
+    resource_q = Q()
+    for field, pk in resources.items():
+        if pk is not None:
+            resource_q |= Q(**{field: pk})
+    if not resource_q or ends_at <= starts_at:
+        return []
+
+    rows = Appointment.objects.filter(
+        resource_q,
+        starts_at__lt=ends_at,
+        ends_at__gt=starts_at,
+        status__in=ACTIVE_APPOINTMENT_STATUSES,
+    )
+    if exclude_ids:
+        rows = rows.exclude(id__in=exclude_ids)
+
+    conflicts = []
+    for row in rows.order_by('starts_at').values('id', *RESOURCE_FIELDS, 'starts_at', 'ends_at', 'status'):
+        conflict_on = [
+            field[:-3] for field, pk in resources.items()
+            if pk is not None and str(row[field]) == str(pk)
+        ]
+        conflicts.append(_conflict_dict(row, conflict_on))
+    return conflicts
+
+
+def lock_booking_resources(provider=None, patient=None):
+    """
+    Serialize concurrent bookings for the same provider and patient by locking
+    their profile rows (always provider first to avoid lock-order deadlocks).
+    """
+    from accounts.models import EnhancedPatient, EnhancedStaffProfile
+
+    if provider is not None:
+        list(EnhancedStaffProfile.objects.select_for_update().filter(pk=_pk(provider)).values_list('pk'))
+    if patient is not None:
+        list(EnhancedPatient.objects.select_for_update().filter(pk=_pk(patient)).values_list('pk'))
+
+
+def save_without_conflicts(save, starts_at, ends_at, provider=None, patient=None, room=None, exclude_ids=None):
+    """
+    Run ``save()`` only if the booking does not overlap existing appointments.
+
+    The check and the write happen in one transaction under row locks; on
+    PostgreSQL an exclusion-constraint violation raised by a concurrent writer
+    is translated into the same AppointmentConflictError.
+    """
+    booking = {
+        'starts_at': starts_at,
+        'ends_at': ends_at,
+        'provider': provider,
+        'patient': patient,
+        'room': room,
+        'exclude_ids': exclude_ids,
+    }
+    with transaction.atomic():
+        lock_booking_resources(provider, patient)
+        conflicts = find_conflicts(**booking)
+        if conflicts:
+            raise AppointmentConflictError(conflicts, conflict_message(conflicts))
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError as e:
+            conflicts = find_conflicts(**booking)
+            if conflicts or any(name in str(e) for name in EXCLUSION_CONSTRAINT_NAMES):
+                logger.info(f"Booking rejected by database overlap constraint: {e}")
+                raise AppointmentConflictError(conflicts, conflict_message(conflicts) if conflicts else str(e))
+            raise
+
+
+def find_double_bookings(appointments):
+    """
+    Active appointments that overlap an earlier-created one on the same
+    provider, patient or room, as the exclusion constraints would reject.
+
+    ``appointments`` is the queryset to check. The earliest-created booking
+    keeps its slot; each later booking that overlaps a kept one is reported as
+    (appointment id, id of the kept appointment, shared resources), in
+    creation order.
+    """
+    active = appointments.filter(
+        status__in=ACTIVE_APPOINTMENT_STATUSES, starts_at__isnull=False, ends_at__gt=F('starts_at')
+    )
+
+    def overlapping(field):
+        return active.filter(
+            **{field: OuterRef(field)}, starts_at__lt=OuterRef('ends_at'), ends_at__gt=OuterRef('starts_at')
+        ).exclude(pk=OuterRef('pk'))
+
+    # Only bookings that overlap another one at all are walked in Python
+    rows = active.filter(
+        Exists(overlapping('provider_id')) | Exists(overlapping('patient_id'))
+        | Q(room_id__isnull=False) & Exists(overlapping('room_id'))
+    ).order_by('created_at', 'pk').values_list('pk', *RESOURCE_FIELDS, 'starts_at', 'ends_at')
+
+    kept = defaultdict(list)  # (field, value) -> [(starts_at, ends_at, pk)]
+    double_bookings = []
+    for pk, provider_id, patient_id, room_id, starts_at, ends_at in rows:
+        resources = [
+            (field, value) for field, value in zip(RESOURCE_FIELDS, (provider_id, patient_id, room_id))
+            if value is not None
+        ]
+        clashes = defaultdict(list)
+        for resource in resources:
+            for other_start, other_end, other_pk in kept[resource]:
+                if other_start < ends_at and starts_at < other_end:
+                    clashes[other_pk].append(resource[0][:-3])
+        if clashes:
+            other_pk, conflict_on = next(iter(clashes.items()))
+            double_bookings.append((pk, other_pk, conflict_on))
+        else:
+            for resource in resources:
+                kept[resource].append((starts_at, ends_at, pk))
+    return double_bookings
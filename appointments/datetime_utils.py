@@ -12,6 +12,19 @@ import pytz
 
 logger = logging.getLogger(__name__)
 
+
+def hospital_timezone(hospital):
+    """Resolve a hospital's configured timezone, falling back to the project default."""
+    tz_name = getattr(hospital, 'timezone', None)
+    if tz_name:
+        try:
+            from zoneinfo import ZoneInfo
+            return ZoneInfo(tz_name)
+        except Exception:
+            logger.warning(f"Unknown timezone '{tz_name}' for hospital {getattr(hospital, 'id', None)}")
+    return timezone.get_default_timezone()
+
+
 class DateTimeValidator:
     """Comprehensive datetime validation for appointments"""
     
@@ -0,0 +1,205 @@
+import random
+import time
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import EnhancedPatient, EnhancedStaffProfile, Hospital
+from appointments.availability import (
+    MINUTES_PER_DAY, AvailabilityEngine, _cache_key, _provider_versions, invalidate_providers
+)
+from appointments.models import Appointment, AppointmentType
+from appointments.slot_search import SlotSearchService
+from authentication.models import User
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+class _Rollback(Exception):
+    pass
+
+
+class PrecomputedEngine(AvailabilityEngine):
+    """
+    Serves a synthetic free-minute matrix (9:00-17:00 with twelve random
+    30-minute bookings per provider-day), so slot search is measured without
+    the database or the cache.
+    """
+
+    def __init__(self, seed=0):
+        super().__init__()
+        self.seed = seed
+        self.calls = []
+
+    def free_matrix(self, providers, dates, room=None, equipment=None, exclude_appointment_id=None):
+        self.calls.append((len(providers), len(dates)))
+        keys = [(p.id, d) for d in dates for p in providers]
+        rng = np.random.default_rng(self.seed)
+        free = np.zeros((len(keys), MINUTES_PER_DAY), dtype=bool)
+        free[:, 8 * 60:17 * 60] = True
+        for row in range(len(keys)):
+            for start in rng.integers(8 * 60, 16 * 60, size=12):
+                free[row, start:start + 30] = False
+        return keys, free, {}
+
+
+def synthetic_providers(count, hospital=None, user=None):
+    """Unsaved providers sharing one hospital and user; slot search only reads their ids and clocks"""
+    hospital = hospital or Hospital(name='Benchmark Hospital')
+    user = user or User(first_name='Benchmark', last_name='Doctor')
+    return [EnhancedStaffProfile(id=uuid.uuid4(), user=user, hospital=hospital) for _ in range(count)]
+
+
+def seed_hospital(providers, days, bookings_per_day=12, seed=0):
+    """
+    A hospital open 9:00-17:00 every day with ``providers`` doctors, each
+    holding ``bookings_per_day`` random 30-minute appointments per day with
+    their own patient. Returns the hospital and the first day seeded.
+    """
+    rng = random.Random(seed)
+    tag = uuid.uuid4().hex[:8]
+    hospital = Hospital.objects.create(
+        name=f'Benchmark Hospital {tag}',
+        slug=f'benchmark-hospital-{tag}',
+        email=f'benchmark-{tag}@hospital.test',
+        phone='+254700000000',
+        address_line_1='1 Benchmark Road',
+        city='Nairobi',
+        state='Nairobi',
+        postal_code='00100',
+        operating_hours={day: {'start': '09:00', 'end': '17:00'} for day in WEEKDAYS},
+    )
+    appointment_type = AppointmentType.objects.create(
+        hospital=hospital, name='Benchmark Consultation', code=f'B{tag}', default_duration=30
+    )
+    start = timezone.localdate() + timedelta(days=1)
+    half_hours = [dt_time(9 + i // 2, 30 * (i % 2)) for i in range(16)]
+
+    # Users and patients are bulk inserted so no welcome emails or registration signals fire
+    users = User.objects.bulk_create([
+        User(username=f'benchmark_{role}_{tag}_{index}', email=f'{role}{index}-{tag}@hospital.test',
+             full_name=f'Benchmark {role.title()} {index}', role=role)
+        for index in range(providers) for role in ('doctor', 'patient')
+    ])
+    # One patient per doctor, so bookings never double-book a patient
+    patients = EnhancedPatient.objects.bulk_create([
+        EnhancedPatient(
+            user=user, date_of_birth=date(1990, 1, 1), gender='F', phone='+254700000001',
+            address_line1='2 Benchmark Road', city='Nairobi', state='Nairobi', zip_code='00100',
+            emergency_contact_name='Contact', emergency_contact_relationship='Sibling',
+            emergency_contact_phone='+254700000002',
+        )
+        for user in users[1::2]
+    ])
+
+    appointments = []
+    for doctor_user, patient in zip(users[::2], patients):
+        doctor = EnhancedStaffProfile.objects.create(
+            user=doctor_user, hospital=hospital, job_title='Physician', hire_date=date(2020, 1, 1)
+        )
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            for start_time in rng.sample(half_hours, min(bookings_per_day, len(half_hours))):
+                appointment = Appointment(
+                    patient=patient, provider=doctor, hospital=hospital, appointment_type=appointment_type,
+                    appointment_date=day, start_time=start_time, duration=30,
+                    end_time=(datetime.combine(day, start_time) + timedelta(minutes=30)).time(),
+                    reason='Benchmark booking', status='scheduled',
+                )
+                appointment.set_scheduled_range()
+                appointments.append(appointment)
+    Appointment.objects.bulk_create(appointments, batch_size=1000)
+    return hospital, start
+
+
+class Command(BaseCommand):
+    help = (
+        'Time multi-provider slot search over a precomputed availability matrix, or with --seed '
+        'over seeded providers and appointments through the default engine (data is rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--providers', type=int, default=50, help='Providers searched')
+        parser.add_argument('--days', type=int, default=14, help='Days in the search range')
+        parser.add_argument('--limit', type=int, default=50, help='Slots per page')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed searches')
+        parser.add_argument('--seed', action='store_true',
+                            help='Search seeded providers and appointments with the database and cache')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            try:
+                with transaction.atomic():
+                    self.search_seeded(options)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+            return
+
+        engine = PrecomputedEngine()
+        service = SlotSearchService(engine=engine)
+        providers = synthetic_providers(options['providers'])
+        start = timezone.localdate() + timedelta(days=1)
+        end = start + timedelta(days=options['days'] - 1)
+
+        # The engine's own cost is not part of the search; time it separately
+        started = time.perf_counter()
+        engine.free_matrix(providers, [start + timedelta(days=i) for i in range(options['days'])])
+        matrix = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for _ in range(options['repeat']):
+            result = service.search(providers, start, end, 30, limit=options['limit'])
+        elapsed = (time.perf_counter() - started) / options['repeat'] * 1000
+
+        self.stdout.write(
+            f"{options['providers']} providers x {options['days']} days: "
+            f"{elapsed:.2f} ms per search including {matrix:.2f} ms building the matrix, "
+            f"{len(result['slots'])} slots returned"
+        )
+
+    def search_seeded(self, options):
+        """Time the endpoint's path: provider lookup, then search with a cold and a warm cache"""
+        self.stdout.write(f"Seeding {options['providers']} providers x {options['days']} days...")
+        hospital, start = seed_hospital(options['providers'], options['days'])
+        end = start + timedelta(days=options['days'] - 1)
+        service = SlotSearchService()
+
+        def search():
+            providers = service.matching_providers(hospital=hospital)
+            return service.search(providers, start, end, 30, limit=options['limit'])
+
+        invalidate_providers(EnhancedStaffProfile.objects.filter(hospital=hospital).values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = search()
+            cold = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for _ in range(options['repeat']):
+            search()
+        warm = (time.perf_counter() - started) / options['repeat'] * 1000
+
+        self.stdout.write(
+            f"{options['providers']} providers x {options['days']} days: "
+            f"{cold:.2f} ms cold ({len(queries)} queries), {warm:.2f} ms with the cache warm, "
+            f"{len(result['slots'])} slots returned"
+        )
+
+        # A cache too small for every provider-day rebuilds bitmaps on "warm" searches too
+        provider_ids = [provider.id for provider in service.matching_providers(hospital=hospital)]
+        versions = _provider_versions(provider_ids)
+        keys = [_cache_key(pid, start + timedelta(days=i), versions[pid])
+                for pid in provider_ids for i in range(options['days'])]
+        cached = len(cache.get_many(keys))
+        if cached < len(keys):
+            self.stdout.write(self.style.WARNING(
+                f"Only {cached} of {len(keys)} provider-day bitmaps stayed cached; "
+                f"the warm time includes rebuilding the rest (check CACHES)"
+            ))
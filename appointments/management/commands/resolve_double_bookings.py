@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from appointments.conflicts import find_double_bookings
+from appointments.models import Appointment
+from appointments.views import cancel_appointment_booking
+
+
+class Command(BaseCommand):
+    help = (
+        'List active appointments that double-book a provider, patient or room '
+        '(run before migrating to the no-overlap constraints)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--apply',
+            action='store_true',
+            help='Cancel the later booking of each pair, notifying its patient and provider',
+        )
+
+    def handle(self, *args, **options):
+        double_bookings = find_double_bookings(Appointment.objects.all())
+        if not double_bookings:
+            self.stdout.write(self.style.SUCCESS("No double bookings found"))
+            return
+
+        appointments = Appointment.objects.select_related(
+            'patient__user', 'provider__user', 'appointment_type'
+        ).in_bulk([pk for pk, _, _ in double_bookings])
+        for pk, kept_pk, conflict_on in double_bookings:
+            appointment = appointments[pk]
+            self.stdout.write(
+                f"  {appointment.id} {appointment.starts_at:%Y-%m-%d %H:%M} "
+                f"overlaps {kept_pk} ({', '.join(conflict_on)})"
+            )
+
+        if not options['apply']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(double_bookings)} double bookings found; run with --apply to cancel the later booking "
+                f"of each, or reschedule them first"
+            ))
+            return
+
+        for pk, kept_pk, _ in double_bookings:
+            cancel_appointment_booking(
+                appointments[pk], f'Cancelled: double-booked with appointment {kept_pk}'
+            )
+        self.stdout.write(self.style.SUCCESS(f"Cancelled {len(double_bookings)} double bookings"))
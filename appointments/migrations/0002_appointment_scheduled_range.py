@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:46
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _hospital_timezone(hospital, cache):
+    if hospital.pk not in cache:
+        try:
+            cache[hospital.pk] = ZoneInfo(hospital.timezone) if hospital.timezone else None
+        except Exception:
+            cache[hospital.pk] = None
+    return cache[hospital.pk] or timezone.get_default_timezone()
+
+
+def backfill_scheduled_range(apps, schema_editor):
+    # Date and time are wall-clock values at the appointment's hospital
+    Appointment = apps.get_model('appointments', 'Appointment')
+    timezones = {}
+    batch = []
+    appointments = Appointment.objects.filter(starts_at__isnull=True).select_related('hospital')
+    for appointment in appointments.iterator(chunk_size=1000):
+        tz = _hospital_timezone(appointment.hospital, timezones)
+        starts_at = timezone.make_aware(datetime.combine(appointment.appointment_date, appointment.start_time), tz)
+        if appointment.duration:
+            ends_at = starts_at + timedelta(minutes=appointment.duration)
+        elif appointment.end_time:
+            ends_at = timezone.make_aware(datetime.combine(appointment.appointment_date, appointment.end_time), tz)
+            if ends_at <= starts_at:
+                ends_at += timedelta(days=1)
+        else:
+            ends_at = starts_at
+        appointment.starts_at, appointment.ends_at = starts_at, ends_at
+        batch.append(appointment)
+        if len(batch) >= 1000:
+            Appointment.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_alter_hospital_hospital_type'),
+        ('appointments', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['provider', 'starts_at', 'ends_at'], name='appt_provider_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'starts_at', 'ends_at'], name='appt_patient_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['room', 'starts_at', 'ends_at'], name='appt_room_range_idx'),
+        ),
+        migrations.RunPython(backfill_scheduled_range, migrations.RunPython.noop),
+    ]
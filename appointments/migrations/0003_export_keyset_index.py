@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_export_keyset_index'),
+        ('appointments', '0002_appointment_scheduled_range'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['hospital', 'updated_at', 'id'], name='appt_hospital_updated_idx'),
+        ),
+    ]
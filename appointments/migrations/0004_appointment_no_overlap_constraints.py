@@ -0,0 +1,136 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:20
+
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef, Q
+
+ACTIVE_STATUSES = ('scheduled', 'confirmed', 'pending', 'checked_in', 'in_progress')
+
+RESOURCE_FIELDS = ('provider_id', 'patient_id', 'room_id')
+
+# Exclusion constraints that make overlapping active bookings impossible at the
+# database level. Only PostgreSQL supports them; other backends rely on the
+# indexed overlap query in appointments.conflicts.
+EXCLUSION_CONSTRAINTS = {
+    'appointments_provider_no_overlap': 'provider_id WITH =',
+    'appointments_patient_no_overlap': 'patient_id WITH =',
+    'appointments_room_no_overlap': 'room_id WITH =',
+}
+
+# Double bookings listed in the error; the command reports all of them
+MAX_REPORTED = 50
+
+
+def find_double_bookings(Appointment):
+    """
+    Active appointments that overlap an earlier-created one on the same
+    provider, patient or room, as (appointment id, id of the kept
+    appointment, shared resources) in creation order. A frozen copy of
+    appointments.conflicts.find_double_bookings, so later changes to the app
+    code cannot change what this migration checks.
+    """
+    active = Appointment.objects.filter(
+        status__in=ACTIVE_STATUSES, starts_at__isnull=False, ends_at__gt=F('starts_at')
+    )
+
+    def overlapping(field):
+        return active.filter(
+            **{field: OuterRef(field)}, starts_at__lt=OuterRef('ends_at'), ends_at__gt=OuterRef('starts_at')
+        ).exclude(pk=OuterRef('pk'))
+
+    rows = active.filter(
+        Exists(overlapping('provider_id')) | Exists(overlapping('patient_id'))
+        | Q(room_id__isnull=False) & Exists(overlapping('room_id'))
+    ).order_by('created_at', 'pk').values_list('pk', *RESOURCE_FIELDS, 'starts_at', 'ends_at')
+
+    kept = defaultdict(list)  # (field, value) -> [(starts_at, ends_at, pk)]
+    double_bookings = []
+    for pk, provider_id, patient_id, room_id, starts_at, ends_at in rows:
+        resources = [
+            (field, value) for field, value in zip(RESOURCE_FIELDS, (provider_id, patient_id, room_id))
+            if value is not None
+        ]
+        clashes = defaultdict(list)
+        for resource in resources:
+            for other_start, other_end, other_pk in kept[resource]:
+                if other_start < ends_at and starts_at < other_end:
+                    clashes[other_pk].append(resource[0][:-3])
+        if clashes:
+            other_pk, conflict_on = next(iter(clashes.items()))
+            double_bookings.append((pk, other_pk, conflict_on))
+        else:
+            for resource in resources:
+                kept[resource].append((starts_at, ends_at, pk))
+    return double_bookings
+
+
+def check_no_double_bookings(Appointment):
+    """
+    Fail with a report of the existing double bookings, which the exclusion
+    constraints would reject. They are resolved with the
+    resolve_double_bookings management command, which cancels bookings through
+    the normal cancellation path so reminders are cancelled and patients and
+    providers are notified; a migration cannot do that.
+    """
+    double_bookings = find_double_bookings(Appointment)
+    if not double_bookings:
+        return
+    lines = [
+        f"  appointment {pk} overlaps appointment {kept_pk} ({', '.join(conflict_on)})"
+        for pk, kept_pk, conflict_on in double_bookings[:MAX_REPORTED]
+    ]
+    if len(double_bookings) > MAX_REPORTED:
+        lines.append(f"  ... and {len(double_bookings) - MAX_REPORTED} more")
+    raise RuntimeError(
+        f"{len(double_bookings)} active appointments double-book a provider, patient or room, "
+        f"so the no-overlap constraints cannot be added:\n" + '\n'.join(lines) + "\n"
+        f"Review them with `python manage.py resolve_double_bookings`, resolve them "
+        f"(`--apply` cancels the later booking of each pair), then migrate again."
+    )
+
+
+def add_exclusion_constraints(apps, schema_editor):
+    # Other backends have no exclusion constraints. A missing btree_gist
+    # extension fails the migration, since the conflict check relies on the
+    # constraints to close the booking race
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = 'appointments'::regclass AND conname = ANY(%s)",
+            [list(EXCLUSION_CONSTRAINTS)]
+        )
+        existing = {name for name, in cursor.fetchall()}
+    if existing == set(EXCLUSION_CONSTRAINTS):
+        return
+
+    check_no_double_bookings(apps.get_model('appointments', 'Appointment'))
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, key in EXCLUSION_CONSTRAINTS.items():
+        if name in existing:
+            continue
+        schema_editor.execute(
+            f"ALTER TABLE appointments ADD CONSTRAINT {name} EXCLUDE USING gist "
+            f"({key}, tstzrange(starts_at, ends_at, '[)') WITH &&) "
+            f"WHERE (status IN {ACTIVE_STATUSES} AND starts_at IS NOT NULL"
+            f"{' AND room_id IS NOT NULL' if name == 'appointments_room_no_overlap' else ''})"
+        )
+
+
+def drop_exclusion_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in EXCLUSION_CONSTRAINTS:
+        schema_editor.execute(f'ALTER TABLE appointments DROP CONSTRAINT IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_export_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_exclusion_constraints, drop_exclusion_constraints),
+    ]
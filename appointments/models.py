@@ -2,9 +2,12 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from datetime import datetime, timedelta
 from decimal import Decimal
 import uuid
 
+from .datetime_utils import hospital_timezone
+
 
 class AppointmentType(models.Model):
     """Different types of appointments (consultation, follow-up, procedure, etc.)"""
@@ -132,6 +135,11 @@ class Appointment(models.Model):
         help_text="Actual duration in minutes"
     )
     
+    # Absolute [starts_at, ends_at) range used for overlap/conflict checks.
+    # Kept in sync by save(); backs the GiST exclusion constraints on PostgreSQL.
+    starts_at = models.DateTimeField(null=True, blank=True, editable=False)
+    ends_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
     # Appointment Details
     title = models.CharField(max_length=255, blank=True)
     reason = models.TextField(help_text="Reason for appointment")
@@ -232,6 +240,10 @@ class Appointment(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['priority']),
             models.Index(fields=['room', 'appointment_date']),
+            models.Index(fields=['provider', 'starts_at', 'ends_at'], name='appt_provider_range_idx'),
+            models.Index(fields=['patient', 'starts_at', 'ends_at'], name='appt_patient_range_idx'),
+            models.Index(fields=['room', 'starts_at', 'ends_at'], name='appt_room_range_idx'),
+            models.Index(fields=['hospital', 'updated_at', 'id'], name='appt_hospital_updated_idx'),
         ]
         unique_together = [['provider', 'appointment_date', 'start_time']]
     
@@ -302,6 +314,12 @@ class Appointment(models.Model):
         if not self.estimated_cost and self.appointment_type.base_cost:
             self.estimated_cost = self.appointment_type.base_cost
         
+        # Keep the absolute time range in sync with date/time/duration
+        self.set_scheduled_range()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'appointment_date', 'start_time', 'end_time', 'duration'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'starts_at', 'ends_at'}
+        
         super().save(*args, **kwargs)
         
         # Automatically create or update HospitalPatient relationship
@@ -310,6 +328,32 @@ class Appointment(models.Model):
     def __str__(self):
         return f"{self.patient.user.full_name} - {self.provider.user.full_name} ({self.appointment_date} {self.start_time})"
     
+    @staticmethod
+    def compute_scheduled_range(appointment_date, start_time, duration=None, end_time=None, hospital=None):
+        """
+        Return the aware (starts_at, ends_at) range for a date, start time and
+        duration, read as wall-clock time at ``hospital``.
+        """
+        tz = hospital_timezone(hospital)
+        starts_at = timezone.make_aware(datetime.combine(appointment_date, start_time), tz)
+        if duration:
+            ends_at = starts_at + timedelta(minutes=duration)
+        elif end_time:
+            ends_at = timezone.make_aware(datetime.combine(appointment_date, end_time), tz)
+            if ends_at <= starts_at:
+                ends_at += timedelta(days=1)
+        else:
+            ends_at = starts_at
+        return starts_at, ends_at
+    
+    def set_scheduled_range(self):
+        """Populate starts_at/ends_at from the appointment's date, time and duration"""
+        if self.appointment_date and self.start_time:
+            self.starts_at, self.ends_at = self.compute_scheduled_range(
+                self.appointment_date, self.start_time, self.duration, self.end_time,
+                self.hospital if self.hospital_id else None
+            )
+    
     @property
     def is_today(self):
         """Check if appointment is today"""
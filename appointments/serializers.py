@@ -7,6 +7,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from accounts.models import EnhancedPatient, EnhancedStaffProfile
 from .models import AppointmentType, Appointment, AppointmentWaitlist, Room, Equipment
+from .conflicts import booking_from_data, save_without_conflicts
 from accounts.models import Hospital
 
 User = get_user_model()
@@ -282,34 +283,20 @@ class AppointmentSerializer(serializers.ModelSerializer):
                     "Appointments must be scheduled between 8:00 AM and 6:00 PM"
                 )
         
-        # Check for conflicts (if this is a new appointment or date/time changed)
-        if appointment_date and start_time and patient and provider:
-            existing_appointments = Appointment.objects.filter(
-                appointment_date=appointment_date,
-                start_time=start_time,
-                status__in=['scheduled', 'confirmed', 'pending']
-            )
-            
-            # Exclude current appointment if updating
-            if self.instance:
-                existing_appointments = existing_appointments.exclude(id=self.instance.id)
-            
-            # Check provider availability
-            provider_conflict = existing_appointments.filter(provider=provider).exists()
-            if provider_conflict:
-                raise serializers.ValidationError(
-                    "Provider is already booked at this time"
-                )
-            
-            # Check patient availability
-            patient_conflict = existing_appointments.filter(patient=patient).exists()
-            if patient_conflict:
-                raise serializers.ValidationError(
-                    "Patient already has an appointment at this time"
-                )
-        
+        # Overlapping bookings are rejected by save(), under row locks
         return data
     
+    def save(self, **kwargs):
+        """
+        Save unless the booking overlaps an appointment of the same provider,
+        patient or room (updates fall back to the instance's current values);
+        raises AppointmentConflictError if it does.
+        """
+        booking = booking_from_data({**self.validated_data, **kwargs}, self.instance)
+        if booking is None:
+            return super().save(**kwargs)
+        return save_without_conflicts(lambda: super(AppointmentSerializer, self).save(**kwargs), **booking)
+    
     def validate_status(self, value):
         """Validate status transitions"""
         if self.instance:  # Updating existing appointment
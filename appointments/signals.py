@@ -4,11 +4,17 @@ Handles lifecycle events to trigger, update, or cancel reminders.
 """
 
 import logging
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.core.cache import cache
+from accounts.models import EnhancedStaffProfile, Hospital
+from calendar_integrations.models import CalendarAvailability, CalendarIntegration, ExternalCalendarEvent
 from .models import Appointment
+from .availability import (
+    invalidate_hospital_availability, invalidate_provider_days, invalidate_providers, invalidate_user_availability
+)
+from .stats import invalidate_appointment_stats
 from notifications.appointment_reminders import AppointmentReminderService
 from notifications.scheduler import NotificationScheduler
 
@@ -55,35 +61,33 @@ def handle_appointment_created_or_updated(sender, instance, created, **kwargs):
             # Existing appointment updated - handle status changes
             logger.info(f"Appointment updated: {instance.id}. Checking for status changes.")
             
-            # Get the previous state to compare changes
-            try:
-                # Get the previous instance from database
-                previous_instance = Appointment.objects.get(id=instance.id)
-                
-                # Check if status changed to cancelled, completed, or no_show
-                if instance.status in ['cancelled', 'completed', 'no_show'] and previous_instance.status not in ['cancelled', 'completed', 'no_show']:
-                    # Cancel all pending reminders for this appointment
-                    logger.info(f"Appointment {instance.id} status changed to {instance.status}. Cancelling reminders.")
-                    scheduler.cancel_appointment_reminders(instance.id)
-                    
-                elif instance.status in ['scheduled', 'confirmed'] and previous_instance.status not in ['scheduled', 'confirmed']:
-                    # Appointment reactivated - reschedule reminders if upcoming
-                    if instance.is_upcoming:
-                        logger.info(f"Appointment {instance.id} reactivated. Rescheduling reminders.")
-                        reminder_service.schedule_appointment_reminders(instance)
-                        
-                elif (instance.appointment_date != previous_instance.appointment_date or 
-                      instance.start_time != previous_instance.start_time) and instance.status in ['scheduled', 'confirmed']:
-                    # Date or time changed - reschedule reminders
-                    logger.info(f"Appointment {instance.id} date/time changed. Rescheduling reminders.")
-                    scheduler.cancel_appointment_reminders(instance.id)
-                    if instance.is_upcoming:
-                        reminder_service.schedule_appointment_reminders(instance)
-                        
-            except Appointment.DoesNotExist:
-                # This shouldn't happen in post_save, but handle gracefully
+            # Compare with the state store_previous_appointment_state() read before the save;
+            # the row in the database already holds the new values
+            if not hasattr(instance, '_previous_status'):
                 logger.warning(f"Could not find previous state for appointment {instance.id}")
+                return
+            previous_status = instance._previous_status
+            
+            # Check if status changed to cancelled, completed, or no_show
+            if instance.status in ['cancelled', 'completed', 'no_show'] and previous_status not in ['cancelled', 'completed', 'no_show']:
+                # Cancel all pending reminders for this appointment
+                logger.info(f"Appointment {instance.id} status changed to {instance.status}. Cancelling reminders.")
+                scheduler.cancel_appointment_reminders(instance.id)
                 
+            elif instance.status in ['scheduled', 'confirmed'] and previous_status not in ['scheduled', 'confirmed']:
+                # Appointment reactivated - reschedule reminders if upcoming
+                if instance.is_upcoming:
+                    logger.info(f"Appointment {instance.id} reactivated. Rescheduling reminders.")
+                    reminder_service.schedule_appointment_reminders(instance)
+                    
+            elif (instance.appointment_date != instance._previous_date or 
+                  instance.start_time != instance._previous_time) and instance.status in ['scheduled', 'confirmed']:
+                # Date or time changed - reschedule reminders
+                logger.info(f"Appointment {instance.id} date/time changed. Rescheduling reminders.")
+                scheduler.cancel_appointment_reminders(instance.id)
+                if instance.is_upcoming:
+                    reminder_service.schedule_appointment_reminders(instance)
+
     except Exception as e:
         logger.error(f"Error handling appointment signal for {instance.id}: {str(e)}")
 
@@ -101,11 +105,97 @@ def store_previous_appointment_state(sender, instance, **kwargs):
             instance._previous_status = previous.status
             instance._previous_date = previous.appointment_date
             instance._previous_time = previous.start_time
+            instance._previous_provider_id = previous.provider_id
         except Appointment.DoesNotExist:
             # New appointment, no previous state
             instance._previous_status = None
             instance._previous_date = None
             instance._previous_time = None
+            instance._previous_provider_id = None
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_availability_cache(sender, instance, **kwargs):
+    """
+    Drop cached availability bitmaps for the provider-days this appointment
+    touched, both before and after the change.
+    """
+    try:
+        invalidate_provider_days([
+            (instance.provider_id, instance.appointment_date),
+            (getattr(instance, '_previous_provider_id', None), getattr(instance, '_previous_date', None)),
+        ])
+    except Exception as e:
+        logger.error(f"Error invalidating availability cache for appointment {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=EnhancedStaffProfile)
+def invalidate_provider_schedule_cache(sender, instance, **kwargs):
+    """
+    Drop cached availability for a provider whose default schedule or
+    hospital may have changed.
+    """
+    try:
+        invalidate_providers([instance.id])
+    except Exception as e:
+        logger.error(f"Error invalidating availability cache for provider {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=Hospital)
+def invalidate_operating_hours_cache(sender, instance, **kwargs):
+    """
+    Drop cached availability for every provider of a hospital whose
+    operating hours or timezone may have changed.
+    """
+    try:
+        invalidate_hospital_availability(instance.id)
+    except Exception as e:
+        logger.error(f"Error invalidating availability cache for hospital {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=CalendarIntegration)
+@receiver(post_delete, sender=CalendarIntegration)
+def invalidate_calendar_integration_cache(sender, instance, **kwargs):
+    """
+    Drop cached availability when an external calendar is connected,
+    paused or removed, since only active integrations block time.
+    """
+    try:
+        invalidate_user_availability([instance.user_id])
+    except Exception as e:
+        logger.error(f"Error invalidating availability cache for calendar integration {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=ExternalCalendarEvent)
+@receiver(post_save, sender=CalendarAvailability)
+@receiver(post_delete, sender=CalendarAvailability)
+def invalidate_external_busy_cache(sender, instance, **kwargs):
+    """
+    Drop cached availability when an external busy block changes.
+
+    Synced events are written in bulk, which sends no signals; the event
+    store invalidates those itself.
+    """
+    try:
+        invalidate_user_availability(
+            CalendarIntegration.objects.filter(id=instance.integration_id).values_list('user_id', flat=True)
+        )
+    except Exception as e:
+        logger.error(f"Error invalidating availability cache for {sender.__name__} {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_statistics_cache(sender, instance, **kwargs):
+    """
+    Drop cached dashboard statistics for the hospital, provider and patient
+    this appointment counts towards.
+    """
+    try:
+        invalidate_appointment_stats(instance)
+    except Exception as e:
+        logger.error(f"Error invalidating statistics cache for appointment {instance.id}: {str(e)}")
 
 
 def handle_appointment_cancellation(appointment_id):
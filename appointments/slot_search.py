@@ -0,0 +1,219 @@
+"""
+Multi-provider slot search.
+
+Finds the earliest (or most evenly balanced) free slots across every provider
+matching a specialty or department over a date range in one request. Free
+minute bitmaps from the availability engine are turned into a free-interval
+index in a single vectorized pass, and per-provider slot streams are combined
+with a heap merge so only the requested page of slots is ever materialized.
+"""
+
+import base64
+import heapq
+import json
+import logging
+import uuid
+from datetime import date, timedelta
+
+import numpy as np
+
+from accounts.models import EnhancedStaffProfile
+from .availability import MINUTES_PER_DAY, availability_engine, minute_to_time, provider_now
+
+logger = logging.getLogger(__name__)
+
+ORDER_EARLIEST = 'earliest'
+ORDER_BALANCED = 'balanced'  # Same day first, then the least-booked provider
+SEARCH_ORDERS = (ORDER_EARLIEST, ORDER_BALANCED)
+
+MAX_SEARCH_DAYS = 31
+DEFAULT_SEARCH_DAYS = 14
+MAX_RESULTS = 100
+
+
+def encode_cursor(order, key):
+    """Opaque cursor for the last slot returned on a page."""
+    payload = json.dumps({'o': order, 'k': list(key)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, order):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        day_ordinal, load, start, provider_id = payload['k']
+        key = (int(day_ordinal), int(load), int(start), str(provider_id))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if payload.get('o') != order:
+        raise ValueError("Cursor does not match the requested order")
+    return key
+
+
+class FreeIntervalIndex:
+    """
+    Start-time ranges long enough for a given duration, per provider-day row.
+
+    Built from an (n, 1440) free-minute matrix: run boundaries are found with
+    one np.diff over the whole matrix, and each run is reduced to the first
+    aligned start and the last start that still fits the duration.
+    """
+
+    def __init__(self, free, duration, slot_interval):
+        n_rows = free.shape[0]
+        padded = np.zeros((n_rows, MINUTES_PER_DAY + 2), dtype=np.int8)
+        padded[:, 1:-1] = free
+        edges = np.diff(padded, axis=1)
+
+        rows, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+
+        first = -(-starts // slot_interval) * slot_interval
+        last = ends - duration
+        keep = first <= last
+
+        self.rows = rows[keep]
+        self.first = first[keep]
+        self.last = last[keep]
+        self.offsets = np.searchsorted(self.rows, np.arange(n_rows + 1))
+
+    def intervals(self, row):
+        """(first_start, last_start) pairs for a row, in time order."""
+        lo, hi = self.offsets[row], self.offsets[row + 1]
+        return zip(self.first[lo:hi].tolist(), self.last[lo:hi].tolist())
+
+    def has_slots(self, row):
+        return self.offsets[row + 1] > self.offsets[row]
+
+
+class SlotSearchService:
+    """Searches free slots across many providers and days."""
+
+    def __init__(self, engine=None):
+        self.engine = engine or availability_engine
+
+    def matching_providers(self, hospital=None, specialization=None, department=None, provider_ids=None):
+        """Active doctors filtered by hospital, specialization (id or name) and department."""
+        queryset = EnhancedStaffProfile.objects.filter(
+            is_active=True,
+            user__role='doctor',
+        ).select_related('hospital', 'user', 'specialization')
+
+        if hospital is not None:
+            queryset = queryset.filter(hospital=hospital)
+        if specialization:
+            try:
+                queryset = queryset.filter(specialization_id=uuid.UUID(str(specialization)))
+            except ValueError:
+                queryset = queryset.filter(specialization__name__iexact=specialization)
+        if department:
+            queryset = queryset.filter(department__iexact=department)
+        if provider_ids:
+            queryset = queryset.filter(id__in=provider_ids)
+
+        return list(queryset.order_by('id'))
+
+    def search(self, providers, start_date, end_date, duration, room=None, equipment=None,
+               limit=20, cursor=None, order=ORDER_EARLIEST, now=None):
+        """
+        Return a page of slots across ``providers`` between two dates (inclusive).
+
+        Result dict has ``slots`` (ordered by ``order``) and ``next_cursor``
+        (None on the last page).
+        """
+        if order not in SEARCH_ORDERS:
+            raise ValueError(f"Invalid order. Must be one of: {', '.join(SEARCH_ORDERS)}")
+        if end_date < start_date:
+            raise ValueError("end_date must be on or after start_date")
+        if (end_date - start_date).days + 1 > MAX_SEARCH_DAYS:
+            raise ValueError(f"Date range cannot exceed {MAX_SEARCH_DAYS} days")
+        duration = int(duration)
+        if duration <= 0 or duration > MINUTES_PER_DAY:
+            raise ValueError("Duration must be between 1 and 1440 minutes")
+        limit = max(1, min(int(limit), MAX_RESULTS))
+        after = decode_cursor(cursor, order) if cursor else None
+
+        if not providers:
+            return {'slots': [], 'next_cursor': None}
+        # Each provider's "today" is on their hospital's clock
+        local_nows = {provider.id: provider_now(provider, now) for provider in providers}
+        start_date = max(start_date, min(local_now.date() for local_now in local_nows.values()))
+        if end_date < start_date:
+            return {'slots': [], 'next_cursor': None}
+
+        dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        keys, free, provider_days = self.engine.free_matrix(providers, dates, room, equipment)
+
+        # Starts must be strictly after the provider's current minute
+        for row, (provider_id, day) in enumerate(keys):
+            local_now = local_nows[provider_id]
+            if day < local_now.date():
+                free[row] = False
+            elif day == local_now.date():
+                free[row, :local_now.hour * 60 + local_now.minute + 1] = False
+
+        index = FreeIntervalIndex(free, duration, self.engine.slot_interval)
+
+        if order == ORDER_BALANCED:
+            loads = [int(np.count_nonzero(provider_days[key].booked)) for key in keys]
+        else:
+            loads = [0] * len(keys)
+
+        streams = [
+            self._provider_stream(index, keys, loads, position, len(providers), after)
+            for position in range(len(providers))
+        ]
+        merged = heapq.merge(*streams)
+
+        page = []
+        for key in merged:
+            if after is not None and key <= after:
+                continue
+            page.append(key)
+            if len(page) > limit:
+                break
+
+        has_more = len(page) > limit
+        page = page[:limit]
+        providers_by_id = {str(p.id): p for p in providers}
+
+        return {
+            'slots': [self._slot_dict(key, duration, providers_by_id) for key in page],
+            'next_cursor': encode_cursor(order, page[-1]) if has_more else None,
+        }
+
+    def _provider_stream(self, index, keys, loads, position, provider_count, after):
+        """Yield (day_ordinal, load, start, provider_id) keys for one provider in sort order."""
+        step = self.engine.slot_interval
+        min_day = after[0] if after else None
+
+        for row in range(position, len(keys), provider_count):
+            if not index.has_slots(row):
+                continue
+            provider_id, day = keys[row]
+            day_ordinal = day.toordinal()
+            if min_day is not None and day_ordinal < min_day:
+                continue
+            provider_key = str(provider_id)
+            load = loads[row]
+            for first, last in index.intervals(row):
+                for start in range(first, last + 1, step):
+                    yield (day_ordinal, load, start, provider_key)
+
+    def _slot_dict(self, key, duration, providers_by_id):
+        day_ordinal, _, start, provider_id = key
+        provider = providers_by_id[provider_id]
+        return {
+            'provider_id': provider_id,
+            'provider_name': provider.user.get_full_name(),
+            'specialization': provider.specialization.name if provider.specialization else None,
+            'department': provider.department,
+            'date': date.fromordinal(day_ordinal).isoformat(),
+            'time': minute_to_time(start).strftime('%H:%M'),
+            'end_time': minute_to_time(start + duration).strftime('%H:%M'),
+            'duration': duration,
+        }
+
+
+slot_search_service = SlotSearchService()
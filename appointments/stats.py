@@ -0,0 +1,120 @@
+"""
+Shared statistics queries for appointment dashboards.
+
+Every count a dashboard needs is computed in one conditional aggregate pass
+(``Count(..., filter=Q(...))``) and time series come from a single
+``TruncDate`` group-by, zero-filled in Python, so the number of queries does
+not depend on the date range. Results are cached per scope (hospital,
+provider, patient or all) for a short time and dropped as soon as an
+appointment in that scope changes.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'appointment_stats'
+CACHE_TIMEOUT = 60
+
+SCOPE_ALL = 'all'
+SCOPE_HOSPITAL = 'hospital'
+SCOPE_PROVIDER = 'provider'
+SCOPE_PATIENT = 'patient'
+
+UPCOMING_STATUSES = ('pending', 'confirmed')
+
+
+def appointment_counts(queryset, today):
+    """All appointment dashboard counts for ``queryset`` in a single query."""
+    last_7_days = today - timedelta(days=7)
+    return queryset.aggregate(
+        total_appointments=Count('id'),
+        today_appointments=Count('id', filter=Q(appointment_date=today)),
+        upcoming_appointments=Count('id', filter=Q(appointment_date__gte=today, status__in=UPCOMING_STATUSES)),
+        completed_appointments=Count('id', filter=Q(status='completed')),
+        cancelled_appointments=Count('id', filter=Q(status='cancelled')),
+        pending_appointments=Count('id', filter=Q(status='pending')),
+        scheduled_upcoming_appointments=Count('id', filter=Q(appointment_date__gte=today, status='scheduled')),
+        this_week_appointments=Count('id', filter=Q(appointment_date__gte=last_7_days)),
+        this_month_appointments=Count(
+            'id', filter=Q(appointment_date__year=today.year, appointment_date__month=today.month)
+        ),
+    )
+
+
+def daily_series(queryset, date_field, start_date, end_date, value=None):
+    """
+    Per-day totals of ``value`` (default: row count) between two dates inclusive.
+
+    ``date_field`` may be a DateField or a DateTimeField; datetimes are
+    truncated to dates in the current time zone. Returns a list of
+    ``(date, value)`` pairs with days that have no rows filled with 0.
+    """
+    field = queryset.model._meta.get_field(date_field)
+    if field.get_internal_type() == 'DateField':
+        day_expression = F(date_field)
+        filters = {f'{date_field}__range': (start_date, end_date)}
+    else:
+        day_expression = TruncDate(date_field)
+        filters = {f'{date_field}__date__range': (start_date, end_date)}
+
+    rows = queryset.filter(**filters).annotate(
+        day=day_expression
+    ).values('day').annotate(
+        value=value if value is not None else Count('id')
+    ).order_by()
+
+    totals = {row['day']: row['value'] or 0 for row in rows}
+    return [
+        (day, totals.get(day, 0))
+        for day in (start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1))
+    ]
+
+
+def _version_key(scope, scope_id):
+    return f'{CACHE_KEY_PREFIX}:version:{scope}:{scope_id}'
+
+
+def cached_stats(scope, scope_id, name, compute, timeout=CACHE_TIMEOUT, **params):
+    """
+    Return ``compute()`` cached under a scope.
+
+    The key carries the scope's current version, so invalidate_stats() makes
+    every cached result for that scope unreachable in one cache write.
+    """
+    version = cache.get(_version_key(scope, scope_id), 0)
+    suffix = ':'.join(f'{key}={params[key]}' for key in sorted(params))
+    key = f'{CACHE_KEY_PREFIX}:{scope}:{scope_id}:{version}:{name}:{suffix}'
+
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, timeout)
+    return result
+
+
+def invalidate_stats(scope, scope_id):
+    """Drop every cached statistic for one scope."""
+    if scope_id:
+        cache.set(_version_key(scope, scope_id), time.time_ns(), None)
+
+
+def invalidate_appointment_stats(appointment):
+    """Drop cached statistics for every scope an appointment counts towards."""
+    provider_ids = {appointment.provider_id, getattr(appointment, '_previous_provider_id', None)}
+    cache.set_many({
+        _version_key(scope, scope_id): time.time_ns()
+        for scope, scope_id in (
+            [(SCOPE_ALL, SCOPE_ALL),
+             (SCOPE_HOSPITAL, appointment.hospital_id),
+             (SCOPE_PATIENT, appointment.patient_id)]
+            + [(SCOPE_PROVIDER, provider_id) for provider_id in provider_ids]
+        )
+        if scope_id
+    }, None)
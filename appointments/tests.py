@@ -775,3 +775,672 @@ class AppointmentIntegrationTestCase(TestCase):
         
         self.assertIn(equipment, appointment.equipment.all())
         self.assertEqual(appointment.equipment.count(), 1)
+
+
+class AvailabilityTestDataMixin:
+    """Shared hospital, doctors, patient and appointment type for availability tests"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from django.core.cache import cache
+        from accounts.models import Hospital
+        
+        cache.clear()
+        
+        self.hospital = Hospital.objects.create(
+            name='Availability Hospital',
+            slug='availability-hospital',
+            email='admin@availability.test',
+            phone='+254700000100',
+            address_line_1='1 Test Road',
+            city='Nairobi',
+            state='Nairobi',
+            postal_code='00100',
+            operating_hours={
+                'monday': {'start': '08:00', 'end': '17:00'},
+                'tuesday': {'start': '08:00', 'end': '17:00'},
+                'saturday': {'closed': True},
+            }
+        )
+        
+        self.doctors = []
+        for index in range(2):
+            doctor_user = User.objects.create_user(
+                username=f'avail_doctor{index}',
+                email=f'avail_doctor{index}@test.com',
+                password='testpass123',
+                full_name=f'Dr. Avail {index}',
+                role='doctor'
+            )
+            self.doctors.append(EnhancedStaffProfile.objects.create(
+                user=doctor_user,
+                hospital=self.hospital,
+                job_title='Physician',
+                hire_date=date(2020, 1, 1)
+            ))
+        
+        patient_user = User.objects.create_user(
+            username='avail_patient',
+            email='avail_patient@test.com',
+            password='testpass123',
+            full_name='Avail Patient',
+            role='patient'
+        )
+        self.patient = EnhancedPatient.objects.create(
+            user=patient_user,
+            date_of_birth=date(1990, 1, 1),
+            gender='F',
+            phone='+254700000101',
+            address_line1='2 Test Road',
+            city='Nairobi',
+            state='Nairobi',
+            zip_code='00100',
+            emergency_contact_name='Contact',
+            emergency_contact_relationship='Sibling',
+            emergency_contact_phone='+254700000102'
+        )
+        
+        self.appointment_type = AppointmentType.objects.create(
+            hospital=self.hospital,
+            name='Availability Consultation',
+            code='AVC',
+            default_duration=30
+        )
+        
+        today = date.today()
+        self.monday = today + timedelta(days=7 - today.weekday())
+        self.tuesday = self.monday + timedelta(days=1)
+        self.saturday = self.monday + timedelta(days=5)
+    
+    def _book(self, provider, day, start, end, **kwargs):
+        return Appointment.objects.create(
+            patient=self.patient,
+            provider=provider,
+            hospital=self.hospital,
+            appointment_type=self.appointment_type,
+            appointment_date=day,
+            start_time=start,
+            end_time=end,
+            duration=(datetime.combine(day, end) - datetime.combine(day, start)).seconds // 60,
+            reason='Availability test',
+            **kwargs
+        )
+
+
+class AvailabilityEngineTestCase(AvailabilityTestDataMixin, TestCase):
+    """Test cases for the bitmap-based availability engine"""
+    
+    def test_sliding_window_starts(self):
+        """A window is feasible only if every minute in it is free"""
+        import numpy as np
+        from .availability import MINUTES_PER_DAY, sliding_window_starts
+        
+        free = np.ones((1, MINUTES_PER_DAY), dtype=bool)
+        free[0, 600:630] = False
+        feasible = sliding_window_starts(free, 30)[0]
+        
+        self.assertTrue(feasible[570])
+        self.assertFalse(feasible[571])
+        self.assertFalse(feasible[615])
+        self.assertTrue(feasible[630])
+    
+    def test_operating_hours_and_provider_schedule(self):
+        """Working hours are the intersection of hospital and provider schedules"""
+        from .availability import AvailabilityEngine
+        
+        provider = self.doctors[0]
+        provider.default_schedule = {'monday': {'start': '10:00', 'end': '19:00'}}
+        provider.save()
+        
+        engine = AvailabilityEngine(use_cache=False)
+        days = engine.get_provider_days([provider], [self.monday, self.tuesday, self.saturday])
+        
+        self.assertEqual(days[(provider.id, self.monday)].working_hours(), (10 * 60, 17 * 60))
+        self.assertIsNone(days[(provider.id, self.tuesday)].working_hours())
+        self.assertIsNone(days[(provider.id, self.saturday)].working_hours())
+    
+    def test_appointments_block_overlapping_slots(self):
+        """Slots overlapping an active appointment are not offered"""
+        from .availability import AvailabilityEngine
+        
+        provider = self.doctors[0]
+        self._book(provider, self.monday, time(9, 0), time(9, 45))
+        self._book(provider, self.monday, time(11, 0), time(11, 30), status='cancelled')
+        
+        engine = AvailabilityEngine(use_cache=False)
+        starts = {slot.start_time for slot in engine.find_slots([provider], [self.monday], 30)}
+        
+        self.assertIn(time(8, 30), starts)
+        self.assertNotIn(time(8, 45), starts)
+        self.assertNotIn(time(9, 30), starts)
+        self.assertIn(time(9, 45), starts)
+        self.assertIn(time(11, 0), starts)
+        self.assertNotIn(time(16, 45), starts)
+    
+    def test_multi_provider_multi_day_query(self):
+        """One call returns slots for every provider-day ordered by time"""
+        from .availability import AvailabilityEngine
+        
+        self._book(self.doctors[0], self.monday, time(8, 0), time(12, 0))
+        
+        engine = AvailabilityEngine(use_cache=False)
+        with self.assertNumQueries(3):
+            slots = engine.find_slots(self.doctors, [self.monday, self.tuesday], 60, limit=3)
+        
+        self.assertEqual([(s.provider_id, s.date, s.start_time) for s in slots], [
+            (self.doctors[1].id, self.monday, time(8, 0)),
+            (self.doctors[1].id, self.monday, time(8, 15)),
+            (self.doctors[1].id, self.monday, time(8, 30)),
+        ])
+        
+        all_slots = engine.find_slots(self.doctors, [self.monday, self.tuesday], 60)
+        first_for_doctor0 = next(s for s in all_slots if s.provider_id == self.doctors[0].id)
+        self.assertEqual(first_for_doctor0.start_time, time(12, 0))
+        self.assertTrue(any(s.date == self.tuesday for s in all_slots))
+    
+    def test_exclude_appointment_when_rescheduling(self):
+        """The appointment being edited does not block its own slot"""
+        from .availability import AvailabilityEngine
+        
+        provider = self.doctors[0]
+        appointment = self._book(provider, self.monday, time(9, 0), time(9, 30))
+        
+        engine = AvailabilityEngine()
+        blocked = {s.start_time for s in engine.find_slots([provider], [self.monday], 30)}
+        released = {
+            s.start_time for s in engine.find_slots(
+                [provider], [self.monday], 30, exclude_appointment_id=appointment.id
+            )
+        }
+        
+        self.assertNotIn(time(9, 0), blocked)
+        self.assertIn(time(9, 0), released)
+    
+    def test_room_requirement(self):
+        """A slot requiring a room is blocked when another provider holds that room"""
+        from .availability import AvailabilityEngine
+        
+        room = Room.objects.create(name='Availability Room', room_number='AV-1', room_type='consultation')
+        self._book(self.doctors[1], self.monday, time(10, 0), time(11, 0), room=room)
+        
+        engine = AvailabilityEngine(use_cache=False)
+        starts = {s.start_time for s in engine.find_slots([self.doctors[0]], [self.monday], 30, room=room)}
+        
+        self.assertIn(time(9, 30), starts)
+        self.assertNotIn(time(10, 30), starts)
+        self.assertIn(time(11, 0), starts)
+    
+    def test_cached_bitmap_invalidated_on_appointment_change(self):
+        """Booking or moving an appointment refreshes the cached provider-day"""
+        from .availability import AvailabilityEngine
+        
+        provider = self.doctors[0]
+        engine = AvailabilityEngine()
+        self.assertIn(time(9, 0), {s.start_time for s in engine.find_slots([provider], [self.monday], 30)})
+        
+        with self.assertNumQueries(0):
+            engine.get_provider_days([provider], [self.monday])
+        
+        appointment = self._book(provider, self.monday, time(9, 0), time(9, 30))
+        self.assertNotIn(time(9, 0), {s.start_time for s in engine.find_slots([provider], [self.monday], 30)})
+        
+        appointment.appointment_date = self.tuesday
+        appointment.save()
+        self.assertIn(time(9, 0), {s.start_time for s in engine.find_slots([provider], [self.monday], 30)})
+
+    def test_cached_bitmap_invalidated_on_schedule_change(self):
+        """Schedule, operating hours and external calendar changes refresh every cached day"""
+        from calendar_integrations.models import CalendarAvailability, CalendarIntegration
+        from .availability import AvailabilityEngine
+
+        provider = self.doctors[0]
+        engine = AvailabilityEngine()
+
+        def starts(day=self.monday):
+            return {s.start_time for s in engine.find_slots([provider], [day], 30)}
+
+        self.assertIn(time(8, 0), starts())
+        self.assertIn(time(8, 0), starts(self.tuesday))
+
+        provider.default_schedule = {'monday': {'start': '10:00', 'end': '17:00'}}
+        provider.save()
+        self.assertNotIn(time(8, 0), starts())
+        self.assertEqual(starts(self.tuesday), set())
+
+        provider.default_schedule = {}
+        provider.save()
+        self.hospital.operating_hours['monday'] = {'start': '12:00', 'end': '17:00'}
+        self.hospital.save()
+        self.assertNotIn(time(10, 0), starts())
+        self.assertIn(time(12, 0), starts())
+
+        integration = CalendarIntegration.objects.create(
+            user=provider.user, provider='google', calendar_id='primary', _access_token='token'
+        )
+        busy = CalendarAvailability.objects.create(
+            integration=integration, date=self.monday, start_time=time(12, 0), end_time=time(13, 0),
+            is_available=False, availability_type='busy'
+        )
+        self.assertNotIn(time(12, 0), starts())
+
+        busy.delete()
+        self.assertIn(time(12, 0), starts())
+
+    def test_past_slots_use_hospital_timezone(self):
+        """Slots are in the past relative to the hospital's clock, not the server's"""
+        from .availability import AvailabilityEngine
+
+        self.hospital.timezone = 'Africa/Nairobi'
+        self.hospital.save()
+        provider = self.doctors[0]
+        provider.hospital = self.hospital
+
+        # 06:30 on the UTC server clock is 09:30 in Nairobi
+        now = timezone.make_aware(datetime.combine(self.monday, time(6, 30)))
+        engine = AvailabilityEngine(use_cache=False)
+        starts = {s.start_time for s in engine.find_slots([provider], [self.monday], 30, now=now)}
+
+        self.assertNotIn(time(9, 30), starts)
+        self.assertIn(time(9, 45), starts)
+
+        available, unavailable, _ = engine.day_slots(provider, self.monday, 30, now=now)
+        reasons = {slot['time']: slot['reason'] for slot in unavailable}
+        self.assertEqual(reasons['09:00'], 'Time has passed')
+        self.assertEqual(available[0]['time'], '09:45')
+
+    def test_time_slots_endpoint_uses_engine(self):
+        """The time-slots API reports booked slots with a conflict reason"""
+        provider = self.doctors[0]
+        self._book(provider, self.monday, time(9, 0), time(9, 30))
+        
+        client = APIClient()
+        client.force_authenticate(user=provider.user)
+        response = client.get(reverse('appointments:get_available_time_slots'), {
+            'provider_id': str(provider.id),
+            'date': self.monday.isoformat(),
+            'duration': 30,
+        }, secure=True)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['working_hours'], {'start': '08:00', 'end': '17:00'})
+        available = {slot['time'] for slot in response.data['available_slots']}
+        self.assertNotIn('09:00', available)
+        self.assertIn('09:30', available)
+        self.assertIn(
+            {'time': '09:00', 'reason': 'Conflicts with existing appointment'},
+            [{'time': s['time'], 'reason': s['reason']} for s in response.data['unavailable_slots']]
+        )
+
+
+class SlotSearchTestCase(AvailabilityTestDataMixin, TestCase):
+    """Test cases for the multi-provider slot search"""
+    
+    def test_earliest_slots_across_providers(self):
+        """Slots from every provider are merged in time order"""
+        from .slot_search import SlotSearchService
+        
+        self._book(self.doctors[0], self.monday, time(8, 0), time(9, 0))
+        service = SlotSearchService()
+        providers = service.matching_providers(hospital=self.hospital)
+        
+        result = service.search(providers, self.monday, self.tuesday, 30, limit=3)
+        
+        self.assertEqual(
+            [(s['provider_id'], s['time']) for s in result['slots']],
+            [(str(self.doctors[1].id), '08:00'), (str(self.doctors[1].id), '08:15'), (str(self.doctors[1].id), '08:30')]
+        )
+        self.assertIsNotNone(result['next_cursor'])
+    
+    def test_cursor_pagination_matches_single_page(self):
+        """Walking pages with the cursor yields the same slots as one large page"""
+        from .slot_search import SlotSearchService
+        
+        self._book(self.doctors[1], self.monday, time(10, 0), time(12, 0))
+        service = SlotSearchService()
+        providers = service.matching_providers(hospital=self.hospital)
+        
+        expected = service.search(providers, self.monday, self.tuesday, 45, limit=100)['slots']
+        
+        collected, cursor = [], None
+        while True:
+            page = service.search(providers, self.monday, self.tuesday, 45, limit=7, cursor=cursor)
+            collected.extend(page['slots'])
+            cursor = page['next_cursor']
+            if not cursor or len(collected) >= len(expected):
+                break
+        
+        self.assertEqual(collected[:len(expected)], expected)
+        
+        with self.assertRaises(ValueError):
+            service.search(providers, self.monday, self.tuesday, 45, cursor=cursor or 'bogus', order='balanced')
+    
+    def test_balanced_order_prefers_least_booked_provider(self):
+        """Balanced ordering ranks the less-booked provider first within a day"""
+        from .slot_search import SlotSearchService
+        
+        self._book(self.doctors[0], self.monday, time(15, 0), time(16, 0))
+        service = SlotSearchService()
+        providers = service.matching_providers(hospital=self.hospital)
+        
+        result = service.search(providers, self.monday, self.monday, 30, limit=2, order='balanced')
+        
+        self.assertEqual({s['provider_id'] for s in result['slots']}, {str(self.doctors[1].id)})
+
+    def test_today_follows_hospital_timezone(self):
+        """Slots earlier than the hospital's current minute are not offered"""
+        from .slot_search import SlotSearchService
+
+        self.hospital.timezone = 'Africa/Nairobi'
+        self.hospital.save()
+        service = SlotSearchService()
+        providers = service.matching_providers(hospital=self.hospital)
+
+        # 06:30 on the UTC server clock is 09:30 in Nairobi
+        now = timezone.make_aware(datetime.combine(self.monday, time(6, 30)))
+        result = service.search(providers, self.monday, self.monday, 30, limit=1, now=now)
+
+        self.assertEqual(result['slots'][0]['time'], '09:45')
+
+    def test_filters_by_specialization_and_department(self):
+        """Only providers in the requested specialty and department are searched"""
+        from accounts.models import Specialization
+        from .slot_search import SlotSearchService
+        
+        cardiology = Specialization.objects.create(name='Cardiology')
+        self.doctors[1].specialization = cardiology
+        self.doctors[1].department = 'Heart Centre'
+        self.doctors[1].save()
+        
+        service = SlotSearchService()
+        self.assertEqual(service.matching_providers(specialization='cardiology'), [self.doctors[1]])
+        self.assertEqual(service.matching_providers(specialization=str(cardiology.id)), [self.doctors[1]])
+        self.assertEqual(service.matching_providers(department='heart centre'), [self.doctors[1]])
+    
+    def test_search_endpoint(self):
+        """The search API returns a page of slots and a cursor"""
+        client = APIClient()
+        client.force_authenticate(user=self.doctors[0].user)
+        response = client.get(reverse('appointments:search_available_slots'), {
+            'start_date': self.monday.isoformat(),
+            'end_date': self.tuesday.isoformat(),
+            'duration': 60,
+            'limit': 5,
+        }, secure=True)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['search']['providers_searched'], 2)
+        self.assertIsNotNone(response.data['next_cursor'])
+    
+    def test_index_and_merge_scale_to_fifty_providers(self):
+        """Ranking 50 providers x 14 days builds one matrix, runs no queries and pulls only the page"""
+        from .management.commands.benchmark_slot_search import PrecomputedEngine, synthetic_providers
+        from .slot_search import SlotSearchService
+        
+        class CountingSlotSearch(SlotSearchService):
+            pulled = 0
+            
+            def _provider_stream(self, *args):
+                for key in super()._provider_stream(*args):
+                    self.pulled += 1
+                    yield key
+        
+        engine = PrecomputedEngine()
+        service = CountingSlotSearch(engine=engine)
+        providers = synthetic_providers(50, hospital=self.hospital, user=self.doctors[0].user)
+        
+        with self.assertNumQueries(0):
+            result = service.search(providers, self.monday, self.monday + timedelta(days=13), 30, limit=50)
+        
+        self.assertEqual(len(result['slots']), 50)
+        self.assertEqual(engine.calls, [(50, 14)])
+        slot_times = [(slot['date'], slot['time']) for slot in result['slots']]
+        self.assertEqual(slot_times, sorted(slot_times))
+        # The heap merge primes each provider's stream once, then pulls one slot per result
+        self.assertLessEqual(service.pulled, 50 + 1 + len(providers))
+    
+    def test_seeded_benchmark_runs_the_default_engine_and_rolls_back(self):
+        """--seed searches real providers and appointments with a cold and a warm cache, leaving no data"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        appointments = Appointment.objects.count()
+        output = StringIO()
+        call_command('benchmark_slot_search', seed=True, providers=3, days=2, limit=5, repeat=2, stdout=output)
+        
+        self.assertIn('3 providers x 2 days', output.getvalue())
+        self.assertIn('with the cache warm, 5 slots returned', output.getvalue())
+        self.assertEqual(Appointment.objects.count(), appointments)
+        self.assertFalse(EnhancedStaffProfile.objects.filter(user__username__startswith='benchmark_doctor_').exists())
+
+
+class AppointmentConflictTestCase(AvailabilityTestDataMixin, TestCase):
+    """Test cases for interval-based appointment conflict detection"""
+    
+    def _range(self, day, start, duration):
+        return Appointment.compute_scheduled_range(day, start, duration)
+    
+    def test_scheduled_range_is_stored(self):
+        """Saving an appointment populates its absolute start and end"""
+        appointment = self._book(self.doctors[0], self.monday, time(9, 0), time(9, 45))
+        
+        self.assertEqual(appointment.starts_at, self._range(self.monday, time(9, 0), 45)[0])
+        self.assertEqual(appointment.ends_at - appointment.starts_at, timedelta(minutes=45))
+    
+    def test_scheduled_range_uses_hospital_timezone(self):
+        """Appointment times are wall-clock times at the hospital"""
+        self.hospital.timezone = 'Africa/Nairobi'
+        self.hospital.save()
+        appointment = self._book(self.doctors[0], self.monday, time(9, 0), time(9, 45))
+        
+        self.assertEqual(appointment.starts_at, timezone.make_aware(datetime.combine(self.monday, time(6, 0))))
+    
+    def _double_book(self):
+        kept = self._book(self.doctors[0], self.monday, time(9, 0), time(10, 0))
+        clash = self._book(self.doctors[0], self.monday, time(9, 30), time(10, 30))
+        after_clash = self._book(self.doctors[0], self.monday, time(10, 0), time(11, 0))
+        # Another provider, but the same patient
+        same_patient = self._book(self.doctors[1], self.monday, time(9, 0), time(10, 0))
+        return kept, clash, after_clash, same_patient
+    
+    def test_constraint_migration_reports_double_bookings(self):
+        """The constraint migration fails with the overlapping pairs instead of changing appointments"""
+        from importlib import import_module
+        from .conflicts import find_double_bookings
+        constraints = import_module('appointments.migrations.0004_appointment_no_overlap_constraints')
+        
+        kept, clash, after_clash, same_patient = self._double_book()
+        
+        self.assertEqual(find_double_bookings(Appointment.objects.all()), [
+            (clash.id, kept.id, ['provider', 'patient']),
+            (same_patient.id, kept.id, ['patient']),
+        ])
+        self.assertEqual(constraints.find_double_bookings(Appointment), find_double_bookings(Appointment.objects.all()))
+        with self.assertRaisesRegex(RuntimeError, f'appointment {clash.id} overlaps appointment {kept.id}'):
+            constraints.check_no_double_bookings(Appointment)
+        self.assertEqual(set(Appointment.objects.values_list('status', flat=True)), {'scheduled'})
+    
+    def test_resolve_double_bookings_cancels_through_the_normal_path(self):
+        """The command cancels the later booking of each pair, cancelling reminders and notifying"""
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        
+        kept, clash, after_clash, same_patient = self._double_book()
+        
+        call_command('resolve_double_bookings', stdout=StringIO())
+        self.assertEqual(set(Appointment.objects.values_list('status', flat=True)), {'scheduled'})
+        
+        with mock.patch('appointments.views.send_appointment_notification') as notify, \
+                mock.patch('appointments.signals.NotificationScheduler') as scheduler:
+            call_command('resolve_double_bookings', '--apply', stdout=StringIO())
+        
+        statuses = dict(Appointment.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[kept.id], 'scheduled')
+        # It only overlapped a booking that was itself cancelled
+        self.assertEqual(statuses[after_clash.id], 'scheduled')
+        self.assertEqual(statuses[clash.id], 'cancelled')
+        self.assertEqual(statuses[same_patient.id], 'cancelled')
+        self.assertIn(str(kept.id), Appointment.objects.get(id=clash.id).cancellation_reason)
+        self.assertEqual([c.args[1] for c in notify.call_args_list], ['cancelled', 'cancelled'])
+        cancelled_reminders = [c.args[0] for c in scheduler.return_value.cancel_appointment_reminders.call_args_list]
+        self.assertEqual(cancelled_reminders, [clash.id, same_patient.id])
+    
+    def test_partial_overlap_is_a_conflict(self):
+        """A booking starting inside an existing one conflicts even though start times differ"""
+        from .conflicts import find_conflicts
+        
+        existing = self._book(self.doctors[0], self.monday, time(9, 0), time(10, 0))
+        
+        conflicts = find_conflicts(*self._range(self.monday, time(9, 30), 30), provider=self.doctors[0])
+        
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(conflicts[0]['appointment_id'], str(existing.id))
+        self.assertEqual(conflicts[0]['conflict_on'], ['provider'])
+    
+    def test_back_to_back_bookings_do_not_conflict(self):
+        """Ranges are half-open, so a booking may start when the previous one ends"""
+        from .conflicts import find_conflicts
+        
+        self._book(self.doctors[0], self.monday, time(9, 0), time(10, 0))
+        
+        self.assertEqual(find_conflicts(*self._range(self.monday, time(10, 0), 30), provider=self.doctors[0]), [])
+        self.assertEqual(find_conflicts(*self._range(self.monday, time(8, 30), 30), provider=self.doctors[0]), [])
+    
+    def test_patient_and_room_conflicts(self):
+        """Overlaps are detected on the patient and room as well as the provider"""
+        from .conflicts import find_conflicts
+        
+        room = Room.objects.create(name='Conflict Room', room_number='CF-1', room_type='consultation')
+        self._book(self.doctors[0], self.monday, time(9, 0), time(10, 0), room=room)
+        
+        conflicts = find_conflicts(
+            *self._range(self.monday, time(9, 15), 30),
+            provider=self.doctors[1], patient=self.patient, room=room
+        )
+        
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(sorted(conflicts[0]['conflict_on']), ['patient', 'room'])
+    
+    def test_cancelled_and_excluded_appointments_are_ignored(self):
+        """Inactive appointments and the appointment being updated never conflict"""
+        from .conflicts import find_conflicts
+        
+        self._book(self.doctors[0], self.monday, time(9, 0), time(10, 0), status='cancelled')
+        current = self._book(self.doctors[0], self.monday, time(11, 0), time(12, 0))
+        
+        self.assertEqual(find_conflicts(*self._range(self.monday, time(9, 0), 60), provider=self.doctors[0]), [])
+        self.assertEqual(
+            find_conflicts(*self._range(self.monday, time(11, 30), 60), provider=self.doctors[0], exclude_ids=[current.id]),
+            []
+        )
+    
+    def test_save_without_conflicts_rejects_overlap(self):
+        """The guarded save raises instead of writing an overlapping booking"""
+        from .conflicts import AppointmentConflictError, save_without_conflicts
+        
+        self._book(self.doctors[0], self.monday, time(9, 0), time(10, 0))
+        starts_at, ends_at = self._range(self.monday, time(9, 30), 30)
+        
+        with self.assertRaises(AppointmentConflictError) as raised:
+            save_without_conflicts(
+                lambda: self._book(self.doctors[0], self.monday, time(9, 30), time(10, 0)),
+                starts_at, ends_at, provider=self.doctors[0]
+            )
+        
+        self.assertEqual(len(raised.exception.conflicts), 1)
+        self.assertEqual(Appointment.objects.filter(provider=self.doctors[0]).count(), 1)
+    
+    def test_serializer_checks_conflicts_only_when_saving(self):
+        """Validation runs no overlap query; the locked save rejects the overlap"""
+        from .conflicts import AppointmentConflictError
+        
+        self._book(self.doctors[0], self.monday, time(9, 0), time(10, 0))
+        moved = self._book(self.doctors[0], self.monday, time(11, 0), time(11, 30))
+        
+        serializer = AppointmentUpdateSerializer(moved, data={'start_time': '09:30'}, partial=True)
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertRaises(AppointmentConflictError):
+            serializer.save()
+        
+        serializer = AppointmentUpdateSerializer(moved, data={'notes': 'Bring referral'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save().notes, 'Bring referral')
+    
+    def test_double_booking_can_be_cancelled_through_the_serializer(self):
+        """Cancelling or editing an inactive booking is not blocked by the slot it overlaps"""
+        kept, clash, after_clash, same_patient = self._double_book()
+        
+        serializer = AppointmentUpdateSerializer(clash, data={'status': 'cancelled'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save().status, 'cancelled')
+        
+        # The cancelled booking's slot has been taken; its notes can still be edited
+        serializer = AppointmentUpdateSerializer(clash, data={'notes': 'Rebooked with another provider'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save().notes, 'Rebooked with another provider')
+
+
+class AppointmentStatisticsTestCase(AvailabilityTestDataMixin, TestCase):
+    """Test cases for the shared appointment statistics layer"""
+    
+    def test_counts_in_single_query(self):
+        """Every dashboard count comes from one aggregate query"""
+        from .stats import appointment_counts
+        
+        self._book(self.doctors[0], self.monday, time(9, 0), time(9, 30), status='confirmed')
+        self._book(self.doctors[0], self.monday, time(10, 0), time(10, 30), status='pending')
+        self._book(self.doctors[1], self.tuesday, time(9, 0), time(9, 30), status='cancelled')
+        
+        with self.assertNumQueries(1):
+            counts = appointment_counts(Appointment.objects.all(), date.today())
+        
+        self.assertEqual(counts['total_appointments'], 3)
+        self.assertEqual(counts['upcoming_appointments'], 2)
+        self.assertEqual(counts['pending_appointments'], 1)
+        self.assertEqual(counts['cancelled_appointments'], 1)
+        self.assertEqual(counts['completed_appointments'], 0)
+    
+    def test_daily_series_zero_fills(self):
+        """Days without appointments are reported as zero"""
+        from .stats import daily_series
+        
+        self._book(self.doctors[0], self.monday, time(9, 0), time(9, 30))
+        self._book(self.doctors[1], self.monday, time(9, 0), time(9, 30))
+        self._book(self.doctors[0], self.monday + timedelta(days=2), time(9, 0), time(9, 30))
+        
+        with self.assertNumQueries(1):
+            series = daily_series(Appointment.objects.all(), 'appointment_date', self.monday, self.monday + timedelta(days=3))
+        
+        self.assertEqual([count for _, count in series], [2, 0, 1, 0])
+        self.assertEqual(series[0][0], self.monday)
+    
+    def test_cache_invalidated_on_change(self):
+        """Cached statistics for a provider are dropped when one of their appointments changes"""
+        from .stats import SCOPE_PROVIDER, appointment_counts, cached_stats
+        
+        provider = self.doctors[0]
+        queryset = Appointment.objects.filter(provider=provider)
+        compute = lambda: appointment_counts(queryset, date.today())
+        
+        self.assertEqual(cached_stats(SCOPE_PROVIDER, provider.id, 'counts', compute)['total_appointments'], 0)
+        with self.assertNumQueries(0):
+            cached_stats(SCOPE_PROVIDER, provider.id, 'counts', compute)
+        
+        self._book(provider, self.monday, time(9, 0), time(9, 30))
+        
+        self.assertEqual(cached_stats(SCOPE_PROVIDER, provider.id, 'counts', compute)['total_appointments'], 1)
+    
+    def test_statistics_view_for_doctor(self):
+        """The statistics endpoint reports the doctor's own appointments"""
+        self._book(self.doctors[0], self.monday, time(9, 0), time(9, 30), status='confirmed')
+        self._book(self.doctors[1], self.monday, time(9, 0), time(9, 30), status='confirmed')
+        
+        client = APIClient()
+        client.force_authenticate(user=self.doctors[0].user)
+        response = client.get(reverse('appointments:appointment_statistics'), secure=True)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['statistics']['total_appointments'], 1)
+        self.assertEqual(response.data['statistics']['upcoming_appointments'], 1)
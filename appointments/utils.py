@@ -1,57 +1,57 @@
 from datetime import datetime, time
 from django.http import JsonResponse
 from django.utils import timezone
+from accounts.models import Hospital
 from .models import Appointment
+from .conflicts import find_conflicts
 from .datetime_utils import DateTimeValidator
 
 def validate_appointment_datetime(date_str, time_str):
     """Validate appointment date and time using comprehensive validator"""
     return DateTimeValidator.validate_appointment_datetime(date_str, time_str)
 
-def check_doctor_availability(doctor_id, date_str, time_str, exclude_appointment_id=None):
-    """Check if doctor is available at the given time"""
+def check_doctor_availability(doctor_id, date_str, time_str, exclude_appointment_id=None, duration=30):
+    """Check if doctor is free for the whole [time, time + duration) interval"""
     try:
         # Parse date and time
         appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         appointment_time = datetime.strptime(time_str, '%H:%M').time()
+        hospital = Hospital.objects.filter(staff_members__id=doctor_id).first()
+        starts_at, ends_at = Appointment.compute_scheduled_range(
+            appointment_date, appointment_time, duration, hospital=hospital
+        )
         
-        # Build query
-        conflicting_appointments = Appointment.objects.filter(
-            doctor_id=doctor_id,
-            date=appointment_date,
-            time=appointment_time
-        ).exclude(status='cancelled')
+        conflicts = find_conflicts(
+            starts_at, ends_at,
+            provider=doctor_id,
+            exclude_ids=[exclude_appointment_id] if exclude_appointment_id else None
+        )
         
-        # Exclude current appointment if updating
-        if exclude_appointment_id:
-            conflicting_appointments = conflicting_appointments.exclude(id=exclude_appointment_id)
-        
-        if conflicting_appointments.exists():
+        if conflicts:
             return False, "Doctor is already booked at this time"
             
         return True, None
     except Exception as e:
         return False, f"Error checking doctor availability: {str(e)}"
 
-def check_patient_availability(patient_id, date_str, time_str, exclude_appointment_id=None):
-    """Check if patient has any conflicting appointments"""
+def check_patient_availability(patient_id, date_str, time_str, exclude_appointment_id=None, duration=30,
+                               hospital=None):
+    """Check if patient has any appointment overlapping [time, time + duration) at ``hospital``'s local time"""
     try:
         # Parse date and time
         appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         appointment_time = datetime.strptime(time_str, '%H:%M').time()
+        starts_at, ends_at = Appointment.compute_scheduled_range(
+            appointment_date, appointment_time, duration, hospital=hospital
+        )
         
-        # Build query
-        conflicting_appointments = Appointment.objects.filter(
-            patient_id=patient_id,
-            date=appointment_date,
-            time=appointment_time
-        ).exclude(status='cancelled')
-        
-        # Exclude current appointment if updating
-        if exclude_appointment_id:
-            conflicting_appointments = conflicting_appointments.exclude(id=exclude_appointment_id)
+        conflicts = find_conflicts(
+            starts_at, ends_at,
+            patient=patient_id,
+            exclude_ids=[exclude_appointment_id] if exclude_appointment_id else None
+        )
         
-        if conflicting_appointments.exists():
+        if conflicts:
             return False, "Patient already has an appointment at this time"
             
         return True, None
@@ -22,6 +22,10 @@ from .forms import (
     AppointmentForm, AppointmentUpdateForm, AppointmentCancelForm,
     AppointmentSearchForm, AvailabilityCheckForm
 )
+from .availability import availability_engine, minute_to_time
+from .stats import SCOPE_ALL, SCOPE_PATIENT, SCOPE_PROVIDER, appointment_counts, cached_stats
+from .conflicts import AppointmentConflictError, find_conflicts
+from .slot_search import slot_search_service, DEFAULT_SEARCH_DAYS, ORDER_EARLIEST
 from .utils import (
     validate_appointment_datetime,
     check_doctor_availability,
@@ -439,6 +443,7 @@ def create_appointment(request):
         
         if serializer.is_valid():
             with transaction.atomic():
+                # The overlap check and insert run together so concurrent bookings cannot race
                 appointment = serializer.save()
                 
                 # If staff/admin, ensure the appointment is linked to their hospital
@@ -513,6 +518,11 @@ def create_appointment(request):
             "details": serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    except AppointmentConflictError as e:
+        return Response({
+            "error": e.message,
+            "conflicts": e.conflicts
+        }, status=status.HTTP_409_CONFLICT)
     except Exception as e:
         logger.error(f"Create appointment error: {str(e)}")
         return Response({
@@ -613,6 +623,11 @@ def update_appointment(request, appointment_id):
             "details": serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    except AppointmentConflictError as e:
+        return Response({
+            "error": e.message,
+            "conflicts": e.conflicts
+        }, status=status.HTTP_409_CONFLICT)
     except Exception as e:
         logger.error(f"Update appointment error: {str(e)}")
         return Response({
@@ -620,6 +635,37 @@ def update_appointment(request, appointment_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def cancel_appointment_booking(appointment, cancellation_reason, cancelled_by=None):
+    """
+    Cancel an appointment and notify its patient and provider. Saving the
+    appointment fires the signals that cancel its pending reminders.
+    """
+    with transaction.atomic():
+        appointment.status = 'cancelled'
+        appointment.cancellation_reason = cancellation_reason
+        appointment.cancelled_by = cancelled_by
+        appointment.cancelled_at = timezone.now()
+        appointment.save()
+
+        # Send cancellation notifications
+        appointment_data = {
+            'id': appointment.id,
+            'date': appointment.appointment_date,
+            'time': appointment.start_time,
+            'type': appointment.appointment_type.name,
+            'patient': appointment.patient.user.get_full_name(),
+            'provider': appointment.provider.user.get_full_name(),
+            'reason': cancellation_reason
+        }
+        
+        send_appointment_notification(
+            appointment_data,
+            'cancelled',
+            appointment.patient.user.email,
+            appointment.provider.user.email
+        )
+
+
 @api_csrf_exempt
 def cancel_appointment(request, appointment_id):
     """Cancel an appointment"""
@@ -667,32 +713,7 @@ def cancel_appointment(request, appointment_id):
             return JsonResponse({"error": "Cannot cancel completed or already cancelled appointment"}, status=400)
 
         data = json.loads(request.body) if request.body else {}
-        cancellation_reason = data.get('reason', 'No reason provided')
-
-        with transaction.atomic():
-            appointment.status = 'cancelled'
-            appointment.cancellation_reason = cancellation_reason
-            appointment.cancelled_by = user.user
-            appointment.cancelled_at = timezone.now()
-            appointment.save()
-
-            # Send cancellation notifications
-            appointment_data = {
-                'id': appointment.id,
-                'date': appointment.appointment_date,
-                'time': appointment.start_time,
-                'type': appointment.appointment_type.name,
-                'patient': appointment.patient.user.get_full_name(),
-                'provider': appointment.provider.user.get_full_name(),
-                'reason': cancellation_reason
-            }
-            
-            send_appointment_notification(
-                appointment_data,
-                'cancelled',
-                appointment.patient.user.email,
-                appointment.provider.user.email
-            )
+        cancel_appointment_booking(appointment, data.get('reason', 'No reason provided'), user.user)
 
         return JsonResponse({
             "message": "Appointment cancelled successfully"
@@ -1076,29 +1097,21 @@ def check_availability(request):
 
         # Validate provider
         try:
-            provider = EnhancedStaffProfile.objects.get(id=provider_id, role='doctor')
+            provider = EnhancedStaffProfile.objects.select_related('user', 'hospital').get(
+                id=provider_id, user__role='doctor'
+            )
         except EnhancedStaffProfile.DoesNotExist:
             return Response({"error": "Provider not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Parse date and time
-        appointment_datetime = datetime.combine(date, time)
-        end_datetime = appointment_datetime + timedelta(minutes=duration)
-
-        # Check for conflicts
-        conflicts = Appointment.objects.filter(
-            provider=provider,
-            appointment_date=date,
-            status__in=['pending', 'confirmed']
-        ).exclude(
-            models.Q(start_time__gte=end_datetime.time()) | 
-            models.Q(start_time__lt=time)
-        )
+        # Check for overlapping bookings over the whole requested interval
+        starts_at, ends_at = Appointment.compute_scheduled_range(date, time, duration, hospital=provider.hospital)
+        conflicts = find_conflicts(starts_at, ends_at, provider=provider)
 
-        is_available = not conflicts.exists()
+        is_available = not conflicts
 
         return Response({
             "available": is_available,
-            "conflicts": list(conflicts.values('id', 'start_time', 'default_duration')) if conflicts.exists() else [],
+            "conflicts": conflicts,
             "provider": provider.user.get_full_name(),
             "date": date,
             "time": time,
@@ -1126,63 +1139,26 @@ def get_appointment_statistics(request):
                 patient = EnhancedPatient.objects.get(user=request.user)
             except EnhancedPatient.DoesNotExist:
                 return Response({"error": "Patient profile not found"}, status=status.HTTP_404_NOT_FOUND)
-                
-            stats = {
-                'total_appointments': Appointment.objects.filter(patient=patient).count(),
-                'upcoming_appointments': Appointment.objects.filter(
-                    patient=patient,
-                    appointment_date__gte=today,
-                    status__in=['pending', 'confirmed']
-                ).count(),
-                'completed_appointments': Appointment.objects.filter(
-                    patient=patient,
-                    status='completed'
-                ).count(),
-                'cancelled_appointments': Appointment.objects.filter(
-                    patient=patient,
-                    status='cancelled'
-                ).count(),
-                'this_month_appointments': Appointment.objects.filter(
-                    patient=patient,
-                    appointment_date__year=today.year,
-                    appointment_date__month=today.month
-                ).count()
-            }
+            
+            scope, scope_id, queryset = SCOPE_PATIENT, patient.id, Appointment.objects.filter(patient=patient)
+            fields = ('total_appointments', 'upcoming_appointments', 'completed_appointments',
+                      'cancelled_appointments', 'this_month_appointments')
         else:
             # Doctor/Admin statistics
             if user_role == 'doctor':
                 try:
-                    provider = EnhancedStaffProfile.objects.get(user=request.user, role='doctor')
-                    base_filter = {'provider': provider}
+                    provider = EnhancedStaffProfile.objects.get(user=request.user, user__role='doctor')
                 except EnhancedStaffProfile.DoesNotExist:
                     return Response({"error": "Provider profile not found"}, status=status.HTTP_404_NOT_FOUND)
+                scope, scope_id, queryset = SCOPE_PROVIDER, provider.id, Appointment.objects.filter(provider=provider)
             else:
-                base_filter = {}
-            
-            stats = {
-                'total_appointments': Appointment.objects.filter(**base_filter).count(),
-                'today_appointments': Appointment.objects.filter(
-                    appointment_date=today,
-                    **base_filter
-                ).count(),
-                'upcoming_appointments': Appointment.objects.filter(
-                    appointment_date__gte=today,
-                    status__in=['pending', 'confirmed'],
-                    **base_filter
-                ).count(),
-                'completed_appointments': Appointment.objects.filter(
-                    status='completed',
-                    **base_filter
-                ).count(),
-                'cancelled_appointments': Appointment.objects.filter(
-                    status='cancelled',
-                    **base_filter
-                ).count(),
-                'pending_appointments': Appointment.objects.filter(
-                    status='pending',
-                    **base_filter
-                ).count()
-            }
+                scope, scope_id, queryset = SCOPE_ALL, SCOPE_ALL, Appointment.objects.all()
+            fields = ('total_appointments', 'today_appointments', 'upcoming_appointments',
+                      'completed_appointments', 'cancelled_appointments', 'pending_appointments')
+        
+        # All counts come from one aggregate query, cached until an appointment in scope changes
+        counts = cached_stats(scope, scope_id, 'counts', lambda: appointment_counts(queryset, today), today=today)
+        stats = {field: counts[field] for field in fields}
 
         return Response({
             "message": "Statistics retrieved successfully",
@@ -1205,13 +1181,17 @@ def get_available_time_slots(request):
         date_str = request.GET.get('date')
         duration = int(request.GET.get('duration', 30))
         exclude_appointment_id = request.GET.get('exclude_appointment_id')  # For editing appointments
+        room_id = request.GET.get('room_id')
+        equipment_ids = [e for e in request.GET.get('equipment_ids', '').split(',') if e]
 
         if not all([provider_id, date_str]):
             return Response({"error": "Provider ID and date are required"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Validate provider
         try:
-            provider = EnhancedStaffProfile.objects.get(id=provider_id, role='doctor')
+            provider = EnhancedStaffProfile.objects.select_related('hospital', 'user').get(
+                id=provider_id, user__role='doctor'
+            )
         except EnhancedStaffProfile.DoesNotExist:
             return Response({"error": "Provider not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -1221,78 +1201,31 @@ def get_available_time_slots(request):
         except ValueError:
             return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get existing appointments for the provider on this date
-        existing_appointments_query = Appointment.objects.filter(
-            provider=provider,
-            appointment_date=appointment_date,
-            status__in=['scheduled', 'confirmed', 'pending', 'checked_in', 'in_progress']
+        # Optional resource requirements
+        room = None
+        if room_id:
+            room = Room.objects.filter(id=room_id).first()
+            if not room:
+                return Response({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
+        equipment = list(Equipment.objects.filter(id__in=equipment_ids)) if equipment_ids else []
+        if len(equipment) != len(set(equipment_ids)):
+            return Response({"error": "Equipment not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        # Bitmap-based availability (operating hours, provider schedule, bookings, external calendars)
+        available_slots, unavailable_slots, hours = availability_engine.day_slots(
+            provider,
+            appointment_date,
+            duration,
+            room=room,
+            equipment=equipment,
+            exclude_appointment_id=exclude_appointment_id,
         )
-        
-        # Exclude current appointment if editing
-        if exclude_appointment_id:
-            existing_appointments_query = existing_appointments_query.exclude(id=exclude_appointment_id)
-        
-        existing_appointments = existing_appointments_query.values_list('start_time', 'end_time', 'duration')
-
-        # Generate time slots (8 AM to 6 PM, 15-minute intervals for better granularity)
-        start_time = time(8, 0)
-        end_time = time(18, 0)
-        slot_interval = timedelta(minutes=15)  # Check every 15 minutes for better availability
-        
-        available_slots = []
-        unavailable_slots = []
-        current_time = datetime.combine(appointment_date, start_time)
-        end_datetime = datetime.combine(appointment_date, end_time)
-
-        while current_time + timedelta(minutes=duration) <= end_datetime:
-            slot_time = current_time.time()
-            slot_end_time = (current_time + timedelta(minutes=duration)).time()
-            
-            # Check if this slot conflicts with existing appointments
-            is_available = True
-            conflict_reason = None
-            
-            for appt_start_time, appt_end_time, appt_duration in existing_appointments:
-                # Use end_time if available, otherwise calculate from start_time + duration
-                if appt_end_time:
-                    calculated_end_time = appt_end_time
-                else:
-                    calculated_end_time = (datetime.combine(appointment_date, appt_start_time) + 
-                                         timedelta(minutes=appt_duration)).time()
-                
-                # Check for overlap: appointments overlap if one starts before the other ends
-                if not (slot_end_time <= appt_start_time or slot_time >= calculated_end_time):
-                    is_available = False
-                    conflict_reason = f"Conflicts with appointment from {appt_start_time.strftime('%H:%M')} to {calculated_end_time.strftime('%H:%M')}"
-                    break
-            
-            # Check if slot is in the past (for today's appointments)
-            if appointment_date == date.today():
-                now = datetime.now().time()
-                if slot_time <= now:
-                    is_available = False
-                    conflict_reason = "Time has passed"
-            
-            slot_data = {
-                'time': slot_time.strftime('%H:%M'),
-                'end_time': slot_end_time.strftime('%H:%M'),
-                'duration': duration,
-                'available': is_available
-            }
-            
-            if is_available:
-                available_slots.append(slot_data)
-            else:
-                slot_data['reason'] = conflict_reason
-                unavailable_slots.append(slot_data)
-            
-            current_time += slot_interval
 
         # Group slots by time periods for better UX
         time_periods = {
-            'morning': {'label': 'Morning (8:00 AM - 12:00 PM)', 'slots': []},
+            'morning': {'label': 'Morning (before 12:00 PM)', 'slots': []},
             'afternoon': {'label': 'Afternoon (12:00 PM - 5:00 PM)', 'slots': []},
-            'evening': {'label': 'Evening (5:00 PM - 6:00 PM)', 'slots': []}
+            'evening': {'label': 'Evening (after 5:00 PM)', 'slots': []}
         }
         
         for slot in available_slots:
@@ -1315,9 +1248,9 @@ def get_available_time_slots(request):
             "unavailable_slots": unavailable_slots[:10],  # Limit for performance
             "time_periods": time_periods,
             "working_hours": {
-                "start": "08:00",
-                "end": "18:00"
-            }
+                "start": minute_to_time(hours[0]).strftime('%H:%M'),
+                "end": minute_to_time(hours[1]).strftime('%H:%M') if hours[1] < 24 * 60 else "24:00"
+            } if hours else None
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -1325,6 +1258,101 @@ def get_available_time_slots(request):
         return Response({"error": "Failed to retrieve available time slots"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_available_slots(request):
+    """Find the earliest (or most balanced) free slots across all matching providers and dates"""
+    try:
+        user_role = getattr(request.user, 'role', 'patient')
+        specialization = request.GET.get('specialization')
+        department = request.GET.get('department')
+        order = request.GET.get('order', ORDER_EARLIEST)
+        cursor = request.GET.get('cursor')
+        room_id = request.GET.get('room_id')
+        equipment_ids = [e for e in request.GET.get('equipment_ids', '').split(',') if e]
+        provider_ids = [p for p in request.GET.get('provider_ids', '').split(',') if p]
+
+        try:
+            duration = int(request.GET.get('duration', 30))
+            limit = int(request.GET.get('limit', 20))
+            start_date = (
+                datetime.strptime(request.GET['start_date'], '%Y-%m-%d').date()
+                if request.GET.get('start_date') else timezone.localdate()
+            )
+            end_date = (
+                datetime.strptime(request.GET['end_date'], '%Y-%m-%d').date()
+                if request.GET.get('end_date') else start_date + timedelta(days=DEFAULT_SEARCH_DAYS - 1)
+            )
+        except ValueError:
+            return Response({
+                "error": "Invalid parameters. Dates must be YYYY-MM-DD; duration and limit must be integers"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Staff search within their own hospital; patients may pick one
+        hospital = None
+        if user_role != 'patient':
+            try:
+                hospital = EnhancedStaffProfile.objects.select_related('hospital').get(user=request.user).hospital
+            except EnhancedStaffProfile.DoesNotExist:
+                return Response({"error": "Staff profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        elif request.GET.get('hospital_id'):
+            from accounts.models import Hospital
+            hospital = Hospital.objects.filter(id=request.GET['hospital_id']).first()
+            if not hospital:
+                return Response({"error": "Hospital not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        room = None
+        if room_id:
+            room = Room.objects.filter(id=room_id).first()
+            if not room:
+                return Response({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
+        equipment = list(Equipment.objects.filter(id__in=equipment_ids)) if equipment_ids else []
+        if len(equipment) != len(set(equipment_ids)):
+            return Response({"error": "Equipment not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        providers = slot_search_service.matching_providers(
+            hospital=hospital,
+            specialization=specialization,
+            department=department,
+            provider_ids=provider_ids,
+        )
+
+        try:
+            result = slot_search_service.search(
+                providers,
+                start_date,
+                end_date,
+                duration,
+                room=room,
+                equipment=equipment,
+                limit=limit,
+                cursor=cursor,
+                order=order,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "message": "Available slots retrieved successfully",
+            "slots": result['slots'],
+            "count": len(result['slots']),
+            "next_cursor": result['next_cursor'],
+            "search": {
+                "specialization": specialization,
+                "department": department,
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                "duration": duration,
+                "order": order,
+                "providers_searched": len(providers),
+            }
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.error(f"Search available slots error: {str(e)}")
+        return Response({"error": "Failed to search available slots"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_appointment_types(request):
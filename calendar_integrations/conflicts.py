@@ -0,0 +1,198 @@
+"""
+Sweep-line conflict detection between external calendar events and
+MediRemind appointments.
+
+For a set of users, the medical external events and active appointments in a
+window are loaded in two queries, merged per user, sorted by start and swept
+once: an interval overlaps exactly the intervals still active (not yet ended)
+when it starts. That finds every overlap in O(n log n + k) per user instead of
+an overlap query per event. New CalendarConflict rows are written with one
+bulk insert that ignores rows already recorded.
+"""
+
+import heapq
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from appointments.availability import ACTIVE_APPOINTMENT_STATUSES
+from appointments.models import Appointment
+from .models import CalendarConflict, ExternalCalendarEvent
+
+logger = logging.getLogger(__name__)
+
+CONFLICT_TYPE_OVERLAP = 'overlap'
+DEFAULT_WINDOW_PAST_DAYS = 7
+DEFAULT_WINDOW_FUTURE_DAYS = 30
+INSERT_BATCH_SIZE = 500
+
+EVENT = 'event'
+APPOINTMENT = 'appointment'
+
+
+def sweep_overlaps(intervals):
+    """
+    Yield every overlapping pair from ``(start, end, item)`` intervals.
+
+    Intervals are half-open, so back-to-back intervals do not overlap.
+    """
+    active = []  # heap of (end, sequence, item)
+    for sequence, (start, end, item) in enumerate(sorted(intervals, key=lambda interval: interval[0])):
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for _, _, other in active:
+            yield other, item
+        heapq.heappush(active, (end, sequence, item))
+
+
+def _load_intervals(user_ids, window_start, window_end):
+    """Per-user (start, end, (kind, row)) intervals, in two queries."""
+    intervals = defaultdict(list)
+
+    events = ExternalCalendarEvent.objects.filter(
+        integration__user_id__in=user_ids,
+        integration__status='active',
+        start_time__lt=window_end,
+        end_time__gt=window_start,
+    ).values('id', 'integration_id', 'integration__user_id', 'title', 'start_time', 'end_time',
+             'is_medical_appointment').order_by()
+    for event in events:
+        intervals[event['integration__user_id']].append(
+            (event['start_time'], event['end_time'], (EVENT, event))
+        )
+
+    appointments = Appointment.objects.filter(
+        Q(provider__user_id__in=user_ids) | Q(patient__user_id__in=user_ids),
+        starts_at__lt=window_end,
+        ends_at__gt=window_start,
+        status__in=ACTIVE_APPOINTMENT_STATUSES,
+    ).values('id', 'provider__user_id', 'patient__user_id', 'starts_at', 'ends_at').order_by()
+    for appointment in appointments:
+        for user_id in {appointment['provider__user_id'], appointment['patient__user_id']}:
+            if user_id in user_ids:
+                intervals[user_id].append(
+                    (appointment['starts_at'], appointment['ends_at'], (APPOINTMENT, appointment))
+                )
+
+    return intervals
+
+
+def _conflict(event, other_kind, other):
+    """Unsaved CalendarConflict owned by a medical external event."""
+    if other_kind == EVENT:
+        key = f"event:{other['id']}"
+        other_start, other_end = other['start_time'], other['end_time']
+        details = {
+            'overlapping_event_id': other['id'],
+            'overlapping_event_title': other['title'],
+        }
+        appointment_id = ''
+    else:
+        key = f"appointment:{other['id']}"
+        other_start, other_end = other['starts_at'], other['ends_at']
+        details = {}
+        appointment_id = str(other['id'])
+
+    details.update({
+        'overlap_start': max(event['start_time'], other_start).isoformat(),
+        'overlap_end': min(event['end_time'], other_end).isoformat(),
+    })
+    return CalendarConflict(
+        integration_id=event['integration_id'],
+        external_event_id=event['id'],
+        conflict_type=CONFLICT_TYPE_OVERLAP,
+        conflict_key=key,
+        mediremind_appointment_id=appointment_id,
+        conflict_details=details,
+    )
+
+
+def find_conflicts(user_ids, window_start, window_end, event_ids=None):
+    """
+    Conflicts for medical external events of ``user_ids`` within a window.
+
+    When ``event_ids`` is given only overlaps involving those events are
+    returned (incremental detection after a sync).
+    """
+    user_ids = set(user_ids)
+    touched = set(event_ids) if event_ids is not None else None
+    conflicts = []
+
+    for intervals in _load_intervals(user_ids, window_start, window_end).values():
+        for (kind_a, row_a), (kind_b, row_b) in sweep_overlaps(intervals):
+            for (kind, row), (other_kind, other) in (((kind_a, row_a), (kind_b, row_b)),
+                                                     ((kind_b, row_b), (kind_a, row_a))):
+                if kind != EVENT or not row['is_medical_appointment']:
+                    continue
+                if touched is not None and row['id'] not in touched and not (
+                    other_kind == EVENT and other['id'] in touched
+                ):
+                    continue
+                conflicts.append(_conflict(row, other_kind, other))
+
+    return conflicts
+
+
+def record_conflicts(conflicts):
+    """Insert conflicts not already recorded; returns how many were new."""
+    if not conflicts:
+        return 0
+
+    existing = set(
+        CalendarConflict.objects.filter(
+            external_event_id__in={conflict.external_event_id for conflict in conflicts},
+            conflict_type=CONFLICT_TYPE_OVERLAP,
+        ).values_list('external_event_id', 'conflict_key')
+    )
+    new_conflicts = [
+        conflict for conflict in conflicts
+        if (conflict.external_event_id, conflict.conflict_key) not in existing
+    ]
+    # ignore_conflicts covers rows inserted concurrently by another worker
+    CalendarConflict.objects.bulk_create(new_conflicts, batch_size=INSERT_BATCH_SIZE, ignore_conflicts=True)
+    return len(new_conflicts)
+
+
+def detect_conflicts(user_ids=None, window_start=None, window_end=None):
+    """Detect and record conflicts for users with active integrations over a window."""
+    now = timezone.now()
+    window_start = window_start or now - timedelta(days=DEFAULT_WINDOW_PAST_DAYS)
+    window_end = window_end or now + timedelta(days=DEFAULT_WINDOW_FUTURE_DAYS)
+
+    if user_ids is None:
+        user_ids = ExternalCalendarEvent.objects.filter(
+            integration__status='active',
+            is_medical_appointment=True,
+            start_time__lt=window_end,
+            end_time__gt=window_start,
+        ).values_list('integration__user_id', flat=True).distinct()
+
+    conflicts = find_conflicts(set(user_ids), window_start, window_end)
+    return record_conflicts(conflicts)
+
+
+def detect_event_conflicts(event_ids):
+    """
+    Incremental detection for events touched by a sync: only their users and
+    the time span they cover are loaded.
+    """
+    event_ids = list(event_ids)
+    if not event_ids:
+        return 0
+
+    touched = list(ExternalCalendarEvent.objects.filter(id__in=event_ids).values(
+        'integration__user_id', 'start_time', 'end_time'
+    ))
+    if not touched:
+        return 0
+
+    conflicts = find_conflicts(
+        {event['integration__user_id'] for event in touched},
+        min(event['start_time'] for event in touched),
+        max(event['end_time'] for event in touched),
+        event_ids=event_ids,
+    )
+    return record_conflicts(conflicts)
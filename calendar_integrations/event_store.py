@@ -0,0 +1,128 @@
+"""
+Bulk persistence of synced external calendar events.
+
+A sync hands over the events a provider reported as changed plus the ids it
+reported as deleted. Existing rows are loaded in one query, events whose
+``updated`` timestamp has not moved are skipped, and the rest are written
+with chunked ``bulk_create(update_conflicts=True)`` upserts. Deletions run as
+a single statement.
+"""
+
+import logging
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from appointments.availability import invalidate_user_availability
+
+from .models import ExternalCalendarEvent
+
+logger = logging.getLogger(__name__)
+
+UPSERT_BATCH_SIZE = 500
+
+UPSERT_FIELDS = [
+    'title', 'description', 'start_time', 'end_time', 'location',
+    'is_medical_appointment', 'last_modified', 'updated_at',
+]
+
+
+def _parse_updated(value):
+    """Provider 'updated' timestamps arrive as RFC 3339 strings."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def apply_event_changes(integration, events, deleted_ids=(), prune_from=None, classify=None):
+    """
+    Upsert changed events and delete removed ones for an integration.
+
+    ``events`` are dicts in the provider service format (id, title,
+    description, location, updated, start_time, end_time). ``deleted_ids``
+    are provider ids of cancelled events. When ``prune_from`` is given (a full
+    sync), stored events ending at or after it that were not returned are
+    deleted too. ``classify(event)`` sets is_medical_appointment.
+
+    Returns counts of created, updated, skipped and deleted events plus the
+    local ids of created/updated events.
+    """
+    now = timezone.now()
+    event_ids = [event_data['id'] for event_data in events]
+
+    existing = dict(
+        ExternalCalendarEvent.objects.filter(
+            integration=integration,
+            external_event_id__in=event_ids
+        ).values_list('external_event_id', 'last_modified')
+    )
+
+    to_write = {}
+    skipped = 0
+    for event_data in events:
+        last_modified = _parse_updated(event_data.get('updated'))
+        previous = existing.get(event_data['id'], False)
+        if previous is not False and last_modified and previous == last_modified:
+            skipped += 1
+            continue
+        # Later copies of the same event in one batch win
+        to_write[event_data['id']] = ExternalCalendarEvent(
+            integration=integration,
+            external_event_id=event_data['id'],
+            title=(event_data.get('title') or '')[:255],
+            description=event_data.get('description') or '',
+            start_time=event_data['start_time'],
+            end_time=event_data['end_time'],
+            location=(event_data.get('location') or '')[:255],
+            is_medical_appointment=classify(event_data) if classify else False,
+            last_modified=last_modified or now,
+            created_at=now,
+            updated_at=now,
+        )
+
+    created = sum(1 for event_id in to_write if event_id not in existing)
+
+    with transaction.atomic():
+        if to_write:
+            ExternalCalendarEvent.objects.bulk_create(
+                list(to_write.values()),
+                batch_size=UPSERT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['integration', 'external_event_id'],
+                update_fields=UPSERT_FIELDS,
+            )
+
+        deleted = 0
+        stale = None
+        if prune_from is not None:
+            stale = ExternalCalendarEvent.objects.filter(
+                integration=integration, end_time__gte=prune_from
+            ).exclude(external_event_id__in=event_ids)
+        elif deleted_ids:
+            stale = ExternalCalendarEvent.objects.filter(
+                integration=integration, external_event_id__in=list(deleted_ids)
+            )
+        if stale is not None:
+            # delete() also reports cascaded conflict rows; count only the events
+            deleted = stale.delete()[1].get(ExternalCalendarEvent._meta.label, 0)
+
+    if to_write or deleted:
+        # Bulk writes send no signals; the provider's cached availability is stale
+        invalidate_user_availability([integration.user_id])
+
+    changed_event_ids = list(
+        ExternalCalendarEvent.objects.filter(
+            integration=integration, external_event_id__in=list(to_write)
+        ).values_list('id', flat=True)
+    ) if to_write else []
+
+    return {
+        'events_created': created,
+        'events_updated': len(to_write) - created,
+        'events_skipped': skipped,
+        'events_deleted': deleted,
+        'changed_event_ids': changed_event_ids,
+    }
@@ -7,20 +7,27 @@ import os
 import json
 import logging
 import secrets
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Tuple
 from django.conf import settings
 from django.utils import timezone
 from django.core.cache import cache
+from django.db import transaction
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 from google.auth.exceptions import RefreshError
 
 # Import models
-from .models import CalendarIntegration, ExternalCalendarEvent, CalendarSyncLog
+from .models import CalendarIntegration, CalendarSyncLog
+from .event_store import apply_event_changes
 
 # Enhanced logging configuration
 logger = logging.getLogger(__name__)
@@ -65,6 +72,56 @@ GOOGLE_CLIENT_CONFIG = {
     }
 }
 
+# Events list requests: page size and the only fields we read
+EVENTS_PAGE_SIZE = 250
+EVENT_LIST_FIELDS = 'nextPageToken,nextSyncToken,items(id,status,summary,description,location,updated,start,end)'
+
+
+# Built API clients kept per process, keyed by integration. Building a client
+# parses the discovery document, which costs more than a small incremental
+# sync. A client is reused only while the access token is unchanged. httplib2
+# connections are not thread-safe, so a cached client never holds one: every
+# request it builds gets its own authorized Http, and the client can be used
+# from any thread.
+CLIENT_CACHE_SIZE = 256
+_client_cache = OrderedDict()
+_client_cache_lock = threading.Lock()
+
+
+def _request_builder(credentials):
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(AuthorizedHttp(credentials, http=httplib2.Http()), *args, **kwargs)
+    return build_request
+
+
+def get_calendar_client(integration_id, credentials):
+    """Return a cached Calendar API client for the integration, building it if needed."""
+    with _client_cache_lock:
+        cached = _client_cache.get(integration_id)
+        if cached is not None and cached[0] == credentials.token:
+            _client_cache.move_to_end(integration_id)
+            return cached[1]
+    
+    client = build('calendar', 'v3', requestBuilder=_request_builder(credentials),
+                   http=AuthorizedHttp(credentials, http=httplib2.Http()))
+    with _client_cache_lock:
+        _client_cache[integration_id] = (credentials.token, client)
+        _client_cache.move_to_end(integration_id)
+        while len(_client_cache) > CLIENT_CACHE_SIZE:
+            _client_cache.popitem(last=False)
+    return client
+
+
+def clear_client_cache():
+    """Drop every cached API client."""
+    with _client_cache_lock:
+        _client_cache.clear()
+
+
+class SyncTokenExpired(Exception):
+    """Google rejected a stored sync token (410 Gone); a full sync is required"""
+
+
 # Error codes for standardized responses
 class CalendarErrorCodes:
     INVALID_CREDENTIALS = 'INVALID_CREDENTIALS'
@@ -447,7 +504,7 @@ class GoogleCalendarService:
                     }
             
             calendar_logger.debug(f"Building Google Calendar service for integration {self.integration.id}")
-            self.service = build('calendar', 'v3', credentials=credentials)
+            self.service = get_calendar_client(self.integration.id, credentials)
             self._credentials = credentials
             
             calendar_logger.info(f"Successfully built Google Calendar service for integration {self.integration.id}")
@@ -521,82 +578,89 @@ class GoogleCalendarService:
             calendar_logger.error(f"Failed to refresh Google Calendar access token: {e}", exc_info=True)
             raise Exception(f"Token refresh failed: {str(e)}")
 
-    def sync_events(self, start_date=None, end_date=None) -> Dict[str, Any]:
+    def sync_events(self, start_date=None, end_date=None, full_sync=False) -> Dict[str, Any]:
         """
         Sync events from Google Calendar to local database.
+        
+        When the integration has a stored sync token only the changes since the
+        last sync are fetched (including cancellations). Without a token, when
+        ``full_sync`` is requested, or when Google reports the token expired
+        (410 Gone), every event from ``start_date`` onwards is fetched and a new
+        sync token is stored.
         """
         calendar_logger.info(f"Starting event sync for integration {self.integration.id if self.integration else 'None'}")
         sync_start_time = timezone.now()
+        sync_type = 'incremental'
         
         try:
             if not start_date:
                 start_date = timezone.now().date()
-            if not end_date:
-                end_date = start_date + timedelta(days=30)
-                
-            calendar_logger.debug(f"Syncing events from {start_date} to {end_date}")
-            
-            # Fetch events from Google Calendar
-            events = self.fetch_events(start_date, end_date)
-            calendar_logger.info(f"Fetched {len(events)} events from Google Calendar")
             
-            events_created = 0
-            events_updated = 0
-            
-            for event_data in events:
-                calendar_logger.debug(f"Processing event: {event_data.get('title', 'Untitled')}")
-                
-                # Create or update local event
-                external_event, created = ExternalCalendarEvent.objects.update_or_create(
-                    integration=self.integration,
-                    external_event_id=event_data['id'],
-                    defaults={
-                        'title': event_data['title'],
-                        'description': event_data['description'],
-                        'start_time': event_data['start_time'],
-                        'end_time': event_data['end_time'],
-                        'location': event_data['location'],
-                        'last_modified': event_data['updated'] or timezone.now(),
-                        'is_medical_appointment': is_medical_appointment(event_data)
-                    }
+            changes = None
+            api_calls = 0
+            if self.integration.sync_token and not full_sync:
+                try:
+                    changes = self.fetch_event_changes(sync_token=self.integration.sync_token)
+                except SyncTokenExpired:
+                    api_calls += 1
+                    calendar_logger.warning(f"Sync token expired for integration {self.integration.id}, running full resync")
+            
+            if changes is None:
+                sync_type = 'full'
+                changes = self.fetch_event_changes(start_date=start_date)
+            api_calls += changes['pages']
+            
+            events = changes['events']
+            calendar_logger.info(f"Fetched {len(events)} changed and {len(changes['cancelled_ids'])} cancelled events "
+                                 f"from Google Calendar ({sync_type} sync, {changes['pages']} pages)")
+            
+            with transaction.atomic():
+                counts = apply_event_changes(
+                    self.integration,
+                    events,
+                    deleted_ids=changes['cancelled_ids'],
+                    # Anything in the synced range that a full sync no longer returns was deleted
+                    prune_from=changes['time_min'] if sync_type == 'full' else None,
+                    classify=is_medical_appointment
                 )
                 
-                if created:
-                    events_created += 1
-                    calendar_logger.debug(f"Created new event: {event_data.get('title', 'Untitled')}")
-                else:
-                    events_updated += 1
-                    calendar_logger.debug(f"Updated existing event: {event_data.get('title', 'Untitled')}")
-            
-            # Update integration sync status
-            self.integration.last_sync_at = timezone.now()
-            self.integration.status = 'active'
-            self.integration.save()
+                # Update integration sync status
+                self.integration.sync_token = changes['next_sync_token'] or ''
+                self.integration.last_sync_at = timezone.now()
+                self.integration.status = 'active'
+                self.integration.save()
             
             sync_end_time = timezone.now()
             sync_duration = (sync_end_time - sync_start_time).total_seconds()
             
             # Create sync log
-            CalendarSyncLog.objects.create(
+            sync_log = CalendarSyncLog.objects.create(
                 integration=self.integration,
-                sync_type='manual',
+                sync_type=sync_type,
                 status='success',
-                events_processed=len(events),
-                events_created=events_created,
-                events_updated=events_updated,
+                events_processed=len(events) + len(changes['cancelled_ids']),
+                events_created=counts['events_created'],
+                events_updated=counts['events_updated'],
+                events_skipped=counts['events_skipped'],
+                events_deleted=counts['events_deleted'],
                 started_at=sync_start_time,
-                completed_at=sync_end_time
+                completed_at=sync_end_time,
+                duration_seconds=sync_duration
             )
             
             calendar_logger.info(f"Event sync completed successfully in {sync_duration:.2f}s - "
-                               f"Processed: {len(events)}, Created: {events_created}, Updated: {events_updated}")
+                               f"Processed: {len(events)}, Created: {counts['events_created']}, "
+                               f"Updated: {counts['events_updated']}, Skipped: {counts['events_skipped']}, "
+                               f"Deleted: {counts['events_deleted']}")
             
             return {
                 'success': True,
+                'sync_type': sync_type,
+                'sync_log_id': sync_log.id,
                 'events_processed': len(events),
-                'events_created': events_created,
-                'events_updated': events_updated,
-                'sync_duration': sync_duration
+                'sync_duration': sync_duration,
+                'api_calls': api_calls,
+                **counts
             }
             
         except Exception as e:
@@ -606,7 +670,7 @@ class GoogleCalendarService:
             # Create failed sync log
             CalendarSyncLog.objects.create(
                 integration=self.integration,
-                sync_type='manual',
+                sync_type=sync_type,
                 status='failed',
                 error_message=str(e),
                 started_at=sync_start_time,
@@ -618,17 +682,87 @@ class GoogleCalendarService:
                 'error': str(e)
             }
     
-    def fetch_events(self, start_date, end_date) -> List[Dict[str, Any]]:
+    def fetch_event_changes(self, sync_token=None, start_date=None) -> Dict[str, Any]:
         """
-        Fetch events from Google Calendar API.
+        Fetch events from Google Calendar API following every result page.
+        
+        With ``sync_token`` only events changed since that token was issued are
+        returned; otherwise all events ending after ``start_date``. Cancelled
+        events are reported separately in ``cancelled_ids``. Raises
+        SyncTokenExpired when Google rejects the token with 410 Gone.
+        """
+        # Build service if not already built
+        if self.service is None:
+            service_result = self.build_service()
+            if not service_result.get('success'):
+                calendar_logger.error("Failed to build Google Calendar service")
+                raise Exception("Failed to build Google Calendar service")
+        
+        params = {
+            'calendarId': 'primary',
+            'singleEvents': True,
+            'showDeleted': True,
+            'maxResults': EVENTS_PAGE_SIZE,
+            'fields': EVENT_LIST_FIELDS,
+        }
+        time_min = None
+        if sync_token:
+            params['syncToken'] = sync_token
+        else:
+            # syncToken requests cannot carry timeMin, so a full sync only bounds the start
+            time_min = timezone.make_aware(datetime.combine(start_date or timezone.now().date(), datetime.min.time()))
+            params['timeMin'] = time_min.isoformat()
+        
+        events = []
+        cancelled_ids = []
+        pages = 0
+        page_token = None
+        
+        while True:
+            try:
+                result = self.service.events().list(pageToken=page_token, **params).execute()
+            except HttpError as e:
+                if sync_token and getattr(e, 'resp', None) is not None and e.resp.status == 410:
+                    raise SyncTokenExpired(str(e))
+                calendar_logger.error(f"Google Calendar API error: {e}")
+                raise Exception(f"Google Calendar API error: {e}")
+            
+            pages += 1
+            for event in result.get('items', []):
+                if event.get('status') == 'cancelled':
+                    cancelled_ids.append(event['id'])
+                elif 'start' in event and 'end' in event:
+                    events.append(self._process_event(event))
+            
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+        
+        return {
+            'events': events,
+            'cancelled_ids': cancelled_ids,
+            'next_sync_token': result.get('nextSyncToken'),
+            'time_min': time_min,
+            'pages': pages,
+        }
+    
+    def fetch_events(self, start_date=None, end_date=None) -> List[Dict[str, Any]]:
         """
+        Fetch events from Google Calendar API for a date range, following every result page.
+        """
+        if not start_date:
+            start_date = timezone.now().date()
+        if not end_date:
+            end_date = start_date + timedelta(days=30)
+        
         calendar_logger.debug(f"Fetching events from Google Calendar API for date range {start_date} to {end_date}")
         
         # Build service if not already built
-        service_result = self.build_service()
-        if not service_result.get('success'):
-            calendar_logger.error("Failed to build Google Calendar service")
-            raise Exception("Failed to build Google Calendar service")
+        if self.service is None:
+            service_result = self.build_service()
+            if not service_result.get('success'):
+                calendar_logger.error("Failed to build Google Calendar service")
+                raise Exception("Failed to build Google Calendar service")
         
         try:
             # Convert dates to RFC3339 format
@@ -637,31 +771,30 @@ class GoogleCalendarService:
             
             calendar_logger.debug(f"Requesting events from {time_min} to {time_max}")
             
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
-            calendar_logger.debug(f"Google Calendar API returned {len(events)} events")
-            
-            # Process events into our format
             processed_events = []
-            for event in events:
-                processed_event = {
-                    'id': event['id'],
-                    'title': event.get('summary', 'No Title'),
-                    'description': event.get('description', ''),
-                    'location': event.get('location', ''),
-                    'updated': event.get('updated'),
-                    'start_time': self._parse_datetime(event['start']),
-                    'end_time': self._parse_datetime(event['end'])
-                }
-                processed_events.append(processed_event)
+            page_token = None
+            while True:
+                events_result = self.service.events().list(
+                    calendarId='primary',
+                    timeMin=time_min,
+                    timeMax=time_max,
+                    singleEvents=True,
+                    orderBy='startTime',
+                    maxResults=EVENTS_PAGE_SIZE,
+                    fields=EVENT_LIST_FIELDS,
+                    pageToken=page_token
+                ).execute()
+                
+                processed_events.extend(
+                    self._process_event(event) for event in events_result.get('items', [])
+                    if event.get('status') != 'cancelled'
+                )
+                
+                page_token = events_result.get('nextPageToken')
+                if not page_token:
+                    break
             
+            calendar_logger.debug(f"Google Calendar API returned {len(processed_events)} events")
             return processed_events
             
         except HttpError as e:
@@ -671,6 +804,20 @@ class GoogleCalendarService:
             calendar_logger.error(f"Error fetching events: {e}")
             raise
     
+    def _process_event(self, event):
+        """
+        Convert a Google Calendar event resource into our format.
+        """
+        return {
+            'id': event['id'],
+            'title': event.get('summary', 'No Title'),
+            'description': event.get('description', ''),
+            'location': event.get('location', ''),
+            'updated': event.get('updated'),
+            'start_time': self._parse_datetime(event['start']),
+            'end_time': self._parse_datetime(event['end'])
+        }
+    
     def _parse_datetime(self, datetime_obj):
         """
         Parse Google Calendar datetime object.
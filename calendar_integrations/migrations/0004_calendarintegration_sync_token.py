@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_integrations', '0003_alter_calendarintegration_sync_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarintegration',
+            name='sync_token',
+            field=models.TextField(blank=True, default='', help_text='Provider token for fetching changes since the last sync'),
+        ),
+    ]
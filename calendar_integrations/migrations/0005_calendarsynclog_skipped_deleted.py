@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_integrations', '0004_calendarintegration_sync_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarsynclog',
+            name='events_deleted',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='calendarsynclog',
+            name='events_skipped',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:03
+
+from django.db import migrations, models
+
+
+def backfill_conflict_keys(apps, schema_editor):
+    """Give existing conflicts a key so the unique constraint can be added."""
+    CalendarConflict = apps.get_model('calendar_integrations', 'CalendarConflict')
+    for conflict in CalendarConflict.objects.filter(conflict_key='').iterator():
+        overlapping_event_id = (conflict.conflict_details or {}).get('overlapping_event_id')
+        if conflict.mediremind_appointment_id:
+            key = f"appointment:{conflict.mediremind_appointment_id}"
+        elif overlapping_event_id:
+            key = f"event:{overlapping_event_id}"
+        else:
+            key = f"legacy:{conflict.pk}"
+        if CalendarConflict.objects.filter(
+            external_event_id=conflict.external_event_id,
+            conflict_type=conflict.conflict_type,
+            conflict_key=key
+        ).exists():
+            key = f"legacy:{conflict.pk}"
+        conflict.conflict_key = key
+        conflict.save(update_fields=['conflict_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_integrations', '0005_calendarsynclog_skipped_deleted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarconflict',
+            name='conflict_key',
+            field=models.CharField(blank=True, default='', help_text="What the event clashes with, e.g. 'event:<id>' or 'appointment:<uuid>'", max_length=255),
+        ),
+        migrations.RunPython(backfill_conflict_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='calendarconflict',
+            constraint=models.UniqueConstraint(fields=('external_event', 'conflict_type', 'conflict_key'), name='unique_calendar_conflict'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_integrations', '0006_calendarconflict_conflict_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarintegration',
+            name='sync_interval_minutes',
+            field=models.PositiveIntegerField(default=15, help_text='Adaptive interval between syncs'),
+        ),
+        migrations.AddIndex(
+            model_name='calendarintegration',
+            index=models.Index(fields=['status', 'sync_enabled', 'next_sync_at'], name='calint_due_sync_idx'),
+        ),
+    ]
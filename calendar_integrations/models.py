@@ -44,6 +44,8 @@ class CalendarIntegration(models.Model):
     sync_enabled = models.BooleanField(default=False)  # Auto sync disabled by default
     last_sync_at = models.DateTimeField(blank=True, null=True)
     next_sync_at = models.DateTimeField(blank=True, null=True)
+    sync_token = models.TextField(blank=True, default='', help_text="Provider token for fetching changes since the last sync")
+    sync_interval_minutes = models.PositiveIntegerField(default=15, help_text="Adaptive interval between syncs")
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
@@ -52,6 +54,9 @@ class CalendarIntegration(models.Model):
     class Meta:
         unique_together = ['user', 'provider', 'calendar_id']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'sync_enabled', 'next_sync_at'], name='calint_due_sync_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.get_provider_display()} - {self.calendar_name}"
@@ -158,6 +163,8 @@ class CalendarSyncLog(models.Model):
     events_processed = models.IntegerField(default=0)
     events_created = models.IntegerField(default=0)
     events_updated = models.IntegerField(default=0)
+    events_skipped = models.IntegerField(default=0)
+    events_deleted = models.IntegerField(default=0)
     conflicts_detected = models.IntegerField(default=0)
     
     # Timing
@@ -189,6 +196,10 @@ class CalendarConflict(models.Model):
     ])
     
     mediremind_appointment_id = models.CharField(max_length=255, blank=True)
+    conflict_key = models.CharField(
+        max_length=255, blank=True, default='',
+        help_text="What the event clashes with, e.g. 'event:<id>' or 'appointment:<uuid>'"
+    )
     conflict_details = models.JSONField(default=dict)
     
     # Resolution
@@ -200,6 +211,12 @@ class CalendarConflict(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['external_event', 'conflict_type', 'conflict_key'],
+                name='unique_calendar_conflict'
+            ),
+        ]
     
     def __str__(self):
         return f"Conflict: {self.external_event.title} - {self.conflict_type}"
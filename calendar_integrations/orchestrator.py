@@ -0,0 +1,219 @@
+"""
+Concurrent calendar sync orchestration.
+
+A scheduler run selects the integrations whose ``next_sync_at`` has passed,
+most overdue first, through the (status, sync_enabled, next_sync_at) index,
+and leases them by pushing ``next_sync_at`` forward so an overlapping run
+skips them. Tokens expiring soon are refreshed in one batch, then the syncs
+run on a bounded thread pool. Work is handed out round-robin across providers
+and each provider has its own concurrency cap, so one slow or rate-limited
+provider cannot hold every worker.
+
+Sync frequency adapts to how often a calendar actually changes: the interval
+halves after a sync that found changes and grows by half after one that found
+none, within MIN_SYNC_INTERVAL and MAX_SYNC_INTERVAL. An integration whose
+sync fails is set to status 'error', which takes it out of later runs. Sync lag (how long past
+due a sync started) and API calls per provider go to the metrics collector.
+"""
+
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from notifications.monitoring import metrics_collector
+from .conflicts import detect_event_conflicts
+from .google_calendar_service import GoogleCalendarService
+from .models import CalendarIntegration, CalendarSyncLog
+from .settings import CALENDAR_SYNC_CONFIG
+from .token_refresh import token_refresh_manager
+
+logger = logging.getLogger(__name__)
+
+LEASE_MINUTES = 10
+INTERVAL_SHRINK = 0.5
+INTERVAL_GROWTH = 1.5
+DEFAULT_PROVIDER_CONCURRENCY = 1
+
+
+def sync_integration(integration):
+    """
+    Sync one integration and detect conflicts for the events that changed.
+
+    Returns the provider sync result with ``conflicts_detected`` added.
+    """
+    if integration.provider != 'google':
+        return {'success': False, 'error': f"Provider {integration.provider} not supported"}
+
+    result = GoogleCalendarService(integration).sync_events()
+    if not result['success']:
+        return result
+
+    conflicts_detected = detect_event_conflicts(result['changed_event_ids'])
+    CalendarSyncLog.objects.filter(id=result['sync_log_id']).update(conflicts_detected=conflicts_detected)
+    result['conflicts_detected'] = conflicts_detected
+    return result
+
+
+def next_sync_interval(current, changed):
+    """Adaptive interval in minutes after a sync that did or did not find changes."""
+    interval = round(current * (INTERVAL_SHRINK if changed else INTERVAL_GROWTH))
+    return max(CALENDAR_SYNC_CONFIG['MIN_SYNC_INTERVAL'], min(CALENDAR_SYNC_CONFIG['MAX_SYNC_INTERVAL'], interval))
+
+
+def apply_sync_result(integration, result, now=None):
+    """Set the integration's adaptive interval and next sync time from a sync result (unsaved)."""
+    now = now or timezone.now()
+    changed = result.get('success') and any(
+        result.get(key) for key in ('events_created', 'events_updated', 'events_deleted')
+    )
+    integration.sync_interval_minutes = next_sync_interval(integration.sync_interval_minutes, changed)
+    integration.next_sync_at = now + timedelta(minutes=integration.sync_interval_minutes)
+
+
+class SyncOrchestrator:
+    """Runs due calendar syncs on a bounded pool with per-provider caps."""
+
+    def __init__(self, max_workers=None, provider_limits=None, sync_func=None, token_manager=None):
+        self.max_workers = max_workers or CALENDAR_SYNC_CONFIG['MAX_CONCURRENT_SYNCS']
+        self.provider_limits = provider_limits or CALENDAR_SYNC_CONFIG['PROVIDER_CONCURRENCY']
+        self.sync_func = sync_func or sync_integration
+        self.token_manager = token_manager or token_refresh_manager
+
+    def claim_due(self, now, limit):
+        """
+        Select up to ``limit`` due integrations, most overdue first, and lease them.
+
+        Rows locked by a concurrent run are skipped. The original
+        ``next_sync_at`` is kept on each instance as ``due_at`` for lag metrics.
+        """
+        with transaction.atomic():
+            integrations = list(
+                CalendarIntegration.objects.select_for_update(skip_locked=True).filter(
+                    Q(next_sync_at__lte=now) | Q(next_sync_at__isnull=True),
+                    status='active',
+                    sync_enabled=True,
+                ).order_by(F('next_sync_at').asc(nulls_first=True), 'id')[:limit]
+            )
+            lease_until = now + timedelta(minutes=LEASE_MINUTES)
+            CalendarIntegration.objects.filter(
+                id__in=[integration.id for integration in integrations]
+            ).update(next_sync_at=lease_until)
+
+        for integration in integrations:
+            integration.due_at = integration.next_sync_at
+            integration.next_sync_at = lease_until
+        return integrations
+
+    def run(self, now=None, limit=None):
+        """Sync every due integration. Returns a summary of the run."""
+        now = now or timezone.now()
+        integrations = self.claim_due(now, limit or CALENDAR_SYNC_CONFIG['SYNC_BATCH_LIMIT'])
+        metrics_collector.set_gauge('calendar.sync.due', len(integrations))
+
+        summary = {
+            'due': len(integrations),
+            'synced': 0,
+            'failed': 0,
+            'tokens_refreshed': 0,
+            'api_calls': {},
+        }
+        if not integrations:
+            return summary
+
+        lead_minutes = CALENDAR_SYNC_CONFIG['TOKEN_REFRESH_LEAD_MINUTES']
+        expiring = [
+            integration for integration in integrations
+            if self.token_manager._needs_refresh(integration, lead_minutes)
+        ]
+        if expiring:
+            summary['tokens_refreshed'] = self.token_manager.refresh_tokens(expiring, self.max_workers)['refreshed']
+
+        started = time.monotonic()
+        api_calls = Counter()
+        failed_ids = []
+        for integration, result in self._dispatch(integrations):
+            provider = integration.provider
+            if result.get('success'):
+                summary['synced'] += 1
+            else:
+                summary['failed'] += 1
+                failed_ids.append(integration.id)
+                integration.status = 'error'
+                logger.error(f"Sync failed for integration {integration.id}: {result.get('error')}")
+            api_calls[provider] += result.get('api_calls', 0)
+            if integration.due_at:
+                lag = (integration.sync_started_at - integration.due_at).total_seconds()
+                metrics_collector.record_histogram('calendar.sync.lag_seconds', max(lag, 0), {'provider': provider})
+            apply_sync_result(integration, result, timezone.now())
+
+        CalendarIntegration.objects.bulk_update(integrations, ['sync_interval_minutes', 'next_sync_at'])
+        if failed_ids:
+            # Only failed rows are written, so a status change made during the run is kept
+            CalendarIntegration.objects.filter(id__in=failed_ids).update(status='error')
+
+        # Calls per minute over the run as a share of the per-minute API quota
+        minutes = max(time.monotonic() - started, 60) / 60
+        for provider, calls in api_calls.items():
+            metrics_collector.increment_counter(f'calendar.sync.api_calls.{provider}', calls)
+            metrics_collector.set_gauge(
+                f'calendar.sync.quota_used_percent.{provider}',
+                calls / minutes / CALENDAR_SYNC_CONFIG['API_RATE_LIMIT_PER_MINUTE'] * 100
+            )
+        summary['api_calls'] = dict(api_calls)
+
+        logger.info(f"Sync run completed: {summary}")
+        return summary
+
+    def _dispatch(self, integrations):
+        """
+        Yield ``(integration, result)`` as syncs finish.
+
+        Each provider keeps its own queue in due order; work is submitted
+        round-robin across providers whenever both the pool and that
+        provider's cap have room, so workers never block waiting on a cap.
+        """
+        queues = OrderedDict()
+        for integration in integrations:
+            queues.setdefault(integration.provider, deque()).append(integration)
+        running = Counter()
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while queues or futures:
+                submitted = True
+                while submitted and len(futures) < self.max_workers:
+                    submitted = False
+                    for provider in list(queues):
+                        cap = max(1, self.provider_limits.get(provider, DEFAULT_PROVIDER_CONCURRENCY))
+                        if running[provider] >= cap or len(futures) >= self.max_workers:
+                            continue
+                        integration = queues[provider].popleft()
+                        if not queues[provider]:
+                            del queues[provider]
+                        integration.sync_started_at = timezone.now()
+                        futures[executor.submit(self._sync, integration)] = integration
+                        running[provider] += 1
+                        submitted = True
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    integration = futures.pop(future)
+                    running[integration.provider] -= 1
+                    yield integration, future.result()
+
+    def _sync(self, integration):
+        """Worker body: never raises, and releases the thread's DB connection."""
+        close_old_connections()
+        try:
+            return self.sync_func(integration)
+        except Exception as e:
+            logger.error(f"Error syncing integration {integration.id}: {e}")
+            return {'success': False, 'error': str(e)}
+        finally:
+            connection.close()
@@ -80,6 +80,14 @@ CALENDAR_SYNC_CONFIG = {
     'API_RATE_LIMIT_PER_MINUTE': 100,
     'BURST_RATE_LIMIT': 10,
     
+    # Sync orchestration
+    'MAX_CONCURRENT_SYNCS': 8,
+    'PROVIDER_CONCURRENCY': {'google': 4, 'outlook': 2},
+    'SYNC_BATCH_LIMIT': 200,  # Integrations picked per scheduler run
+    'MIN_SYNC_INTERVAL': 5,  # Adaptive interval bounds (in minutes)
+    'MAX_SYNC_INTERVAL': 240,
+    'TOKEN_REFRESH_LEAD_MINUTES': 10,
+    
     # Data retention
     'SYNC_LOG_RETENTION_DAYS': 30,
     'EXTERNAL_EVENT_RETENTION_DAYS': 365,
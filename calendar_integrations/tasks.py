@@ -7,10 +7,10 @@ import logging
 from datetime import datetime, timedelta
 from django.utils import timezone
 from celery import shared_task
-from django.db import transaction
 
-from .models import CalendarIntegration, ExternalCalendarEvent, CalendarSyncLog, CalendarConflict
-from .google_calendar_service import GoogleCalendarService
+from .models import CalendarIntegration, CalendarSyncLog
+from .conflicts import detect_conflicts
+from .orchestrator import SyncOrchestrator, apply_sync_result, sync_integration
 
 logger = logging.getLogger(__name__)
 
@@ -29,97 +29,33 @@ def sync_calendar_events(self, integration_id):
         
         logger.info(f"Starting sync for integration {integration_id}")
         
-        # Create sync log
-        sync_log = CalendarSyncLog.objects.create(
-            integration=integration,
-            sync_type='automatic',
-            status='running',
-            started_at=timezone.now()
-        )
-        
-        try:
-            if integration.provider == 'google':
-                service = GoogleCalendarService(integration)
-                
-                # Test connection
-                connection_test = service.test_connection()
-                if not connection_test['success']:
-                    raise Exception(f"Connection failed: {connection_test['error']}")
-                
-                # Fetch events
-                events = service.fetch_events()
-                
-                # Process events
-                events_created = 0
-                events_updated = 0
-                conflicts_detected = 0
-                
-                with transaction.atomic():
-                    for event_data in events:
-                        external_event, created = ExternalCalendarEvent.objects.update_or_create(
-                            integration=integration,
-                            external_event_id=event_data['id'],
-                            defaults={
-                                'title': event_data['title'],
-                                'description': event_data['description'],
-                                'start_time': event_data['start_time'],
-                                'end_time': event_data['end_time'],
-                                'location': event_data['location'],
-                                'last_modified': event_data['updated'] or timezone.now(),
-                                'is_medical_appointment': _is_medical_appointment(event_data)
-                            }
-                        )
-                        
-                        if created:
-                            events_created += 1
-                        else:
-                            events_updated += 1
-                        
-                        # Simple conflict detection
-                        if external_event.is_medical_appointment:
-                            conflicts = _detect_conflicts(external_event)
-                            conflicts_detected += len(conflicts)
-                
-                # Update integration
-                integration.last_sync_at = timezone.now()
-                integration.schedule_next_sync()
-                
-                # Update sync log
-                sync_log.status = 'success'
-                sync_log.events_processed = len(events)
-                sync_log.events_created = events_created
-                sync_log.events_updated = events_updated
-                sync_log.conflicts_detected = conflicts_detected
-                sync_log.completed_at = timezone.now()
-                sync_log.save()
-                
-                logger.info(f"Sync completed for integration {integration_id}: "
-                           f"{events_created} created, {events_updated} updated, "
-                           f"{conflicts_detected} conflicts")
-                
-                return {
-                    'success': True,
-                    'events_processed': len(events),
-                    'events_created': events_created,
-                    'events_updated': events_updated,
-                    'conflicts_detected': conflicts_detected
-                }
-            
-            else:
-                raise Exception(f"Provider {integration.provider} not supported")
-                
-        except Exception as e:
-            # Update sync log with error
-            sync_log.status = 'error'
-            sync_log.error_message = str(e)
-            sync_log.completed_at = timezone.now()
-            sync_log.save()
-            
-            # Update integration status
+        # Incremental when a sync token is stored, full resync otherwise;
+        # conflict detection only for events that changed in this sync
+        result = sync_integration(integration)
+        if not result['success']:
             integration.status = 'error'
-            integration.save()
-            
-            raise e
+            integration.save(update_fields=['status'])
+            raise Exception(result['error'])
+        
+        conflicts_detected = result['conflicts_detected']
+        apply_sync_result(integration, result)
+        integration.save(update_fields=['sync_interval_minutes', 'next_sync_at'])
+        
+        logger.info(f"Sync completed for integration {integration_id} ({result['sync_type']}): "
+                   f"{result['events_created']} created, {result['events_updated']} updated, "
+                   f"{result['events_skipped']} unchanged, {result['events_deleted']} deleted, "
+                   f"{conflicts_detected} conflicts")
+        
+        return {
+            'success': True,
+            'sync_type': result['sync_type'],
+            'events_processed': result['events_processed'],
+            'events_created': result['events_created'],
+            'events_updated': result['events_updated'],
+            'events_skipped': result['events_skipped'],
+            'events_deleted': result['events_deleted'],
+            'conflicts_detected': conflicts_detected
+        }
             
     except CalendarIntegration.DoesNotExist:
         logger.error(f"Integration {integration_id} not found")
@@ -144,22 +80,9 @@ def detect_calendar_conflicts():
     try:
         logger.info("Starting conflict detection")
         
-        # Get all medical appointments from last 7 days and next 30 days
-        start_date = timezone.now() - timedelta(days=7)
-        end_date = timezone.now() + timedelta(days=30)
-        
-        medical_events = ExternalCalendarEvent.objects.filter(
-            is_medical_appointment=True,
-            start_time__gte=start_date,
-            start_time__lte=end_date,
-            integration__status='active'
-        ).select_related('integration')
-        
-        conflicts_detected = 0
-        
-        for event in medical_events:
-            conflicts = _detect_conflicts(event)
-            conflicts_detected += len(conflicts)
+        # Medical events from last 7 days and next 30 days against each user's
+        # other events and appointments, one sweep per user
+        conflicts_detected = detect_conflicts()
         
         logger.info(f"Conflict detection completed: {conflicts_detected} conflicts found")
         
@@ -201,27 +124,18 @@ def cleanup_old_sync_logs():
 @shared_task
 def schedule_all_syncs():
     """
-    MVP task to schedule sync for all active integrations.
+    Sync every integration whose next sync is due, concurrently with
+    per-provider caps (see orchestrator.SyncOrchestrator).
     """
     try:
-        integrations = CalendarIntegration.objects.filter(
-            status='active',
-            sync_enabled=True
-        )
-        
-        scheduled_count = 0
-        
-        for integration in integrations:
-            # Check if sync is due
-            if integration.is_sync_due():
-                sync_calendar_events.delay(integration.id)
-                scheduled_count += 1
+        summary = SyncOrchestrator().run()
         
-        logger.info(f"Scheduled sync for {scheduled_count} integrations")
+        logger.info(f"Synced {summary['synced']} of {summary['due']} due integrations")
         
         return {
             'success': True,
-            'scheduled_count': scheduled_count
+            'scheduled_count': summary['due'],
+            **summary
         }
         
     except Exception as e:
@@ -248,43 +162,3 @@ def _is_medical_appointment(event_data):
     ).lower()
     
     return any(keyword in text_to_check for keyword in medical_keywords)
-
-
-def _detect_conflicts(external_event):
-    """
-    Simple conflict detection for medical appointments.
-    """
-    conflicts = []
-    
-    try:
-        # Check for overlapping events in the same time slot
-        overlapping_events = ExternalCalendarEvent.objects.filter(
-            integration__user=external_event.integration.user,
-            start_time__lt=external_event.end_time,
-            end_time__gt=external_event.start_time
-        ).exclude(id=external_event.id)
-        
-        for overlapping_event in overlapping_events:
-            # Create conflict record
-            conflict, created = CalendarConflict.objects.get_or_create(
-                integration=external_event.integration,
-                external_event=external_event,
-                conflict_type='time_overlap',
-                defaults={
-                    'conflict_details': {
-                        'overlapping_event_id': overlapping_event.id,
-                        'overlapping_event_title': overlapping_event.title,
-                        'overlap_start': max(external_event.start_time, overlapping_event.start_time).isoformat(),
-                        'overlap_end': min(external_event.end_time, overlapping_event.end_time).isoformat()
-                    }
-                }
-            )
-            
-            if created:
-                conflicts.append(conflict)
-                logger.info(f"Conflict detected: {external_event.title} overlaps with {overlapping_event.title}")
-    
-    except Exception as e:
-        logger.error(f"Error detecting conflicts for event {external_event.id}: {e}")
-    
-    return conflicts
\ No newline at end of file
@@ -0,0 +1,429 @@
+"""
+Tests for calendar integration sync
+"""
+from datetime import timedelta
+
+import httplib2
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from .google_calendar_service import EVENT_LIST_FIELDS, GoogleCalendarService
+from .models import CalendarIntegration, CalendarSyncLog, ExternalCalendarEvent
+
+User = get_user_model()
+
+
+class FakeEventsResource:
+    """Stands in for service.events(), replaying canned list() pages"""
+    
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+    
+    def list(self, **params):
+        self.requests.append(params)
+        response = self.responses.pop(0)
+        
+        class Request:
+            def execute(inner):
+                if isinstance(response, Exception):
+                    raise response
+                return response
+        return Request()
+
+
+class FakeCalendarService:
+    def __init__(self, responses):
+        self.resource = FakeEventsResource(responses)
+    
+    def events(self):
+        return self.resource
+
+
+def google_event(event_id, start, title='Busy', status='confirmed', updated=None):
+    return {
+        'id': event_id,
+        'status': status,
+        'summary': title,
+        'updated': (updated or start).isoformat(),
+        'start': {'dateTime': start.isoformat()},
+        'end': {'dateTime': (start + timedelta(hours=1)).isoformat()},
+    }
+
+
+class CalendarIntegrationTestDataMixin:
+    """Shared user and Google integration for calendar sync tests"""
+    
+    def setUp(self):
+        """Set up test data"""
+        user = User.objects.create_user(
+            username='calendar_doctor',
+            email='calendar_doctor@test.com',
+            password='testpass123',
+            full_name='Dr. Calendar',
+            role='doctor'
+        )
+        self.integration = CalendarIntegration.objects.create(
+            user=user,
+            provider='google',
+            calendar_id='primary',
+            _access_token='token',
+            status='active',
+            sync_enabled=True
+        )
+        self.start = timezone.now() + timedelta(days=1)
+
+
+class GoogleIncrementalSyncTestCase(CalendarIntegrationTestDataMixin, TestCase):
+    """Test cases for sync-token based incremental sync"""
+    
+    def _sync(self, responses, **kwargs):
+        service = GoogleCalendarService(self.integration)
+        service.service = FakeCalendarService(responses)
+        return service.sync_events(**kwargs), service.service.resource.requests
+    
+    def test_full_sync_follows_pages_and_stores_token(self):
+        """A first sync pages through every result and keeps the sync token"""
+        result, requests = self._sync([
+            {'items': [google_event('a', self.start)], 'nextPageToken': 'page-2'},
+            {'items': [google_event('b', self.start + timedelta(hours=2))], 'nextSyncToken': 'token-1'},
+        ])
+        
+        self.assertTrue(result['success'])
+        self.assertEqual(result['sync_type'], 'full')
+        self.assertEqual(result['events_created'], 2)
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[1]['pageToken'], 'page-2')
+        self.assertEqual(requests[0]['fields'], EVENT_LIST_FIELDS)
+        self.assertIn('timeMin', requests[0])
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.sync_token, 'token-1')
+        self.assertEqual(CalendarSyncLog.objects.get().sync_type, 'full')
+    
+    def test_incremental_sync_applies_changes_and_cancellations(self):
+        """With a stored token only deltas are requested; cancelled events are removed"""
+        self._sync([{'items': [google_event('a', self.start), google_event('b', self.start)], 'nextSyncToken': 'token-1'}])
+        
+        result, requests = self._sync([{
+            'items': [
+                google_event('a', self.start, title='Moved', updated=timezone.now()),
+                {'id': 'b', 'status': 'cancelled'},
+            ],
+            'nextSyncToken': 'token-2',
+        }])
+        
+        self.assertEqual(result['sync_type'], 'incremental')
+        self.assertEqual(requests[0]['syncToken'], 'token-1')
+        self.assertNotIn('timeMin', requests[0])
+        self.assertEqual(result['events_updated'], 1)
+        self.assertEqual(result['events_deleted'], 1)
+        self.assertEqual(list(ExternalCalendarEvent.objects.values_list('title', flat=True)), ['Moved'])
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.sync_token, 'token-2')
+    
+    def test_expired_token_triggers_full_resync(self):
+        """A 410 Gone response falls back to a full sync that drops vanished events"""
+        self._sync([{'items': [google_event('a', self.start), google_event('b', self.start)], 'nextSyncToken': 'token-1'}])
+        
+        gone = HttpError(httplib2.Response({'status': 410}), b'{"error": {"code": 410}}')
+        result, requests = self._sync([
+            gone,
+            {'items': [google_event('a', self.start)], 'nextSyncToken': 'token-fresh'},
+        ])
+        
+        self.assertTrue(result['success'])
+        self.assertEqual(result['sync_type'], 'full')
+        self.assertEqual(len(requests), 2)
+        self.assertNotIn('syncToken', requests[1])
+        self.assertEqual(list(ExternalCalendarEvent.objects.values_list('external_event_id', flat=True)), ['a'])
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.sync_token, 'token-fresh')
+
+
+class ExternalEventUpsertTestCase(CalendarIntegrationTestDataMixin, TestCase):
+    """Test cases for the bulk event upsert stage"""
+    
+    def _events(self, count, updated_offset=0):
+        service = GoogleCalendarService(self.integration)
+        events = []
+        for index in range(count):
+            event = google_event(f'evt-{index}', self.start + timedelta(hours=index))
+            event['updated'] = (self.start + timedelta(minutes=updated_offset)).isoformat()
+            events.append(service._process_event(event))
+        return events
+    
+    def test_upsert_query_count_is_constant(self):
+        """Writing 5 or 60 events costs the same number of queries (one chunk each)"""
+        from .event_store import apply_event_changes
+        
+        # Including the provider lookup for availability cache invalidation
+        with self.assertNumQueries(6):
+            apply_event_changes(self.integration, self._events(5))
+        ExternalCalendarEvent.objects.all().delete()
+        with self.assertNumQueries(6):
+            result = apply_event_changes(self.integration, self._events(60))
+        
+        self.assertEqual(result['events_created'], 60)
+        self.assertEqual(len(result['changed_event_ids']), 60)
+    
+    def test_unchanged_events_are_skipped(self):
+        """Events whose updated timestamp has not moved are not rewritten"""
+        from .event_store import apply_event_changes
+        
+        apply_event_changes(self.integration, self._events(3))
+        events = self._events(3)
+        events[0] = self._events(1, updated_offset=5)[0]
+        events[0]['title'] = 'Renamed'
+        
+        result = apply_event_changes(self.integration, events, deleted_ids=['evt-2'])
+        
+        self.assertEqual(result['events_created'], 0)
+        self.assertEqual(result['events_updated'], 1)
+        self.assertEqual(result['events_skipped'], 2)
+        self.assertEqual(result['events_deleted'], 1)
+        self.assertEqual(ExternalCalendarEvent.objects.get(external_event_id='evt-0').title, 'Renamed')
+    
+    def test_sync_log_records_counts(self):
+        """The sync log carries created, updated, skipped and deleted counts"""
+        service = GoogleCalendarService(self.integration)
+        service.service = FakeCalendarService([
+            {'items': [google_event('a', self.start), google_event('b', self.start)], 'nextSyncToken': 't1'},
+            {'items': [google_event('a', self.start), {'id': 'b', 'status': 'cancelled'}], 'nextSyncToken': 't2'},
+        ])
+        service.sync_events()
+        service.sync_events()
+        
+        log = CalendarSyncLog.objects.filter(sync_type='incremental').get()
+        self.assertEqual(
+            (log.events_created, log.events_updated, log.events_skipped, log.events_deleted),
+            (0, 0, 1, 1)
+        )
+
+
+class CalendarConflictDetectionTestCase(CalendarIntegrationTestDataMixin, TestCase):
+    """Test cases for sweep-line conflict detection"""
+    
+    def _event(self, event_id, start_hour, end_hour, medical=True):
+        day = self.start.replace(hour=0, minute=0, second=0, microsecond=0)
+        return ExternalCalendarEvent.objects.create(
+            integration=self.integration,
+            external_event_id=event_id,
+            title=f'Event {event_id}',
+            start_time=day + timedelta(hours=start_hour),
+            end_time=day + timedelta(hours=end_hour),
+            is_medical_appointment=medical,
+            last_modified=timezone.now()
+        )
+    
+    def test_sweep_overlaps(self):
+        """Every overlapping pair is found once and touching intervals are not overlaps"""
+        from .conflicts import sweep_overlaps
+        
+        intervals = [(1, 3, 'a'), (2, 5, 'b'), (4, 6, 'c'), (6, 7, 'd'), (0, 10, 'e')]
+        pairs = {frozenset(pair) for pair in sweep_overlaps(intervals)}
+        
+        self.assertEqual(pairs, {
+            frozenset('ab'), frozenset('bc'), frozenset('ae'), frozenset('be'),
+            frozenset('ce'), frozenset('de'),
+        })
+    
+    def test_detect_records_each_overlap_once(self):
+        """Detection stores one conflict per medical event and clashing item, idempotently"""
+        from .conflicts import detect_conflicts
+        from .models import CalendarConflict
+        
+        medical = self._event('m', 9, 11)
+        other = self._event('o', 10, 12, medical=False)
+        self._event('later', 12, 13, medical=False)
+        
+        with self.assertNumQueries(4):
+            self.assertEqual(detect_conflicts(user_ids=[self.integration.user_id]), 1)
+        self.assertEqual(detect_conflicts(user_ids=[self.integration.user_id]), 0)
+        
+        conflict = CalendarConflict.objects.get()
+        self.assertEqual(conflict.external_event, medical)
+        self.assertEqual(conflict.conflict_key, f'event:{other.id}')
+        self.assertEqual(conflict.conflict_details['overlapping_event_id'], other.id)
+    
+    def test_incremental_detection_limited_to_touched_events(self):
+        """Incremental detection only reports overlaps involving the touched events"""
+        from .conflicts import detect_event_conflicts
+        from .models import CalendarConflict
+        
+        first = self._event('a', 9, 11)
+        self._event('b', 10, 12)
+        self._event('c', 15, 17)
+        touched = self._event('d', 16, 18, medical=False)
+        
+        self.assertEqual(detect_event_conflicts([touched.id]), 1)
+        self.assertEqual(
+            list(CalendarConflict.objects.values_list('external_event__external_event_id', flat=True)),
+            ['c']
+        )
+        self.assertEqual(detect_event_conflicts([first.id]), 2)
+
+
+class SyncOrchestratorTestCase(CalendarIntegrationTestDataMixin, TestCase):
+    """Test cases for the concurrent sync orchestrator"""
+    
+    def _integration(self, calendar_id, provider='google', due_in_minutes=-1, **fields):
+        return CalendarIntegration.objects.create(
+            user=self.integration.user,
+            provider=provider,
+            calendar_id=calendar_id,
+            _access_token='token',
+            status='active',
+            sync_enabled=True,
+            token_expiry=timezone.now() + timedelta(hours=1),
+            next_sync_at=timezone.now() + timedelta(minutes=due_in_minutes),
+            **fields
+        )
+    
+    def test_only_due_integrations_synced_most_overdue_first(self):
+        """Due integrations are picked oldest first and rescheduled afterwards"""
+        from .orchestrator import SyncOrchestrator
+        
+        self.integration.delete()
+        late = self._integration('late', due_in_minutes=-30)
+        recent = self._integration('recent', due_in_minutes=-1)
+        future = self._integration('future', due_in_minutes=30)
+        synced = []
+        
+        def sync(integration):
+            synced.append(integration.calendar_id)
+            return {'success': True, 'api_calls': 2}
+        
+        summary = SyncOrchestrator(max_workers=1, sync_func=sync).run()
+        
+        self.assertEqual(synced, ['late', 'recent'])
+        self.assertEqual(summary['synced'], 2)
+        self.assertEqual(summary['api_calls'], {'google': 4})
+        for integration in (late, recent):
+            integration.refresh_from_db()
+            self.assertGreater(integration.next_sync_at, timezone.now())
+        self.assertEqual(
+            CalendarIntegration.objects.get(id=future.id).next_sync_at, future.next_sync_at
+        )
+    
+    def test_provider_concurrency_caps(self):
+        """No provider ever runs more syncs at once than its cap"""
+        import threading
+        import time
+        from collections import Counter
+        from .orchestrator import SyncOrchestrator
+        
+        self.integration.delete()
+        for i in range(6):
+            self._integration(f'google-{i}')
+        for i in range(3):
+            self._integration(f'outlook-{i}', provider='outlook')
+        lock = threading.Lock()
+        running = Counter()
+        peak = Counter()
+        
+        def sync(integration):
+            with lock:
+                running[integration.provider] += 1
+                peak[integration.provider] = max(peak[integration.provider], running[integration.provider])
+            time.sleep(0.02)
+            with lock:
+                running[integration.provider] -= 1
+            return {'success': True}
+        
+        orchestrator = SyncOrchestrator(
+            max_workers=4, provider_limits={'google': 2, 'outlook': 1}, sync_func=sync
+        )
+        summary = orchestrator.run()
+        
+        self.assertEqual(summary['synced'], 9)
+        self.assertEqual(peak['google'], 2)
+        self.assertEqual(peak['outlook'], 1)
+    
+    def test_sync_interval_adapts_to_changes(self):
+        """Calendars that change are synced more often, idle ones less often"""
+        from .orchestrator import SyncOrchestrator
+        
+        self.integration.delete()
+        busy = self._integration('busy', sync_interval_minutes=20)
+        idle = self._integration('idle', sync_interval_minutes=20)
+        floor = self._integration('floor', sync_interval_minutes=6)
+        
+        def sync(integration):
+            changed = integration.calendar_id != 'idle'
+            return {'success': True, 'events_updated': 3 if changed else 0}
+        
+        SyncOrchestrator(sync_func=sync).run()
+        
+        intervals = dict(CalendarIntegration.objects.values_list('calendar_id', 'sync_interval_minutes'))
+        self.assertEqual(intervals, {'busy': 10, 'idle': 30, 'floor': 5})
+        busy.refresh_from_db()
+        self.assertAlmostEqual(
+            (busy.next_sync_at - timezone.now()).total_seconds() / 60, 10, delta=1
+        )
+    
+    def test_failed_sync_marks_integration_error(self):
+        """A failed sync sets the integration to error so later runs skip it"""
+        from .orchestrator import SyncOrchestrator
+        
+        self.integration.delete()
+        broken = self._integration('broken')
+        working = self._integration('working')
+        
+        def sync(integration):
+            if integration.calendar_id == 'broken':
+                raise ConnectionError('calendar API unreachable')
+            return {'success': True}
+        
+        summary = SyncOrchestrator(sync_func=sync).run()
+        
+        self.assertEqual((summary['synced'], summary['failed']), (1, 1))
+        self.assertEqual(CalendarIntegration.objects.get(id=broken.id).status, 'error')
+        self.assertEqual(CalendarIntegration.objects.get(id=working.id).status, 'active')
+        self.assertEqual(SyncOrchestrator(sync_func=sync).claim_due(timezone.now() + timedelta(hours=1), 10),
+                         [working])
+    
+    def test_cached_client_requests_do_not_share_connections(self):
+        """Requests built from one cached client each get their own Http, so threads can share it"""
+        from google.oauth2.credentials import Credentials
+        from .google_calendar_service import clear_client_cache, get_calendar_client
+        
+        clear_client_cache()
+        self.addCleanup(clear_client_cache)
+        credentials = Credentials('token')
+        client = get_calendar_client(self.integration.id, credentials)
+        self.assertIs(get_calendar_client(self.integration.id, credentials), client)
+        
+        first = client.events().list(calendarId='primary')
+        second = client.events().list(calendarId='primary')
+        self.assertIsNot(first.http, second.http)
+        self.assertIsNot(first.http.http, second.http.http)
+    
+    def test_tokens_expiring_soon_refreshed_in_one_batch(self):
+        """Tokens inside the lead time are refreshed before syncing and saved together"""
+        from unittest import mock
+        from .orchestrator import SyncOrchestrator
+        from .token_refresh import TokenRefreshManager
+        
+        self.integration.delete()
+        expiring = self._integration('expiring', _refresh_token='refresh')
+        expiring.token_expiry = timezone.now() + timedelta(minutes=2)
+        expiring.save()
+        self._integration('fresh', _refresh_token='refresh')
+        new_expiry = timezone.now() + timedelta(hours=1)
+        
+        def refresh(manager, integration, save=True):
+            integration._access_token = 'new-token'
+            integration.token_expiry = new_expiry
+            return True
+        
+        with mock.patch.object(TokenRefreshManager, '_refresh_google_token', autospec=True,
+                               side_effect=refresh) as refresh_mock:
+            summary = SyncOrchestrator(sync_func=lambda integration: {'success': True}).run()
+        
+        self.assertEqual(summary['tokens_refreshed'], 1)
+        self.assertEqual(refresh_mock.call_count, 1)
+        expiring.refresh_from_db()
+        self.assertEqual(expiring._access_token, 'new-token')
+        self.assertEqual(expiring.token_expiry, new_expiry)
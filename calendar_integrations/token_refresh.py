@@ -4,11 +4,14 @@ Handles automatic refresh of expired OAuth tokens.
 """
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from django.db.models import Q
 from django.utils import timezone
 from django.conf import settings
 from .models import CalendarIntegration
 from .google_calendar_service import GoogleCalendarService
+from .settings import CALENDAR_SYNC_CONFIG
 
 logger = logging.getLogger(__name__)
 
@@ -50,12 +53,13 @@ class TokenRefreshManager:
             logger.error(f"Error refreshing token for integration {integration.id}: {e}")
             return False
     
-    def _needs_refresh(self, integration):
+    def _needs_refresh(self, integration, lead_minutes=5):
         """
         Check if token needs to be refreshed.
         
         Args:
             integration (CalendarIntegration): The integration to check
+            lead_minutes (int): How long before expiry a token is refreshed
             
         Returns:
             bool: True if token needs refresh
@@ -64,16 +68,17 @@ class TokenRefreshManager:
             # If no expiry is set, assume it needs refresh
             return True
         
-        # Refresh if token expires within 5 minutes
-        refresh_threshold = timezone.now() + timedelta(minutes=5)
+        # Refresh if token expires within the lead time
+        refresh_threshold = timezone.now() + timedelta(minutes=lead_minutes)
         return integration.token_expiry <= refresh_threshold
     
-    def _refresh_google_token(self, integration: CalendarIntegration) -> bool:
+    def _refresh_google_token(self, integration: CalendarIntegration, save: bool = True) -> bool:
         """
         Refresh Google Calendar token for a specific integration.
         
         Args:
             integration: The CalendarIntegration instance to refresh
+            save: Whether to save the integration (batch refreshes save all at once)
             
         Returns:
             bool: True if refresh was successful, False otherwise
@@ -104,7 +109,8 @@ class TokenRefreshManager:
             elif 'expires_in' in token_data:
                 integration.token_expiry = timezone.now() + timedelta(seconds=token_data['expires_in'])
             
-            integration.save()
+            if save:
+                integration.save()
             
             logger.info(f"Successfully refreshed token for integration {integration.id}")
             return True
@@ -127,9 +133,46 @@ class TokenRefreshManager:
         logger.warning(f"Outlook token refresh not implemented for integration {integration.id}")
         return False
     
-    def refresh_all_expired_tokens(self):
+    def refresh_tokens(self, integrations, max_workers=None):
         """
-        Refresh all expired tokens across all integrations.
+        Refresh tokens for many integrations at once.
+        
+        Provider calls run concurrently and the new tokens are written with a
+        single bulk update.
+        
+        Args:
+            integrations (list): Integrations whose tokens should be refreshed
+            max_workers (int): Maximum concurrent refresh requests
+            
+        Returns:
+            dict: Counts of refreshed and failed integrations
+        """
+        results = {'refreshed': 0, 'failed': 0}
+        integrations = [
+            integration for integration in integrations
+            if integration._refresh_token and integration.provider == 'google'
+        ]
+        if not integrations:
+            return results
+        
+        max_workers = max_workers or CALENDAR_SYNC_CONFIG['MAX_CONCURRENT_SYNCS']
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            outcomes = list(executor.map(
+                lambda integration: self._refresh_google_token(integration, save=False),
+                integrations
+            ))
+        
+        refreshed = [integration for integration, ok in zip(integrations, outcomes) if ok]
+        CalendarIntegration.objects.bulk_update(
+            refreshed, ['_access_token', '_refresh_token', 'token_expiry']
+        )
+        results['refreshed'] = len(refreshed)
+        results['failed'] = len(integrations) - len(refreshed)
+        return results
+    
+    def refresh_all_expired_tokens(self, lead_minutes=None):
+        """
+        Refresh all tokens that have expired or will expire within the lead time.
         
         Returns:
             dict: Summary of refresh results
@@ -142,31 +185,26 @@ class TokenRefreshManager:
         }
         
         try:
-            # Get all active integrations with tokens that might need refresh
-            integrations = CalendarIntegration.objects.filter(
+            if lead_minutes is None:
+                lead_minutes = CALENDAR_SYNC_CONFIG['TOKEN_REFRESH_LEAD_MINUTES']
+            
+            candidates = CalendarIntegration.objects.filter(
                 status__in=['active', 'error'],
                 sync_enabled=True
             ).exclude(
-                refresh_token__isnull=True
+                _refresh_token__isnull=True
             ).exclude(
-                refresh_token=''
+                _refresh_token=''
             )
-            
-            results['total_checked'] = integrations.count()
-            
-            for integration in integrations:
-                try:
-                    if self._needs_refresh(integration):
-                        if self.refresh_token_if_needed(integration):
-                            results['refreshed'] += 1
-                        else:
-                            results['failed'] += 1
-                    else:
-                        results['skipped'] += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error processing integration {integration.id}: {e}")
-                    results['failed'] += 1
+            results['total_checked'] = candidates.count()
+            
+            # Only tokens expiring within the lead time are loaded
+            integrations = list(candidates.filter(
+                Q(token_expiry__isnull=True) |
+                Q(token_expiry__lte=timezone.now() + timedelta(minutes=lead_minutes))
+            ))
+            results['skipped'] = results['total_checked'] - len(integrations)
+            results.update(self.refresh_tokens(integrations))
             
             logger.info(f"Token refresh batch completed: {results}")
             return results
@@ -474,12 +474,22 @@ PATIENT_PORTAL_URL = PATIENT_NOTIFICATION_SETTINGS['PATIENT_PORTAL_URL']
 SUPPORT_URL = PATIENT_NOTIFICATION_SETTINGS['SUPPORT_URL']
 PRIVACY_URL = PATIENT_NOTIFICATION_SETTINGS['PRIVACY_URL']
 
+# Distributed task dispatch: set e.g. DISTRIBUTED_TASK_LOAD_EPSILON=0.25 to place tasks
+# with consistent hashing with bounded loads; unset keeps least-loaded dispatch
+DISTRIBUTED_TASK_LOAD_EPSILON = (
+    float(os.getenv('DISTRIBUTED_TASK_LOAD_EPSILON')) if os.getenv('DISTRIBUTED_TASK_LOAD_EPSILON') else None
+)
+
 # Ensure logs directory exists for logging
 import os
 LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 if not os.path.exists(LOGS_DIR):
     os.makedirs(LOGS_DIR)
 
+# Write-ahead journal for partner API audit records (api_integration.audit);
+# must be on local disk, and should survive restarts of the web workers
+API_AUDIT_JOURNAL_DIR = os.getenv('API_AUDIT_JOURNAL_DIR', os.path.join(LOGS_DIR, 'audit_journal'))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -554,5 +564,17 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': crontab(minute='*/2'),  # every 2 minutes
         'options': {'queue': 'notifications', 'expires': 110},
     },
+    'reconcile-analytics-rollups': {
+        'task': 'analytics.tasks.reconcile_analytics_rollups',
+        'schedule': crontab(minute=15),  # hourly at :15
+        'kwargs': {'days': 3},
+        'options': {'expires': 3000},
+    },
+    'refresh-log-rollups': {
+        'task': 'notifications.tasks.refresh_log_rollups',
+        'schedule': crontab(minute='*/5'),  # every 5 minutes
+        'kwargs': {'hours': 2},
+        'options': {'queue': 'notifications', 'expires': 240},
+    },
 }
 
@@ -0,0 +1,20 @@
+import os
+import sys
+
+from django.apps import AppConfig
+
+
+class NotificationsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'notifications'
+
+    def ready(self):
+        """Start the metrics file writer and database log writer once the app registry is ready."""
+        if os.getenv('METRICS_MULTIPROC_DIR'):
+            from .metrics_exposition import start_metrics_file_writer
+            from .monitoring import metrics_collector
+            start_metrics_file_writer(metrics_collector)
+        if sys.argv[1:2] == ['test'] or os.getenv('TESTING') == 'true':
+            return
+        from .logging_config import start_database_logging
+        start_database_logging()
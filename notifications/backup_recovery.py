@@ -2,9 +2,12 @@ import asyncio
 import json
 import os
 import shutil
-import gzip
 import pickle
 import hashlib
+import gzip
+import logging
+import tarfile
+import tempfile
 import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Callable, Union, Tuple
@@ -13,16 +16,27 @@ from enum import Enum
 from abc import ABC, abstractmethod
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
+import base64
 import sqlite3
 import boto3
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
 
-from .logging_config import NotificationLogger
-from .monitoring import SystemMonitor
+from .backup_snapshots import GarbageCollectionStats, SnapshotStore
+from .backup_stream import (
+    MAGIC, CODEC_NONE, BackupFormatError, default_codec, file_checksum, read_backup, verify_backup, write_backup
+)
+from .monitoring import SystemMonitor, metrics_collector
 from .database_optimization import DatabaseOptimizer
 
 
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_DEFAULT_PART_SIZE = 16 * 1024 * 1024
+S3_MAX_PARTS = 10000
+
+
 class BackupType(Enum):
     """Types of backups."""
     FULL = "full"
@@ -116,6 +130,10 @@ class RecoveryRecord:
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
+def _content_md5(data: bytes) -> str:
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
 class StorageBackend(ABC):
     """Abstract base class for storage backends."""
     
@@ -139,6 +157,15 @@ class StorageBackend(ABC):
         """List files in the storage backend."""
         pass
     
+    @abstractmethod
+    async def scan_files(self, remote_path: str) -> Dict[str, float]:
+        """
+        Map each file under ``remote_path`` to its modification time (a Unix
+        timestamp). Unlike list_files, a failed listing raises instead of
+        looking like an empty directory.
+        """
+        pass
+    
     @abstractmethod
     async def file_exists(self, remote_path: str) -> bool:
         """Check if a file exists in the storage backend."""
@@ -156,7 +183,7 @@ class LocalStorageBackend(StorageBackend):
     def __init__(self, base_path: str):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
-        self.logger = NotificationLogger()
+        self.logger = logging.getLogger(__name__)
     
     async def upload_file(self, local_path: str, remote_path: str) -> bool:
         """Copy file to local storage."""
@@ -210,22 +237,24 @@ class LocalStorageBackend(StorageBackend):
     async def list_files(self, remote_path: str) -> List[str]:
         """List files in local storage."""
         try:
-            dir_path = self.base_path / remote_path
-            
-            if not dir_path.exists():
-                return []
-            
-            files = []
-            for item in dir_path.rglob('*'):
-                if item.is_file():
-                    relative_path = item.relative_to(self.base_path)
-                    files.append(str(relative_path))
-            
-            return files
+            return list(await self.scan_files(remote_path))
         except Exception as e:
             self.logger.error(f"Failed to list files in {remote_path}: {e}")
             return []
     
+    async def scan_files(self, remote_path: str) -> Dict[str, float]:
+        """List files in local storage with their modification times; raises on error."""
+        def scan():
+            dir_path = self.base_path / remote_path
+            if not dir_path.exists():
+                return {}
+            return {
+                str(item.relative_to(self.base_path)): item.stat().st_mtime
+                for item in dir_path.rglob('*') if item.is_file()
+            }
+        
+        return await asyncio.get_event_loop().run_in_executor(None, scan)
+    
     async def file_exists(self, remote_path: str) -> bool:
         """Check if file exists in local storage."""
         file_path = self.base_path / remote_path
@@ -241,24 +270,43 @@ class LocalStorageBackend(StorageBackend):
 
 
 class S3StorageBackend(StorageBackend):
-    """AWS S3 storage backend."""
+    """
+    AWS S3 storage backend.
     
-    def __init__(self, bucket_name: str, aws_access_key: str, aws_secret_key: str, region: str = 'us-east-1'):
+    Files larger than ``part_size`` are uploaded as multipart uploads with up
+    to ``max_concurrency`` parts in flight, and downloaded with as many
+    parallel ranged GETs. The upload id of an unfinished multipart upload is
+    kept in ``state_dir``, so uploading the same file again after a failure
+    resumes with the parts S3 does not have yet.
+    """
+    
+    def __init__(self, bucket_name: str, aws_access_key: str, aws_secret_key: str, region: str = 'us-east-1',
+                 part_size: int = S3_DEFAULT_PART_SIZE, max_concurrency: int = 8,
+                 state_dir: Optional[str] = None, s3_client=None):
+        if part_size < S3_MIN_PART_SIZE:
+            raise ValueError(f"S3 part size must be at least {S3_MIN_PART_SIZE} bytes")
         self.bucket_name = bucket_name
-        self.s3_client = boto3.client(
+        self.part_size = part_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.state_dir = state_dir or os.path.join(tempfile.gettempdir(), 's3_multipart_uploads')
+        self.s3_client = s3_client or boto3.client(
             's3',
             aws_access_key_id=aws_access_key,
             aws_secret_access_key=aws_secret_key,
-            region_name=region
+            region_name=region,
+            config=BotoConfig(max_pool_connections=max(10, self.max_concurrency))
         )
-        self.logger = NotificationLogger()
+        self.logger = logging.getLogger(__name__)
     
     async def upload_file(self, local_path: str, remote_path: str) -> bool:
         """Upload file to S3."""
         try:
-            await asyncio.get_event_loop().run_in_executor(
-                None, self.s3_client.upload_file, local_path, self.bucket_name, remote_path
-            )
+            size = os.path.getsize(local_path)
+            if size <= self.part_size:
+                upload = partial(self._put_object, local_path, remote_path)
+            else:
+                upload = partial(self._upload_multipart, local_path, remote_path, size)
+            await asyncio.get_event_loop().run_in_executor(None, upload)
             return True
         except Exception as e:
             self.logger.error(f"Failed to upload file to S3 {remote_path}: {e}")
@@ -270,7 +318,7 @@ class S3StorageBackend(StorageBackend):
             Path(local_path).parent.mkdir(parents=True, exist_ok=True)
             
             await asyncio.get_event_loop().run_in_executor(
-                None, self.s3_client.download_file, self.bucket_name, remote_path, local_path
+                None, self._download, remote_path, local_path
             )
             return True
         except Exception as e:
@@ -281,7 +329,7 @@ class S3StorageBackend(StorageBackend):
         """Delete file from S3."""
         try:
             await asyncio.get_event_loop().run_in_executor(
-                None, self.s3_client.delete_object, {'Bucket': self.bucket_name, 'Key': remote_path}
+                None, partial(self.s3_client.delete_object, Bucket=self.bucket_name, Key=remote_path)
             )
             return True
         except Exception as e:
@@ -291,24 +339,30 @@ class S3StorageBackend(StorageBackend):
     async def list_files(self, remote_path: str) -> List[str]:
         """List files in S3."""
         try:
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, self.s3_client.list_objects_v2, {'Bucket': self.bucket_name, 'Prefix': remote_path}
-            )
-            
-            files = []
-            if 'Contents' in response:
-                files = [obj['Key'] for obj in response['Contents']]
-            
-            return files
+            return list(await self.scan_files(remote_path))
         except Exception as e:
             self.logger.error(f"Failed to list files in S3 {remote_path}: {e}")
             return []
     
+    async def scan_files(self, remote_path: str) -> Dict[str, float]:
+        """List files in S3 with their modification times; raises on error."""
+        def list_keys():
+            keys = {}
+            kwargs = {'Bucket': self.bucket_name, 'Prefix': remote_path}
+            while True:
+                response = self.s3_client.list_objects_v2(**kwargs)
+                keys.update((obj['Key'], obj['LastModified'].timestamp()) for obj in response.get('Contents', []))
+                if not response.get('IsTruncated'):
+                    return keys
+                kwargs['ContinuationToken'] = response['NextContinuationToken']
+        
+        return await asyncio.get_event_loop().run_in_executor(None, list_keys)
+    
     async def file_exists(self, remote_path: str) -> bool:
         """Check if file exists in S3."""
         try:
             await asyncio.get_event_loop().run_in_executor(
-                None, self.s3_client.head_object, {'Bucket': self.bucket_name, 'Key': remote_path}
+                None, partial(self.s3_client.head_object, Bucket=self.bucket_name, Key=remote_path)
             )
             return True
         except ClientError:
@@ -321,11 +375,130 @@ class S3StorageBackend(StorageBackend):
         """Get file size in S3."""
         try:
             response = await asyncio.get_event_loop().run_in_executor(
-                None, self.s3_client.head_object, {'Bucket': self.bucket_name, 'Key': remote_path}
+                None, partial(self.s3_client.head_object, Bucket=self.bucket_name, Key=remote_path)
             )
             return response.get('ContentLength', 0)
         except Exception:
             return 0
+    
+    def _put_object(self, local_path: str, remote_path: str):
+        with open(local_path, 'rb') as f:
+            data = f.read()
+        self.s3_client.put_object(
+            Bucket=self.bucket_name, Key=remote_path, Body=data, ContentMD5=_content_md5(data)
+        )
+    
+    def _upload_multipart(self, local_path: str, remote_path: str, size: int):
+        """Upload the parts S3 does not have yet, ``max_concurrency`` at a time, then complete."""
+        part_size = max(self.part_size, -(-size // S3_MAX_PARTS))
+        part_count = -(-size // part_size)
+        state_path = self._upload_state_path(local_path, remote_path, size, part_size)
+        
+        uploaded = None
+        upload_id = self._load_upload_id(state_path)
+        if upload_id:
+            uploaded = self._uploaded_parts(remote_path, upload_id, part_size, size)
+        if uploaded is None:
+            upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=remote_path
+            )['UploadId']
+            uploaded = {}
+            os.makedirs(self.state_dir, exist_ok=True)
+            with open(state_path, 'w') as f:
+                json.dump({'upload_id': upload_id, 'key': remote_path}, f)
+        else:
+            self.logger.info(f"Resuming upload of {remote_path}: {len(uploaded)}/{part_count} parts present")
+        
+        def upload_part(number: int) -> Tuple[int, str]:
+            offset = (number - 1) * part_size
+            with open(local_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(min(part_size, size - offset))
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket_name, Key=remote_path, UploadId=upload_id,
+                PartNumber=number, Body=data, ContentMD5=_content_md5(data)
+            )
+            return number, response['ETag']
+        
+        missing = [number for number in range(1, part_count + 1) if number not in uploaded]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, max(1, len(missing)))) as pool:
+            for number, etag in pool.map(upload_part, missing):
+                uploaded[number] = etag
+        
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=remote_path, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': uploaded[number]}
+                                       for number in sorted(uploaded)]}
+        )
+        os.remove(state_path)
+    
+    def _upload_state_path(self, local_path: str, remote_path: str, size: int, part_size: int) -> str:
+        # A changed file (size or mtime) starts a new upload
+        identity = [self.bucket_name, remote_path, os.path.abspath(local_path), size,
+                    os.stat(local_path).st_mtime_ns, part_size]
+        return os.path.join(self.state_dir, hashlib.sha256(json.dumps(identity).encode()).hexdigest() + '.json')
+    
+    @staticmethod
+    def _load_upload_id(state_path: str) -> Optional[str]:
+        try:
+            with open(state_path) as f:
+                return json.load(f)['upload_id']
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _uploaded_parts(self, remote_path: str, upload_id: str, part_size: int,
+                        size: int) -> Optional[Dict[int, str]]:
+        """Complete parts already in S3 (part number -> ETag), or None if the upload is gone"""
+        parts = {}
+        kwargs = {'Bucket': self.bucket_name, 'Key': remote_path, 'UploadId': upload_id}
+        try:
+            while True:
+                response = self.s3_client.list_parts(**kwargs)
+                for part in response.get('Parts', []):
+                    number = part['PartNumber']
+                    if part['Size'] == min(part_size, size - (number - 1) * part_size):
+                        parts[number] = part['ETag']
+                if not response.get('IsTruncated'):
+                    return parts
+                kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchUpload', '404'):
+                return None
+            raise
+    
+    def _download(self, remote_path: str, local_path: str):
+        """Fetch the object with parallel ranged GETs into a temporary file, then rename it."""
+        head = self.s3_client.head_object(Bucket=self.bucket_name, Key=remote_path)
+        size, etag = head['ContentLength'], head['ETag']
+        ranges = [(offset, min(self.part_size, size - offset)) for offset in range(0, size, self.part_size)]
+        partial_path = f"{local_path}.download"
+        
+        def fetch(byte_range: Tuple[int, int]):
+            offset, length = byte_range
+            # If-Match fails the download if the object is replaced midway
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name, Key=remote_path,
+                Range=f"bytes={offset}-{offset + length - 1}", IfMatch=etag
+            )
+            received = 0
+            with open(partial_path, 'r+b') as f:
+                f.seek(offset)
+                for block in iter(lambda: response['Body'].read(1024 * 1024), b''):
+                    f.write(block)
+                    received += len(block)
+            if received != length:
+                raise IOError(f"Short read of {remote_path} at byte {offset}")
+        
+        try:
+            with open(partial_path, 'wb') as f:
+                f.truncate(size)
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, max(1, len(ranges)))) as pool:
+                list(pool.map(fetch, ranges))
+            os.replace(partial_path, local_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
 
 
 class BackupManager:
@@ -334,12 +507,25 @@ class BackupManager:
     def __init__(self, config: BackupConfig):
         self.config = config
         self.backup_records: Dict[str, BackupRecord] = {}
-        self.logger = NotificationLogger()
+        self.logger = logging.getLogger(__name__)
         self.storage_backend = self._create_storage_backend()
         self.running = False
         self._backup_thread = None
         self._cleanup_thread = None
         self._lock = threading.Lock()
+        self._snapshot_store = None
+    
+    @property
+    def snapshots(self) -> SnapshotStore:
+        """Content-addressed snapshot repository used for incremental backups"""
+        if self._snapshot_store is None:
+            self._snapshot_store = SnapshotStore(
+                self.storage_backend,
+                passphrase=self.encryption_passphrase(),
+                codec=default_codec() if self.config.compression_enabled else CODEC_NONE,
+                workers=self.config.max_parallel_operations
+            )
+        return self._snapshot_store
     
     def _create_storage_backend(self) -> StorageBackend:
         """Create storage backend based on configuration."""
@@ -351,7 +537,11 @@ class BackupManager:
             access_key = self.config.metadata.get('aws_access_key')
             secret_key = self.config.metadata.get('aws_secret_key')
             region = self.config.metadata.get('region', 'us-east-1')
-            return S3StorageBackend(bucket, access_key, secret_key, region)
+            return S3StorageBackend(
+                bucket, access_key, secret_key, region,
+                part_size=self.config.metadata.get('part_size', S3_DEFAULT_PART_SIZE),
+                max_concurrency=self.config.metadata.get('max_concurrency', self.config.max_parallel_operations)
+            )
         else:
             raise ValueError(f"Unsupported storage provider: {self.config.storage_provider}")
     
@@ -396,6 +586,11 @@ class BackupManager:
             backup_record.status = BackupStatus.RUNNING
             backup_record.started_at = datetime.now()
             
+            if backup_record.backup_type == BackupType.INCREMENTAL:
+                await self._create_snapshot_backup(source_path, backup_record)
+                self.logger.info(f"Backup {backup_id} completed successfully")
+                return backup_id
+            
             # Create backup file
             backup_file_path = await self._create_backup_file(source_path, backup_record)
             
@@ -406,10 +601,6 @@ class BackupManager:
                 )
                 
                 if success:
-                    # Calculate file sizes and checksum
-                    backup_record.file_size = os.path.getsize(backup_file_path)
-                    backup_record.checksum = await self._calculate_checksum(backup_file_path)
-                    
                     # Verify backup if enabled
                     if self.config.verify_after_backup:
                         backup_record.status = BackupStatus.VERIFYING
@@ -445,62 +636,130 @@ class BackupManager:
         
         return backup_id
     
+    async def _create_snapshot_backup(self, source_path: str, backup_record: BackupRecord):
+        """Incremental backup: upload only the chunks that are not in the repository yet."""
+        stats = await self.snapshots.create_snapshot(source_path, backup_record.backup_id)
+        backup_record.destination_path = stats.manifest_path
+        backup_record.file_size = stats.total_size
+        backup_record.compressed_size = stats.uploaded_size
+        backup_record.checksum = stats.checksum
+        backup_record.metadata.update(
+            snapshot_id=stats.snapshot_id,
+            files=stats.files,
+            unchanged_files=stats.unchanged_files,
+            new_chunks=stats.new_chunks,
+            reused_chunks=stats.reused_chunks
+        )
+        
+        if self.config.verify_after_backup:
+            backup_record.status = BackupStatus.VERIFYING
+            # Download the chunks this backup uploaded: a listing alone cannot catch a
+            # corrupt upload, and reused chunks were verified by the backup that uploaded them
+            verification_result = await self._verify_snapshot(stats.snapshot_id, stats.uploaded_chunks)
+            backup_record.verification_status = verification_result
+            backup_record.status = BackupStatus.VERIFIED if verification_result else BackupStatus.FAILED
+        else:
+            backup_record.status = BackupStatus.COMPLETED
+        
+        backup_record.completed_at = datetime.now()
+    
+    async def verify_incremental_backup(self, backup_id: str) -> bool:
+        """
+        Download and authenticate every chunk an incremental backup references,
+        reused ones included. This reads the whole backup back from storage, so
+        it is run on demand rather than after each backup.
+        """
+        backup_record = self.backup_records.get(backup_id)
+        snapshot_id = backup_record.metadata.get('snapshot_id') if backup_record else backup_id
+        return await self._verify_snapshot(snapshot_id)
+    
+    async def _verify_snapshot(self, snapshot_id: str, only_chunks: Optional[List[str]] = None) -> bool:
+        try:
+            return await self.snapshots.verify_snapshot(
+                snapshot_id, download_chunks=True, only_chunks=only_chunks
+            )
+        except BackupFormatError as e:
+            self.logger.error(f"Snapshot {snapshot_id} failed verification: {e}")
+            return False
+    
+    async def collect_garbage(self) -> GarbageCollectionStats:
+        """Delete snapshot chunks that no remaining incremental backup references."""
+        stats = await self.snapshots.collect_garbage()
+        self.logger.info(
+            f"Snapshot garbage collection deleted {stats.deleted_chunks} chunks "
+            f"({stats.referenced_chunks} referenced by {stats.snapshots} snapshots)"
+        )
+        return stats
+    
     async def _create_backup_file(self, source_path: str, backup_record: BackupRecord) -> Optional[str]:
-        """Create a backup file from the source."""
+        """
+        Create a backup file from the source: a streaming container (see
+        backup_stream) that is compressed, encrypted and checksummed chunk by
+        chunk, so the backup is never held in memory.
+        """
+        temp_backup_path = os.path.join(tempfile.gettempdir(), f"{backup_record.backup_id}.backup")
+        intermediate_path = None
         try:
-            temp_backup_path = f"/tmp/{backup_record.backup_id}.backup"
-            
-            if os.path.isfile(source_path):
+            if os.path.isfile(source_path) and not self._is_sqlite(source_path):
                 # Single file backup
-                if self.config.compression_enabled:
-                    await self._compress_file(source_path, temp_backup_path)
-                else:
-                    shutil.copy2(source_path, temp_backup_path)
+                payload_path, payload = source_path, 'file'
             
             elif os.path.isdir(source_path):
                 # Directory backup
-                await self._create_archive(source_path, temp_backup_path)
+                intermediate_path = f"{temp_backup_path}.tar"
+                await self._create_archive(source_path, intermediate_path)
+                payload_path, payload = intermediate_path, 'tar'
             
             else:
                 # Database backup (assuming SQLite for this example)
-                await self._create_database_backup(source_path, temp_backup_path)
-            
-            # Encrypt if enabled
-            if self.config.encryption_enabled:
-                encrypted_path = f"{temp_backup_path}.encrypted"
-                await self._encrypt_file(temp_backup_path, encrypted_path)
-                os.remove(temp_backup_path)
-                return encrypted_path
+                intermediate_path = f"{temp_backup_path}.db"
+                await self._create_database_backup(source_path, intermediate_path)
+                payload_path, payload = intermediate_path, 'file'
             
+            stats = await asyncio.get_event_loop().run_in_executor(
+                None, self._write_container, payload_path, temp_backup_path
+            )
+            backup_record.file_size = stats.original_size
+            backup_record.compressed_size = stats.stored_size
+            backup_record.checksum = stats.checksum
+            backup_record.metadata['payload'] = payload
             return temp_backup_path
         
         except Exception as e:
             self.logger.error(f"Failed to create backup file: {e}")
             return None
-    
-    async def _compress_file(self, source_path: str, dest_path: str):
-        """Compress a file using gzip."""
-        def compress():
-            with open(source_path, 'rb') as f_in:
-                with gzip.open(dest_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
         
-        await asyncio.get_event_loop().run_in_executor(None, compress)
+        finally:
+            if intermediate_path and os.path.exists(intermediate_path):
+                os.remove(intermediate_path)
+    
+    @staticmethod
+    def _is_sqlite(path: str) -> bool:
+        return path.endswith('.db') or path.endswith('.sqlite')
+    
+    def encryption_passphrase(self) -> Optional[str]:
+        """Passphrase for backup encryption, or None when encryption is disabled"""
+        if not self.config.encryption_enabled:
+            return None
+        passphrase = self.config.encryption_key or os.getenv('BACKUP_ENCRYPTION_KEY')
+        if not passphrase:
+            raise ValueError("Backup encryption is enabled but no encryption key is configured")
+        return passphrase
+    
+    def _write_container(self, payload_path: str, dest_path: str):
+        with open(payload_path, 'rb') as source, open(dest_path, 'wb') as dest:
+            return write_backup(
+                source, dest,
+                passphrase=self.encryption_passphrase(),
+                codec=default_codec() if self.config.compression_enabled else CODEC_NONE,
+                workers=self.config.max_parallel_operations
+            )
     
     async def _create_archive(self, source_dir: str, dest_path: str):
-        """Create a compressed archive of a directory."""
+        """Create an (uncompressed) tar archive of a directory; the container compresses it."""
         def create_archive():
-            if self.config.compression_enabled:
-                shutil.make_archive(dest_path.replace('.backup', ''), 'gztar', source_dir)
-                # Rename to .backup extension
-                archive_path = f"{dest_path.replace('.backup', '')}.tar.gz"
-                if os.path.exists(archive_path):
-                    shutil.move(archive_path, dest_path)
-            else:
-                shutil.make_archive(dest_path.replace('.backup', ''), 'tar', source_dir)
-                archive_path = f"{dest_path.replace('.backup', '')}.tar"
-                if os.path.exists(archive_path):
-                    shutil.move(archive_path, dest_path)
+            with tarfile.open(dest_path, 'w') as archive:
+                archive.add(source_dir, arcname='.')
         
         await asyncio.get_event_loop().run_in_executor(None, create_archive)
     
@@ -508,7 +767,7 @@ class BackupManager:
         """Create a database backup."""
         def backup_database():
             # For SQLite databases
-            if db_path.endswith('.db') or db_path.endswith('.sqlite'):
+            if self._is_sqlite(db_path):
                 with sqlite3.connect(db_path) as source_conn:
                     with sqlite3.connect(dest_path) as backup_conn:
                         source_conn.backup(backup_conn)
@@ -519,61 +778,40 @@ class BackupManager:
         
         await asyncio.get_event_loop().run_in_executor(None, backup_database)
     
-    async def _encrypt_file(self, source_path: str, dest_path: str):
-        """Encrypt a file (simplified implementation)."""
-        # This is a simplified encryption example
-        # In production, use proper encryption libraries like cryptography
-        def encrypt():
-            with open(source_path, 'rb') as f_in:
-                with open(dest_path, 'wb') as f_out:
-                    data = f_in.read()
-                    # Simple XOR encryption (NOT secure for production)
-                    key = self.config.encryption_key or "default_key"
-                    encrypted_data = bytes(a ^ ord(key[i % len(key)]) for i, a in enumerate(data))
-                    f_out.write(encrypted_data)
-        
-        await asyncio.get_event_loop().run_in_executor(None, encrypt)
-    
     async def _calculate_checksum(self, file_path: str) -> str:
-        """Calculate MD5 checksum of a file."""
-        def calculate():
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        
-        return await asyncio.get_event_loop().run_in_executor(None, calculate)
+        """Calculate the SHA-256 checksum of a file."""
+        return await asyncio.get_event_loop().run_in_executor(None, file_checksum, file_path)
     
     async def _verify_backup(self, backup_record: BackupRecord) -> bool:
         """Verify the integrity of a backup."""
         try:
-            # Download backup file temporarily
-            temp_path = f"/tmp/verify_{backup_record.backup_id}.backup"
-            
-            success = await self.storage_backend.download_file(
-                backup_record.destination_path, temp_path
-            )
-            
-            if not success:
-                return False
-            
-            # Verify checksum
-            actual_checksum = await self._calculate_checksum(temp_path)
-            checksum_valid = actual_checksum == backup_record.checksum
-            
-            # Clean up temporary file
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-            
-            return checksum_valid
+            # Download backup file temporarily; the directory is removed however verification ends
+            with tempfile.TemporaryDirectory(prefix=f"verify_{backup_record.backup_id}_") as work_dir:
+                temp_path = os.path.join(work_dir, 'backup')
+                
+                success = await self.storage_backend.download_file(
+                    backup_record.destination_path, temp_path
+                )
+                
+                if not success:
+                    return False
+                
+                # Verify checksum, then authenticate every chunk (without decompressing)
+                actual_checksum = await self._calculate_checksum(temp_path)
+                checksum_valid = actual_checksum == backup_record.checksum
+                if checksum_valid:
+                    await asyncio.get_event_loop().run_in_executor(None, self._verify_container, temp_path)
+                
+                return checksum_valid
         
         except Exception as e:
             self.logger.error(f"Backup verification failed: {e}")
             return False
     
+    def _verify_container(self, path: str):
+        with open(path, 'rb') as source:
+            verify_backup(source, self.encryption_passphrase(), self.config.max_parallel_operations)
+    
     def _cleanup_old_backups(self):
         """Clean up old backups based on retention policy."""
         while self.running:
@@ -585,7 +823,7 @@ class BackupManager:
                     for backup_id, record in self.backup_records.items():
                         if (record.retention_until and 
                             current_time > record.retention_until and
-                            record.status == BackupStatus.COMPLETED):
+                            record.status in (BackupStatus.COMPLETED, BackupStatus.VERIFIED)):
                             expired_backups.append(backup_id)
                 
                 # Delete expired backups
@@ -605,8 +843,18 @@ class BackupManager:
             if not backup_record:
                 return False
             
-            # Delete from storage backend
-            success = await self.storage_backend.delete_file(backup_record.destination_path)
+            # Delete from storage backend; a snapshot's chunks may be shared with other snapshots
+            snapshot_id = backup_record.metadata.get('snapshot_id')
+            if snapshot_id:
+                success = await self.snapshots.delete_snapshot(snapshot_id)
+                if success:
+                    try:
+                        await self.collect_garbage()
+                    except Exception as e:
+                        # The snapshot is gone; its chunks wait for the next collection
+                        self.logger.warning(f"Snapshot garbage collection skipped: {e}")
+            else:
+                success = await self.storage_backend.delete_file(backup_record.destination_path)
             
             if success:
                 with self._lock:
@@ -656,7 +904,7 @@ class RecoveryManager:
     def __init__(self, backup_manager: BackupManager):
         self.backup_manager = backup_manager
         self.recovery_records: Dict[str, RecoveryRecord] = {}
-        self.logger = NotificationLogger()
+        self.logger = logging.getLogger(__name__)
         self._lock = threading.Lock()
     
     async def restore_backup(self, backup_id: str, target_path: str, 
@@ -682,14 +930,42 @@ class RecoveryManager:
             
             # Get backup record
             backup_record = self.backup_manager.backup_records.get(backup_id)
-            if not backup_record:
+            if backup_record:
+                if backup_record.status not in (BackupStatus.COMPLETED, BackupStatus.VERIFIED):
+                    raise ValueError(f"Backup {backup_id} is not in completed state")
+                snapshot_id = backup_record.metadata.get('snapshot_id')
+            elif self.backup_manager.config.backup_type == BackupType.INCREMENTAL:
+                # Snapshots outlive the in-memory backup records: any snapshot can be restored
+                snapshot_id = backup_id
+            else:
                 raise ValueError(f"Backup {backup_id} not found")
             
-            if backup_record.status != BackupStatus.COMPLETED:
-                raise ValueError(f"Backup {backup_id} is not in completed state")
+            if snapshot_id:
+                recovery_record.recovered_files = await self.backup_manager.snapshots.restore_snapshot(
+                    snapshot_id, target_path
+                )
+            else:
+                await self._restore_archive(backup_record, target_path, recovery_type, recovery_record)
+            
+            recovery_record.status = BackupStatus.COMPLETED
+            recovery_record.completed_at = datetime.now()
             
+            self.logger.info(f"Recovery {recovery_id} completed successfully")
+        
+        except Exception as e:
+            recovery_record.status = BackupStatus.FAILED
+            recovery_record.error_message = str(e)
+            recovery_record.completed_at = datetime.now()
+            self.logger.error(f"Recovery {recovery_id} failed: {e}")
+        
+        return recovery_id
+    
+    async def _restore_archive(self, backup_record: BackupRecord, target_path: str,
+                               recovery_type: RecoveryType, recovery_record: RecoveryRecord):
+        """Restore a full backup archive."""
+        with tempfile.TemporaryDirectory(prefix=f"restore_{recovery_record.recovery_id}_") as work_dir:
             # Download backup file
-            temp_backup_path = f"/tmp/restore_{recovery_id}.backup"
+            temp_backup_path = os.path.join(work_dir, 'backup')
             
             success = await self.backup_manager.storage_backend.download_file(
                 backup_record.destination_path, temp_backup_path
@@ -698,87 +974,108 @@ class RecoveryManager:
             if not success:
                 raise Exception("Failed to download backup file")
             
-            # Decrypt if needed
-            if self.backup_manager.config.encryption_enabled:
-                decrypted_path = f"{temp_backup_path}.decrypted"
-                await self._decrypt_file(temp_backup_path, decrypted_path)
+            decoded_path = os.path.join(work_dir, 'decoded')
+            try:
+                with open(temp_backup_path, 'rb') as f:
+                    legacy = f.read(len(MAGIC)) != MAGIC
+                if legacy:
+                    payload = await asyncio.get_event_loop().run_in_executor(
+                        None, self._decode_legacy_file, temp_backup_path, decoded_path
+                    )
+                else:
+                    # Authenticate, decrypt and decompress chunk by chunk
+                    await self._decode_file(temp_backup_path, decoded_path)
+                    payload = backup_record.metadata.get('payload', 'file')
+            finally:
                 os.remove(temp_backup_path)
-                temp_backup_path = decrypted_path
             
-            # Restore based on recovery type
+            # Restore based on recovery type; the work directory is removed afterwards
             if recovery_type == RecoveryType.FULL_RESTORE:
-                await self._restore_full(temp_backup_path, target_path, recovery_record)
+                await self._restore_full(decoded_path, target_path, payload, recovery_record)
             elif recovery_type == RecoveryType.PARTIAL_RESTORE:
-                await self._restore_partial(temp_backup_path, target_path, recovery_record)
+                await self._restore_partial(decoded_path, target_path, payload, recovery_record)
             elif recovery_type == RecoveryType.TABLE_RESTORE:
-                await self._restore_table(temp_backup_path, target_path, recovery_record)
-            
-            recovery_record.status = BackupStatus.COMPLETED
-            recovery_record.completed_at = datetime.now()
-            
-            # Clean up temporary files
+                await self._restore_table(decoded_path, target_path, payload, recovery_record)
+    
+    async def _decode_file(self, source_path: str, dest_path: str):
+        """Decode a backup container; fails at the first chunk that does not authenticate."""
+        def decode():
             try:
-                os.remove(temp_backup_path)
+                with open(source_path, 'rb') as f_in:
+                    with open(dest_path, 'wb') as f_out:
+                        read_backup(
+                            f_in, f_out,
+                            passphrase=self.backup_manager.encryption_passphrase(),
+                            workers=self.backup_manager.config.max_parallel_operations
+                        )
             except Exception:
-                pass
-            
-            self.logger.info(f"Recovery {recovery_id} completed successfully")
+                if os.path.exists(dest_path):
+                    os.remove(dest_path)
+                raise
         
-        except Exception as e:
-            recovery_record.status = BackupStatus.FAILED
-            recovery_record.error_message = str(e)
-            recovery_record.completed_at = datetime.now()
-            self.logger.error(f"Recovery {recovery_id} failed: {e}")
-        
-        return recovery_id
+        await asyncio.get_event_loop().run_in_executor(None, decode)
     
-    async def _decrypt_file(self, source_path: str, dest_path: str):
-        """Decrypt a file (simplified implementation)."""
-        def decrypt():
-            with open(source_path, 'rb') as f_in:
-                with open(dest_path, 'wb') as f_out:
-                    data = f_in.read()
-                    # Simple XOR decryption (matches encryption)
-                    key = self.backup_manager.config.encryption_key or "default_key"
-                    decrypted_data = bytes(a ^ ord(key[i % len(key)]) for i, a in enumerate(data))
-                    f_out.write(decrypted_data)
+    def _decode_legacy_file(self, source_path: str, dest_path: str) -> str:
+        """
+        Decode a backup written before the MRBK container format and return its
+        payload kind. Those backups were XOR-obfuscated with the encryption key
+        when encryption was enabled, and hold a gzip-compressed file, a plain
+        file or database copy, or a tar or tar.gz archive of a directory.
+        """
+        config = self.backup_manager.config
+        raw_path = f"{dest_path}.raw"
+        if config.encryption_enabled:
+            key = bytes(ord(c) for c in (config.encryption_key or "default_key"))
+            # Whole multiples of the key, so every block starts at key offset 0
+            block_size = len(key) * 65536
+            keystream = key * 65536
+            with open(source_path, 'rb') as f_in, open(raw_path, 'wb') as f_out:
+                for block in iter(lambda: f_in.read(block_size), b''):
+                    mask = int.from_bytes(keystream[:len(block)], 'big')
+                    f_out.write((int.from_bytes(block, 'big') ^ mask).to_bytes(len(block), 'big'))
+        else:
+            shutil.copyfile(source_path, raw_path)
         
-        await asyncio.get_event_loop().run_in_executor(None, decrypt)
+        with open(raw_path, 'rb') as f:
+            compressed = f.read(2) == b'\x1f\x8b'
+        if compressed:
+            with gzip.open(raw_path, 'rb') as f_in, open(dest_path, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.remove(raw_path)
+        else:
+            os.replace(raw_path, dest_path)
+        return 'tar' if tarfile.is_tarfile(dest_path) else 'file'
     
-    async def _restore_full(self, backup_path: str, target_path: str, recovery_record: RecoveryRecord):
+    async def _restore_full(self, backup_path: str, target_path: str, payload: str,
+                            recovery_record: RecoveryRecord):
         """Perform a full restore."""
         def restore():
             # Create target directory if it doesn't exist
-            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
             
-            if backup_path.endswith('.tar.gz') or backup_path.endswith('.tar'):
+            if payload == 'tar':
                 # Extract archive
-                shutil.unpack_archive(backup_path, target_path)
-                recovery_record.recovered_files = [target_path]
-            elif self.backup_manager.config.compression_enabled:
-                # Decompress file
-                with gzip.open(backup_path, 'rb') as f_in:
-                    with open(target_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                recovery_record.recovered_files = [target_path]
+                with tarfile.open(backup_path) as archive:
+                    archive.extractall(target_path, filter='data')
             else:
-                # Direct copy
-                shutil.copy2(backup_path, target_path)
-                recovery_record.recovered_files = [target_path]
+                shutil.copyfile(backup_path, target_path)
+            recovery_record.recovered_files = [target_path]
         
         await asyncio.get_event_loop().run_in_executor(None, restore)
     
-    async def _restore_partial(self, backup_path: str, target_path: str, recovery_record: RecoveryRecord):
+    async def _restore_partial(self, backup_path: str, target_path: str, payload: str,
+                               recovery_record: RecoveryRecord):
         """Perform a partial restore."""
         # This is a simplified implementation
         # In practice, this would involve more complex logic to restore specific files/tables
-        await self._restore_full(backup_path, target_path, recovery_record)
+        await self._restore_full(backup_path, target_path, payload, recovery_record)
     
-    async def _restore_table(self, backup_path: str, target_path: str, recovery_record: RecoveryRecord):
+    async def _restore_table(self, backup_path: str, target_path: str, payload: str,
+                             recovery_record: RecoveryRecord):
         """Restore specific database tables."""
         # This is a simplified implementation
         # In practice, this would involve database-specific restore logic
-        await self._restore_full(backup_path, target_path, recovery_record)
+        await self._restore_full(backup_path, target_path, payload, recovery_record)
     
     def get_recovery_status(self, recovery_id: str) -> Optional[Dict[str, Any]]:
         """Get the status of a recovery operation."""
@@ -811,8 +1108,8 @@ class BackupRecoveryManager:
     def __init__(self, backup_config: BackupConfig):
         self.backup_manager = BackupManager(backup_config)
         self.recovery_manager = RecoveryManager(self.backup_manager)
-        self.logger = NotificationLogger()
-        self.monitor = SystemMonitor()
+        self.logger = logging.getLogger(__name__)
+        self.monitor = SystemMonitor(metrics_collector)
     
     def start(self):
         """Start the backup and recovery manager."""
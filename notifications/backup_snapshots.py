@@ -0,0 +1,565 @@
+"""
+Incremental, content-addressed backup snapshots.
+
+A snapshot stores every file as a list of fixed-size chunks, and every chunk
+once, under the hash of its content: a chunk that is already in the
+repository, from any earlier snapshot, is referenced rather than uploaded
+again. Fixed-size chunks suit the data being backed up. SQLite rewrites whole
+pages, and with a chunk size that is a multiple of the page size unchanged
+pages stay in unchanged chunks; log files grow by appending, which only
+changes their last chunk. Files whose size and modification time match the
+previous snapshot of the same source are not read at all.
+
+Each snapshot has a manifest listing its files and their chunks, so any
+snapshot is restored directly from its manifest, with no chain of
+incrementals to replay. Deleting a snapshot deletes its manifest only;
+collect_garbage() then deletes the chunks no remaining manifest references.
+The repository is listed with StorageBackend.scan_files, which raises when a
+listing fails: an empty manifest listing must never be mistaken for "no
+snapshots", or every chunk would be collected.
+
+Repository layout in the storage backend::
+
+    snapshots/config.json                                    salt, key check
+    snapshots/manifests/<source key>/<created ns>-<snapshot id>
+    snapshots/inflight/<started ns>-<snapshot id>            snapshot being written
+    snapshots/chunks/<id[:2]>/<id>
+
+Chunks and manifests are compressed and, given a passphrase, sealed with
+AES-256-GCM (as in backup_stream). In an encrypted repository chunk ids are
+HMAC-SHA256 of the content under a key derived from the passphrase, so stored
+names reveal nothing about the content. Each snapshot re-lists the stored
+chunks before reusing any, so garbage collected by another process is
+noticed. A snapshot being written announces itself with an in-flight marker,
+and garbage collection keeps every chunk modified after the oldest in-flight
+snapshot started (or after the collection itself started), so chunks that
+are uploaded but not yet in a manifest survive. A collection can still
+delete an old unreferenced chunk that another process is about to reuse, so
+only one process should write to a repository at a time. Within a process,
+snapshots and garbage collection are serialized.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import PurePath
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .backup_stream import (
+    BackupFormatError, compress_chunk, decompress_chunk, default_codec, derive_key, ordered_map
+)
+
+REPOSITORY_PREFIX = 'snapshots'
+CONFIG_PATH = f'{REPOSITORY_PREFIX}/config.json'
+MANIFEST_PREFIX = f'{REPOSITORY_PREFIX}/manifests'
+CHUNK_PREFIX = f'{REPOSITORY_PREFIX}/chunks'
+INFLIGHT_PREFIX = f'{REPOSITORY_PREFIX}/inflight'
+REPOSITORY_VERSION = 1
+DEFAULT_CHUNK_SIZE = 256 * 1024  # A multiple of every SQLite page size
+MAX_MANIFEST_SIZE = 256 * 1024 * 1024
+NONCE_SIZE = 12
+KEY_CHECK_AAD = b'key-check'
+SQLITE_SUFFIXES = ('.db', '.sqlite')
+SQLITE_SIDE_FILES = ('-wal', '-shm', '-journal')
+GC_GRACE_SECONDS = 300  # Allowance for clock skew between this host and the storage backend
+STALE_INFLIGHT_SECONDS = 24 * 3600  # An older in-flight marker was left by a crashed writer
+
+
+@dataclass
+class SnapshotStats:
+    """What a snapshot stored, and how much of it was new"""
+    snapshot_id: str
+    manifest_path: str = ''
+    checksum: str = ''
+    files: int = 0
+    total_size: int = 0
+    unchanged_files: int = 0
+    new_chunks: int = 0
+    reused_chunks: int = 0
+    uploaded_size: int = 0
+    uploaded_chunks: List[str] = field(default_factory=list)
+
+
+@dataclass
+class GarbageCollectionStats:
+    snapshots: int = 0
+    referenced_chunks: int = 0
+    deleted_chunks: int = 0
+    recent_chunks: int = 0  # Unreferenced, but too new to delete
+
+
+def _is_sqlite(path: str) -> bool:
+    return path.endswith(SQLITE_SUFFIXES)
+
+
+def _walk(source_path: str) -> Iterator[Tuple[str, str, bool]]:
+    """(relative path, path, is_dir) of a file, or of a directory's contents in a stable order"""
+    if not os.path.isdir(source_path):
+        yield os.path.basename(source_path), source_path, False
+        return
+    for root, dirs, files in os.walk(source_path):
+        dirs.sort()
+        relative_root = os.path.relpath(root, source_path)
+        for name in dirs:
+            yield os.path.normpath(os.path.join(relative_root, name)), os.path.join(root, name), True
+        databases = {name for name in files if _is_sqlite(name)}
+        for name in sorted(files):
+            # A database is copied consistently through the backup API; its WAL is not needed
+            if any(name == database + suffix for database in databases for suffix in SQLITE_SIDE_FILES):
+                continue
+            path = os.path.join(root, name)
+            if os.path.isfile(path):
+                yield os.path.normpath(os.path.join(relative_root, name)), path, False
+
+
+def _safe_join(target_path: str, relative: str) -> str:
+    target = os.path.abspath(target_path)
+    path = os.path.abspath(os.path.join(target, relative))
+    if os.path.commonpath([target, path]) != target:
+        raise BackupFormatError(f"Manifest path {relative!r} is outside the restore target")
+    return path
+
+
+class SnapshotStore:
+    """Repository of content-addressed snapshots in a StorageBackend"""
+
+    def __init__(self, storage_backend, passphrase: Optional[str] = None, codec: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 4):
+        self.backend = storage_backend
+        self.passphrase = passphrase
+        self.codec = default_codec() if codec is None else codec
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._opened = False
+        self._aesgcm = None
+        self._id_key = None
+        self._chunks = set()  # ids of the chunks in the repository
+
+    async def create_snapshot(self, source_path: str, snapshot_id: str) -> SnapshotStats:
+        """Snapshot a file, SQLite database or directory, uploading only new chunks"""
+        if '/' in snapshot_id or os.sep in snapshot_id:
+            raise ValueError(f"Invalid snapshot id: {snapshot_id}")
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(source_path)
+        loop = asyncio.get_running_loop()
+
+        async with self._exclusive():
+            index = await self._manifest_index()
+            if snapshot_id in index:
+                raise ValueError(f"Snapshot {snapshot_id} already exists")
+            # Another process may have collected garbage since the last snapshot
+            await self._list_chunks()
+            source_key = self._source_key(source_path)
+            previous_files = await self._previous_files(index, source_key)
+
+            async with self._in_flight(snapshot_id):
+                stats = SnapshotStats(snapshot_id)
+                entries = []
+                with tempfile.TemporaryDirectory(prefix='snapshot_') as staging:
+                    for relative, path, is_dir in _walk(source_path):
+                        file_stat = os.stat(path)
+                        entry = {'path': relative, 'mode': stat.S_IMODE(file_stat.st_mode)}
+                        if is_dir:
+                            entries.append(dict(entry, type='dir'))
+                            continue
+
+                        entry.update(type='file', mtime_ns=file_stat.st_mtime_ns)
+                        previous = previous_files.get(relative)
+                        if (previous and not _is_sqlite(path) and previous['size'] == file_stat.st_size
+                                and previous['mtime_ns'] == file_stat.st_mtime_ns
+                                and all(chunk_id in self._chunks for chunk_id in previous['chunks'])):
+                            entry.update(size=previous['size'], chunks=previous['chunks'])
+                            stats.unchanged_files += 1
+                            stats.reused_chunks += len(previous['chunks'])
+                        else:
+                            read_path = path
+                            if _is_sqlite(path):
+                                read_path = os.path.join(staging, 'database')
+                                await loop.run_in_executor(None, self._copy_database, path, read_path)
+                            size, chunks, staged = await loop.run_in_executor(
+                                None, self._chunk_file, read_path, staging
+                            )
+                            for chunk_id, staged_path in staged:
+                                stats.uploaded_size += os.path.getsize(staged_path)
+                                if not await self.backend.upload_file(staged_path, self._chunk_path(chunk_id)):
+                                    raise OSError(f"Failed to upload chunk {chunk_id}")
+                                os.remove(staged_path)
+                                self._chunks.add(chunk_id)
+                                stats.uploaded_chunks.append(chunk_id)
+                            if read_path != path:
+                                os.remove(read_path)
+                            entry.update(size=size, chunks=chunks)
+                            stats.new_chunks += len(staged)
+                            stats.reused_chunks += len(chunks) - len(staged)
+                        entries.append(entry)
+                        stats.files += 1
+                        stats.total_size += entry['size']
+
+                    manifest = {
+                        'version': REPOSITORY_VERSION,
+                        'snapshot_id': snapshot_id,
+                        'source_path': os.path.abspath(source_path),
+                        'kind': 'dir' if os.path.isdir(source_path) else 'file',
+                        'created_at': datetime.now().isoformat(),
+                        'chunk_size': self.chunk_size,
+                        'entries': entries,
+                    }
+                    sealed = self._seal(json.dumps(manifest, separators=(',', ':')).encode(),
+                                        self._manifest_aad(snapshot_id))
+                    stats.manifest_path = f'{MANIFEST_PREFIX}/{source_key}/{time.time_ns():020d}-{snapshot_id}'
+                    stats.checksum = hashlib.sha256(sealed).hexdigest()
+                    manifest_file = os.path.join(staging, 'manifest')
+                    with open(manifest_file, 'wb') as f:
+                        f.write(sealed)
+                    if not await self.backend.upload_file(manifest_file, stats.manifest_path):
+                        raise OSError(f"Failed to upload the manifest of snapshot {snapshot_id}")
+                return stats
+
+    async def restore_snapshot(self, snapshot_id: str, target_path: str) -> List[str]:
+        """Restore a snapshot to ``target_path``; returns the files restored"""
+        async with self._exclusive():
+            manifest = await self._load_manifest(snapshot_id)
+            restored = []
+            with tempfile.TemporaryDirectory(prefix='restore_') as staging:
+                if manifest['kind'] == 'file':
+                    entry = manifest['entries'][0]
+                    await self._restore_file(entry, target_path, manifest['chunk_size'], staging)
+                    return [target_path]
+
+                os.makedirs(target_path, exist_ok=True)
+                for entry in manifest['entries']:
+                    path = _safe_join(target_path, entry['path'])
+                    if entry['type'] == 'dir':
+                        os.makedirs(path, exist_ok=True)
+                        os.chmod(path, entry['mode'])
+                    else:
+                        await self._restore_file(entry, path, manifest['chunk_size'], staging)
+                        restored.append(path)
+            return restored
+
+    async def verify_snapshot(self, snapshot_id: str, download_chunks: bool = False,
+                              only_chunks: Optional[Iterable[str]] = None) -> bool:
+        """
+        Check that every chunk of a snapshot is listed in the repository and,
+        with ``download_chunks``, that every chunk downloads and authenticates.
+        ``only_chunks`` limits the download to those chunks, such as the ones
+        a snapshot just uploaded (SnapshotStats.uploaded_chunks).
+        """
+        loop = asyncio.get_running_loop()
+        async with self._exclusive():
+            manifest = await self._load_manifest(snapshot_id)
+            chunk_ids = {chunk_id for entry in manifest['entries'] for chunk_id in entry.get('chunks', ())}
+            await self._list_chunks()
+            if not chunk_ids <= self._chunks:
+                return False
+            if download_chunks:
+                if only_chunks is not None:
+                    chunk_ids &= set(only_chunks)
+                with tempfile.TemporaryDirectory(prefix='verify_') as staging:
+                    for chunk_id in chunk_ids:
+                        local_path = os.path.join(staging, chunk_id)
+                        if not await self.backend.download_file(self._chunk_path(chunk_id), local_path):
+                            return False
+                        await loop.run_in_executor(
+                            None, self._read_chunk, local_path, chunk_id, manifest['chunk_size']
+                        )
+                        os.remove(local_path)
+            return True
+
+    async def list_snapshots(self) -> List[Dict[str, Any]]:
+        """Snapshots in the repository, oldest first"""
+        async with self._exclusive():
+            index = await self._manifest_index()
+        snapshots = [
+            {
+                'snapshot_id': snapshot_id,
+                'source_key': source_key,
+                'created_at': datetime.fromtimestamp(created_ns / 1e9).isoformat(),
+                'manifest_path': path,
+            }
+            for snapshot_id, (source_key, created_ns, path) in index.items()
+        ]
+        return sorted(snapshots, key=lambda snapshot: snapshot['created_at'])
+
+    async def delete_snapshot(self, snapshot_id: str) -> bool:
+        """Delete a snapshot's manifest; its chunks go at the next collect_garbage()"""
+        async with self._exclusive():
+            index = await self._manifest_index()
+            if snapshot_id not in index:
+                return False
+            return await self.backend.delete_file(index[snapshot_id][2])
+
+    async def collect_garbage(self) -> GarbageCollectionStats:
+        """
+        Delete the chunks no snapshot references. A listing or manifest that
+        cannot be read aborts the collection, and so does an empty manifest
+        listing while chunks exist. Chunks modified after the oldest in-flight
+        snapshot started are kept, since its manifest is not written yet.
+        """
+        async with self._exclusive():
+            started = time.time()
+            in_flight = [started_ns / 1e9 for started_ns in (await self._in_flight_index()).values()
+                         if started - started_ns / 1e9 < STALE_INFLIGHT_SECONDS]
+            cutoff = min([started] + in_flight) - GC_GRACE_SECONDS
+
+            index = await self._manifest_index()
+            referenced = set()
+            for snapshot_id in index:
+                manifest = await self._load_manifest(snapshot_id, index)
+                for entry in manifest['entries']:
+                    referenced.update(entry.get('chunks', ()))
+
+            chunks = await self.backend.scan_files(CHUNK_PREFIX)
+            if not index and chunks:
+                raise OSError(
+                    f"No snapshot manifests are listed but {len(chunks)} chunks exist; "
+                    f"refusing to collect garbage"
+                )
+
+            stats = GarbageCollectionStats(snapshots=len(index), referenced_chunks=len(referenced))
+            for path, modified in chunks.items():
+                chunk_id = PurePath(path).name
+                if chunk_id in referenced:
+                    continue
+                if modified >= cutoff:
+                    stats.recent_chunks += 1
+                elif await self.backend.delete_file(path):
+                    self._chunks.discard(chunk_id)
+                    stats.deleted_chunks += 1
+            return stats
+
+    @contextlib.asynccontextmanager
+    async def _exclusive(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._lock.acquire)
+        try:
+            await self._open()
+            yield
+        finally:
+            self._lock.release()
+
+    async def _open(self):
+        """Read (or create) the repository config, once"""
+        if self._opened:
+            return
+        with tempfile.TemporaryDirectory(prefix='snapshot_config_') as staging:
+            local_path = os.path.join(staging, 'config.json')
+            if await self.backend.file_exists(CONFIG_PATH):
+                if not await self.backend.download_file(CONFIG_PATH, local_path):
+                    raise OSError("Failed to download the snapshot repository config")
+                with open(local_path) as f:
+                    config = json.load(f)
+                if config.get('version') != REPOSITORY_VERSION:
+                    raise BackupFormatError("Unsupported snapshot repository version")
+                if config['encrypted'] != bool(self.passphrase):
+                    raise BackupFormatError(
+                        "Snapshot repository is encrypted and no encryption key was given"
+                        if config['encrypted'] else "Snapshot repository is not encrypted"
+                    )
+                self._set_keys(bytes.fromhex(config['salt']))
+                if self._aesgcm is not None:
+                    try:
+                        self._open_blob(bytes.fromhex(config['key_check']), KEY_CHECK_AAD, 0)
+                    except BackupFormatError:
+                        raise BackupFormatError("Wrong encryption key for the snapshot repository")
+            else:
+                salt = os.urandom(16)
+                self._set_keys(salt)
+                config = {
+                    'version': REPOSITORY_VERSION,
+                    'encrypted': bool(self.passphrase),
+                    'salt': salt.hex(),
+                    'key_check': self._seal(b'', KEY_CHECK_AAD).hex() if self._aesgcm else None,
+                }
+                with open(local_path, 'w') as f:
+                    json.dump(config, f)
+                if not await self.backend.upload_file(local_path, CONFIG_PATH):
+                    raise OSError("Failed to create the snapshot repository config")
+
+        self._opened = True
+
+    async def _list_chunks(self):
+        """Re-read the ids of the chunks in the repository"""
+        self._chunks = {PurePath(path).name for path in await self.backend.scan_files(CHUNK_PREFIX)}
+
+    @contextlib.asynccontextmanager
+    async def _in_flight(self, snapshot_id: str):
+        """Mark a snapshot as being written, so garbage collection keeps its new chunks"""
+        marker_path = f'{INFLIGHT_PREFIX}/{time.time_ns():020d}-{snapshot_id}'
+        with tempfile.TemporaryDirectory(prefix='snapshot_marker_') as staging:
+            local_path = os.path.join(staging, 'marker')
+            open(local_path, 'wb').close()
+            if not await self.backend.upload_file(local_path, marker_path):
+                raise OSError(f"Failed to mark snapshot {snapshot_id} as in flight")
+        try:
+            yield
+        finally:
+            await self.backend.delete_file(marker_path)
+
+    async def _in_flight_index(self) -> Dict[str, int]:
+        """in-flight marker path -> started ns"""
+        index = {}
+        for path in await self.backend.scan_files(INFLIGHT_PREFIX):
+            started, _, snapshot_id = PurePath(path).name.partition('-')
+            if snapshot_id and started.isdigit():
+                index[path] = int(started)
+        return index
+
+    def _set_keys(self, salt: bytes):
+        if self.passphrase:
+            key = derive_key(self.passphrase, salt, length=64)
+            self._aesgcm = AESGCM(key[:32])
+            self._id_key = key[32:]
+
+    def _chunk_id(self, data: bytes) -> str:
+        if self._id_key is not None:
+            return hmac.new(self._id_key, data, hashlib.sha256).hexdigest()
+        return hashlib.sha256(data).hexdigest()
+
+    def _source_key(self, source_path: str) -> str:
+        return self._chunk_id(os.path.abspath(source_path).encode())[:16]
+
+    @staticmethod
+    def _chunk_path(chunk_id: str) -> str:
+        return f'{CHUNK_PREFIX}/{chunk_id[:2]}/{chunk_id}'
+
+    @staticmethod
+    def _manifest_aad(snapshot_id: str) -> bytes:
+        return f'manifest:{snapshot_id}'.encode()
+
+    def _seal(self, data: bytes, aad: bytes) -> bytes:
+        """codec (u8) | nonce | AES-GCM ciphertext, or codec | compressed data"""
+        header = bytes([self.codec])
+        compressed = compress_chunk(self.codec, data)
+        if self._aesgcm is None:
+            return header + compressed
+        nonce = os.urandom(NONCE_SIZE)
+        return header + nonce + self._aesgcm.encrypt(nonce, compressed, header + aad)
+
+    def _open_blob(self, blob: bytes, aad: bytes, max_size: int) -> bytes:
+        if not blob:
+            raise BackupFormatError("Empty snapshot object")
+        header, body = blob[:1], blob[1:]
+        if self._aesgcm is not None:
+            try:
+                body = self._aesgcm.decrypt(body[:NONCE_SIZE], body[NONCE_SIZE:], header + aad)
+            except InvalidTag:
+                raise BackupFormatError("Snapshot object failed authentication")
+        return decompress_chunk(header[0], body, max_size)
+
+    def _chunk_file(self, path: str, staging: str) -> Tuple[int, List[str], List[Tuple[str, str]]]:
+        """Split a file into chunks; new chunks are sealed into ``staging`` for upload"""
+        def process(block: bytes) -> Tuple[str, Optional[bytes], int]:
+            chunk_id = self._chunk_id(block)
+            if chunk_id in self._chunks:
+                return chunk_id, None, len(block)
+            return chunk_id, self._seal(block, chunk_id.encode()), len(block)
+
+        size = 0
+        chunks = []
+        staged = {}
+        with open(path, 'rb') as f:
+            blocks = ((block,) for block in iter(lambda: f.read(self.chunk_size), b''))
+            for chunk_id, sealed, block_size in ordered_map(process, blocks, self.workers):
+                size += block_size
+                chunks.append(chunk_id)
+                if sealed is not None and chunk_id not in staged:
+                    staged[chunk_id] = os.path.join(staging, chunk_id)
+                    with open(staged[chunk_id], 'wb') as chunk_file:
+                        chunk_file.write(sealed)
+        return size, chunks, list(staged.items())
+
+    def _read_chunk(self, path: str, chunk_id: str, chunk_size: int) -> bytes:
+        with open(path, 'rb') as f:
+            data = self._open_blob(f.read(), chunk_id.encode(), chunk_size)
+        if self._chunk_id(data) != chunk_id:
+            raise BackupFormatError(f"Chunk {chunk_id} failed its checksum")
+        return data
+
+    @staticmethod
+    def _copy_database(db_path: str, dest_path: str):
+        """Consistent copy of a live SQLite database"""
+        source_conn = sqlite3.connect(db_path)
+        backup_conn = sqlite3.connect(dest_path)
+        try:
+            source_conn.backup(backup_conn)
+        finally:
+            backup_conn.close()
+            source_conn.close()
+
+    async def _restore_file(self, entry: Dict[str, Any], dest_path: str, chunk_size: int, staging: str):
+        """Write a file from its chunks, fetching up to ``workers`` chunks at a time"""
+        loop = asyncio.get_running_loop()
+
+        async def fetch(position: int, chunk_id: str) -> bytes:
+            local_path = os.path.join(staging, str(position))
+            if not await self.backend.download_file(self._chunk_path(chunk_id), local_path):
+                raise BackupFormatError(f"Chunk {chunk_id} is missing from the repository")
+            try:
+                return await loop.run_in_executor(None, self._read_chunk, local_path, chunk_id, chunk_size)
+            finally:
+                os.remove(local_path)
+
+        os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+        partial_path = f'{dest_path}.restoring'
+        try:
+            with open(partial_path, 'wb') as out:
+                chunks = entry['chunks']
+                for start in range(0, len(chunks), self.workers):
+                    batch = chunks[start:start + self.workers]
+                    for data in await asyncio.gather(*(fetch(start + i, c) for i, c in enumerate(batch))):
+                        out.write(data)
+            os.chmod(partial_path, entry['mode'])
+            os.replace(partial_path, dest_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        os.utime(dest_path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+
+    async def _manifest_index(self) -> Dict[str, Tuple[str, int, str]]:
+        """snapshot id -> (source key, created ns, manifest path)"""
+        index = {}
+        for path in await self.backend.scan_files(MANIFEST_PREFIX):
+            parts = PurePath(path).parts
+            created, _, snapshot_id = parts[-1].partition('-')
+            if snapshot_id and created.isdigit():
+                index[snapshot_id] = (parts[-2], int(created), PurePath(path).as_posix())
+        return index
+
+    async def _load_manifest(self, snapshot_id: str, index: Optional[Dict] = None) -> Dict[str, Any]:
+        index = await self._manifest_index() if index is None else index
+        if snapshot_id not in index:
+            raise ValueError(f"Snapshot {snapshot_id} not found")
+        with tempfile.TemporaryDirectory(prefix='manifest_') as staging:
+            local_path = os.path.join(staging, 'manifest')
+            if not await self.backend.download_file(index[snapshot_id][2], local_path):
+                raise OSError(f"Failed to download the manifest of snapshot {snapshot_id}")
+            with open(local_path, 'rb') as f:
+                blob = f.read()
+        manifest = json.loads(self._open_blob(blob, self._manifest_aad(snapshot_id), MAX_MANIFEST_SIZE))
+        if manifest.get('snapshot_id') != snapshot_id:
+            raise BackupFormatError(f"Manifest does not belong to snapshot {snapshot_id}")
+        return manifest
+
+    async def _previous_files(self, index, source_key: str) -> Dict[str, Dict[str, Any]]:
+        """Files of the latest snapshot of the same source, by relative path"""
+        same_source = [(created_ns, snapshot_id) for snapshot_id, (key, created_ns, _) in index.items()
+                       if key == source_key]
+        if not same_source:
+            return {}
+        manifest = await self._load_manifest(max(same_source)[1], index)
+        return {entry['path']: entry for entry in manifest['entries'] if entry['type'] == 'file'}
@@ -0,0 +1,281 @@
+"""
+Streaming backup container: chunked compression, AES-256-GCM and SHA-256.
+
+A backup is read and written in chunks of ``chunk_size`` bytes, so memory use
+is bounded by the chunk size and the number of workers, however large the
+backup is. Each chunk is compressed on its own (in parallel, zlib and zstd
+release the GIL) and then sealed, so restore can authenticate every chunk
+before using it and stop at the first corrupt one.
+
+Layout (integers are big-endian)::
+
+    header = MAGIC | version (u8) | codec (u8) | flags (u8) | chunk_size (u32)
+             | salt (16 bytes) | nonce_prefix (4 bytes)
+    frame  = length (u32) | final (u8) | payload
+
+With encryption, ``payload`` is the compressed chunk sealed with AES-256-GCM
+under a key derived from the passphrase and salt with scrypt; the nonce is
+``nonce_prefix | chunk index (u64)`` and the header, chunk index and final
+flag are authenticated as associated data, so chunks cannot be reordered,
+dropped or moved between backups. Without encryption, ``payload`` is the
+compressed chunk followed by the first 16 bytes of its SHA-256. The last
+frame has ``final`` set; a stream that ends before it is truncated.
+
+The SHA-256 of the whole container is computed while it is written and is
+the checksum recorded for the backup.
+"""
+
+import hashlib
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'MRBK'
+VERSION = 1
+CODEC_NONE = 0
+CODEC_GZIP = 1  # zlib deflate per chunk
+CODEC_ZSTD = 2
+FLAG_ENCRYPTED = 0x01
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+DIGEST_SIZE = 16
+TAG_SIZE = 16
+
+HEADER = struct.Struct('>4sBBBI16s4s')
+FRAME = struct.Struct('>IB')
+CHUNK_AAD = struct.Struct('>QB')
+NONCE_INDEX = struct.Struct('>Q')
+
+
+class BackupFormatError(ValueError):
+    """The backup is not a valid container, or a chunk failed authentication"""
+
+
+@dataclass
+class StreamStats:
+    """Sizes and checksum of a container written or read"""
+    original_size: int = 0
+    stored_size: int = 0
+    chunks: int = 0
+    checksum: str = ''
+
+
+def default_codec() -> int:
+    return CODEC_ZSTD if zstandard is not None else CODEC_GZIP
+
+
+def derive_key(passphrase: str, salt: bytes, length: int = 32) -> bytes:
+    """AES-256 key (or ``length`` bytes of key material) from the configured passphrase"""
+    return Scrypt(salt=salt, length=length, n=2 ** 14, r=8, p=1).derive(passphrase.encode())
+
+
+def compress_chunk(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_GZIP:
+        return zlib.compress(data, 6)
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def decompress_chunk(codec: int, data: bytes, chunk_size: int) -> bytes:
+    if codec == CODEC_GZIP:
+        decompressor = zlib.decompressobj()
+        chunk = decompressor.decompress(data, chunk_size)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise BackupFormatError("Chunk decompresses beyond the chunk size")
+        return chunk
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise BackupFormatError("Backup is zstd-compressed but zstandard is not installed")
+        try:
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=chunk_size)
+        except zstandard.ZstdError as e:
+            raise BackupFormatError(f"Corrupt zstd chunk: {e}")
+    return data
+
+
+def _read_chunks(source: BinaryIO, chunk_size: int) -> Iterator[Tuple[int, bytes, bool]]:
+    """(index, chunk, is_last) with one chunk of read-ahead; an empty source is one empty chunk"""
+    index = 0
+    chunk = source.read(chunk_size)
+    while True:
+        following = source.read(chunk_size) if chunk else b''
+        yield index, chunk, not following
+        if not following:
+            return
+        chunk = following
+        index += 1
+
+
+def ordered_map(function, items, workers: int):
+    """map() over a thread pool, in order, with at most 2 * workers items in flight"""
+    if workers <= 1:
+        for item in items:
+            yield function(*item)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(function, *item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _HashingWriter:
+    def __init__(self, dest: BinaryIO):
+        self.dest = dest
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.dest.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+
+
+def write_backup(source: BinaryIO, dest: BinaryIO, passphrase: Optional[str] = None,
+                 codec: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 workers: int = 4) -> StreamStats:
+    """Write ``source`` to ``dest`` as a container; encrypted if a passphrase is given."""
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}")
+    codec = default_codec() if codec is None else codec
+    if codec == CODEC_ZSTD and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package")
+
+    salt, nonce_prefix = os.urandom(16), os.urandom(4)
+    header = HEADER.pack(MAGIC, VERSION, codec, FLAG_ENCRYPTED if passphrase else 0,
+                         chunk_size, salt, nonce_prefix)
+    aesgcm = AESGCM(derive_key(passphrase, salt)) if passphrase else None
+
+    def seal(index: int, chunk: bytes, final: bool) -> Tuple[int, bytes, bool]:
+        compressed = compress_chunk(codec, chunk)
+        if aesgcm is not None:
+            nonce = nonce_prefix + NONCE_INDEX.pack(index)
+            payload = aesgcm.encrypt(nonce, compressed, header + CHUNK_AAD.pack(index, final))
+        else:
+            payload = compressed + hashlib.sha256(compressed).digest()[:DIGEST_SIZE]
+        return len(chunk), payload, final
+
+    out = _HashingWriter(dest)
+    out.write(header)
+    stats = StreamStats()
+    for original_size, payload, final in ordered_map(seal, _read_chunks(source, chunk_size), workers):
+        out.write(FRAME.pack(len(payload), final))
+        out.write(payload)
+        stats.original_size += original_size
+        stats.chunks += 1
+
+    stats.stored_size = out.size
+    stats.checksum = out.sha256.hexdigest()
+    return stats
+
+
+def _read_exact(source: BinaryIO, size: int, what: str) -> bytes:
+    data = source.read(size)
+    if len(data) != size:
+        raise BackupFormatError(f"Backup is truncated (in {what})")
+    return data
+
+
+def _frames(source: BinaryIO, passphrase: Optional[str]):
+    """Parse the header; returns (header fields, opener, frame iterator)."""
+    header = _read_exact(source, HEADER.size, 'header')
+    magic, version, codec, flags, chunk_size, salt, nonce_prefix = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise BackupFormatError("Not a backup container, or an unsupported version")
+    if codec not in (CODEC_NONE, CODEC_GZIP, CODEC_ZSTD) or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise BackupFormatError("Backup header is corrupt")
+
+    encrypted = bool(flags & FLAG_ENCRYPTED)
+    if encrypted and not passphrase:
+        raise BackupFormatError("Backup is encrypted and no encryption key was given")
+    aesgcm = AESGCM(derive_key(passphrase, salt)) if encrypted else None
+    max_payload = chunk_size + chunk_size // 8 + 1024 + TAG_SIZE + DIGEST_SIZE
+
+    def open_payload(index: int, payload: bytes, final: bool) -> bytes:
+        """The chunk's compressed bytes, once authenticated"""
+        if aesgcm is not None:
+            try:
+                return aesgcm.decrypt(nonce_prefix + NONCE_INDEX.pack(index), payload,
+                                      header + CHUNK_AAD.pack(index, final))
+            except InvalidTag:
+                raise BackupFormatError(f"Chunk {index} failed authentication")
+        compressed, digest = payload[:-DIGEST_SIZE], payload[-DIGEST_SIZE:]
+        if len(payload) < DIGEST_SIZE or hashlib.sha256(compressed).digest()[:DIGEST_SIZE] != digest:
+            raise BackupFormatError(f"Chunk {index} failed its checksum")
+        return compressed
+
+    def frames():
+        index = 0
+        while True:
+            length, final = FRAME.unpack(_read_exact(source, FRAME.size, f'chunk {index}'))
+            if length > max_payload:
+                raise BackupFormatError(f"Chunk {index} is larger than the chunk size allows")
+            yield index, _read_exact(source, length, f'chunk {index}'), bool(final)
+            if final:
+                if source.read(1):
+                    raise BackupFormatError("Unexpected data after the last chunk")
+                return
+            index += 1
+
+    return codec, chunk_size, open_payload, frames()
+
+
+def read_backup(source: BinaryIO, dest: BinaryIO, passphrase: Optional[str] = None,
+                workers: int = 4) -> StreamStats:
+    """
+    Restore a container from ``source`` into ``dest``, authenticating each
+    chunk before it is written. Raises BackupFormatError at the first bad chunk.
+    """
+    codec, chunk_size, open_payload, frames = _frames(source, passphrase)
+
+    def restore(index: int, payload: bytes, final: bool) -> Tuple[int, bytes]:
+        return len(payload), decompress_chunk(codec, open_payload(index, payload, final), chunk_size)
+
+    stats = StreamStats()
+    for stored_size, chunk in ordered_map(restore, frames, workers):
+        dest.write(chunk)
+        stats.original_size += len(chunk)
+        stats.stored_size += stored_size
+        stats.chunks += 1
+    return stats
+
+
+def verify_backup(source: BinaryIO, passphrase: Optional[str] = None, workers: int = 4) -> StreamStats:
+    """Authenticate every chunk of a container without decompressing it"""
+    _, _, open_payload, frames = _frames(source, passphrase)
+
+    def check(index: int, payload: bytes, final: bool) -> int:
+        open_payload(index, payload, final)
+        return len(payload)
+
+    stats = StreamStats()
+    for stored_size in ordered_map(check, frames, workers):
+        stats.stored_size += stored_size
+        stats.chunks += 1
+    return stats
+
+
+def file_checksum(path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file, read in blocks"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
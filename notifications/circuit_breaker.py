@@ -1,5 +1,7 @@
+import os
 import time
 import threading
+import uuid
 from datetime import datetime, timedelta
 from typing import Dict, Any, Callable, Optional
 from dataclasses import dataclass
@@ -24,6 +26,7 @@ class CircuitBreakerConfig:
     failure_rate_threshold: float = 0.5 # Failure rate to open circuit (0.0-1.0)
     slow_call_threshold_ms: int = 5000  # Calls slower than this are considered failures
     minimum_calls: int = 10             # Minimum calls before evaluating failure rate
+    half_open_max_calls: int = 1        # Concurrent trial calls allowed while half-open
 
 @dataclass
 class CallResult:
@@ -45,6 +48,7 @@ class CircuitBreaker:
         self.success_count = 0
         self.last_failure_time = None
         self.last_state_change = datetime.now()
+        self.half_open_calls = 0
         
         # Sliding window for call results
         self.call_history = deque(maxlen=self.config.window_size)
@@ -67,37 +71,60 @@ class CircuitBreaker:
     
     def call(self, func: Callable, *args, **kwargs) -> Any:
         """Execute function with circuit breaker protection"""
+        permit = self._acquire_permit()
+        
+        # The lock is not held while the protected call runs
+        start_time = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            duration_ms = (time.time() - start_time) * 1000
+            self._complete_call(permit, False, duration_ms, str(e))
+            raise
+        
+        duration_ms = (time.time() - start_time) * 1000
+        # Check if call was too slow
+        if duration_ms > self.config.slow_call_threshold_ms:
+            self._complete_call(permit, False, duration_ms, "Slow call")
+        else:
+            self._complete_call(permit, True, duration_ms)
+        return result
+    
+    def _acquire_permit(self) -> Optional[int]:
+        """Admit a call or raise; returns the half-open generation for trial calls"""
         with self.lock:
             self.total_calls += 1
             
             # Check if circuit is open
             if self.state == CircuitState.OPEN:
-                if self._should_attempt_reset():
-                    self._transition_to_half_open()
-                else:
-                    self._record_rejected_call()
-                    raise CircuitBreakerOpenException(
-                        f"Circuit breaker '{self.name}' is OPEN"
-                    )
+                if not self._should_attempt_reset():
+                    self._reject_call()
+                self._transition_to_half_open()
             
-            # Execute the function
-            start_time = time.time()
-            try:
-                result = func(*args, **kwargs)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                # Check if call was too slow
-                if duration_ms > self.config.slow_call_threshold_ms:
-                    self._record_failure(duration_ms, "Slow call")
-                else:
-                    self._record_success(duration_ms)
-                
-                return result
-                
-            except Exception as e:
-                duration_ms = (time.time() - start_time) * 1000
-                self._record_failure(duration_ms, str(e))
-                raise
+            if self.state == CircuitState.HALF_OPEN:
+                if self.half_open_calls >= self.config.half_open_max_calls:
+                    self._reject_call()
+                self.half_open_calls += 1
+                return self.state_changes
+            return None
+    
+    def _complete_call(self, permit: Optional[int], success: bool, duration_ms: float,
+                       error: Optional[str] = None):
+        """Record the outcome of an admitted call"""
+        with self.lock:
+            if permit is not None and permit == self.state_changes:
+                self.half_open_calls -= 1
+            if success:
+                self._record_success(duration_ms)
+            else:
+                self._record_failure(duration_ms, error)
+    
+    def _reject_call(self):
+        """Count a rejected call and fail fast"""
+        self._record_rejected_call()
+        raise CircuitBreakerOpenException(
+            f"Circuit breaker '{self.name}' is {self.state.value.upper()}"
+        )
     
     def _should_attempt_reset(self) -> bool:
         """Check if enough time has passed to attempt reset"""
@@ -113,6 +140,7 @@ class CircuitBreaker:
         self.state = CircuitState.HALF_OPEN
         self.success_count = 0
         self.failure_count = 0
+        self.half_open_calls = 0
         self.last_state_change = datetime.now()
         self.state_changes += 1
         
@@ -265,7 +293,8 @@ class CircuitBreaker:
                     'success_threshold': self.config.success_threshold,
                     'timeout_seconds': self.config.timeout_seconds,
                     'failure_rate_threshold': self.config.failure_rate_threshold,
-                    'slow_call_threshold_ms': self.config.slow_call_threshold_ms
+                    'slow_call_threshold_ms': self.config.slow_call_threshold_ms,
+                    'half_open_max_calls': self.config.half_open_max_calls
                 }
             }
     
@@ -298,18 +327,510 @@ class CircuitBreakerOpenException(Exception):
     """Exception raised when circuit breaker is open"""
     pass
 
-class CircuitBreakerManager:
-    """Manages multiple circuit breakers"""
+# Shared breaker state. Each breaker owns three keys, hash-tagged by name so a
+# cluster keeps them on one slot: a hash with the state and counters, a list
+# of recent outcomes ('1' failure, '0' success; newest first) and a sorted set
+# of half-open trial leases scored by expiry. Time comes from the Redis server.
+#   KEYS: state hash, probe set
+#   ARGV: open timeout ms, max trial calls, trial lease ms, trial token
+#   Returns: allowed, state, trial flag, retry-after ms, transitioned flag
+ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local transitioned = 0
+if state == 'open' then
+    local reopen_at = tonumber(redis.call('HGET', KEYS[1], 'opened_at') or 0) + tonumber(ARGV[1])
+    if now < reopen_at then
+        return {0, state, 0, reopen_at - now, 0}
+    end
+    state = 'half_open'
+    transitioned = 1
+    redis.call('HSET', KEYS[1], 'state', state, 'success_count', 0, 'failure_count', 0, 'changed_at', now)
+    redis.call('HINCRBY', KEYS[1], 'state_changes', 1)
+    redis.call('DEL', KEYS[2])
+end
+if state == 'half_open' then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[2]) then
+        return {0, state, 0, 0, transitioned}
+    end
+    redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), ARGV[4])
+    redis.call('PEXPIRE', KEYS[2], ARGV[3])
+    return {1, state, 1, 0, transitioned}
+end
+return {1, state, 0, 0, 0}
+"""
+
+# Adds a batch of outcomes to the window and applies the state transitions.
+#   KEYS: state hash, outcome list, probe set
+#   ARGV: successes, failures, trial token ('' if none), window size,
+#         failure threshold, success threshold, failure rate threshold,
+#         minimum calls, key TTL seconds
+#   Returns: state, previous state, failure count, window calls, window failures
+RECORD_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local successes = tonumber(ARGV[1])
+local failures = tonumber(ARGV[2])
+local probe = ARGV[3] ~= ''
+local size = tonumber(ARGV[4])
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local previous = state
+if probe then
+    redis.call('ZREM', KEYS[3], ARGV[3])
+end
+local window_failures = tonumber(redis.call('HGET', KEYS[1], 'window_failures') or 0)
+for i = 1, math.min(successes, size) do
+    redis.call('LPUSH', KEYS[2], '0')
+end
+for i = 1, failures do
+    redis.call('LPUSH', KEYS[2], '1')
+end
+window_failures = window_failures + failures
+local calls = redis.call('LLEN', KEYS[2])
+if calls > size then
+    for _, outcome in ipairs(redis.call('LRANGE', KEYS[2], size, -1)) do
+        if outcome == '1' then
+            window_failures = window_failures - 1
+        end
+    end
+    redis.call('LTRIM', KEYS[2], 0, size - 1)
+    calls = size
+end
+local failure_count = tonumber(redis.call('HGET', KEYS[1], 'failure_count') or 0)
+if successes > 0 then
+    failure_count = 0
+end
+failure_count = failure_count + failures
+if state == 'closed' and failures > 0 then
+    if failure_count >= tonumber(ARGV[5]) or
+            (calls >= tonumber(ARGV[8]) and window_failures / calls >= tonumber(ARGV[7])) then
+        state = 'open'
+    end
+elseif state == 'half_open' then
+    if failures > 0 then
+        state = 'open'
+    elseif probe and redis.call('HINCRBY', KEYS[1], 'success_count', 1) >= tonumber(ARGV[6]) then
+        state = 'closed'
+    end
+end
+if state ~= previous then
+    redis.call('HSET', KEYS[1], 'state', state, 'success_count', 0, 'changed_at', now)
+    redis.call('HINCRBY', KEYS[1], 'state_changes', 1)
+    redis.call('DEL', KEYS[3])
+    if state == 'open' then
+        redis.call('HSET', KEYS[1], 'opened_at', now)
+    else
+        failure_count = 0
+    end
+end
+redis.call('HSET', KEYS[1], 'failure_count', failure_count, 'window_failures', window_failures)
+redis.call('HINCRBY', KEYS[1], 'total_calls', successes + failures)
+redis.call('HINCRBY', KEYS[1], 'total_failures', failures)
+redis.call('EXPIRE', KEYS[1], ARGV[9])
+redis.call('EXPIRE', KEYS[2], ARGV[9])
+return {state, previous, failure_count, calls, window_failures}
+"""
+
+# Manual reset (ARGV[1] = 'closed') or force open (ARGV[1] = 'open').
+#   KEYS: state hash, outcome list, probe set
+SET_STATE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+redis.call('DEL', KEYS[3])
+redis.call('HSET', KEYS[1], 'state', ARGV[1], 'success_count', 0, 'failure_count', 0, 'changed_at', now)
+redis.call('HINCRBY', KEYS[1], 'state_changes', 1)
+if ARGV[1] == 'open' then
+    redis.call('HSET', KEYS[1], 'opened_at', now)
+else
+    redis.call('DEL', KEYS[2])
+    redis.call('HSET', KEYS[1], 'window_failures', 0)
+end
+return 1
+"""
+
+
+@dataclass
+class CircuitPermit:
+    """Admission decision from a CircuitStateStore"""
+    allowed: bool
+    state: CircuitState
+    probe: bool = False
+    retry_after_ms: int = 0
+    transitioned: bool = False
+
+
+@dataclass
+class CircuitOutcome:
+    """Shared state after recording outcomes in a CircuitStateStore"""
+    state: CircuitState
+    previous_state: CircuitState
+    failure_count: int
+    window_calls: int
+    window_failures: int
+
+
+def _probe_lease_ms(config: CircuitBreakerConfig) -> int:
+    """How long a trial call holds its slot if its worker never reports back"""
+    return max(config.slow_call_threshold_ms * 2, 1000)
+
+
+class LocalCircuitStateStore:
+    """
+    In-process equivalent of the Redis scripts. Breakers sharing one store
+    share state; RedisCircuitStateStore also falls back to it.
+    """
     
     def __init__(self):
+        self._circuits: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def _circuit(self, name: str) -> Dict[str, Any]:
+        if name not in self._circuits:
+            self._circuits[name] = {
+                'state': 'closed', 'opened_at': 0, 'changed_at': 0, 'failure_count': 0,
+                'success_count': 0, 'state_changes': 0, 'window_failures': 0,
+                'total_calls': 0, 'total_failures': 0, 'window': deque(), 'probes': {},
+            }
+        return self._circuits[name]
+    
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+    
+    def acquire(self, name: str, config: CircuitBreakerConfig, token: str) -> CircuitPermit:
+        now = self._now_ms()
+        with self._lock:
+            circuit = self._circuit(name)
+            transitioned = False
+            if circuit['state'] == 'open':
+                reopen_at = circuit['opened_at'] + config.timeout_seconds * 1000
+                if now < reopen_at:
+                    return CircuitPermit(False, CircuitState.OPEN, retry_after_ms=reopen_at - now)
+                transitioned = True
+                circuit.update(state='half_open', success_count=0, failure_count=0, changed_at=now)
+                circuit['state_changes'] += 1
+                circuit['probes'].clear()
+            if circuit['state'] == 'half_open':
+                probes = circuit['probes']
+                for expired in [t for t, expires_at in probes.items() if expires_at <= now]:
+                    del probes[expired]
+                if len(probes) >= config.half_open_max_calls:
+                    return CircuitPermit(False, CircuitState.HALF_OPEN, transitioned=transitioned)
+                probes[token] = now + _probe_lease_ms(config)
+                return CircuitPermit(True, CircuitState.HALF_OPEN, probe=True, transitioned=transitioned)
+            return CircuitPermit(True, CircuitState.CLOSED)
+    
+    def record(self, name: str, config: CircuitBreakerConfig, successes: int, failures: int,
+               token: str = '') -> CircuitOutcome:
+        now = self._now_ms()
+        with self._lock:
+            circuit = self._circuit(name)
+            state = previous = circuit['state']
+            if token:
+                circuit['probes'].pop(token, None)
+            
+            window = circuit['window']
+            window.extendleft([0] * min(successes, config.window_size) + [1] * failures)
+            circuit['window_failures'] += failures
+            while len(window) > config.window_size:
+                circuit['window_failures'] -= window.pop()
+            calls = len(window)
+            
+            failure_count = 0 if successes else circuit['failure_count']
+            failure_count += failures
+            if state == 'closed' and failures:
+                if failure_count >= config.failure_threshold or (
+                        calls >= config.minimum_calls and
+                        circuit['window_failures'] / calls >= config.failure_rate_threshold):
+                    state = 'open'
+            elif state == 'half_open':
+                if failures:
+                    state = 'open'
+                elif token:
+                    circuit['success_count'] += 1
+                    if circuit['success_count'] >= config.success_threshold:
+                        state = 'closed'
+            
+            if state != previous:
+                circuit.update(state=state, success_count=0, changed_at=now)
+                circuit['state_changes'] += 1
+                circuit['probes'].clear()
+                if state == 'open':
+                    circuit['opened_at'] = now
+                else:
+                    failure_count = 0
+            circuit['failure_count'] = failure_count
+            circuit['total_calls'] += successes + failures
+            circuit['total_failures'] += failures
+            return CircuitOutcome(CircuitState(state), CircuitState(previous), failure_count,
+                                  calls, circuit['window_failures'])
+    
+    def set_state(self, name: str, state: CircuitState):
+        now = self._now_ms()
+        with self._lock:
+            circuit = self._circuit(name)
+            circuit['probes'].clear()
+            circuit.update(state=state.value, success_count=0, failure_count=0, changed_at=now)
+            circuit['state_changes'] += 1
+            if state == CircuitState.OPEN:
+                circuit['opened_at'] = now
+            else:
+                circuit['window'].clear()
+                circuit['window_failures'] = 0
+    
+    def describe(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            circuit = self._circuit(name)
+            return {key: value for key, value in circuit.items() if key not in ('window', 'probes')}
+
+
+class RedisCircuitStateStore:
+    """
+    Breaker state shared by every worker through atomic Lua scripts. When Redis
+    is unreachable the breakers of this process share a LocalCircuitStateStore
+    instead, and Redis is retried after REDIS_RETRY_SECONDS.
+    """
+    
+    REDIS_RETRY_SECONDS = 30
+    KEY_TTL_SECONDS = 86400
+    
+    def __init__(self, redis_client, key_prefix: str = 'circuit_breaker'):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.fallback = LocalCircuitStateStore()
+        self._scripts = {}
+        self._redis_down_until = 0.0
+    
+    def _keys(self, name: str):
+        prefix = f"{self.key_prefix}:{{{name}}}"
+        return f"{prefix}:state", f"{prefix}:window", f"{prefix}:probes"
+    
+    def _run(self, source: str, keys, args):
+        if time.monotonic() < self._redis_down_until:
+            return None
+        try:
+            if source not in self._scripts:
+                self._scripts[source] = self.redis_client.register_script(source)
+            return [value.decode() if isinstance(value, bytes) else value
+                    for value in self._scripts[source](keys=keys, args=args)]
+        except Exception as e:
+            notification_logger.warning(
+                LogCategory.SYSTEM,
+                f"Redis circuit breaker state unavailable, using in-process state: {e}",
+                "circuit_breaker"
+            )
+            self._redis_down_until = time.monotonic() + self.REDIS_RETRY_SECONDS
+            return None
+    
+    def acquire(self, name: str, config: CircuitBreakerConfig, token: str) -> CircuitPermit:
+        state_key, _, probes_key = self._keys(name)
+        raw = self._run(ACQUIRE_SCRIPT, [state_key, probes_key], [
+            config.timeout_seconds * 1000, config.half_open_max_calls, _probe_lease_ms(config), token
+        ])
+        if raw is None:
+            return self.fallback.acquire(name, config, token)
+        return CircuitPermit(raw[0] == 1, CircuitState(raw[1]), raw[2] == 1, int(raw[3]), raw[4] == 1)
+    
+    def record(self, name: str, config: CircuitBreakerConfig, successes: int, failures: int,
+               token: str = '') -> CircuitOutcome:
+        raw = self._run(RECORD_SCRIPT, list(self._keys(name)), [
+            successes, failures, token, config.window_size, config.failure_threshold,
+            config.success_threshold, config.failure_rate_threshold, config.minimum_calls,
+            self.KEY_TTL_SECONDS
+        ])
+        if raw is None:
+            return self.fallback.record(name, config, successes, failures, token)
+        return CircuitOutcome(CircuitState(raw[0]), CircuitState(raw[1]), int(raw[2]), int(raw[3]), int(raw[4]))
+    
+    def set_state(self, name: str, state: CircuitState):
+        if self._run(SET_STATE_SCRIPT, list(self._keys(name)), [state.value]) is None:
+            self.fallback.set_state(name, state)
+    
+    def describe(self, name: str) -> Dict[str, Any]:
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                values = self.redis_client.hgetall(self._keys(name)[0])
+                return {
+                    (key.decode() if isinstance(key, bytes) else key):
+                        (value.decode() if isinstance(value, bytes) else value)
+                    for key, value in values.items()
+                }
+            except Exception as e:
+                notification_logger.warning(
+                    LogCategory.SYSTEM,
+                    f"Could not read shared circuit breaker state: {e}",
+                    "circuit_breaker"
+                )
+        return self.fallback.describe(name)
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    """
+    Circuit breaker whose state, sliding window and half-open trial calls are
+    kept in a state store shared by every worker, so one worker tripping the
+    circuit fails fast everywhere.
+    
+    The last state seen is cached for ``snapshot_ttl`` seconds. While it says
+    CLOSED, calls are admitted without touching the store and successes are
+    flushed once per TTL; while the circuit is cooling down, calls are
+    rejected locally. Failures, trial calls and half-open admission always go
+    to the store.
+    """
+    
+    def __init__(self, name: str, config: CircuitBreakerConfig = None, store=None,
+                 snapshot_ttl: float = 1.0):
+        super().__init__(name, config)
+        self.store = store or LocalCircuitStateStore()
+        self.snapshot_ttl = snapshot_ttl
+        self.window_calls = 0
+        self.window_failures = 0
+        self._admit = True
+        self._snapshot_until = 0.0
+        self._pending_successes = 0
+        self._flush_at = 0.0
+    
+    def _acquire_permit(self) -> Optional[str]:
+        with self.lock:
+            self.total_calls += 1
+            if time.monotonic() < self._snapshot_until:
+                if self._admit:
+                    return None
+                self._reject_call()
+        
+        token = uuid.uuid4().hex
+        permit = self.store.acquire(self.name, self.config, token)
+        with self.lock:
+            if permit.transitioned:
+                self._announce_transition(CircuitState.OPEN, permit.state)
+            self._apply_state(permit.state, permit.retry_after_ms)
+            if not permit.allowed and permit.state == CircuitState.HALF_OPEN:
+                # Every trial slot is taken; stop asking for a while
+                self._admit = False
+                self._snapshot_until = time.monotonic() + self.snapshot_ttl
+            if not permit.allowed:
+                self._reject_call()
+        return token if permit.probe else None
+    
+    def _complete_call(self, permit: Optional[str], success: bool, duration_ms: float,
+                       error: Optional[str] = None):
+        with self.lock:
+            self.call_history.append(CallResult(
+                success=success,
+                duration_ms=duration_ms,
+                timestamp=datetime.now(),
+                error=error
+            ))
+            if success:
+                self.total_successes += 1
+                metrics_collector.increment_counter(f'circuit_breaker.{self.name}.success')
+                metrics_collector.record_timer(f'circuit_breaker.{self.name}.duration', duration_ms)
+            else:
+                self.total_failures += 1
+                metrics_collector.increment_counter(f'circuit_breaker.{self.name}.failure')
+            
+            if success:
+                self._pending_successes += 1
+                if permit is None and time.monotonic() < self._flush_at:
+                    return
+        self._flush(permit or '', 0 if success else 1)
+    
+    def _flush(self, token: str = '', failures: int = 0):
+        """Send batched outcomes to the store and refresh the snapshot"""
+        with self.lock:
+            successes, self._pending_successes = self._pending_successes, 0
+            self._flush_at = time.monotonic() + self.snapshot_ttl
+        if not (successes or failures or token):
+            return
+        outcome = self.store.record(self.name, self.config, successes, failures, token)
+        with self.lock:
+            if outcome.state != outcome.previous_state:
+                self._announce_transition(outcome.previous_state, outcome.state)
+            retry_after_ms = self.config.timeout_seconds * 1000 if outcome.state == CircuitState.OPEN else 0
+            self._apply_state(outcome.state, retry_after_ms)
+            self.failure_count = outcome.failure_count
+            self.window_calls = outcome.window_calls
+            self.window_failures = outcome.window_failures
+    
+    def _apply_state(self, state: CircuitState, retry_after_ms: int = 0):
+        """Adopt the shared state and cache the admission decision it implies"""
+        if state != self.state:
+            self.state = state
+            self.last_state_change = datetime.now()
+            if state == CircuitState.OPEN:
+                self.last_failure_time = datetime.now()
+        if state == CircuitState.HALF_OPEN:
+            # Admission depends on free trial slots, so the store decides
+            self._snapshot_until = 0.0
+            return
+        ttl = self.snapshot_ttl
+        if state == CircuitState.OPEN:
+            ttl = min(ttl, retry_after_ms / 1000)
+        self._admit = state == CircuitState.CLOSED
+        self._snapshot_until = time.monotonic() + ttl
+    
+    def _announce_transition(self, old_state: CircuitState, new_state: CircuitState):
+        """Log a transition this worker caused in the shared state"""
+        self.state_changes += 1
+        log = notification_logger.warning if new_state == CircuitState.OPEN else notification_logger.info
+        log(
+            LogCategory.SYSTEM,
+            f"Circuit breaker '{self.name}' transitioned from {old_state.value} to {new_state.value}",
+            "circuit_breaker",
+            metadata={'shared': True}
+        )
+        metric = {CircuitState.OPEN: 'opened', CircuitState.CLOSED: 'closed'}.get(new_state, 'state_change')
+        metrics_collector.increment_counter(f'circuit_breaker.{self.name}.{metric}')
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get local statistics plus the shared state"""
+        self._flush()
+        stats = super().get_statistics()
+        stats['shared'] = self.store.describe(self.name)
+        return stats
+    
+    def reset(self):
+        """Manually reset the shared circuit to closed state"""
+        self._set_shared_state(CircuitState.CLOSED)
+    
+    def force_open(self):
+        """Manually force the shared circuit to open state"""
+        self._set_shared_state(CircuitState.OPEN)
+    
+    def _set_shared_state(self, state: CircuitState):
+        self.store.set_state(self.name, state)
+        with self.lock:
+            old_state = self.state
+            self._pending_successes = 0
+            if state == CircuitState.CLOSED:
+                self.call_history.clear()
+                self.failure_count = 0
+            self._apply_state(state, self.config.timeout_seconds * 1000)
+        
+        notification_logger.warning(
+            LogCategory.SYSTEM,
+            f"Circuit breaker '{self.name}' manually set to {state.value} from {old_state.value}",
+            "circuit_breaker"
+        )
+
+
+class CircuitBreakerManager:
+    """Manages multiple circuit breakers; with a state store they are shared across workers"""
+    
+    def __init__(self, state_store=None):
         self.breakers: Dict[str, CircuitBreaker] = {}
+        self.state_store = state_store
         self.lock = threading.RLock()
     
     def get_breaker(self, name: str, config: CircuitBreakerConfig = None) -> CircuitBreaker:
         """Get or create a circuit breaker"""
         with self.lock:
             if name not in self.breakers:
-                self.breakers[name] = CircuitBreaker(name, config)
+                if self.state_store is not None:
+                    self.breakers[name] = SharedCircuitBreaker(name, config, self.state_store)
+                else:
+                    self.breakers[name] = CircuitBreaker(name, config)
             return self.breakers[name]
     
     def remove_breaker(self, name: str) -> bool:
@@ -348,8 +869,23 @@ class CircuitBreakerManager:
                 'breaker_names': list(self.breakers.keys())
             }
 
+def _default_state_store():
+    """Redis-backed shared state when CIRCUIT_BREAKER_SHARED_STATE is enabled"""
+    if os.getenv('CIRCUIT_BREAKER_SHARED_STATE', 'false').lower() != 'true':
+        return None
+    try:
+        from redis_pool_config import get_redis_connection
+        return RedisCircuitStateStore(get_redis_connection())
+    except Exception as e:
+        notification_logger.warning(
+            LogCategory.SYSTEM,
+            f"Redis connection pool unavailable for circuit breakers: {e}",
+            "circuit_breaker"
+        )
+        return None
+
 # Global circuit breaker manager
-circuit_manager = CircuitBreakerManager()
+circuit_manager = CircuitBreakerManager(_default_state_store())
 
 # Predefined circuit breakers for common services
 def get_sms_circuit_breaker() -> CircuitBreaker:
@@ -415,6 +951,8 @@ def circuit_breaker(name: str, config: CircuitBreakerConfig = None):
 __all__ = [
     'CircuitState', 'CircuitBreakerConfig', 'CallResult',
     'CircuitBreaker', 'CircuitBreakerOpenException', 'CircuitBreakerManager',
+    'SharedCircuitBreaker', 'LocalCircuitStateStore', 'RedisCircuitStateStore',
+    'CircuitPermit', 'CircuitOutcome',
     'circuit_manager', 'circuit_breaker',
     'get_sms_circuit_breaker', 'get_email_circuit_breaker',
     'get_push_circuit_breaker', 'get_database_circuit_breaker'
@@ -4,12 +4,22 @@ Dead Letter Queue implementation for failed notifications.
 Handles notifications that have exceeded maximum retry attempts.
 """
 
+from datetime import timedelta
+
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 import uuid
 import json
 
+STATISTICS_CACHE_KEY = 'dead_letter_queue:statistics'
+STATISTICS_CACHE_TIMEOUT = 30
+
+RETRY_CANDIDATE_STATUSES = ['pending_review', 'requires_manual_intervention']
+NON_RETRYABLE_FAILURE_TYPES = ['permanent_failure', 'invalid_recipient', 'data_corruption']
+
 class DeadLetterQueue(models.Model):
     """Model for storing failed notifications that have exceeded maximum retry attempts"""
     
@@ -219,50 +229,73 @@ class DeadLetterQueueManager:
     def get_retry_candidates():
         """Get entries that are candidates for retry"""
         return DeadLetterQueue.objects.filter(
-            status__in=['pending_review', 'requires_manual_intervention']
+            status__in=RETRY_CANDIDATE_STATUSES
         ).exclude(
-            failure_type__in=['permanent_failure', 'invalid_recipient', 'data_corruption']
+            failure_type__in=NON_RETRYABLE_FAILURE_TYPES
         ).order_by('-created_at')
     
     @staticmethod
-    def get_statistics() -> dict:
-        """Get dead letter queue statistics"""
-        total_entries = DeadLetterQueue.objects.count()
+    def get_statistics(use_cache: bool = False) -> dict:
+        """
+        Get dead letter queue statistics from one conditional-aggregation
+        query plus a group-by on delivery_method, so every method stored is
+        reported under its own name. With ``use_cache`` a snapshot up to
+        STATISTICS_CACHE_TIMEOUT seconds old may be returned.
+        """
+        if use_cache:
+            stats = cache.get(STATISTICS_CACHE_KEY)
+            if stats is not None:
+                return stats
         
-        status_counts = {
-            status: DeadLetterQueue.objects.filter(status=status).count()
-            for status, _ in DeadLetterQueue.STATUSES
-        }
+        now = timezone.now()
+        today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        days = [today - timedelta(days=i) for i in range(7)]
         
-        failure_type_counts = {
-            failure_type: DeadLetterQueue.objects.filter(failure_type=failure_type).count()
-            for failure_type, _ in DeadLetterQueue.FAILURE_TYPES
-        }
+        aggregates = {'total_entries': Count('id')}
+        for status, _ in DeadLetterQueue.STATUSES:
+            aggregates[f'status:{status}'] = Count('id', filter=Q(status=status))
+        for failure_type, _ in DeadLetterQueue.FAILURE_TYPES:
+            aggregates[f'failure_type:{failure_type}'] = Count('id', filter=Q(failure_type=failure_type))
+        for name, age in (('last_24h', 1), ('last_7d', 7), ('last_30d', 30)):
+            aggregates[f'recent:{name}'] = Count('id', filter=Q(created_at__gte=now - timedelta(days=age)))
+        for i, day in enumerate(days):
+            aggregates[f'day:{i}'] = Count('id', filter=Q(
+                final_failure_time__gte=day, final_failure_time__lt=day + timedelta(days=1)
+            ))
+        aggregates['retry_candidates_count'] = Count('id', filter=Q(
+            status__in=RETRY_CANDIDATE_STATUSES
+        ) & ~Q(failure_type__in=NON_RETRYABLE_FAILURE_TYPES))
         
-        # Time-based statistics
-        from datetime import timedelta
-        now = timezone.now()
+        counts = DeadLetterQueue.objects.aggregate(**aggregates)
+        
+        def group(prefix):
+            return {
+                key[len(prefix) + 1:]: value
+                for key, value in counts.items() if key.startswith(f'{prefix}:')
+            }
         
-        last_24h = DeadLetterQueue.objects.filter(created_at__gte=now - timedelta(days=1)).count()
-        last_7d = DeadLetterQueue.objects.filter(created_at__gte=now - timedelta(days=7)).count()
-        last_30d = DeadLetterQueue.objects.filter(created_at__gte=now - timedelta(days=30)).count()
+        status_counts = group('status')
+        delivery_method_counts = dict(
+            DeadLetterQueue.objects.order_by().values('delivery_method')
+            .annotate(count=Count('id')).values_list('delivery_method', 'count')
+        )
         
-        return {
-            'total_entries': total_entries,
+        stats = {
+            'total_entries': counts['total_entries'],
             'status_counts': status_counts,
-            'failure_type_counts': failure_type_counts,
-            'recent_entries': {
-                'last_24h': last_24h,
-                'last_7d': last_7d,
-                'last_30d': last_30d
-            },
+            'failure_type_counts': group('failure_type'),
+            'delivery_method_counts': delivery_method_counts,
+            'recent_entries': group('recent'),
+            'daily_failures': [
+                {'date': day.strftime('%Y-%m-%d'), 'count': counts[f'day:{i}']}
+                for i, day in enumerate(days)
+            ],
             'pending_review_count': status_counts.get('pending_review', 0),
-            'retry_candidates_count': DeadLetterQueue.objects.filter(
-                status__in=['pending_review', 'requires_manual_intervention']
-            ).exclude(
-                failure_type__in=['permanent_failure', 'invalid_recipient', 'data_corruption']
-            ).count()
+            'retry_candidates_count': counts['retry_candidates_count'],
+            'generated_at': now.isoformat(),
         }
+        cache.set(STATISTICS_CACHE_KEY, stats, STATISTICS_CACHE_TIMEOUT)
+        return stats
 
 
 # Enhanced retry logic for ScheduledTask
@@ -170,49 +170,22 @@ def get_dead_letter_statistics(request):
         if not user:
             return JsonResponse({'error': 'Authentication required'}, status=401)
         
-        # Get statistics
-        stats = DeadLetterQueueManager.get_statistics()
+        # Counts come from one aggregate and one delivery_method group-by, cached briefly
+        stats = DeadLetterQueueManager.get_statistics(use_cache=True)
         
-        # Get additional statistics
-        now = timezone.now()
-        
-        # Recent failures (last 7 days by day)
-        recent_failures = []
-        for i in range(7):
-            date = now - timedelta(days=i)
-            count = DeadLetterQueue.objects.filter(
-                final_failure_time__date=date.date()
-            ).count()
-            recent_failures.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'count': count
-            })
-        
-        # Top failure types
-        failure_type_stats = DeadLetterQueue.objects.values('failure_type').annotate(
-            count=models.Count('id')
-        ).order_by('-count')[:10]
-        
-        # Top delivery methods with failures
-        delivery_method_stats = DeadLetterQueue.objects.values('delivery_method').annotate(
-            count=models.Count('id')
-        ).order_by('-count')[:10]
+        def breakdown(counts, key):
+            top = sorted(((name, count) for name, count in counts.items() if count), key=lambda item: -item[1])
+            return [{key: name, 'count': count} for name, count in top[:10]]
         
         # Retry candidates
         retry_candidates = DeadLetterQueueManager.get_retry_candidates()
         
         return JsonResponse({
             'statistics': stats,
-            'recent_failures': recent_failures,
-            'failure_type_breakdown': [
-                {'failure_type': item['failure_type'], 'count': item['count']}
-                for item in failure_type_stats
-            ],
-            'delivery_method_breakdown': [
-                {'delivery_method': item['delivery_method'], 'count': item['count']}
-                for item in delivery_method_stats
-            ],
-            'retry_candidates_count': retry_candidates.count(),
+            'recent_failures': stats['daily_failures'],
+            'failure_type_breakdown': breakdown(stats['failure_type_counts'], 'failure_type'),
+            'delivery_method_breakdown': breakdown(stats['delivery_method_counts'], 'delivery_method'),
+            'retry_candidates_count': stats['retry_candidates_count'],
             'retry_candidates': [
                 {
                     'id': str(entry.id),
@@ -1,6 +1,8 @@
 import asyncio
+import bisect
 import json
 import hashlib
+import math
 import time
 import uuid
 from datetime import datetime, timedelta
@@ -15,6 +17,8 @@ import pickle
 import zlib
 from collections import defaultdict, deque
 
+from django.conf import settings
+
 from .logging_config import NotificationLogger
 from .monitoring import SystemMonitor
 from .cache_layer import CacheManager
@@ -89,6 +93,7 @@ class DistributedTask:
     task_id: str
     task_type: str
     payload: Dict[str, Any]
+    routing_key: Optional[str] = None
     assigned_node: Optional[str] = None
     status: str = "pending"
     created_at: datetime = field(default_factory=datetime.now)
@@ -99,91 +104,152 @@ class DistributedTask:
 
 
 class ConsistentHashRing:
-    """Consistent hashing implementation for distributed data placement."""
-    
-    def __init__(self, replicas: int = 150):
+    """
+    Consistent hashing implementation for distributed data placement.
+    
+    Virtual node positions are kept in a sorted list, so a lookup is a binary
+    search, and adding or removing a node merges or filters only that node's
+    positions instead of rebuilding the ring.
+    
+    assign() and release() track which node holds each key. With
+    ``load_epsilon`` set, assign() uses consistent hashing with bounded loads:
+    a key goes to the first node clockwise from its position whose load is
+    below ceil((1 + load_epsilon) * average load). The bound is checked only
+    when a key is assigned. Assigned keys stay where they are when nodes join,
+    so a join lowers the average without moving load, and older nodes can
+    exceed (1 + load_epsilon) times the new average until their keys are
+    released. When a node leaves, only its keys are reassigned.
+    """
+    
+    def __init__(self, replicas: int = 150, load_epsilon: Optional[float] = None):
         self.replicas = replicas
+        self.load_epsilon = load_epsilon
         self.ring: Dict[int, str] = {}
         self.sorted_keys: List[int] = []
         self.nodes: set = set()
+        self.assignments: Dict[str, str] = {}
+        self.node_keys: Dict[str, set] = {}
     
     def _hash(self, key: str) -> int:
         """Hash function for the ring."""
         return int(hashlib.md5(key.encode()).hexdigest(), 16)
     
+    def _index(self, hash_value: int) -> int:
+        """Index of the first ring position clockwise from a hash"""
+        index = bisect.bisect_left(self.sorted_keys, hash_value)
+        return 0 if index == len(self.sorted_keys) else index
+    
     def add_node(self, node: str):
         """Add a node to the hash ring."""
         if node in self.nodes:
             return
         
         self.nodes.add(node)
+        self.node_keys[node] = set()
         
+        positions = []
         for i in range(self.replicas):
             virtual_key = f"{node}:{i}"
             hash_value = self._hash(virtual_key)
-            self.ring[hash_value] = node
+            if hash_value not in self.ring:
+                self.ring[hash_value] = node
+                positions.append(hash_value)
         
-        self.sorted_keys = sorted(self.ring.keys())
+        # Two sorted runs: Timsort merges them in linear time
+        positions.sort()
+        self.sorted_keys = sorted(self.sorted_keys + positions)
     
     def remove_node(self, node: str):
-        """Remove a node from the hash ring."""
+        """Remove a node from the hash ring, reassigning the keys it held."""
         if node not in self.nodes:
             return
         
         self.nodes.remove(node)
         
+        removed = set()
         for i in range(self.replicas):
             virtual_key = f"{node}:{i}"
             hash_value = self._hash(virtual_key)
-            if hash_value in self.ring:
+            if self.ring.get(hash_value) == node:
                 del self.ring[hash_value]
+                removed.add(hash_value)
         
-        self.sorted_keys = sorted(self.ring.keys())
+        self.sorted_keys = [ring_key for ring_key in self.sorted_keys if ring_key not in removed]
+        
+        orphaned = self.node_keys.pop(node, set())
+        for key in orphaned:
+            del self.assignments[key]
+        for key in orphaned:
+            self.assign(key)
     
     def get_node(self, key: str) -> Optional[str]:
         """Get the node responsible for a key."""
         if not self.ring:
             return None
         
-        hash_value = self._hash(key)
-        
-        # Find the first node clockwise from the hash
-        for ring_key in self.sorted_keys:
-            if hash_value <= ring_key:
-                return self.ring[ring_key]
-        
-        # Wrap around to the first node
-        return self.ring[self.sorted_keys[0]]
+        return self.ring[self.sorted_keys[self._index(self._hash(key))]]
     
     def get_nodes(self, key: str, count: int) -> List[str]:
         """Get multiple nodes for replication."""
         if not self.ring or count <= 0:
             return []
         
-        hash_value = self._hash(key)
         nodes = []
-        seen_nodes = set()
-        
-        # Start from the position in the ring
-        start_index = 0
-        for i, ring_key in enumerate(self.sorted_keys):
-            if hash_value <= ring_key:
-                start_index = i
+        for node in self._nodes_clockwise(self._index(self._hash(key))):
+            nodes.append(node)
+            if len(nodes) >= count:
                 break
         
-        # Collect unique nodes
+        return nodes
+    
+    def _nodes_clockwise(self, start_index: int):
+        """Distinct nodes in ring order from a position"""
+        seen_nodes = set()
         for i in range(len(self.sorted_keys)):
-            index = (start_index + i) % len(self.sorted_keys)
-            node = self.ring[self.sorted_keys[index]]
-            
+            node = self.ring[self.sorted_keys[(start_index + i) % len(self.sorted_keys)]]
             if node not in seen_nodes:
-                nodes.append(node)
                 seen_nodes.add(node)
-                
-                if len(nodes) >= count:
-                    break
+                yield node
+                if len(seen_nodes) == len(self.nodes):
+                    return
+    
+    @property
+    def total_load(self) -> int:
+        return len(self.assignments)
+    
+    def load(self, node: str) -> int:
+        return len(self.node_keys.get(node, ()))
+    
+    def capacity(self) -> float:
+        """Most keys a node may hold once one more key is assigned"""
+        if self.load_epsilon is None or not self.nodes:
+            return math.inf
+        return math.ceil((1 + self.load_epsilon) * (self.total_load + 1) / len(self.nodes))
+    
+    def assign(self, key: str, position_key: Optional[str] = None) -> Optional[str]:
+        """
+        Place a key on a node (the node it already has, if any) and count it in
+        that node's load. ``position_key``, if given, is hashed for the ring
+        position instead of ``key``.
+        """
+        node = self.assignments.get(key)
+        if node is not None or not self.ring:
+            return node
+        
+        capacity = self.capacity()
+        for node in self._nodes_clockwise(self._index(self._hash(position_key or key))):
+            if len(self.node_keys[node]) < capacity:
+                break
         
-        return nodes
+        self.assignments[key] = node
+        self.node_keys[node].add(key)
+        return node
+    
+    def release(self, key: str):
+        """Stop counting a key in its node's load."""
+        node = self.assignments.pop(key, None)
+        if node is not None:
+            self.node_keys[node].discard(key)
 
 
 class ClusterManager:
@@ -633,10 +699,22 @@ class DistributedDataManager:
 
 
 class DistributedTaskManager:
-    """Manages distributed task execution."""
-    
-    def __init__(self, cluster_manager: ClusterManager):
+    """
+    Manages distributed task execution.
+    
+    Tasks go to the active node with the lowest load factor, unless
+    DISTRIBUTED_TASK_LOAD_EPSILON is set: then they are placed on a
+    ConsistentHashRing with bounded loads, keyed by the task's routing key
+    (its id if none is given). Tasks with the same routing key land on the
+    same node while it has capacity, and each node is capped by the number of
+    tasks it is running.
+    """
+    
+    def __init__(self, cluster_manager: ClusterManager, load_epsilon: Optional[float] = None):
         self.cluster_manager = cluster_manager
+        if load_epsilon is None:
+            load_epsilon = getattr(settings, 'DISTRIBUTED_TASK_LOAD_EPSILON', None)
+        self.task_ring = ConsistentHashRing(load_epsilon=load_epsilon) if load_epsilon is not None else None
         self.tasks: Dict[str, DistributedTask] = {}
         self.task_queue = deque()
         self.logger = NotificationLogger()
@@ -658,14 +736,15 @@ class DistributedTaskManager:
             self._task_processor_thread.join(timeout=5)
         self.logger.info("Distributed task manager stopped")
     
-    def submit_task(self, task_type: str, payload: Dict[str, Any]) -> str:
+    def submit_task(self, task_type: str, payload: Dict[str, Any], routing_key: Optional[str] = None) -> str:
         """Submit a task for distributed execution."""
         task_id = str(uuid.uuid4())
         
         task = DistributedTask(
             task_id=task_id,
             task_type=task_type,
-            payload=payload
+            payload=payload,
+            routing_key=routing_key
         )
         
         with self._lock:
@@ -721,8 +800,7 @@ class DistributedTaskManager:
             self.logger.warning(f"No available nodes for task {task.task_id}")
             return
         
-        # Simple load balancing: choose node with lowest load factor
-        best_node = min(available_nodes, key=lambda x: x.load_factor)
+        best_node = self._select_node(task, available_nodes)
         
         task.assigned_node = best_node.node_id
         task.status = "running"
@@ -743,6 +821,24 @@ class DistributedTaskManager:
             task.completed_at = datetime.now()
             
             self.logger.error(f"Task {task.task_id} failed on node {best_node.node_id}: {e}")
+        
+        finally:
+            if self.task_ring is not None:
+                self.task_ring.release(task.task_id)
+    
+    def _select_node(self, task: DistributedTask, available_nodes: List[ClusterNode]) -> ClusterNode:
+        """Pick the node for a task: bounded-load hashing if enabled, else the lowest load factor."""
+        if self.task_ring is None:
+            return min(available_nodes, key=lambda x: x.load_factor)
+        
+        nodes = {node.node_id: node for node in available_nodes}
+        for node_id in self.task_ring.nodes - nodes.keys():
+            self.task_ring.remove_node(node_id)
+        for node_id in nodes.keys() - self.task_ring.nodes:
+            self.task_ring.add_node(node_id)
+        
+        # Placed by routing key, counted per task so tasks sharing a key each add load
+        return nodes[self.task_ring.assign(task.task_id, position_key=task.routing_key)]
     
     def _execute_task_on_node(self, task: DistributedTask, node: ClusterNode) -> Dict[str, Any]:
         """Execute a task on a specific node."""
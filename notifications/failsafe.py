@@ -1,11 +1,13 @@
+import heapq
+import itertools
 import time
 import threading
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import json
-from collections import deque, defaultdict
+from collections import defaultdict
 import uuid
 from supabase_client import supabase
 from .logging_config import notification_logger, LogCategory
@@ -209,9 +211,18 @@ class FailsafeDeliveryManager:
             DeliveryMethod.PUSH: [PushProvider()]
         }
         
-        self.pending_tasks = deque()
-        self.retry_queue = deque()
+        # Heaps of (-priority, created_at, seq, task) and (retry_time, seq, task);
+        # queued_tasks maps the id of every queued task to (task, retry_time)
+        self.pending_tasks = []
+        self.retry_queue = []
+        self.queued_tasks: Dict[str, Tuple[NotificationTask, Optional[datetime]]] = {}
         self.completed_tasks = {}
+        self._sequence = itertools.count()
+        
+        # Workers wait for pending tasks; the retry thread waits for the earliest retry
+        self._queue_lock = threading.Lock()
+        self._task_available = threading.Condition(self._queue_lock)
+        self._retry_changed = threading.Condition(self._queue_lock)
         
         self.is_running = False
         self.worker_threads = []
@@ -254,6 +265,9 @@ class FailsafeDeliveryManager:
     def stop(self):
         """Stop the delivery manager"""
         self.is_running = False
+        with self._queue_lock:
+            self._task_available.notify_all()
+            self._retry_changed.notify_all()
         
         # Wait for threads to finish
         for worker in self.worker_threads:
@@ -295,7 +309,7 @@ class FailsafeDeliveryManager:
             current_status=DeliveryStatus.PENDING
         )
         
-        self.pending_tasks.append(task)
+        self._enqueue(task)
         self.stats['total_tasks'] += 1
         
         # Store task in database
@@ -324,11 +338,9 @@ class FailsafeDeliveryManager:
         """Main worker loop for processing notifications"""
         while self.is_running:
             try:
-                task = self._get_next_task()
+                task = self._get_next_task(timeout=1.0)
                 if task:
                     self._process_task(task, worker_name)
-                else:
-                    time.sleep(1)  # No tasks available, wait
             except Exception as e:
                 notification_logger.error(
                     LogCategory.SYSTEM,
@@ -339,27 +351,25 @@ class FailsafeDeliveryManager:
                 time.sleep(5)  # Wait before retrying
     
     def _retry_loop(self):
-        """Loop for processing retry queue"""
+        """Move retries to the pending heap as they fall due"""
         while self.is_running:
             try:
-                current_time = datetime.now()
-                tasks_to_retry = []
-                
-                # Check retry queue for tasks ready to retry
-                while self.retry_queue:
-                    task, retry_time = self.retry_queue.popleft()
-                    if current_time >= retry_time:
-                        tasks_to_retry.append(task)
-                    else:
-                        # Put it back, it's not time yet
-                        self.retry_queue.appendleft((task, retry_time))
-                        break
-                
-                # Add retry tasks back to pending queue
-                for task in tasks_to_retry:
-                    self.pending_tasks.append(task)
-                
-                time.sleep(10)  # Check every 10 seconds
+                with self._retry_changed:
+                    current_time = datetime.now()
+                    due = 0
+                    while self.retry_queue and self.retry_queue[0][0] <= current_time:
+                        _, _, task = heapq.heappop(self.retry_queue)
+                        self._push_pending(task)
+                        due += 1
+                    if due:
+                        self._task_available.notify(due)
+                    
+                    # Sleep until the earliest retry, or until an earlier one is scheduled
+                    timeout = None
+                    if self.retry_queue:
+                        timeout = (self.retry_queue[0][0] - current_time).total_seconds()
+                    if self.is_running:
+                        self._retry_changed.wait(timeout)
                 
             except Exception as e:
                 notification_logger.error(
@@ -370,19 +380,29 @@ class FailsafeDeliveryManager:
                 )
                 time.sleep(30)
     
-    def _get_next_task(self) -> Optional[NotificationTask]:
-        """Get the next task to process (priority-based)"""
-        if not self.pending_tasks:
-            return None
-        
-        # Sort by priority (higher priority first) and creation time
-        sorted_tasks = sorted(self.pending_tasks, 
-                            key=lambda t: (-t.priority, t.created_at))
-        
-        # Remove and return the highest priority task
-        task = sorted_tasks[0]
-        self.pending_tasks.remove(task)
-        return task
+    def _push_pending(self, task: NotificationTask):
+        """Push a task on the pending heap; the caller holds the queue lock"""
+        heapq.heappush(self.pending_tasks, (-task.priority, task.created_at, next(self._sequence), task))
+        self.queued_tasks[task.id] = (task, None)
+    
+    def _enqueue(self, task: NotificationTask):
+        """Queue a task for delivery and wake a worker"""
+        with self._task_available:
+            self._push_pending(task)
+            self._task_available.notify()
+    
+    def _get_next_task(self, timeout: float = None) -> Optional[NotificationTask]:
+        """Get the next task to process (priority-based), waiting up to ``timeout`` seconds"""
+        with self._task_available:
+            if not self.pending_tasks and timeout:
+                self._task_available.wait(timeout)
+            if not self.pending_tasks:
+                return None
+            
+            # Highest priority first, then oldest
+            task = heapq.heappop(self.pending_tasks)[-1]
+            self.queued_tasks.pop(task.id, None)
+            return task
     
     def _process_task(self, task: NotificationTask, worker_name: str):
         """Process a notification task"""
@@ -621,9 +641,14 @@ class FailsafeDeliveryManager:
             retry_delay = task.retry_intervals[-1]  # Use last interval
         
         retry_time = datetime.now() + timedelta(seconds=retry_delay)
-        self.retry_queue.append((task, retry_time))
-        
         task.current_status = DeliveryStatus.RETRY
+        with self._retry_changed:
+            entry = (retry_time, next(self._sequence), task)
+            heapq.heappush(self.retry_queue, entry)
+            self.queued_tasks[task.id] = (task, retry_time)
+            if self.retry_queue[0] is entry:
+                self._retry_changed.notify()
+        
         self.stats['retry_attempts'] += 1
         
         notification_logger.info(
@@ -689,17 +714,14 @@ class FailsafeDeliveryManager:
         if task_id in self.completed_tasks:
             return self.completed_tasks[task_id].to_dict()
         
-        # Check pending tasks
-        for task in self.pending_tasks:
-            if task.id == task_id:
-                return task.to_dict()
-        
-        # Check retry queue
-        for task, retry_time in self.retry_queue:
-            if task.id == task_id:
-                task_dict = task.to_dict()
+        # Check pending tasks and the retry queue
+        queued = self.queued_tasks.get(task_id)
+        if queued:
+            task, retry_time = queued
+            task_dict = task.to_dict()
+            if retry_time:
                 task_dict['retry_time'] = retry_time.isoformat()
-                return task_dict
+            return task_dict
         
         # Check database
         try:
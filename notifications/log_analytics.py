@@ -0,0 +1,231 @@
+"""
+Log analytics from hourly rollups.
+
+LogRollup holds one row per hour, level, category, component, HTTP status
+code and response-time bucket, with a count, the summed response time and the
+most recent message. The refresh_log_rollups task rebuilds the recent hours
+from system_logs every 5 minutes (the log writer thread never touches the
+rollups), so summaries lag the logs by up to 5 minutes; the grouping runs in
+the database, so a refresh transfers one row per group, not per log. The
+backfill_log_rollups management command rebuilds older hours, e.g. after
+deploying the rollup table.
+Summaries are aggregated over the rollup rows, so their cost depends on how
+many distinct groups there are in the window, not on how many logs were
+written, and summaries never scan system_logs.
+
+Windows are whole hours: a 24-hour summary covers the current hour and the 24
+before it. Response-time percentiles are estimated from the histogram by
+linear interpolation within a bucket, so they are exact to the bucket bounds
+in LATENCY_BUCKETS_MS.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, F, FloatField, IntegerField, Max, Q, Sum, Value, When
+)
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, TruncHour
+from django.db.models.lookups import LessThanOrEqual
+from django.utils import timezone
+
+from .models import LogRollup, SystemLog
+
+# Upper bounds (inclusive) of the response-time buckets; one more bucket holds slower requests
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+NO_LATENCY = -1
+PERCENTILES = (50, 90, 95, 99)
+ROLLUP_FIELDS = ('bucket', 'level', 'category', 'component', 'status_code', 'latency_bucket')
+ROLLUP_KEY = tuple(f'rollup_{field}' for field in ROLLUP_FIELDS)
+
+# Metadata values that parse as numbers; anything else counts as missing
+_INTEGER = r'^-?[0-9]+$'
+_HAS_LATENCY = Q(metadata__response_time_ms__regex=r'^-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?$')
+_RESPONSE_TIME = Cast(KT('metadata__response_time_ms'), FloatField())
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _with_rollup_key(logs):
+    """``logs`` annotated with the ROLLUP_KEY of each row, computed in SQL."""
+    return logs.annotate(
+        rollup_bucket=TruncHour('timestamp', tzinfo=dt_timezone.utc),
+        rollup_level=F('level'),
+        rollup_category=Case(When(category='', then=Value('system')), default=F('category')),
+        rollup_component=Case(When(component='', then=Value('unknown')), default=F('component')),
+        rollup_status_code=Case(
+            When(metadata__status_code__regex=_INTEGER,
+                 then=Cast(KT('metadata__status_code'), IntegerField())),
+            default=Value(0),
+        ),
+        # Nested so the cast only runs on numbers; a missing key makes the test NULL, not false
+        rollup_latency_bucket=Case(
+            When(_HAS_LATENCY, then=Case(
+                *[When(LessThanOrEqual(_RESPONSE_TIME, bound), then=Value(index))
+                  for index, bound in enumerate(LATENCY_BUCKETS_MS)],
+                default=Value(len(LATENCY_BUCKETS_MS)),
+            )),
+            default=Value(NO_LATENCY),
+        ),
+    )
+
+
+def refresh_rollups(start: datetime, end: Optional[datetime] = None) -> int:
+    """
+    Rebuild the rollups for the hour buckets from ``start`` on from system_logs.
+
+    The logs are grouped in SQL, so one row per rollup group leaves the
+    database (plus the newest message of each group), and the rollups are
+    replaced with one bulk insert. Running it again over the same window is
+    harmless. Returns the number of log rows rolled up.
+    """
+    start = hour_bucket(start)
+    logs = SystemLog.objects.filter(timestamp__gte=start)
+    rollups = LogRollup.objects.filter(bucket__gte=start)
+    if end is not None:
+        end = hour_bucket(end)
+        logs = logs.filter(timestamp__lt=end)
+        rollups = rollups.filter(bucket__lt=end)
+
+    grouped = _with_rollup_key(logs).values(*ROLLUP_KEY).annotate(
+        rollup_count=Count('id'),
+        rollup_latency_sum=Sum(Case(When(_HAS_LATENCY, then=_RESPONSE_TIME), default=Value(0.0))),
+        rollup_last_seen=Max('timestamp'),
+    ).order_by()
+    groups = {}
+    for group in grouped:
+        key = tuple(group[name] for name in ROLLUP_KEY)
+        groups[key] = LogRollup(
+            **dict(zip(ROLLUP_FIELDS, key)), count=group['rollup_count'],
+            latency_sum_ms=group['rollup_latency_sum'] or 0.0, last_seen=group['rollup_last_seen'],
+        )
+
+    if groups:
+        # Newest message per group: the (group, last_seen) pairs are known, so
+        # only the logs at those timestamps are read
+        newest = _with_rollup_key(
+            logs.filter(timestamp__in={rollup.last_seen for rollup in groups.values()})
+        ).values(*ROLLUP_KEY, 'timestamp', 'message')
+        for row in newest:
+            rollup = groups.get(tuple(row[name] for name in ROLLUP_KEY))
+            if rollup is not None and rollup.last_seen == row['timestamp']:
+                rollup.last_message = row['message']
+
+    with transaction.atomic():
+        rollups.delete()
+        LogRollup.objects.bulk_create(groups.values(), batch_size=1000)
+    return sum(rollup.count for rollup in groups.values())
+
+
+def window_start(hours: int, now: Optional[datetime] = None) -> datetime:
+    return hour_bucket((now or timezone.now()) - timedelta(hours=hours))
+
+
+def error_summary(hours: int = 24, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Error counts and the latest error per component and category"""
+    rollups = (
+        LogRollup.objects.filter(level='ERROR', bucket__gte=window_start(hours, now))
+        .values('component', 'category')
+        .annotate(total=Sum('count'), latest_at=Max('last_seen'))
+    )
+    breakdown = {}
+    latest = {}
+    for group in rollups:
+        key = f"{group['component']}:{group['category']}"
+        breakdown[key] = {
+            'count': group['total'],
+            'latest_error': None,
+            'component': group['component'],
+            'category': group['category'],
+        }
+        latest[(group['component'], group['category'])] = group['latest_at']
+
+    if latest:
+        # Message of the newest error per group; the (group, last_seen) pairs are
+        # known, so only the matching rollup rows are read
+        newest = LogRollup.objects.filter(
+            level='ERROR', bucket__gte=window_start(hours, now), last_seen__in=set(latest.values())
+        ).values_list('component', 'category', 'last_seen', 'last_message')
+        for component, category, last_seen, message in newest:
+            if latest.get((component, category)) == last_seen:
+                breakdown[f"{component}:{category}"]['latest_error'] = {
+                    'timestamp': last_seen.isoformat(),
+                    'message': message,
+                }
+
+    return {
+        'total_errors': sum(item['count'] for item in breakdown.values()),
+        'error_breakdown': breakdown,
+        'time_range_hours': hours,
+    }
+
+
+def percentiles(histogram: Dict[int, int], points=PERCENTILES) -> Dict[str, float]:
+    """Percentile estimates (ms) from a latency bucket -> count histogram"""
+    total = sum(histogram.values())
+    if not total:
+        return {f'p{point}': 0 for point in points}
+
+    results = {}
+    for point in points:
+        target = total * point / 100
+        seen = 0
+        for bucket in sorted(histogram):
+            count = histogram[bucket]
+            if seen + count >= target:
+                lower = LATENCY_BUCKETS_MS[bucket - 1] if bucket > 0 else 0
+                if bucket >= len(LATENCY_BUCKETS_MS):
+                    value = lower  # Open-ended bucket: report its lower bound
+                else:
+                    upper = LATENCY_BUCKETS_MS[bucket]
+                    value = lower + (upper - lower) * (target - seen) / count
+                results[f'p{point}'] = round(value, 2)
+                break
+            seen += count
+    return results
+
+
+def api_performance(hours: int = 24, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Request count, status code distribution and response-time statistics for API logs"""
+    rollups = (
+        LogRollup.objects.filter(category='api', bucket__gte=window_start(hours, now))
+        .values('status_code', 'latency_bucket')
+        .annotate(total=Sum('count'), latency_sum=Sum('latency_sum_ms'))
+    )
+    total_requests = 0
+    status_codes = defaultdict(int)
+    histogram = defaultdict(int)
+    latency_sum = 0.0
+    for group in rollups:
+        total_requests += group['total']
+        if group['status_code']:
+            status_codes[group['status_code']] += group['total']
+        if group['latency_bucket'] != NO_LATENCY:
+            histogram[group['latency_bucket']] += group['total']
+            latency_sum += group['latency_sum']
+
+    timed = sum(histogram.values())
+    return {
+        'api_metrics': {
+            'total_requests': total_requests,
+            'average_response_time_ms': latency_sum / timed if timed else 0,
+            'response_time_percentiles_ms': percentiles(histogram),
+            'status_code_distribution': dict(status_codes),
+        },
+        'time_range_hours': hours,
+    }
+
+
+def component_counts(hours: int = 24, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Log counts per level, category and component"""
+    return list(
+        LogRollup.objects.filter(bucket__gte=window_start(hours, now))
+        .values('level', 'category', 'component')
+        .annotate(count=Sum('count'))
+        .order_by('-count')
+    )
@@ -1,8 +1,14 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import random
+import sys
+import threading
+import time
+from collections import deque
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import json
 from enum import Enum
 from dataclasses import dataclass, asdict
@@ -49,19 +55,111 @@ class LogEntry:
         data['category'] = self.category.value
         return data
 
-class DatabaseLogHandler(logging.Handler):
-    """Custom log handler that stores logs in Supabase"""
+class SupabaseLogSink:
+    """Writes log rows to a Supabase table with one insert per batch"""
     
     def __init__(self, table_name: str = 'system_logs'):
+        self.table_name = table_name
+    
+    def write(self, rows: List[Dict[str, Any]]):
+        result = supabase.table(self.table_name).insert(rows).execute()
+        if not result.data:
+            raise RuntimeError(f"Supabase insert into {self.table_name} returned no data")
+    
+    def is_ready(self) -> bool:
+        return True
+
+
+class DjangoLogSink:
+    """Writes log rows to the SystemLog table with one bulk insert per batch"""
+    
+    def __init__(self):
+        self._table_exists = False
+    
+    def write(self, rows: List[Dict[str, Any]]):
+        from django.db import connection
+        from .models import SystemLog
+        
+        # Runs on the writer thread, outside any request cycle
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+        SystemLog.objects.bulk_create([SystemLog(**row) for row in _with_aware_timestamps(rows)])
+    
+    def is_ready(self) -> bool:
+        """False until migrations have created the SystemLog table"""
+        if not self._table_exists:
+            from django.db import connection
+            from .models import SystemLog
+            self._table_exists = SystemLog._meta.db_table in connection.introspection.table_names()
+        return self._table_exists
+
+
+def _with_aware_timestamps(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    from django.utils import timezone
+    return [
+        dict(row, timestamp=timezone.make_aware(datetime.fromisoformat(row['timestamp'])))
+        for row in rows
+    ]
+
+
+def get_log_sink(target: Optional[str] = None, table_name: str = 'system_logs'):
+    """Sink for LOG_DATABASE_TARGET: 'supabase' (default) or 'django'"""
+    target = target or os.getenv('LOG_DATABASE_TARGET', 'supabase')
+    if target == 'django':
+        return DjangoLogSink()
+    return SupabaseLogSink(table_name)
+
+
+class DatabaseLogHandler(logging.Handler):
+    """
+    Asynchronous, batched log handler for the database.
+    
+    Rollups for LogAnalyzer are not computed here; the refresh_log_rollups
+    task rebuilds them from system_logs.
+    
+    Works like a QueueHandler/QueueListener pair: ``emit`` only turns the
+    record into a row and appends it to a bounded deque (appends and pops are
+    atomic, so no lock is taken on the logging thread), and a background
+    thread writes rows to the sink in batches of ``batch_size`` or every
+    ``flush_interval`` seconds, whichever comes first.
+    
+    When the queue is full the oldest rows are dropped, or, with
+    ``spill_path`` set, new rows are appended to an NDJSON file that is
+    replayed once the sink catches up. A failed batch is retried with jittered
+    exponential backoff, up to ``max_retries`` times, and then spilled or
+    dropped, so a database outage never grows memory without bound.
+    """
+    
+    def __init__(self, table_name: str = 'system_logs', sink=None, batch_size: int = 100,
+                 flush_interval: float = 2.0, max_queue_size: int = 10000,
+                 spill_path: Optional[str] = None, max_spill_bytes: int = 50 * 1024 * 1024,
+                 max_retries: int = 5, retry_base_delay: float = 0.5, retry_max_delay: float = 30.0,
+                 autostart: bool = True):
         super().__init__()
         self.table_name = table_name
-        self.batch_size = 10
-        self.log_batch = []
+        self.sink = sink or get_log_sink(table_name=table_name)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.spill_path = spill_path
+        self.max_spill_bytes = max_spill_bytes
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.autostart = autostart
+        
+        self.queue = deque(maxlen=max_queue_size)
+        self.stats = {'written': 0, 'dropped': 0, 'spilled': 0, 'retries': 0, 'failed_batches': 0}
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
     
     def emit(self, record):
-        """Emit a log record to the database"""
+        """Queue a log record for the background writer; never blocks on the database"""
         try:
-            # Extract structured data from record
             log_data = {
                 'timestamp': datetime.fromtimestamp(record.created).isoformat(),
                 'level': record.levelname,
@@ -79,35 +177,139 @@ class DatabaseLogHandler(logging.Handler):
                 'line_number': record.lineno
             }
             
-            # Add to batch
-            self.log_batch.append(log_data)
+            if len(self.queue) >= self.max_queue_size:
+                if self.spill_path and self._spill([log_data]):
+                    return
+                self.stats['dropped'] += 1  # deque(maxlen) discards the oldest row
+            self.queue.append(log_data)
             
-            # Flush batch if it reaches batch size
-            if len(self.log_batch) >= self.batch_size:
-                self.flush_batch()
-                
-        except Exception as e:
-            # Fallback to console logging if database logging fails
-            print(f"Failed to log to database: {e}")
-            print(f"Original log: {record.getMessage()}")
+            if len(self.queue) >= self.batch_size:
+                self._wakeup.set()
+            self._ensure_started()
+        except Exception:
+            self.handleError(record)
     
     def flush_batch(self):
-        """Flush the current batch to database"""
-        if not self.log_batch:
-            return
-            
-        try:
-            result = supabase.table(self.table_name).insert(self.log_batch).execute()
-            if result.data:
-                self.log_batch.clear()
-        except Exception as e:
-            print(f"Failed to flush log batch to database: {e}")
-            # Keep the batch for retry
+        """Write everything queued so far (and any spilled rows) to the sink."""
+        with self._flush_lock:
+            while self.queue:
+                batch = []
+                while self.queue and len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.popleft())
+                    except IndexError:
+                        break
+                if batch and not self._write_with_retry(batch):
+                    return
+            self._replay_spill()
     
-    def close(self):
-        """Close handler and flush remaining logs"""
+    def flush(self):
         self.flush_batch()
+    
+    def close(self):
+        """Stop the writer and flush remaining logs"""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval + 5)
+        try:
+            # A handler that was never started (tests, management commands run
+            # before migrate) leaves its queue unwritten
+            if self.autostart and self._sink_ready():
+                self.flush_batch()
+        except Exception as e:
+            sys.stderr.write(f"Failed to flush log batch to database: {e}\n")
         super().close()
+    
+    def _write_with_retry(self, batch) -> bool:
+        """Write a batch, retrying with jittered backoff; spill or drop it after max_retries."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sink.write(batch)
+                self.stats['written'] += len(batch)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries or self._stopping.is_set():
+                    sys.stderr.write(f"Failed to flush log batch to database: {e}\n")
+                    break
+                self.stats['retries'] += 1
+                delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt)
+                time.sleep(random.uniform(0, delay))
+        
+        self.stats['failed_batches'] += 1
+        if not (self.spill_path and self._spill(batch)):
+            self.stats['dropped'] += len(batch)
+        return False
+    
+    def _spill(self, rows) -> bool:
+        """Append rows to the spill file; False if it is full or cannot be written."""
+        try:
+            with self._spill_lock:
+                if os.path.exists(self.spill_path) and os.path.getsize(self.spill_path) >= self.max_spill_bytes:
+                    return False
+                with open(self.spill_path, 'a') as spill:
+                    for row in rows:
+                        spill.write(json.dumps(row, default=str) + '\n')
+            self.stats['spilled'] += len(rows)
+            return True
+        except OSError as e:
+            sys.stderr.write(f"Failed to spill logs to {self.spill_path}: {e}\n")
+            return False
+    
+    def _replay_spill(self):
+        """Write spilled rows back through the sink once the queue has drained."""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        draining = f"{self.spill_path}.draining"
+        with self._spill_lock:
+            if not os.path.exists(draining):
+                os.replace(self.spill_path, draining)
+        
+        with open(draining) as spill:
+            rows = [json.loads(line) for line in spill if line.strip()]
+        os.remove(draining)
+        
+        for start in range(0, len(rows), self.batch_size):
+            if not self._write_with_retry(rows[start:start + self.batch_size]):
+                # The failed batch was spilled again; keep the rest for the next attempt
+                self._spill(rows[start + self.batch_size:])
+                return
+    
+    def _sink_ready(self) -> bool:
+        return getattr(self.sink, 'is_ready', lambda: True)()
+    
+    def _ensure_started(self):
+        if not self.autostart or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-log-writer', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                # Rows stay queued (bounded) until the sink's table exists
+                if self._sink_ready():
+                    self.flush_batch()
+            except Exception as e:
+                sys.stderr.write(f"Database log writer error: {e}\n")
+
+_database_handlers: List[DatabaseLogHandler] = []
+_database_logging_started = False
+
+
+def start_database_logging():
+    """Start the writer threads of the NotificationLogger database handlers."""
+    global _database_logging_started
+    _database_logging_started = True
+    for handler in _database_handlers:
+        handler.autostart = True
+        handler._ensure_started()
+
 
 class NotificationLogger:
     """Centralized logger for the notification system"""
@@ -163,11 +365,15 @@ class NotificationLogger:
         error_handler.setFormatter(detailed_formatter)
         self.logger.addHandler(error_handler)
         
-        # Database handler
+        # Database handler (writes from a background thread)
         try:
-            db_handler = DatabaseLogHandler()
+            # Records are only queued until start_database_logging() runs from AppConfig.ready()
+            db_handler = DatabaseLogHandler(spill_path=os.path.join(log_dir, 'db_log_spill.ndjson'),
+                                            autostart=_database_logging_started)
             db_handler.setLevel(logging.INFO)
             self.logger.addHandler(db_handler)
+            _database_handlers.append(db_handler)
+            atexit.register(db_handler.close)
         except Exception as e:
             self.logger.warning(f"Failed to setup database logging: {e}")
     
@@ -311,7 +517,7 @@ class NotificationLogger:
         )
 
 class LogAnalyzer:
-    """Analyze logs for patterns and issues"""
+    """Analyze logs for patterns and issues, from the hourly rollups in log_analytics"""
     
     def __init__(self, logger: NotificationLogger):
         self.logger = logger
@@ -319,39 +525,8 @@ class LogAnalyzer:
     def get_error_summary(self, hours: int = 24) -> Dict[str, Any]:
         """Get error summary for the last N hours"""
         try:
-            from_time = datetime.now() - timedelta(hours=hours)
-            
-            result = supabase.table('system_logs').select('*').gte(
-                'timestamp', from_time.isoformat()
-            ).eq('level', 'ERROR').execute()
-            
-            errors = result.data if result.data else []
-            
-            # Group errors by component and category
-            error_summary = {}
-            for error in errors:
-                component = error.get('component', 'unknown')
-                category = error.get('category', 'unknown')
-                key = f"{component}:{category}"
-                
-                if key not in error_summary:
-                    error_summary[key] = {
-                        'count': 0,
-                        'latest_error': None,
-                        'component': component,
-                        'category': category
-                    }
-                
-                error_summary[key]['count'] += 1
-                if not error_summary[key]['latest_error'] or \
-                   error['timestamp'] > error_summary[key]['latest_error']['timestamp']:
-                    error_summary[key]['latest_error'] = error
-            
-            return {
-                'total_errors': len(errors),
-                'error_breakdown': error_summary,
-                'time_range_hours': hours
-            }
+            from .log_analytics import error_summary
+            return error_summary(hours)
             
         except Exception as e:
             self.logger.error(
@@ -364,37 +539,8 @@ class LogAnalyzer:
     def get_performance_metrics(self, hours: int = 24) -> Dict[str, Any]:
         """Get performance metrics from logs"""
         try:
-            from_time = datetime.now() - timedelta(hours=hours)
-            
-            # Get API performance metrics
-            result = supabase.table('system_logs').select('*').gte(
-                'timestamp', from_time.isoformat()
-            ).eq('category', 'api').execute()
-            
-            api_logs = result.data if result.data else []
-            
-            response_times = []
-            status_codes = {}
-            
-            for log in api_logs:
-                metadata = log.get('metadata', {})
-                if 'response_time_ms' in metadata:
-                    response_times.append(metadata['response_time_ms'])
-                
-                status_code = metadata.get('status_code')
-                if status_code:
-                    status_codes[status_code] = status_codes.get(status_code, 0) + 1
-            
-            avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-            
-            return {
-                'api_metrics': {
-                    'total_requests': len(api_logs),
-                    'average_response_time_ms': avg_response_time,
-                    'status_code_distribution': status_codes
-                },
-                'time_range_hours': hours
-            }
+            from .log_analytics import api_performance
+            return api_performance(hours)
             
         except Exception as e:
             self.logger.error(
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notifications.log_analytics import hour_bucket, refresh_rollups, window_start
+
+
+class Command(BaseCommand):
+    help = 'Rebuild log rollups from system_logs for past hours (run once after deploying the rollup table)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=168,
+            help='Number of past hours to rebuild, plus the current one (default: 168)',
+        )
+        parser.add_argument(
+            '--chunk-hours',
+            type=int,
+            default=24,
+            help='Hours rebuilt per transaction (default: 24)',
+        )
+
+    def handle(self, *args, **options):
+        hours = max(1, options['hours'])
+        chunk = timedelta(hours=max(1, options['chunk_hours']))
+        start = window_start(hours)
+        current_hour = hour_bucket(timezone.now())
+
+        self.stdout.write(f"Backfilling log rollups from {start:%Y-%m-%d %H:00}")
+
+        total = 0
+        chunk_start = start
+        while chunk_start <= current_hour:
+            chunk_end = chunk_start + chunk
+            # The last chunk is open-ended so logs written during the backfill are included
+            count = refresh_rollups(chunk_start, chunk_end if chunk_end <= current_hour else None)
+            total += count
+            self.stdout.write(f"  {chunk_start:%Y-%m-%d %H:00}: {count} log rows")
+            chunk_start = chunk_end
+
+        self.stdout.write(self.style.SUCCESS(f"Backfill complete: {total} log rows"))
@@ -0,0 +1,106 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.distributed_architecture import ConsistentHashRing
+
+
+def linear_get_node(ring, key):
+    """Lookup by scanning the sorted positions, as the ring used to, for comparison"""
+    hash_value = ring._hash(key)
+    for ring_key in ring.sorted_keys:
+        if hash_value <= ring_key:
+            return ring.ring[ring_key]
+    return ring.ring[ring.sorted_keys[0]]
+
+
+def moved_keys(before, after):
+    return [key for key in before if before[key] != after[key]]
+
+
+class Command(BaseCommand):
+    help = 'Time ConsistentHashRing lookups and measure key movement when nodes join and leave'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=20, help='Nodes in the ring')
+        parser.add_argument('--replicas', type=int, default=150, help='Virtual nodes per node')
+        parser.add_argument('--keys', type=int, default=100000, help='Keys placed on the ring')
+        parser.add_argument('--epsilon', type=float, default=0.1, help='Load bound for bounded-load mode')
+
+    def handle(self, *args, **options):
+        node_count, keys = options['nodes'], [f'notification:{i}' for i in range(options['keys'])]
+        ring = ConsistentHashRing(replicas=options['replicas'])
+        nodes = [f'node-{i}' for i in range(node_count)]
+
+        started = time.perf_counter()
+        for node in nodes:
+            ring.add_node(node)
+        self.stdout.write(f'Built a ring of {len(ring.sorted_keys)} positions in '
+                          f'{(time.perf_counter() - started) * 1000:.1f} ms')
+        self.time_lookups(ring, keys)
+        self.measure_movement(ring, keys, nodes)
+        self.measure_bounded_load(options, keys, nodes)
+
+    def time_lookups(self, ring, keys):
+        started = time.perf_counter()
+        for key in keys:
+            ring.get_node(key)
+        per_lookup = (time.perf_counter() - started) / len(keys) * 1e6
+        sample = keys[:1000]
+        started = time.perf_counter()
+        for key in sample:
+            linear_get_node(ring, key)
+        linear = (time.perf_counter() - started) / len(sample) * 1e6
+        self.stdout.write(f'get_node: {per_lookup:.2f} us per lookup (linear scan: {linear:.2f} us)')
+
+    def measure_movement(self, ring, keys, nodes):
+        before = {key: ring.get_node(key) for key in keys}
+
+        started = time.perf_counter()
+        ring.add_node('node-new')
+        elapsed = (time.perf_counter() - started) * 1000
+        after = {key: ring.get_node(key) for key in keys}
+        moved = moved_keys(before, after)
+        ideal = 1 / (len(nodes) + 1)
+        misplaced = sum(1 for key in moved if after[key] != 'node-new')
+        self.stdout.write(f'add_node in {elapsed:.2f} ms: {len(moved) / len(keys):.2%} of keys moved '
+                          f'(ideal {ideal:.2%}), {misplaced} moved to an existing node')
+
+        started = time.perf_counter()
+        ring.remove_node(nodes[0])
+        elapsed = (time.perf_counter() - started) * 1000
+        final = {key: ring.get_node(key) for key in keys}
+        moved = moved_keys(after, final)
+        misplaced = sum(1 for key in moved if after[key] != nodes[0])
+        self.stdout.write(f'remove_node in {elapsed:.2f} ms: {len(moved) / len(keys):.2%} of keys moved '
+                          f'(ideal {1 / (len(nodes) + 1):.2%}), {misplaced} moved from a remaining node')
+
+    def measure_bounded_load(self, options, keys, nodes):
+        epsilon = options['epsilon']
+        ring = ConsistentHashRing(replicas=options['replicas'], load_epsilon=epsilon)
+        for node in nodes:
+            ring.add_node(node)
+
+        started = time.perf_counter()
+        for key in keys:
+            ring.assign(key)
+        per_assign = (time.perf_counter() - started) / len(keys) * 1e6
+        average = len(keys) / len(nodes)
+        busiest = max(ring.load(node) for node in nodes)
+        unbounded = ConsistentHashRing(replicas=options['replicas'])
+        for node in nodes:
+            unbounded.add_node(node)
+        for key in keys:
+            unbounded.assign(key)
+        unbounded_busiest = max(unbounded.load(node) for node in nodes)
+        self.stdout.write(f'bounded assign: {per_assign:.2f} us per key, busiest node at '
+                          f'{busiest / average:.3f}x average (bound {1 + epsilon:.2f}x, '
+                          f'unbounded {unbounded_busiest / average:.3f}x)')
+
+        before = dict(ring.assignments)
+        ring.remove_node(nodes[0])
+        moved = moved_keys(before, ring.assignments)
+        average = len(keys) / (len(nodes) - 1)
+        busiest = max(ring.load(node) for node in nodes[1:])
+        self.stdout.write(f'bounded remove_node: {len(moved) / len(keys):.2%} of keys moved '
+                          f'(the removed node held {len(moved)}), busiest node at {busiest / average:.3f}x average')
@@ -0,0 +1,89 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from notifications.log_analytics import api_performance, error_summary, refresh_rollups, window_start
+from notifications.logging_config import DjangoLogSink
+from notifications.models import LogRollup, SystemLog
+
+COMPONENTS = ['api', 'scheduler', 'queue_manager', 'notification_sender', 'database']
+STATUS_CODES = [200, 200, 200, 201, 204, 400, 404, 500]
+
+
+class _Rollback(Exception):
+    pass
+
+
+def synthetic_logs(count, hours=24):
+    """Log rows spread over the last ``hours``, in the shape DatabaseLogHandler writes"""
+    now = timezone.localtime().replace(tzinfo=None)
+    for i in range(count):
+        api = i % 3 != 0
+        yield {
+            'timestamp': (now - timedelta(seconds=random.uniform(0, hours * 3600))).isoformat(),
+            'level': 'ERROR' if i % 20 == 0 else 'INFO',
+            'category': 'api' if api else 'scheduler',
+            'component': random.choice(COMPONENTS),
+            'message': f"Benchmark log {i}",
+            'metadata': {
+                'status_code': random.choice(STATUS_CODES),
+                'response_time_ms': random.lognormvariate(4, 1),
+            } if api else None,
+        }
+
+
+class Command(BaseCommand):
+    help = 'Time LogAnalyzer summaries as log volume grows (data is rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logs', type=int, default=1000, help='Log rows in the smallest run')
+        parser.add_argument('--scale', type=int, default=100, help='Growth factor of the largest run')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per summary')
+
+    def handle(self, *args, **options):
+        sizes = [options['logs'], options['logs'] * options['scale']]
+        sink = DjangoLogSink()
+
+        try:
+            with transaction.atomic():
+                written = 0
+                for size in sizes:
+                    self.stdout.write(f'Writing {size - written} logs...')
+                    batch = []
+                    for row in synthetic_logs(size - written):
+                        batch.append(row)
+                        if len(batch) == 500:
+                            sink.write(batch)
+                            batch = []
+                    if batch:
+                        sink.write(batch)
+                    refresh_rollups(window_start(24))
+                    written = size
+                    self.report(size, options['repeat'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def report(self, size, repeat):
+        self.stdout.write(f'{size:>9} logs  {LogRollup.objects.count()} rollup rows')
+        for name, summary in (('error_summary', error_summary), ('api_performance', api_performance)):
+            with CaptureQueriesContext(connection) as queries:
+                summary(24)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                summary(24)
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            self.stdout.write(f'{size:>9} logs  {name:<16} {elapsed:8.2f} ms  {len(queries)} queries')
+
+        # For comparison: what the analyzer used to do, pulling the window's rows
+        started = time.perf_counter()
+        list(SystemLog.objects.filter(
+            timestamp__gte=timezone.now() - timedelta(hours=24)
+        ).values('component', 'category', 'metadata'))
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(self.style.WARNING(f'{size:>9} logs  {"full window scan":<16} {elapsed:8.2f} ms'))
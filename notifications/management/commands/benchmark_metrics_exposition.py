@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications import metrics_exposition
+from notifications.metrics_exposition import MetricsFileWriter, render_metrics
+from notifications.monitoring import MetricsCollector
+
+
+def write_workers(directory, workers, counters, timers):
+    """Write one metrics file per fake worker process, each with the same series"""
+    for pid in range(workers):
+        collector = MetricsCollector()
+        for i in range(counters):
+            collector.increment_counter(f'counter.{i}')
+        for i in range(timers):
+            collector.record_timer(f'timer.{i}', i)
+        writer = MetricsFileWriter(collector, directory)
+        writer.path = os.path.join(directory, f'metrics_{1000 + pid}.json')
+        writer.write()
+
+
+class Command(BaseCommand):
+    help = 'Time rendering the multiprocess Prometheus exposition, with cold and warm file caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker metric files')
+        parser.add_argument('--counters', type=int, default=1000, help='Counter series per worker')
+        parser.add_argument('--timers', type=int, default=100, help='Timer series per worker')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed renders')
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='metrics_benchmark_')
+        try:
+            write_workers(directory, options['workers'], options['counters'], options['timers'])
+            collector = MetricsCollector()
+
+            metrics_exposition._file_cache.clear()
+            started = time.perf_counter()
+            text = render_metrics(collector, directory)
+            cold = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                render_metrics(collector, directory)
+            warm = (time.perf_counter() - started) / options['repeat'] * 1000
+
+            self.stdout.write(
+                f"{options['workers']} workers, {len(text.splitlines())} lines: "
+                f"{cold:.2f} ms cold, {warm:.2f} ms with the file cache warm"
+            )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            metrics_exposition._file_cache.clear()
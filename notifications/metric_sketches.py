@@ -0,0 +1,223 @@
+"""
+Mergeable quantile sketches for MetricsCollector.
+
+QuantileSketch is a log-bucketed histogram (the DDSketch / HDR histogram
+scheme): a value v > 0 is counted in bucket ceil(log_gamma(v)), with gamma
+chosen so that every quantile is reported within ``relative_accuracy`` of the
+true value. Memory is bounded by ``max_buckets`` per sign; beyond that the
+lowest buckets are collapsed together, which only costs accuracy in the far
+low tail. Two sketches with the same accuracy merge exactly by adding bucket
+counts, so sketches from several threads or worker processes combine into the
+sketch of all their values.
+
+WindowedSketch keeps one QuantileSketch per time slot, keyed by the absolute
+slot number (``int(time / slot_seconds)``), so quantiles cover the whole
+window rather than the last N samples, and windows from different processes
+line up when merged.
+"""
+
+import math
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BUCKETS = 2048
+MIN_INDEXABLE_VALUE = 1e-9
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch with bounded memory"""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                 max_buckets: int = DEFAULT_MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}  # bucket index -> count
+        self.negative = {}  # bucket index of -value -> count
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1):
+        if value > MIN_INDEXABLE_VALUE:
+            self._add_to(self.positive, self._index(value), count)
+        elif value < -MIN_INDEXABLE_VALUE:
+            self._add_to(self.negative, self._index(-value), count)
+        else:
+            self.zero_count += count
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'QuantileSketch'):
+        """Add another sketch's values to this one"""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+            self._collapse(store)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0..1), within relative_accuracy; None if empty"""
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return self._clamp(-self._value(index))
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._clamp(self._value(index))
+        return self.max
+
+    @property
+    def avg(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable state, for merging across processes"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'positive': {str(index): count for index, count in self.positive.items()},
+            'negative': {str(index): count for index, count in self.negative.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuantileSketch':
+        sketch = cls(data['relative_accuracy'], data['max_buckets'])
+        sketch.positive = {int(index): count for index, count in data['positive'].items()}
+        sketch.negative = {int(index): count for index, count in data['negative'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        if sketch.count:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # Midpoint (in relative terms) of (gamma^(index-1), gamma^index]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def _clamp(self, value: float) -> float:
+        return min(max(value, self.min), self.max)
+
+    def _add_to(self, store, index, count):
+        store[index] = store.get(index, 0) + count
+        if len(store) > self.max_buckets:
+            self._collapse(store)
+
+    def _collapse(self, store):
+        """Fold the lowest buckets into one so at most max_buckets remain"""
+        if len(store) <= self.max_buckets:
+            return
+        indexes = sorted(store)
+        excess = len(store) - self.max_buckets
+        target = indexes[excess]
+        store[target] += sum(store.pop(index) for index in indexes[:excess])
+
+
+class WindowedSketch:
+    """QuantileSketch over a sliding window of ``slots`` time slots"""
+
+    def __init__(self, window_seconds: float = 300, slots: int = 10,
+                 relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                 max_buckets: int = DEFAULT_MAX_BUCKETS, clock=time.time):
+        self.window_seconds = window_seconds
+        self.slots = slots
+        self.slot_seconds = window_seconds / slots
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self.sketches = {}  # absolute slot number -> QuantileSketch
+
+    def add(self, value: float):
+        slot = self._current_slot()
+        sketch = self.sketches.get(slot)
+        if sketch is None:
+            self._expire(slot)
+            sketch = self.sketches[slot] = QuantileSketch(self.relative_accuracy, self.max_buckets)
+        sketch.add(value)
+
+    def merge(self, other: 'WindowedSketch'):
+        current = self._current_slot()
+        for slot, sketch in other.sketches.items():
+            if slot <= current - self.slots:
+                continue
+            if slot in self.sketches:
+                self.sketches[slot].merge(sketch)
+            else:
+                copy = QuantileSketch(self.relative_accuracy, self.max_buckets)
+                copy.merge(sketch)
+                self.sketches[slot] = copy
+        self._expire(current)
+
+    def window(self) -> QuantileSketch:
+        """One sketch of every value recorded in the current window"""
+        current = self._current_slot()
+        merged = QuantileSketch(self.relative_accuracy, self.max_buckets)
+        for slot, sketch in self.sketches.items():
+            if slot > current - self.slots:
+                merged.merge(sketch)
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'window_seconds': self.window_seconds,
+            'slots': self.slots,
+            'sketches': {str(slot): sketch.to_dict() for slot, sketch in self.sketches.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], clock=time.time) -> 'WindowedSketch':
+        sketches = {int(slot): QuantileSketch.from_dict(sketch) for slot, sketch in data['sketches'].items()}
+        first = next(iter(sketches.values()), None)
+        windowed = cls(
+            data['window_seconds'], data['slots'],
+            first.relative_accuracy if first else DEFAULT_RELATIVE_ACCURACY,
+            first.max_buckets if first else DEFAULT_MAX_BUCKETS,
+            clock=clock,
+        )
+        windowed.sketches = sketches
+        return windowed
+
+    def _current_slot(self) -> int:
+        return int(self.clock() // self.slot_seconds)
+
+    def _expire(self, current_slot: int):
+        for slot in [slot for slot in self.sketches if slot <= current_slot - self.slots]:
+            del self.sketches[slot]
+
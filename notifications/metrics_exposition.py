@@ -0,0 +1,336 @@
+"""
+Prometheus text exposition of MetricsCollector metrics, across worker processes.
+
+Every gunicorn and Celery worker has its own MetricsCollector. With
+METRICS_MULTIPROC_DIR set, each process runs a MetricsFileWriter that writes
+``collector.export()`` to ``<dir>/metrics_<pid>.json`` (temp file + rename,
+so readers never see a partial file) whenever its metrics changed, at most
+every ``interval`` seconds, and at least every HEARTBEAT_SECONDS. A scrape
+reads every file and combines them:
+
+- counters and histogram buckets, sums and counts are added up;
+- gauges are reported per process, with a ``pid`` label, for processes that
+  have written within STALE_SECONDS.
+
+Metrics recorded with tags are stored per tag combination (see
+``monitoring.series_key``) and exported with the tags as labels.
+
+A file that has not been written for STALE_SECONDS belongs to a process that
+has exited. Its counters and histograms are folded into ``archive.json`` so
+totals never go backwards and the directory does not grow with every
+recycled worker. Like PROMETHEUS_MULTIPROC_DIR, the directory should be
+emptied when the service (re)starts.
+
+Parsed files are cached by modification time, so a scrape only re-reads the
+files that changed since the previous one.
+"""
+
+import atexit
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: dead process files are left in place
+    fcntl = None
+
+MULTIPROC_DIR_ENV = 'METRICS_MULTIPROC_DIR'
+METRIC_PREFIX = 'mediremind_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+HEARTBEAT_SECONDS = 30
+STALE_SECONDS = 300
+ARCHIVE_FILE = 'archive.json'
+FILE_PATTERN = re.compile(r'^metrics_(\d+)\.json$')
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+_names = {}
+_series = {}
+_file_cache = {}  # path -> (mtime_ns, size, data)
+_cache_lock = threading.Lock()
+
+
+def metric_name(name: str) -> str:
+    """Prometheus name for a collector metric ('cache.memory.hits' -> 'mediremind_cache_memory_hits')"""
+    sanitized = _names.get(name)
+    if sanitized is None:
+        sanitized = _names[name] = METRIC_PREFIX + _INVALID_NAME_CHARS.sub('_', name)
+    return sanitized
+
+
+def series(key: str) -> Tuple[str, str]:
+    """
+    Prometheus name and label text of a collector series key
+    ('calendar.sync.lag{provider="google"}' -> ('mediremind_calendar_sync_lag', 'provider="google"'))
+    """
+    parsed = _series.get(key)
+    if parsed is None:
+        name, _, labels = key.partition('{')
+        parsed = _series[key] = (metric_name(name), labels[:-1])
+    return parsed
+
+
+def _labels(*labels: str) -> str:
+    text = ','.join(label for label in labels if label)
+    return f'{{{text}}}' if text else ''
+
+
+def _format(value: float) -> str:
+    if type(value) is int:
+        return str(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsFileWriter:
+    """Background thread that writes one process's metrics to the shared directory"""
+
+    def __init__(self, collector, directory: str, interval: float = 1.0):
+        self.collector = collector
+        self.directory = directory
+        self.interval = interval
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f'metrics_{self.pid}.json')
+        self._last_payload = None
+        self._last_write = 0.0
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-file-writer', daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self.write()
+
+    def write(self):
+        """Write the collector's export if it changed or the heartbeat is due"""
+        payload = json.dumps(self.collector.export(), separators=(',', ':'))
+        now = time.monotonic()
+        if payload == self._last_payload and now - self._last_write < HEARTBEAT_SECONDS:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.metrics_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as temp:
+                temp.write(payload)
+            os.replace(temp_path, self.path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._last_payload = payload
+        self._last_write = now
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                sys.stderr.write(f"Failed to write metrics to {self.directory}: {e}\n")
+
+
+_writer = None
+
+
+def start_metrics_file_writer(collector, directory: Optional[str] = None, interval: float = 1.0):
+    """
+    Write this process's metrics to ``directory`` (default: METRICS_MULTIPROC_DIR).
+
+    A forked child (gunicorn with preload, Celery prefork) starts from empty
+    metrics and gets its own writer and file.
+    """
+    global _writer
+    directory = directory or os.getenv(MULTIPROC_DIR_ENV)
+    if not directory:
+        return None
+    if _writer is not None and _writer.pid == os.getpid():
+        return _writer
+
+    def start():
+        global _writer
+        _writer = MetricsFileWriter(collector, directory, interval)
+        _writer.start()
+
+    def after_fork_in_child():
+        collector.reset()
+        start()
+
+    start()
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=after_fork_in_child)
+    atexit.register(lambda: _writer and _writer.pid == os.getpid() and _writer.stop())
+    return _writer
+
+
+def _empty_state() -> Dict[str, Any]:
+    return {'counters': {}, 'gauges': {}, 'histograms': {}}
+
+
+def _read(path: str, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+    """Parsed file contents, reusing the previous parse if the file is unchanged"""
+    with _cache_lock:
+        cached = _file_cache.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    try:
+        with open(path) as metrics_file:
+            data = json.load(metrics_file)
+    except (OSError, ValueError):
+        return None  # Removed or replaced while reading
+    with _cache_lock:
+        _file_cache[path] = (stat.st_mtime_ns, stat.st_size, data)
+    return data
+
+
+def _add(total: Dict[str, Any], state: Dict[str, Any]):
+    """Add counters and histograms of ``state`` into ``total``"""
+    counters = total['counters']
+    for name, value in state.get('counters', {}).items():
+        counters[name] = counters.get(name, 0) + value
+    histograms = total['histograms']
+    for name, histogram in state.get('histograms', {}).items():
+        merged = histograms.get(name)
+        if merged is None:
+            histograms[name] = {'buckets': list(histogram['buckets']), 'sum': histogram['sum'],
+                                'count': histogram['count']}
+        else:
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], histogram['buckets'])]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+
+
+def _compact(directory: str, stale: List[str]):
+    """Fold the counters and histograms of stale process files into the archive"""
+    if fcntl is None:
+        return
+    with open(os.path.join(directory, '.compact.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        try:
+            with open(archive_path) as archive_file:
+                archive = json.load(archive_file)
+        except (OSError, ValueError):
+            archive = _empty_state()
+        folded = []
+        for path in stale:
+            try:
+                with open(path) as metrics_file:
+                    _add(archive, json.load(metrics_file))
+                folded.append(path)
+            except (OSError, ValueError):
+                continue  # Already folded by another scrape
+        if not folded:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.archive_', suffix='.tmp')
+        with os.fdopen(fd, 'w') as temp:
+            json.dump(archive, temp, separators=(',', ':'))
+        os.replace(temp_path, archive_path)
+        for path in folded:
+            os.remove(path)
+            with _cache_lock:
+                _file_cache.pop(path, None)
+
+
+def collect(directory: str, now: Optional[float] = None) -> Tuple[Dict[str, Any], Dict[str, Dict[str, float]]]:
+    """
+    Combine the metric files in ``directory``.
+
+    Returns (totals, gauges): summed counters and histograms of every process
+    (live, exited and archived), and gauges by name and pid of live processes.
+    """
+    now = now or time.time()
+    totals = _empty_state()
+    gauges = {}
+    stale = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = FILE_PATTERN.match(entry.name)
+            if not match and entry.name != ARCHIVE_FILE:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            data = _read(entry.path, stat)
+            if data is None:
+                continue
+            _add(totals, data)
+            if not match:
+                continue
+            if now - stat.st_mtime > STALE_SECONDS:
+                stale.append(entry.path)
+                continue
+            for name, value in data.get('gauges', {}).items():
+                gauges.setdefault(name, {})[match.group(1)] = value
+
+    if stale:
+        try:
+            _compact(directory, stale)
+        except OSError as e:
+            sys.stderr.write(f"Failed to compact metric files in {directory}: {e}\n")
+    return totals, gauges
+
+
+def render(totals: Dict[str, Any], gauges: Dict[str, Dict[str, float]], bucket_bounds) -> str:
+    """Prometheus text format (version 0.0.4)"""
+    lines = []
+    append = lines.append
+    family = None
+
+    def declare(name, kind):
+        # Series of one family (same name, different labels) share a TYPE line
+        nonlocal family
+        if (name, kind) != family:
+            family = (name, kind)
+            append(f'# TYPE {name} {kind}')
+
+    for key, value in sorted(totals['counters'].items(), key=lambda item: series(item[0])):
+        prometheus_name, labels = series(key)
+        declare(f'{prometheus_name}_total', 'counter')
+        append(f'{prometheus_name}_total{_labels(labels)} {_format(value)}')
+
+    for key, by_pid in sorted(gauges.items(), key=lambda item: series(item[0])):
+        prometheus_name, labels = series(key)
+        declare(prometheus_name, 'gauge')
+        for pid, value in sorted(by_pid.items()):
+            pid_label = f'pid="{pid}"'
+            append(f'{prometheus_name}{_labels(labels, pid_label)} {_format(value)}')
+
+    bounds = [_format(bound) for bound in bucket_bounds] + ['+Inf']
+    for key, histogram in sorted(totals['histograms'].items(), key=lambda item: series(item[0])):
+        prometheus_name, labels = series(key)
+        declare(prometheus_name, 'histogram')
+        for bound, cumulative in zip(bounds, accumulate(histogram['buckets'])):
+            bound_label = f'le="{bound}"'
+            append(f'{prometheus_name}_bucket{_labels(labels, bound_label)} {cumulative}')
+        label_text = _labels(labels)
+        append(f'{prometheus_name}_sum{label_text} {_format(histogram["sum"])}\n'
+               f'{prometheus_name}_count{label_text} {histogram["count"]}')
+
+    append('')
+    return '\n'.join(lines)
+
+
+def render_metrics(collector, directory: Optional[str] = None) -> str:
+    """
+    Exposition text for all worker processes, or for ``collector`` alone when
+    no multiprocess directory is configured
+    """
+    from .monitoring import EXPORT_BUCKETS
+
+    directory = directory or os.getenv(MULTIPROC_DIR_ENV)
+    if directory and os.path.isdir(directory):
+        totals, gauges = collect(directory)
+    else:
+        export = collector.export()
+        totals = export
+        gauges = {name: {str(os.getpid()): value} for name, value in export['gauges'].items()}
+    return render(totals, gauges, EXPORT_BUCKETS)
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:31
+
+from django.db import migrations, models
+import uuid
+
+
+def create_system_logs_table(apps, schema_editor):
+    # Deployments that ran create_system_logs_table.sql already have the table
+    SystemLog = apps.get_model('notifications', 'SystemLog')
+    if SystemLog._meta.db_table not in schema_editor.connection.introspection.table_names():
+        schema_editor.create_model(SystemLog)
+
+
+def drop_system_logs_table(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_rename_notificati_status_fec4b8_idx_notificatio_status_7eed86_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='SystemLog',
+                    fields=[
+                        ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                        ('timestamp', models.DateTimeField()),
+                        ('level', models.CharField(max_length=10)),
+                        ('category', models.CharField(default='system', max_length=30)),
+                        ('component', models.CharField(max_length=100)),
+                        ('message', models.TextField()),
+                        ('user_id', models.CharField(blank=True, max_length=255, null=True)),
+                        ('appointment_id', models.CharField(blank=True, max_length=255, null=True)),
+                        ('task_id', models.CharField(blank=True, max_length=255, null=True)),
+                        ('request_id', models.CharField(blank=True, max_length=255, null=True)),
+                        ('metadata', models.JSONField(blank=True, null=True)),
+                        ('error_details', models.TextField(blank=True, null=True)),
+                        ('module', models.CharField(blank=True, max_length=255)),
+                        ('function', models.CharField(blank=True, max_length=255)),
+                        ('line_number', models.IntegerField(blank=True, null=True)),
+                    ],
+                    options={
+                        'db_table': 'system_logs',
+                        'ordering': ['-timestamp'],
+                        'indexes': [models.Index(fields=['timestamp'], name='system_logs_timesta_84e60c_idx'), models.Index(fields=['level', 'timestamp'], name='system_logs_level_36b166_idx'), models.Index(fields=['category', 'timestamp'], name='system_logs_categor_322359_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_system_logs_table, drop_system_logs_table),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_systemlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the hour')),
+                ('level', models.CharField(max_length=10)),
+                ('category', models.CharField(max_length=30)),
+                ('component', models.CharField(max_length=100)),
+                ('status_code', models.IntegerField(default=0)),
+                ('latency_bucket', models.SmallIntegerField(default=-1)),
+                ('count', models.BigIntegerField(default=0)),
+                ('latency_sum_ms', models.FloatField(default=0.0)),
+                ('last_seen', models.DateTimeField()),
+                ('last_message', models.TextField(blank=True)),
+            ],
+            options={
+                'db_table': 'system_log_rollups',
+                'indexes': [models.Index(fields=['level', 'bucket'], name='system_log__level_a15eb5_idx'), models.Index(fields=['category', 'bucket'], name='system_log__categor_7748fe_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'level', 'category', 'component', 'status_code', 'latency_bucket'), name='log_rollup_unique')],
+            },
+        ),
+    ]
@@ -207,4 +207,81 @@ class SchedulerStats(models.Model):
         ordering = ['-date']
     
     def __str__(self):
-        return f"Stats for {self.date} - {self.total_processed} processed"
\ No newline at end of file
+        return f"Stats for {self.date} - {self.total_processed} processed"
+
+class SystemLog(models.Model):
+    """
+    Structured application log record written by DatabaseLogHandler.
+    
+    Maps the system_logs table from create_system_logs_table.sql.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    timestamp = models.DateTimeField()
+    level = models.CharField(max_length=10)
+    category = models.CharField(max_length=30, default='system')
+    component = models.CharField(max_length=100)
+    message = models.TextField()
+    
+    # Context
+    user_id = models.CharField(max_length=255, null=True, blank=True)
+    appointment_id = models.CharField(max_length=255, null=True, blank=True)
+    task_id = models.CharField(max_length=255, null=True, blank=True)
+    request_id = models.CharField(max_length=255, null=True, blank=True)
+    metadata = models.JSONField(null=True, blank=True)
+    error_details = models.TextField(null=True, blank=True)
+    
+    # Source location
+    module = models.CharField(max_length=255, blank=True)
+    function = models.CharField(max_length=255, blank=True)
+    line_number = models.IntegerField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'system_logs'
+        indexes = [
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['level', 'timestamp']),
+            models.Index(fields=['category', 'timestamp']),
+        ]
+        ordering = ['-timestamp']
+    
+    def __str__(self):
+        return f"{self.timestamp} {self.level} {self.component}: {self.message[:50]}"
+
+
+class LogRollup(models.Model):
+    """
+    Hourly log counts, rebuilt from SystemLog by the refresh_log_rollups task.
+    
+    One row per (hour, level, category, component, status code, response-time
+    bucket); status_code is 0 and latency_bucket -1 when a log has none. Log
+    analytics read these instead of scanning system_logs.
+    """
+    
+    bucket = models.DateTimeField(help_text="Start of the hour")
+    level = models.CharField(max_length=10)
+    category = models.CharField(max_length=30)
+    component = models.CharField(max_length=100)
+    status_code = models.IntegerField(default=0)
+    latency_bucket = models.SmallIntegerField(default=-1)
+    
+    count = models.BigIntegerField(default=0)
+    latency_sum_ms = models.FloatField(default=0.0)
+    last_seen = models.DateTimeField()
+    last_message = models.TextField(blank=True)
+    
+    class Meta:
+        db_table = 'system_log_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bucket', 'level', 'category', 'component', 'status_code', 'latency_bucket'],
+                name='log_rollup_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['level', 'bucket']),
+            models.Index(fields=['category', 'bucket']),
+        ]
+    
+    def __str__(self):
+        return f"{self.bucket} {self.level} {self.category}/{self.component}: {self.count}"
@@ -1,4 +1,7 @@
+import itertools
+import re
 import time
+from bisect import bisect_left
 import psutil
 import threading
 from datetime import datetime, timedelta
@@ -6,9 +9,10 @@ from typing import Dict, Any, List, Optional
 from dataclasses import dataclass, asdict
 from enum import Enum
 import json
-from collections import deque, defaultdict
+from collections import defaultdict
 from supabase_client import supabase
 from .logging_config import notification_logger, LogCategory
+from .metric_sketches import WindowedSketch
 from .tasks import monitor_notification_health
 
 class MetricType(Enum):
@@ -61,101 +65,263 @@ class Alert:
             data['resolved_at'] = self.resolved_at.isoformat()
         return data
 
-class MetricsCollector:
-    """Collects and stores system metrics"""
+SUMMARY_QUANTILES = {'p50': 0.5, 'p95': 0.95, 'p99': 0.99, 'p999': 0.999}
+# Upper bounds of the cumulative histogram buckets exported for scraping
+EXPORT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_INVALID_LABEL_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def series_key(name: str, tags: Dict[str, str] = None) -> str:
+    """
+    Key a metric is stored under: its name, followed by its tags as
+    Prometheus labels ('calendar.sync.lag_seconds{provider="google"}')
+    """
+    if not tags:
+        return name
+    labels = ','.join(
+        '{}="{}"'.format(
+            _INVALID_LABEL_CHARS.sub('_', str(key)),
+            str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        )
+        for key, value in sorted(tags.items())
+    )
+    return f'{name}{{{labels}}}'
+
+class _MetricStripe:
+    """One lock stripe of a MetricsCollector"""
     
-    def __init__(self, max_history: int = 1000):
-        self.metrics_history = deque(maxlen=max_history)
-        self.current_metrics = {}
-        self.counters = defaultdict(float)
-        self.gauges = defaultdict(float)
-        self.histograms = defaultdict(list)
-        self.timers = defaultdict(list)
+    def __init__(self):
         self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.gauges = {}  # name -> (sequence, value)
+        self.latest = {}  # histogram/timer name -> (sequence, last value recorded)
+        self.histograms = {}
+        self.timers = {}
+        self.buckets = {}  # histogram/timer name -> [per-bucket counts, sum, count]
+
+class MetricsCollector:
+    """
+    Collects and stores system metrics
+    
+    Each thread records into one of ``stripes`` lock stripes, so concurrent
+    increments rarely wait on each other; reads merge the stripes (for
+    gauges, the most recently set value wins). ``tags`` become part of the
+    series key, so each tag combination is its own series.
+    Histograms and timers are WindowedSketch quantile sketches, so their
+    percentiles cover every value in the last ``window_seconds`` with bounded
+    memory. ``snapshot`` and ``merge_snapshot`` combine the metrics of several
+    worker processes.
+    """
+    
+    def __init__(self, window_seconds: int = 300, window_slots: int = 10,
+                 relative_accuracy: float = 0.01, stripes: int = 16):
+        self.window_seconds = window_seconds
+        self.window_slots = window_slots
+        self.relative_accuracy = relative_accuracy
+        self._stripes = [_MetricStripe() for _ in range(stripes)]
+        self._stripe_ids = itertools.count()
+        self._sequence = itertools.count()  # orders gauge writes across stripes
+        self._local = threading.local()
+    
+    def _stripe(self) -> _MetricStripe:
+        stripe = getattr(self._local, 'stripe', None)
+        if stripe is None:
+            stripe = self._local.stripe = self._stripes[next(self._stripe_ids) % len(self._stripes)]
+        return stripe
+    
+    def _new_sketch(self) -> WindowedSketch:
+        return WindowedSketch(self.window_seconds, self.window_slots, self.relative_accuracy)
     
     def increment_counter(self, name: str, value: float = 1.0, tags: Dict[str, str] = None):
         """Increment a counter metric"""
-        with self.lock:
-            self.counters[name] += value
-            metric = Metric(name, self.counters[name], MetricType.COUNTER, datetime.now(), tags)
-            self._store_metric(metric)
+        stripe = self._stripe()
+        key = series_key(name, tags)
+        with stripe.lock:
+            stripe.counters[key] += value
     
     def set_gauge(self, name: str, value: float, tags: Dict[str, str] = None):
         """Set a gauge metric"""
-        with self.lock:
-            self.gauges[name] = value
-            metric = Metric(name, value, MetricType.GAUGE, datetime.now(), tags)
-            self._store_metric(metric)
+        stripe = self._stripe()
+        key = series_key(name, tags)
+        with stripe.lock:
+            stripe.gauges[key] = (next(self._sequence), value)
+    
+    record_gauge = set_gauge
     
     def record_histogram(self, name: str, value: float, tags: Dict[str, str] = None):
         """Record a histogram value"""
-        with self.lock:
-            self.histograms[name].append(value)
-            # Keep only last 100 values
-            if len(self.histograms[name]) > 100:
-                self.histograms[name] = self.histograms[name][-100:]
-            
-            metric = Metric(name, value, MetricType.HISTOGRAM, datetime.now(), tags)
-            self._store_metric(metric)
+        self._record('histograms', series_key(name, tags), value)
     
     def record_timer(self, name: str, duration: float, tags: Dict[str, str] = None):
         """Record a timer value (in milliseconds)"""
-        with self.lock:
-            self.timers[name].append(duration)
-            # Keep only last 100 values
-            if len(self.timers[name]) > 100:
-                self.timers[name] = self.timers[name][-100:]
-            
-            metric = Metric(name, duration, MetricType.TIMER, datetime.now(), tags)
-            self._store_metric(metric)
+        self._record('timers', series_key(name, tags), duration)
+    
+    def _record(self, kind: str, name: str, value: float):
+        stripe = self._stripe()
+        sketches = getattr(stripe, kind)
+        with stripe.lock:
+            sketch = sketches.get(name)
+            if sketch is None:
+                sketch = sketches[name] = self._new_sketch()
+            sketch.add(value)
+            totals = stripe.buckets.get(name)
+            if totals is None:
+                totals = stripe.buckets[name] = [[0] * (len(EXPORT_BUCKETS) + 1), 0.0, 0]
+            totals[0][bisect_left(EXPORT_BUCKETS, value)] += 1
+            totals[1] += value
+            totals[2] += 1
+            stripe.latest[name] = (next(self._sequence), value)
+    
+    @property
+    def counters(self) -> Dict[str, float]:
+        totals = defaultdict(float)
+        for stripe in self._stripes:
+            with stripe.lock:
+                for name, value in stripe.counters.items():
+                    totals[name] += value
+        return dict(totals)
+    
+    def _last_written(self, kind: str) -> Dict[str, float]:
+        """Gauges or latest values of all stripes, keeping the most recent write per name"""
+        merged = {}
+        for stripe in self._stripes:
+            with stripe.lock:
+                for name, entry in getattr(stripe, kind).items():
+                    if name not in merged or entry[0] > merged[name][0]:
+                        merged[name] = entry
+        return {name: value for name, (_, value) in merged.items()}
+    
+    @property
+    def gauges(self) -> Dict[str, float]:
+        return self._last_written('gauges')
+    
+    @property
+    def latest(self) -> Dict[str, float]:
+        return self._last_written('latest')
     
-    def _store_metric(self, metric: Metric):
-        """Store metric in history and current metrics"""
-        self.metrics_history.append(metric)
-        self.current_metrics[metric.name] = metric
+    def _merged(self, kind: str) -> Dict[str, WindowedSketch]:
+        """Histograms or timers of all stripes, merged per name"""
+        merged = {}
+        for stripe in self._stripes:
+            with stripe.lock:
+                for name, sketch in getattr(stripe, kind).items():
+                    if name not in merged:
+                        merged[name] = self._new_sketch()
+                    merged[name].merge(sketch)
+        return merged
+    
+    @property
+    def histograms(self) -> Dict[str, WindowedSketch]:
+        return self._merged('histograms')
+    
+    @property
+    def timers(self) -> Dict[str, WindowedSketch]:
+        return self._merged('timers')
+    
+    def _summarize(self, name: str, sketch: WindowedSketch, latest: Dict[str, float] = None) -> Dict[str, Any]:
+        window = sketch.window()
+        summary = {
+            'count': window.count,
+            'window_seconds': self.window_seconds,
+            'latest': latest.get(name) if latest is not None else self.latest.get(name)
+        }
+        if window.count:
+            summary.update({
+                'min': window.min,
+                'max': window.max,
+                'avg': window.avg,
+                **{label: window.quantile(q) for label, q in SUMMARY_QUANTILES.items()}
+            })
+        return summary
     
     def get_metric_summary(self, name: str) -> Dict[str, Any]:
         """Get summary statistics for a metric"""
-        with self.lock:
-            if name in self.histograms and self.histograms[name]:
-                values = self.histograms[name]
-                return {
-                    'count': len(values),
-                    'min': min(values),
-                    'max': max(values),
-                    'avg': sum(values) / len(values),
-                    'latest': values[-1]
-                }
-            elif name in self.timers and self.timers[name]:
-                values = self.timers[name]
-                return {
-                    'count': len(values),
-                    'min': min(values),
-                    'max': max(values),
-                    'avg': sum(values) / len(values),
-                    'latest': values[-1]
-                }
-            elif name in self.gauges:
-                return {
-                    'current': self.gauges[name]
-                }
-            elif name in self.counters:
-                return {
-                    'total': self.counters[name]
-                }
-            else:
-                return {}
+        for sketches in (self.histograms, self.timers):
+            if name in sketches:
+                return self._summarize(name, sketches[name])
+        gauges = self.gauges
+        if name in gauges:
+            return {
+                'current': gauges[name]
+            }
+        counters = self.counters
+        if name in counters:
+            return {
+                'total': counters[name]
+            }
+        return {}
     
     def get_all_metrics(self) -> Dict[str, Any]:
         """Get all current metrics"""
-        with self.lock:
-            return {
-                'counters': dict(self.counters),
-                'gauges': dict(self.gauges),
-                'histograms': {k: self.get_metric_summary(k) for k in self.histograms},
-                'timers': {k: self.get_metric_summary(k) for k in self.timers},
-                'timestamp': datetime.now().isoformat()
-            }
+        latest = self.latest
+        return {
+            'counters': self.counters,
+            'gauges': self.gauges,
+            'histograms': {k: self._summarize(k, v, latest) for k, v in self.histograms.items()},
+            'timers': {k: self._summarize(k, v, latest) for k, v in self.timers.items()},
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable state of this collector, for merging in another process"""
+        return {
+            'counters': self.counters,
+            'gauges': self.gauges,
+            'latest': self.latest,
+            'histograms': {k: v.to_dict() for k, v in self.histograms.items()},
+            'timers': {k: v.to_dict() for k, v in self.timers.items()}
+        }
+    
+    def export(self) -> Dict[str, Any]:
+        """
+        Cumulative state for scraping: counter totals, gauges, and per histogram
+        or timer the count of values in each EXPORT_BUCKETS bucket (plus one for
+        larger values), their sum and their count since the process started
+        """
+        histograms = {}
+        for stripe in self._stripes:
+            with stripe.lock:
+                for name, (buckets, total, count) in stripe.buckets.items():
+                    merged = histograms.setdefault(
+                        name, {'buckets': [0] * (len(EXPORT_BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+                    )
+                    merged['buckets'] = [a + b for a, b in zip(merged['buckets'], buckets)]
+                    merged['sum'] += total
+                    merged['count'] += count
+        return {
+            'counters': self.counters,
+            'gauges': self.gauges,
+            'histograms': histograms
+        }
+    
+    def reset(self):
+        """Forget every metric (used in a forked worker, which starts from zero)"""
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.counters.clear()
+                stripe.gauges.clear()
+                stripe.latest.clear()
+                stripe.histograms.clear()
+                stripe.timers.clear()
+                stripe.buckets.clear()
+    
+    def merge_snapshot(self, snapshot: Dict[str, Any]):
+        """Add another collector's snapshot: counters and sketches add up, gauges are replaced"""
+        stripe = self._stripe()
+        with stripe.lock:
+            for name, value in snapshot.get('counters', {}).items():
+                stripe.counters[name] += value
+            for kind in ('histograms', 'timers'):
+                sketches = getattr(stripe, kind)
+                for name, data in snapshot.get(kind, {}).items():
+                    if name not in sketches:
+                        sketches[name] = self._new_sketch()
+                    sketches[name].merge(WindowedSketch.from_dict(data))
+            for kind in ('gauges', 'latest'):
+                values = getattr(stripe, kind)
+                for name, value in snapshot.get(kind, {}).items():
+                    values[name] = (next(self._sequence), value)
 
 class SystemMonitor:
     """Monitors system resources and health"""
@@ -461,6 +461,26 @@ def collect_queue_stats():
         raise
 
 
+@shared_task
+def refresh_log_rollups(hours=2):
+    """
+    Periodic task that rebuilds the LogAnalyzer rollups for the last ``hours``
+    hours (plus the current one) from system_logs.
+
+    It runs every 5 minutes, so log summaries lag the logs by up to 5
+    minutes. Older hours are only built by the backfill_log_rollups command.
+    """
+    try:
+        from .log_analytics import refresh_rollups, window_start
+        
+        count = refresh_rollups(window_start(hours))
+        logger.info(f"Refreshed log rollups from {count} log rows")
+        return {"log_rows": count}
+    except Exception as e:
+        logger.error(f"Failed to refresh log rollups: {e}")
+        raise
+
+
 @shared_task
 def monitor_notification_health():
     """
@@ -0,0 +1,279 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from notifications.backup_recovery import (
+    BackupConfig, BackupManager, BackupStatus, BackupType, LocalStorageBackend, RecoveryManager,
+    StorageProvider
+)
+from notifications.backup_snapshots import CHUNK_PREFIX, INFLIGHT_PREFIX, MANIFEST_PREFIX, SnapshotStore
+from notifications.backup_stream import BackupFormatError
+
+CHUNK_SIZE = 4096
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_tree(root):
+    tree = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                tree[os.path.relpath(path, root)] = f.read()
+    return tree
+
+
+class SnapshotStoreTestCase(SimpleTestCase):
+    """Test cases for incremental, content-addressed snapshots"""
+
+    def setUp(self):
+        self.repository = tempfile.mkdtemp()
+        self.source = tempfile.mkdtemp()
+        self.restore_root = tempfile.mkdtemp()
+        self.backend = LocalStorageBackend(self.repository)
+        write_file(os.path.join(self.source, 'patients.json'), os.urandom(CHUNK_SIZE * 8))
+        write_file(os.path.join(self.source, 'logs', 'app.log'),
+                   b''.join(b'reminder %d sent\n' % i for i in range(1000)))
+
+    def store(self, passphrase='backup-secret'):
+        return SnapshotStore(self.backend, passphrase=passphrase, chunk_size=CHUNK_SIZE)
+
+    def stored_chunks(self):
+        return len(asyncio.run(self.backend.list_files(CHUNK_PREFIX)))
+
+    def age_chunks(self, seconds=7200):
+        """Backdate the stored chunks past the garbage collection grace period"""
+        for path in asyncio.run(self.backend.list_files(CHUNK_PREFIX)):
+            modified = time.time() - seconds
+            os.utime(os.path.join(self.repository, path), (modified, modified))
+
+    def in_flight_marker(self, snapshot_id, started):
+        path = os.path.join(self.repository, INFLIGHT_PREFIX, f'{int(started * 1e9):020d}-{snapshot_id}')
+        write_file(path, b'')
+        return path
+
+    def test_incremental_snapshot_uploads_only_changes(self):
+        store = self.store()
+        first = asyncio.run(store.create_snapshot(self.source, 'monday'))
+        self.assertEqual(first.files, 2)
+        self.assertEqual(first.reused_chunks, 0)
+        chunks_after_first = self.stored_chunks()
+
+        with open(os.path.join(self.source, 'logs', 'app.log'), 'ab') as f:
+            f.write(b'reminder sent\n')
+        second = asyncio.run(self.store().create_snapshot(self.source, 'tuesday'))
+
+        self.assertEqual(second.unchanged_files, 1)
+        self.assertEqual(second.new_chunks, 1)  # Only the log's last chunk changed
+        self.assertEqual(second.reused_chunks, first.new_chunks - 1)
+        self.assertEqual(self.stored_chunks(), chunks_after_first + 1)
+        self.assertLess(second.uploaded_size, first.uploaded_size / 4)
+        self.assertEqual(asyncio.run(self.backend.list_files(INFLIGHT_PREFIX)), [])
+
+    def test_restore_any_point_in_time(self):
+        store = self.store()
+        original = read_tree(self.source)
+        asyncio.run(store.create_snapshot(self.source, 'monday'))
+        write_file(os.path.join(self.source, 'patients.json'), b'overwritten')
+        write_file(os.path.join(self.source, 'appointments', 'today.json'), b'[]')
+        asyncio.run(store.create_snapshot(self.source, 'tuesday'))
+
+        monday = os.path.join(self.restore_root, 'monday')
+        asyncio.run(self.store().restore_snapshot('monday', monday))
+        self.assertEqual(read_tree(monday), original)
+
+        tuesday = os.path.join(self.restore_root, 'tuesday')
+        restored = asyncio.run(self.store().restore_snapshot('tuesday', tuesday))
+        self.assertEqual(read_tree(tuesday), read_tree(self.source))
+        self.assertEqual(len(restored), 3)
+        self.assertEqual([s['snapshot_id'] for s in asyncio.run(store.list_snapshots())], ['monday', 'tuesday'])
+
+    def test_garbage_collection_keeps_shared_chunks(self):
+        store = self.store()
+        asyncio.run(store.create_snapshot(self.source, 'monday'))
+        write_file(os.path.join(self.source, 'patients.json'), os.urandom(CHUNK_SIZE * 2))
+        asyncio.run(store.create_snapshot(self.source, 'tuesday'))
+        before = self.stored_chunks()
+        self.age_chunks()
+
+        self.assertTrue(asyncio.run(store.delete_snapshot('monday')))
+        stats = asyncio.run(store.collect_garbage())
+
+        self.assertEqual(stats.snapshots, 1)
+        self.assertEqual(stats.deleted_chunks, 8)  # The old patients.json; the log is shared
+        self.assertEqual(self.stored_chunks(), before - 8)
+        target = os.path.join(self.restore_root, 'tuesday')
+        asyncio.run(store.restore_snapshot('tuesday', target))
+        self.assertEqual(read_tree(target), read_tree(self.source))
+
+    def test_new_chunks_are_kept_for_the_grace_period(self):
+        store = self.store()
+        asyncio.run(store.create_snapshot(self.source, 'monday'))
+        write_file(os.path.join(self.source, 'patients.json'), os.urandom(CHUNK_SIZE * 2))
+        asyncio.run(store.create_snapshot(self.source, 'tuesday'))
+        asyncio.run(store.delete_snapshot('monday'))
+
+        stats = asyncio.run(store.collect_garbage())
+        self.assertEqual((stats.deleted_chunks, stats.recent_chunks), (0, 8))
+
+    def test_chunks_newer_than_an_in_flight_snapshot_are_kept(self):
+        store = self.store()
+        asyncio.run(store.create_snapshot(self.source, 'monday'))
+        write_file(os.path.join(self.source, 'patients.json'), os.urandom(CHUNK_SIZE * 2))
+        asyncio.run(store.create_snapshot(self.source, 'tuesday'))
+        asyncio.run(store.delete_snapshot('monday'))
+        self.age_chunks(2 * 3600)
+
+        # Another process started a snapshot three hours ago and has not written its manifest
+        marker = self.in_flight_marker('wednesday', started=time.time() - 3 * 3600)
+        stats = asyncio.run(store.collect_garbage())
+        self.assertEqual((stats.deleted_chunks, stats.recent_chunks), (0, 8))
+
+        # A marker left a day ago by a crashed writer is ignored
+        os.remove(marker)
+        self.in_flight_marker('thursday', started=time.time() - 25 * 3600)
+        self.assertEqual(asyncio.run(store.collect_garbage()).deleted_chunks, 8)
+
+    def test_collection_refuses_to_run_without_manifests(self):
+        store = self.store()
+        asyncio.run(store.create_snapshot(self.source, 'monday'))
+        self.age_chunks()
+        chunks = self.stored_chunks()
+
+        scan_files = self.backend.scan_files
+
+        async def failing_manifest_listing(remote_path):
+            if remote_path == MANIFEST_PREFIX:
+                raise OSError('listing timed out')
+            return await scan_files(remote_path)
+
+        with mock.patch.object(self.backend, 'scan_files', side_effect=failing_manifest_listing):
+            with self.assertRaisesRegex(OSError, 'listing timed out'):
+                asyncio.run(store.collect_garbage())
+        self.assertEqual(self.stored_chunks(), chunks)
+
+        # The manifest is gone, whether deleted or lost: nothing tells the chunks are unreferenced
+        asyncio.run(store.delete_snapshot('monday'))
+        with self.assertRaisesRegex(OSError, 'refusing to collect garbage'):
+            asyncio.run(store.collect_garbage())
+        self.assertEqual(self.stored_chunks(), chunks)
+
+    def test_chunks_collected_by_another_process_are_uploaded_again(self):
+        store = self.store()
+        keep = os.path.join(tempfile.mkdtemp(), 'settings.json')
+        write_file(keep, b'{}')
+        asyncio.run(store.create_snapshot(keep, 'settings'))
+        asyncio.run(store.create_snapshot(self.source, 'monday'))
+        self.age_chunks()
+
+        other = self.store()
+        asyncio.run(other.delete_snapshot('monday'))
+        self.assertEqual(self.stored_chunks() - 1, asyncio.run(other.collect_garbage()).deleted_chunks)
+
+        asyncio.run(store.create_snapshot(self.source, 'tuesday'))
+        self.assertTrue(asyncio.run(store.verify_snapshot('tuesday', download_chunks=True)))
+        target = os.path.join(self.restore_root, 'tuesday')
+        asyncio.run(self.store().restore_snapshot('tuesday', target))
+        self.assertEqual(read_tree(target), read_tree(self.source))
+
+        os.remove(os.path.join(self.repository, asyncio.run(self.backend.list_files(CHUNK_PREFIX))[0]))
+        self.assertFalse(asyncio.run(store.verify_snapshot('tuesday')))
+
+    def test_sqlite_database_snapshot(self):
+        db_path = os.path.join(self.source, 'reminders.db')
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('CREATE TABLE reminders (id INTEGER PRIMARY KEY, body TEXT)')
+            conn.executemany('INSERT INTO reminders (body) VALUES (?)', [('x' * 200,)] * 500)
+        conn.close()
+
+        store = self.store(passphrase=None)
+        asyncio.run(store.create_snapshot(db_path, 'db-1'))
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("UPDATE reminders SET body = 'changed' WHERE id = 1")
+        conn.close()
+        second = asyncio.run(store.create_snapshot(db_path, 'db-2'))
+        self.assertGreater(second.reused_chunks, second.new_chunks)
+
+        target = os.path.join(self.restore_root, 'restored.db')
+        asyncio.run(store.restore_snapshot('db-2', target))
+        with sqlite3.connect(target) as conn:
+            self.assertEqual(conn.execute('SELECT body FROM reminders WHERE id = 1').fetchone(), ('changed',))
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM reminders').fetchone(), (500,))
+        conn.close()
+
+    def test_corrupt_chunk_and_wrong_key_are_rejected(self):
+        asyncio.run(self.store().create_snapshot(self.source, 'monday'))
+        with self.assertRaisesRegex(BackupFormatError, 'Wrong encryption key'):
+            asyncio.run(self.store('wrong').restore_snapshot('monday', self.restore_root))
+        with self.assertRaisesRegex(BackupFormatError, 'no encryption key'):
+            asyncio.run(self.store(None).list_snapshots())
+
+        chunk_path = os.path.join(self.repository, asyncio.run(self.backend.list_files(CHUNK_PREFIX))[0])
+        with open(chunk_path, 'r+b') as f:
+            f.seek(20)
+            byte = f.read(1)
+            f.seek(20)
+            f.write(bytes([byte[0] ^ 1]))
+        store = self.store()
+        self.assertTrue(asyncio.run(store.verify_snapshot('monday')))
+        with self.assertRaisesRegex(BackupFormatError, 'failed authentication'):
+            asyncio.run(store.verify_snapshot('monday', download_chunks=True))
+
+
+class IncrementalBackupManagerTestCase(SimpleTestCase):
+    """Test cases for incremental backups through BackupManager"""
+
+    def setUp(self):
+        self.config = BackupConfig(
+            backup_type=BackupType.INCREMENTAL,
+            storage_provider=StorageProvider.LOCAL,
+            destination_path=tempfile.mkdtemp(),
+            encryption_key='backup-secret',
+        )
+        self.source = tempfile.mkdtemp()
+        write_file(os.path.join(self.source, 'data.json'), b'{"appointments": []}' * 1000)
+
+    def chunk_downloads(self, download_file):
+        return sum(1 for call in download_file.call_args_list if call.args[0].startswith(CHUNK_PREFIX))
+
+    def test_backup_restore_and_retention(self):
+        manager = BackupManager(self.config)
+        backend = manager.storage_backend
+        with mock.patch.object(backend, 'download_file', wraps=backend.download_file) as download_file:
+            first = asyncio.run(manager.create_backup(self.source, 'backup_first'))
+            new_chunks = manager.backup_records[first].metadata['new_chunks']
+            self.assertEqual(self.chunk_downloads(download_file), new_chunks)
+            download_file.reset_mock()
+            second = asyncio.run(manager.create_backup(self.source, 'backup_second'))
+
+            record = manager.backup_records[second]
+            self.assertEqual(record.status, BackupStatus.VERIFIED, record.error_message)
+            self.assertEqual(record.metadata['unchanged_files'], 1)
+            self.assertEqual(record.compressed_size, 0)
+            # Verification downloads only what this backup uploaded
+            self.assertEqual(self.chunk_downloads(download_file), 0)
+
+            self.assertTrue(asyncio.run(manager.verify_incremental_backup(second)))
+            self.assertEqual(self.chunk_downloads(download_file), record.metadata['reused_chunks'])
+
+        # A new process has no backup records but can restore any snapshot
+        recovery = RecoveryManager(BackupManager(self.config))
+        target = tempfile.mkdtemp()
+        recovery_id = asyncio.run(recovery.restore_backup(first, target))
+        self.assertEqual(recovery.recovery_records[recovery_id].status, BackupStatus.COMPLETED)
+        self.assertEqual(read_tree(target), read_tree(self.source))
+
+        self.assertTrue(asyncio.run(manager._delete_backup(first)))
+        self.assertEqual([s['snapshot_id'] for s in asyncio.run(manager.snapshots.list_snapshots())],
+                         ['backup_second'])
+        self.assertGreater(len(asyncio.run(manager.storage_backend.list_files(CHUNK_PREFIX))), 0)
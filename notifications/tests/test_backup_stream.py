@@ -0,0 +1,194 @@
+import asyncio
+import gzip
+import io
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from notifications.backup_recovery import (
+    BackupConfig, BackupManager, BackupRecord, BackupStatus, BackupType, RecoveryManager, StorageProvider
+)
+from notifications.backup_stream import (
+    CODEC_GZIP, CODEC_NONE, HEADER, BackupFormatError, read_backup, verify_backup, write_backup
+)
+
+
+def frame_offsets(container):
+    """Byte offset of every frame payload in a container"""
+    offsets = []
+    position = HEADER.size
+    while position < len(container):
+        length = int.from_bytes(container[position:position + 4], 'big')
+        offsets.append(position + 5)
+        position += 5 + length
+    return offsets
+
+
+class BackupStreamTestCase(SimpleTestCase):
+    """Test cases for the streaming backup container"""
+
+    def setUp(self):
+        self.data = os.urandom(100_000) + b'reminder ' * 50_000
+
+    def round_trip(self, passphrase, codec, workers=4):
+        container = io.BytesIO()
+        written = write_backup(io.BytesIO(self.data), container, passphrase=passphrase,
+                               codec=codec, chunk_size=64 * 1024, workers=workers)
+        restored = io.BytesIO()
+        read = read_backup(io.BytesIO(container.getvalue()), restored, passphrase=passphrase, workers=workers)
+        return container.getvalue(), written, read, restored.getvalue()
+
+    def test_round_trip(self):
+        for passphrase in (None, 'backup-secret'):
+            for codec in (CODEC_NONE, CODEC_GZIP):
+                for workers in (1, 4):
+                    container, written, read, restored = self.round_trip(passphrase, codec, workers)
+                    self.assertEqual(restored, self.data)
+                    self.assertEqual(written.chunks, 9)
+                    self.assertEqual(written.original_size, len(self.data))
+                    self.assertEqual(written.stored_size, len(container))
+                    self.assertEqual(read.chunks, 9)
+                    if codec == CODEC_GZIP:
+                        self.assertLess(len(container), len(self.data) * 0.5)
+                    if passphrase:
+                        self.assertNotIn(b'reminder reminder', container)
+
+    def test_empty_source(self):
+        container = io.BytesIO()
+        stats = write_backup(io.BytesIO(b''), container, passphrase='secret')
+        self.assertEqual(stats.chunks, 1)
+        restored = io.BytesIO()
+        read_backup(io.BytesIO(container.getvalue()), restored, passphrase='secret')
+        self.assertEqual(restored.getvalue(), b'')
+
+    def test_tampered_chunk_is_detected(self):
+        for passphrase in (None, 'backup-secret'):
+            container, _, _, _ = self.round_trip(passphrase, CODEC_GZIP)
+            tampered = bytearray(container)
+            tampered[frame_offsets(container)[3] + 10] ^= 0x01
+            with self.assertRaisesRegex(BackupFormatError, 'Chunk 3'):
+                verify_backup(io.BytesIO(bytes(tampered)), passphrase)
+            with self.assertRaisesRegex(BackupFormatError, 'Chunk 3'):
+                read_backup(io.BytesIO(bytes(tampered)), io.BytesIO(), passphrase)
+
+    def test_truncated_and_reordered_backups_are_rejected(self):
+        container, _, _, _ = self.round_trip('backup-secret', CODEC_GZIP)
+        offsets = frame_offsets(container)
+        with self.assertRaisesRegex(BackupFormatError, 'truncated'):
+            verify_backup(io.BytesIO(container[:offsets[-1] - 5]), 'backup-secret')
+
+        # Swap the first two (equally sized, incompressible) chunks
+        first, second, third = offsets[0] - 5, offsets[1] - 5, offsets[2] - 5
+        swapped = container[:first] + container[second:third] + container[first:second] + container[third:]
+        with self.assertRaisesRegex(BackupFormatError, 'Chunk 0'):
+            verify_backup(io.BytesIO(swapped), 'backup-secret')
+
+    def test_wrong_or_missing_key(self):
+        container, _, _, _ = self.round_trip('backup-secret', CODEC_GZIP)
+        with self.assertRaisesRegex(BackupFormatError, 'Chunk 0 failed authentication'):
+            read_backup(io.BytesIO(container), io.BytesIO(), passphrase='wrong')
+        with self.assertRaisesRegex(BackupFormatError, 'no encryption key'):
+            read_backup(io.BytesIO(container), io.BytesIO())
+        with self.assertRaisesRegex(BackupFormatError, 'Not a backup container'):
+            read_backup(io.BytesIO(b'x' * 64), io.BytesIO())
+
+
+class BackupManagerTestCase(SimpleTestCase):
+    """Test cases for BackupManager and RecoveryManager with local storage"""
+
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.work = tempfile.mkdtemp()
+        self.manager = BackupManager(BackupConfig(
+            backup_type=BackupType.FULL,
+            storage_provider=StorageProvider.LOCAL,
+            destination_path=self.storage,
+            encryption_key='backup-secret',
+        ))
+        self.recovery = RecoveryManager(self.manager)
+
+    def test_file_backup_and_restore(self):
+        source = os.path.join(self.work, 'reminders.json')
+        with open(source, 'wb') as f:
+            f.write(b'{"reminder": "take medication"}\n' * 10_000)
+
+        backup_id = asyncio.run(self.manager.create_backup(source))
+        record = self.manager.backup_records[backup_id]
+        self.assertEqual(record.status, BackupStatus.VERIFIED, record.error_message)
+        self.assertEqual(record.file_size, os.path.getsize(source))
+        self.assertLess(record.compressed_size, record.file_size)
+        self.assertEqual(len(record.checksum), 64)
+
+        target = os.path.join(self.work, 'restored', 'reminders.json')
+        recovery_id = asyncio.run(self.recovery.restore_backup(backup_id, target))
+        self.assertEqual(self.recovery.recovery_records[recovery_id].status, BackupStatus.COMPLETED)
+        with open(source, 'rb') as original, open(target, 'rb') as restored:
+            self.assertEqual(original.read(), restored.read())
+
+    def test_directory_backup_and_restore(self):
+        source = os.path.join(self.work, 'data')
+        os.makedirs(os.path.join(source, 'nested'))
+        for name in ('a.txt', os.path.join('nested', 'b.txt')):
+            with open(os.path.join(source, name), 'w') as f:
+                f.write(name * 100)
+
+        backup_id = asyncio.run(self.manager.create_backup(source))
+        target = os.path.join(self.work, 'restored')
+        recovery_id = asyncio.run(self.recovery.restore_backup(backup_id, target))
+
+        self.assertEqual(self.recovery.recovery_records[recovery_id].status, BackupStatus.COMPLETED)
+        with open(os.path.join(target, 'nested', 'b.txt')) as f:
+            self.assertEqual(f.read(), os.path.join('nested', 'b.txt') * 100)
+
+    def legacy_record(self, data, name):
+        """Store a backup the way releases before the MRBK container wrote it: gzip, then XOR"""
+        key = b'backup-secret'
+        obfuscated = bytes(byte ^ key[i % len(key)] for i, byte in enumerate(gzip.compress(data)))
+        with open(os.path.join(self.storage, name), 'wb') as f:
+            f.write(obfuscated)
+        record = BackupRecord(name, BackupType.FULL, BackupStatus.COMPLETED, '', name)
+        self.manager.backup_records[name] = record
+        return record
+
+    def test_legacy_file_backup_restores(self):
+        data = b'{"reminder": "take medication"}\n' * 1000
+        self.legacy_record(data, 'legacy-file.backup')
+
+        target = os.path.join(self.work, 'restored', 'reminders.json')
+        recovery_id = asyncio.run(self.recovery.restore_backup('legacy-file.backup', target))
+
+        record = self.recovery.recovery_records[recovery_id]
+        self.assertEqual(record.status, BackupStatus.COMPLETED, record.error_message)
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_legacy_directory_backup_restores(self):
+        source = os.path.join(self.work, 'data')
+        os.makedirs(source)
+        with open(os.path.join(source, 'a.txt'), 'w') as f:
+            f.write('appointments')
+        archive = shutil.make_archive(os.path.join(self.work, 'archive'), 'tar', source)
+        with open(archive, 'rb') as f:
+            self.legacy_record(f.read(), 'legacy-dir.backup')
+
+        target = os.path.join(self.work, 'restored-dir')
+        recovery_id = asyncio.run(self.recovery.restore_backup('legacy-dir.backup', target))
+
+        self.assertEqual(self.recovery.recovery_records[recovery_id].status, BackupStatus.COMPLETED)
+        with open(os.path.join(target, 'a.txt')) as f:
+            self.assertEqual(f.read(), 'appointments')
+
+    def test_encryption_requires_a_key(self):
+        self.manager.config.encryption_key = None
+        source = os.path.join(self.work, 'plain.txt')
+        with open(source, 'w') as f:
+            f.write('data')
+        with patch.dict(os.environ):
+            os.environ.pop('BACKUP_ENCRYPTION_KEY', None)
+            backup_id = asyncio.run(self.manager.create_backup(source))
+        record = self.manager.backup_records[backup_id]
+        self.assertEqual(record.status, BackupStatus.FAILED)
+        self.assertEqual(record.error_message, 'Failed to create backup file')
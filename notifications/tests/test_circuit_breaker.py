@@ -0,0 +1,239 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from notifications.circuit_breaker import (
+    ACQUIRE_SCRIPT, RECORD_SCRIPT, CircuitBreaker, CircuitBreakerConfig, CircuitBreakerManager,
+    CircuitBreakerOpenException, CircuitState, LocalCircuitStateStore, RedisCircuitStateStore,
+    SharedCircuitBreaker
+)
+
+
+class CountingStore(LocalCircuitStateStore):
+    """Local store that counts round trips, standing in for Redis"""
+
+    def __init__(self):
+        super().__init__()
+        self.acquires = 0
+        self.records = 0
+
+    def acquire(self, *args, **kwargs):
+        self.acquires += 1
+        return super().acquire(*args, **kwargs)
+
+    def record(self, *args, **kwargs):
+        self.records += 1
+        return super().record(*args, **kwargs)
+
+
+class FakeScript:
+    """Stands in for a registered Redis script, returning a canned reply"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+
+    def __call__(self, keys, args):
+        self.calls.append((keys, args))
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+class FakeRedis:
+    def __init__(self, replies):
+        self.scripts = {source: FakeScript(reply) for source, reply in replies.items()}
+
+    def register_script(self, source):
+        return self.scripts[source]
+
+
+def fail():
+    raise ConnectionError('provider down')
+
+
+def run_concurrently(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    """Test cases for the in-process circuit breaker"""
+
+    def test_calls_are_not_serialized(self):
+        breaker = CircuitBreaker('provider', CircuitBreakerConfig())
+        started = time.perf_counter()
+        run_concurrently([lambda: breaker.call(time.sleep, 0.2)] * 4)
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual(breaker.total_successes, 4)
+
+    def test_half_open_limits_concurrent_trial_calls(self):
+        breaker = CircuitBreaker('provider', CircuitBreakerConfig(
+            failure_threshold=1, success_threshold=2, timeout_seconds=0, half_open_max_calls=1
+        ))
+        with self.assertRaises(ConnectionError):
+            breaker.call(fail)
+        self.assertEqual(breaker.state, CircuitState.OPEN)
+
+        release = threading.Event()
+        probe = threading.Thread(target=breaker.call, args=(release.wait,))
+        probe.start()
+        while breaker.half_open_calls == 0:
+            time.sleep(0.001)
+        with self.assertRaises(CircuitBreakerOpenException):
+            breaker.call(lambda: 'second trial')
+        release.set()
+        probe.join()
+
+        breaker.call(lambda: 'ok')
+        self.assertEqual(breaker.state, CircuitState.CLOSED)
+
+
+class SharedCircuitBreakerTestCase(SimpleTestCase):
+    """Test cases for circuit breaker state shared across workers"""
+
+    def setUp(self):
+        self.store = CountingStore()
+        self.config = CircuitBreakerConfig(failure_threshold=3, success_threshold=2, timeout_seconds=0,
+                                           half_open_max_calls=2)
+
+    def worker(self, snapshot_ttl=0.0, config=None):
+        return SharedCircuitBreaker('sms_service', config or self.config, self.store, snapshot_ttl)
+
+    def test_one_worker_trips_the_circuit_for_all(self):
+        config = CircuitBreakerConfig(failure_threshold=3, timeout_seconds=60)
+        first, second = self.worker(config=config), self.worker(config=config)
+        for worker in (first, second, first):
+            with self.assertRaises(ConnectionError):
+                worker.call(fail)
+
+        calls = []
+        with self.assertRaises(CircuitBreakerOpenException):
+            second.call(calls.append, 'sent')
+        self.assertEqual(calls, [])
+        self.assertEqual(second.state, CircuitState.OPEN)
+        self.assertEqual(self.store.describe('sms_service')['total_failures'], 3)
+
+    def test_snapshot_keeps_store_off_the_hot_path(self):
+        worker = self.worker(snapshot_ttl=60)
+        for i in range(100):
+            worker.call(lambda: 'sent')
+        self.assertEqual(self.store.acquires, 1)
+        self.assertEqual(self.store.records, 1)  # The first success, then batched
+
+        stats = worker.get_statistics()
+        self.assertEqual(stats['shared']['total_calls'], 100)
+        self.assertEqual(worker.window_calls, 100)
+
+        # A failure is reported at once
+        with self.assertRaises(ConnectionError):
+            worker.call(fail)
+        self.assertEqual(self.store.records, 3)
+        self.assertEqual(self.store.describe('sms_service')['failure_count'], 1)
+
+    def test_failure_rate_over_shared_window(self):
+        config = CircuitBreakerConfig(failure_threshold=100, window_size=10, minimum_calls=10,
+                                      failure_rate_threshold=0.5, timeout_seconds=60)
+        workers = [self.worker(config=config) for _ in range(3)]
+        for i in range(20):
+            workers[i % 3].call(lambda: 'sent')
+        for i in range(5):
+            with self.assertRaises(ConnectionError):
+                workers[i % 3].call(fail)
+            if i < 4:
+                workers[(i + 1) % 3].call(lambda: 'sent')
+
+        state = self.store.describe('sms_service')
+        self.assertEqual(state['state'], 'open')
+        self.assertEqual(state['window_failures'], 5)
+        self.assertEqual(len(self.store._circuit('sms_service')['window']), 10)
+
+    def test_half_open_trial_calls_are_limited_cluster_wide(self):
+        workers = [self.worker() for _ in range(4)]
+        workers[0].force_open()
+
+        release = threading.Event()
+        admitted, rejected = [], []
+
+        def trial(worker):
+            try:
+                worker.call(lambda: (admitted.append(worker), release.wait(5)))
+            except CircuitBreakerOpenException:
+                rejected.append(worker)
+
+        threads = [threading.Thread(target=trial, args=(worker,)) for worker in workers[:2]]
+        for thread in threads:
+            thread.start()
+        while len(admitted) < 2:
+            time.sleep(0.001)
+        run_concurrently([lambda worker=worker: trial(worker) for worker in workers[2:]])
+        self.assertEqual(len(rejected), 2)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.store.describe('sms_service')['state'], 'closed')
+        workers[3].call(lambda: 'sent')
+        self.assertEqual(workers[3].state, CircuitState.CLOSED)
+
+    def test_failed_trial_call_reopens(self):
+        worker = self.worker(config=CircuitBreakerConfig(timeout_seconds=0, success_threshold=2))
+        worker.force_open()
+        worker.call(lambda: 'sent')
+        self.assertEqual(worker.state, CircuitState.HALF_OPEN)
+        with self.assertRaises(ConnectionError):
+            worker.call(fail)
+        self.assertEqual(self.store.describe('sms_service')['state'], 'open')
+
+        worker.reset()
+        self.assertEqual(self.store.describe('sms_service')['window_failures'], 0)
+        self.assertEqual(worker.state, CircuitState.CLOSED)
+
+    def test_manager_shares_breakers_through_store(self):
+        manager = CircuitBreakerManager(state_store=self.store)
+        breaker = manager.get_breaker('email_service')
+        self.assertIsInstance(breaker, SharedCircuitBreaker)
+        self.assertIs(breaker.store, self.store)
+        self.assertNotIsInstance(CircuitBreakerManager().get_breaker('email_service'), SharedCircuitBreaker)
+
+
+class RedisCircuitStateStoreTestCase(SimpleTestCase):
+    """Test cases for the Redis-backed breaker state"""
+
+    def test_scripts_use_hash_tagged_keys(self):
+        redis_client = FakeRedis({
+            ACQUIRE_SCRIPT: [0, b'open', 0, 1500, 0],
+            RECORD_SCRIPT: [b'open', b'closed', 5, 10, 6],
+        })
+        store = RedisCircuitStateStore(redis_client)
+        config = CircuitBreakerConfig()
+
+        permit = store.acquire('push_service', config, 'token')
+        self.assertFalse(permit.allowed)
+        self.assertEqual(permit.state, CircuitState.OPEN)
+        self.assertEqual(permit.retry_after_ms, 1500)
+        keys, args = redis_client.scripts[ACQUIRE_SCRIPT].calls[0]
+        self.assertEqual(keys, ['circuit_breaker:{push_service}:state', 'circuit_breaker:{push_service}:probes'])
+        self.assertEqual(args[:2], [60000, 1])
+
+        outcome = store.record('push_service', config, 3, 1)
+        self.assertEqual((outcome.previous_state, outcome.state), (CircuitState.CLOSED, CircuitState.OPEN))
+        self.assertEqual(redis_client.scripts[RECORD_SCRIPT].calls[0][1][:4], [3, 1, '', 100])
+
+    def test_unreachable_redis_falls_back_to_local_state(self):
+        redis_client = FakeRedis({
+            ACQUIRE_SCRIPT: ConnectionError('unreachable'),
+            RECORD_SCRIPT: ConnectionError('unreachable'),
+        })
+        worker = SharedCircuitBreaker('sms_service', CircuitBreakerConfig(failure_threshold=1, timeout_seconds=60),
+                                      RedisCircuitStateStore(redis_client), snapshot_ttl=0)
+        with self.assertRaises(ConnectionError):
+            worker.call(fail)
+        with self.assertRaises(CircuitBreakerOpenException):
+            worker.call(lambda: 'sent')
+        # Redis is not retried until REDIS_RETRY_SECONDS have passed
+        self.assertEqual(len(redis_client.scripts[ACQUIRE_SCRIPT].calls), 1)
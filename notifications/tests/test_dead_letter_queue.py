@@ -0,0 +1,90 @@
+import json
+import uuid
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from notifications.dead_letter_queue import DeadLetterQueue, DeadLetterQueueManager
+from notifications.dead_letter_queue_api import get_dead_letter_statistics
+
+
+def add_entry(status='pending_review', failure_type='timeout', delivery_method='email', age=timedelta()):
+    created_at = timezone.now() - age
+    return DeadLetterQueue.objects.create(
+        original_task_id=uuid.uuid4(),
+        task_type='reminder',
+        appointment_id=uuid.uuid4(),
+        patient_id='patient-1',
+        delivery_method=delivery_method,
+        failure_type=failure_type,
+        final_error_message='Provider timed out',
+        original_scheduled_time=created_at,
+        final_failure_time=created_at,
+        status=status,
+        created_at=created_at,
+    )
+
+
+class DeadLetterStatisticsTestCase(TestCase):
+    """Test cases for aggregate-query dead letter queue statistics"""
+
+    def setUp(self):
+        cache.clear()
+        add_entry()
+        add_entry('pending_review', 'permanent_failure', 'sms', timedelta(hours=30))
+        add_entry('requires_manual_intervention', 'service_unavailable', 'push', timedelta(days=3))
+        add_entry('archived', 'timeout', 'email', timedelta(days=10))
+        add_entry('manually_resolved', 'invalid_recipient', 'fax', timedelta(days=40))
+
+    def test_statistics_in_two_queries(self):
+        # The aggregate, then the delivery_method group-by
+        with self.assertNumQueries(2):
+            stats = DeadLetterQueueManager.get_statistics()
+
+        objects = DeadLetterQueue.objects
+        self.assertEqual(stats['total_entries'], 5)
+        for status, _ in DeadLetterQueue.STATUSES:
+            self.assertEqual(stats['status_counts'][status], objects.filter(status=status).count())
+        for failure_type, _ in DeadLetterQueue.FAILURE_TYPES:
+            self.assertEqual(stats['failure_type_counts'][failure_type],
+                             objects.filter(failure_type=failure_type).count())
+        self.assertEqual(stats['delivery_method_counts'],
+                         {'email': 2, 'sms': 1, 'push': 1, 'fax': 1})
+        self.assertEqual(stats['recent_entries'], {'last_24h': 1, 'last_7d': 3, 'last_30d': 4})
+        self.assertEqual(stats['pending_review_count'], 2)
+        self.assertEqual(stats['retry_candidates_count'], DeadLetterQueueManager.get_retry_candidates().count())
+        self.assertEqual(sum(day['count'] for day in stats['daily_failures']), 3)
+        self.assertEqual(stats['daily_failures'][0]['date'], timezone.localdate().strftime('%Y-%m-%d'))
+
+    def test_query_count_does_not_grow_with_entries(self):
+        for i in range(50):
+            add_entry(failure_type=DeadLetterQueue.FAILURE_TYPES[i % 10][0], age=timedelta(days=i))
+        with self.assertNumQueries(2):
+            stats = DeadLetterQueueManager.get_statistics()
+        self.assertEqual(stats['total_entries'], 55)
+
+    def test_cached_snapshot(self):
+        DeadLetterQueueManager.get_statistics()
+        add_entry()
+        with self.assertNumQueries(0):
+            self.assertEqual(DeadLetterQueueManager.get_statistics(use_cache=True)['total_entries'], 5)
+        self.assertEqual(DeadLetterQueueManager.get_statistics()['total_entries'], 6)
+
+    def test_statistics_endpoint(self):
+        request = RequestFactory().get('/api/notifications/dead-letter-queue/statistics/')
+        request.authenticated_user = object()
+
+        # The aggregate, the delivery_method group-by, then the candidate rows
+        with self.assertNumQueries(3):
+            response = get_dead_letter_statistics(request)
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual(body['failure_type_breakdown'][0], {'failure_type': 'timeout', 'count': 2})
+        self.assertEqual(body['retry_candidates_count'], 2)
+        self.assertEqual(len(body['retry_candidates']), 2)
+        self.assertEqual(len(body['recent_failures']), 7)
+
+        with self.assertNumQueries(1):
+            get_dead_letter_statistics(request)
@@ -0,0 +1,115 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase
+
+from notifications.failsafe import (
+    DeliveryAttempt, DeliveryMethod, DeliveryStatus, FailsafeDeliveryManager, NotificationTask
+)
+
+
+def make_task(number, priority=5, created_at=None):
+    now = created_at or datetime.now()
+    return NotificationTask(
+        id=f'task-{number}',
+        appointment_id=f'appointment-{number}',
+        recipient_id='patient-1',
+        message='Your appointment is tomorrow',
+        primary_method=DeliveryMethod.EMAIL,
+        fallback_methods=[],
+        max_attempts=5,
+        retry_intervals=[1],
+        priority=priority,
+        created_at=now,
+        expires_at=now + timedelta(hours=1),
+        attempts=[],
+        current_status=DeliveryStatus.PENDING
+    )
+
+
+def fail_once(task, retry_delay):
+    task.retry_intervals = [retry_delay]
+    task.attempts = [DeliveryAttempt('attempt-1', task.id, DeliveryMethod.EMAIL, 'patient@example.com',
+                                     task.message, DeliveryStatus.FAILED, 1, datetime.now())]
+    return task
+
+
+class FailsafeQueueTestCase(SimpleTestCase):
+    """Test cases for heap-based task selection and timed retries"""
+
+    def setUp(self):
+        self.manager = FailsafeDeliveryManager()
+
+    def tearDown(self):
+        self.manager.stop()
+
+    def start_retry_thread(self):
+        self.manager.is_running = True
+        self.manager.retry_thread = threading.Thread(target=self.manager._retry_loop, daemon=True)
+        self.manager.retry_thread.start()
+
+    def test_tasks_dispatch_by_priority_then_age(self):
+        random.seed(7)
+        base = datetime.now()
+        tasks = [make_task(i, random.randint(1, 10), base + timedelta(microseconds=i)) for i in range(100000)]
+        for task in tasks:
+            self.manager._enqueue(task)
+        self.assertEqual(self.manager.get_statistics()['queue_status']['pending_tasks'], 100000)
+
+        started = time.perf_counter()
+        order = [self.manager._get_next_task() for _ in tasks]
+        elapsed = time.perf_counter() - started
+
+        expected = sorted(tasks, key=lambda t: (-t.priority, t.created_at))
+        self.assertEqual([t.id for t in order], [t.id for t in expected])
+        self.assertIsNone(self.manager._get_next_task())
+        self.assertEqual(self.manager.queued_tasks, {})
+        self.assertLess(elapsed, 5)
+
+    def test_retry_fires_on_time_behind_100k_later_retries(self):
+        far = datetime.now() + timedelta(hours=1)
+        for i in range(100000):
+            self.manager.retry_queue.append((far + timedelta(seconds=i), i, make_task(i)))
+        self.manager.retry_queue.sort()
+        self.start_retry_thread()
+
+        # Scheduled after the later entries, but due first
+        task = fail_once(make_task('urgent'), 1)
+        scheduled = time.monotonic()
+        self.manager._schedule_retry(task)
+        status = self.manager.get_task_status(task.id)
+        self.assertEqual(status['current_status'], 'retry')
+        self.assertIn('retry_time', status)
+
+        picked = self.manager._get_next_task(timeout=5)
+        waited = time.monotonic() - scheduled
+        self.assertIs(picked, task)
+        self.assertGreaterEqual(waited, 0.95)
+        self.assertLess(waited, 1.5)
+        self.assertEqual(len(self.manager.retry_queue), 100000)
+
+    def test_retries_fire_in_due_order(self):
+        self.start_retry_thread()
+        tasks = [fail_once(make_task(i), delay) for i, delay in enumerate([0.6, 0.2, 0.4])]
+        for task in tasks:
+            self.manager._schedule_retry(task)
+
+        order = [self.manager._get_next_task(timeout=2) for _ in tasks]
+        self.assertEqual([t.id for t in order], ['task-1', 'task-2', 'task-0'])
+
+    def test_idle_worker_wakes_when_task_is_queued(self):
+        task = make_task('new')
+        timer = threading.Timer(0.1, self.manager._enqueue, args=(task,))
+        started = time.monotonic()
+        timer.start()
+        self.assertIs(self.manager._get_next_task(timeout=5), task)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_stop_wakes_retry_thread(self):
+        self.start_retry_thread()
+        started = time.monotonic()
+        self.manager.stop()
+        self.assertFalse(self.manager.retry_thread.is_alive())
+        self.assertLess(time.monotonic() - started, 1)
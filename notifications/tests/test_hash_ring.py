@@ -0,0 +1,147 @@
+import random
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from notifications.distributed_architecture import (
+    ClusterNode, ConsistentHashRing, DistributedTaskManager, NodeRole, NodeStatus
+)
+from notifications.management.commands.benchmark_hash_ring import linear_get_node
+
+
+def build_ring(node_count, **kwargs):
+    ring = ConsistentHashRing(**kwargs)
+    for i in range(node_count):
+        ring.add_node(f'node-{i}')
+    return ring
+
+
+class ConsistentHashRingTestCase(SimpleTestCase):
+    """Test cases for consistent hashing and bounded-load assignment"""
+
+    def setUp(self):
+        self.keys = [f'notification:{i}' for i in range(5000)]
+
+    def test_lookup_matches_ring_order(self):
+        ring = build_ring(8, replicas=50)
+        for key in self.keys[:500] + ['', 'a' * 300]:
+            self.assertEqual(ring.get_node(key), linear_get_node(ring, key))
+        self.assertEqual(ring.sorted_keys, sorted(ring.ring))
+        self.assertIsNone(ConsistentHashRing().get_node('key'))
+
+    def test_membership_changes_move_minimal_keys(self):
+        ring = build_ring(10, replicas=100)
+        before = {key: ring.get_node(key) for key in self.keys}
+
+        ring.add_node('node-new')
+        after = {key: ring.get_node(key) for key in self.keys}
+        moved = [key for key in self.keys if before[key] != after[key]]
+        self.assertTrue(all(after[key] == 'node-new' for key in moved))
+        self.assertLess(len(moved), len(self.keys) * 0.15)
+
+        ring.remove_node('node-3')
+        final = {key: ring.get_node(key) for key in self.keys}
+        self.assertTrue(all(after[key] == 'node-3' for key in self.keys if final[key] != after[key]))
+        self.assertEqual(ring.sorted_keys, sorted(ring.ring))
+        self.assertEqual(len(ring.sorted_keys), 10 * 100)
+
+        # Removing and re-adding restores the original placement
+        ring.remove_node('node-new')
+        ring.add_node('node-3')
+        self.assertEqual({key: ring.get_node(key) for key in self.keys}, before)
+
+    def test_get_nodes_returns_distinct_nodes(self):
+        ring = build_ring(4, replicas=20)
+        nodes = ring.get_nodes('appointment:1', 3)
+        self.assertEqual(len(set(nodes)), 3)
+        self.assertEqual(nodes[0], ring.get_node('appointment:1'))
+        self.assertEqual(len(ring.get_nodes('appointment:1', 10)), 4)
+
+    def test_bounded_load_caps_every_node(self):
+        epsilon = 0.1
+        ring = build_ring(12, replicas=20, load_epsilon=epsilon)
+        unbounded = build_ring(12, replicas=20)
+        for key in self.keys:
+            ring.assign(key)
+            unbounded.assign(key)
+
+        average = len(self.keys) / 12
+        self.assertLessEqual(max(ring.load(node) for node in ring.nodes), (1 + epsilon) * average + 1)
+        self.assertGreater(max(unbounded.load(node) for node in unbounded.nodes), (1 + epsilon) * average)
+        self.assertEqual(sum(ring.load(node) for node in ring.nodes), len(self.keys))
+
+    def test_bounded_assignments_are_sticky(self):
+        ring = build_ring(6, replicas=40, load_epsilon=0.2)
+        for key in self.keys:
+            ring.assign(key)
+        before = dict(ring.assignments)
+
+        ring.add_node('node-new')
+        self.assertEqual(ring.assignments, before)
+        self.assertEqual(ring.assign(self.keys[0]), before[self.keys[0]])
+
+        ring.remove_node('node-2')
+        moved = [key for key in self.keys if ring.assignments[key] != before[key]]
+        self.assertEqual(sorted(moved), sorted(key for key in self.keys if before[key] == 'node-2'))
+        self.assertLessEqual(max(ring.load(node) for node in ring.nodes), 1.2 * len(self.keys) / 6 + 1)
+
+        random.seed(3)
+        for key in random.sample(self.keys, 1000):
+            ring.release(key)
+        self.assertEqual(ring.total_load, len(self.keys) - 1000)
+        self.assertEqual(sum(ring.load(node) for node in ring.nodes), ring.total_load)
+
+
+class StubClusterManager:
+    def __init__(self, node_count):
+        self.nodes = [
+            ClusterNode(f'node-{i}', 'localhost', 9000 + i, NodeRole.WORKER, NodeStatus.ACTIVE, load_factor=i / 10)
+            for i in range(node_count)
+        ]
+
+    def get_active_nodes(self):
+        return list(self.nodes)
+
+
+class TaskDispatchTestCase(SimpleTestCase):
+    """Test cases for placing distributed tasks on nodes"""
+
+    def setUp(self):
+        patcher = mock.patch('notifications.distributed_architecture.NotificationLogger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def dispatch(self, manager, routing_key=None):
+        task_id = manager.submit_task('send_reminder', {}, routing_key=routing_key)
+        with mock.patch.object(manager, '_execute_task_on_node', return_value={}):
+            manager._assign_and_execute_task(manager.tasks[task_id])
+        return manager.tasks[task_id].assigned_node
+
+    @override_settings(DISTRIBUTED_TASK_LOAD_EPSILON=None)
+    def test_least_loaded_node_by_default(self):
+        manager = DistributedTaskManager(StubClusterManager(4))
+
+        self.assertIsNone(manager.task_ring)
+        self.assertEqual({self.dispatch(manager, f'patient:{i}') for i in range(10)}, {'node-0'})
+
+    @override_settings(DISTRIBUTED_TASK_LOAD_EPSILON=0.25)
+    def test_bounded_load_dispatch_follows_routing_key(self):
+        cluster = StubClusterManager(4)
+        manager = DistributedTaskManager(cluster)
+
+        first = self.dispatch(manager, 'patient:42')
+        self.assertEqual(self.dispatch(manager, 'patient:42'), first)
+        self.assertGreater(len({self.dispatch(manager, f'patient:{i}') for i in range(50)}), 1)
+        self.assertEqual(manager.task_ring.total_load, 0)
+
+        cluster.nodes = [node for node in cluster.nodes if node.node_id != first]
+        self.assertNotEqual(self.dispatch(manager, 'patient:42'), first)
+        self.assertNotIn(first, manager.task_ring.nodes)
+
+    def test_tasks_sharing_a_key_each_count_toward_capacity(self):
+        ring = build_ring(4, replicas=20, load_epsilon=0.0)
+        nodes = [ring.assign(f'task-{i}', position_key='patient:42') for i in range(8)]
+
+        self.assertEqual(ring.total_load, 8)
+        self.assertLessEqual(max(ring.load(node) for node in ring.nodes), 2)
+        self.assertEqual(nodes[0], ring.get_node('patient:42'))
@@ -0,0 +1,157 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from notifications.log_analytics import (
+    api_performance, error_summary, percentiles, refresh_rollups, window_start
+)
+from notifications.logging_config import DjangoLogSink, LogAnalyzer, notification_logger
+from notifications.management.commands.benchmark_log_analytics import synthetic_logs
+from notifications.models import LogRollup, SystemLog
+
+
+def log_row(minutes_ago, level='INFO', category='api', component='api', message='ok', **metadata):
+    timestamp = timezone.localtime().replace(tzinfo=None) - timedelta(minutes=minutes_ago)
+    return {
+        'timestamp': timestamp.isoformat(),
+        'level': level,
+        'category': category,
+        'component': component,
+        'message': message,
+        'metadata': metadata or None,
+    }
+
+
+class LogAnalyticsTestCase(TestCase):
+    """Test cases for rollup-based log analytics"""
+
+    def setUp(self):
+        self.sink = DjangoLogSink()
+
+    def write(self, rows):
+        """Store a batch of logs and refresh the rollups, as the periodic task does"""
+        self.sink.write(rows)
+        refresh_rollups(window_start(48))
+
+    def test_error_summary(self):
+        """Errors are counted per component and category with the latest message"""
+        self.write([
+            log_row(30, 'ERROR', 'scheduler', 'scheduler', 'older failure'),
+            log_row(5, 'ERROR', 'scheduler', 'scheduler', 'newest failure'),
+            log_row(10, 'INFO', 'scheduler', 'scheduler', 'fine'),
+        ])
+        self.write([log_row(20, 'ERROR', 'queue', 'queue_manager', 'queue failure')])
+        self.write([log_row(60 * 30, 'ERROR', 'scheduler', 'scheduler', 'outside window')])
+
+        summary = LogAnalyzer(notification_logger).get_error_summary(hours=24)
+
+        self.assertEqual(summary['total_errors'], 3)
+        scheduler = summary['error_breakdown']['scheduler:scheduler']
+        self.assertEqual(scheduler['count'], 2)
+        self.assertEqual(scheduler['latest_error']['message'], 'newest failure')
+        self.assertEqual(summary['error_breakdown']['queue_manager:queue']['count'], 1)
+
+    def test_latest_message_across_batches(self):
+        """An older row written later does not replace the latest message"""
+        self.write([log_row(5, 'ERROR', message='newer')])
+        self.write([log_row(15, 'ERROR', message='older')])
+
+        summary = error_summary(24)
+        self.assertEqual(summary['error_breakdown']['api:api']['latest_error']['message'], 'newer')
+        self.assertEqual(summary['error_breakdown']['api:api']['count'], 2)
+
+    def test_api_performance(self):
+        """Status codes, averages and percentiles come from the rollups"""
+        rows = [log_row(1, status_code=200, response_time_ms=ms) for ms in range(1, 101)]
+        rows.append(log_row(1, 'WARNING', status_code=500, response_time_ms=3000))
+        rows.append(log_row(1, message='no metadata'))
+        self.write(rows)
+
+        metrics = api_performance(24)['api_metrics']
+
+        self.assertEqual(metrics['total_requests'], 102)
+        self.assertEqual(metrics['status_code_distribution'], {200: 100, 500: 1})
+        self.assertAlmostEqual(metrics['average_response_time_ms'], (5050 + 3000) / 101)
+        # The true median is 50.5 ms; bucket interpolation lands close to it
+        self.assertAlmostEqual(metrics['response_time_percentiles_ms']['p50'], 50.5, delta=5)
+        self.assertGreater(metrics['response_time_percentiles_ms']['p99'], 90)
+
+    def test_refresh_rebuilds_from_system_logs(self):
+        """Writing logs leaves the rollups alone; refreshing them twice counts each log once"""
+        rows = [log_row(5, 'ERROR', message='failure'), log_row(60 * 3, 'ERROR', message='earlier')]
+        self.sink.write(rows)
+        self.assertFalse(LogRollup.objects.exists())
+
+        self.assertEqual(refresh_rollups(window_start(1)), 1)
+        self.assertEqual(refresh_rollups(window_start(1)), 1)
+        self.assertEqual(error_summary(24)['total_errors'], 1)
+
+        refresh_rollups(window_start(24))
+        self.assertEqual(error_summary(24)['total_errors'], 2)
+
+    def test_refresh_groups_in_the_database(self):
+        """Refreshing reads one row per group and buckets status codes and response times"""
+        rows = [log_row(1, status_code=200, response_time_ms=40) for _ in range(300)]
+        rows += [
+            log_row(2, 'ERROR', category='', component='', message='blank names', status_code='503'),
+            log_row(3, status_code='teapot', response_time_ms='slow'),
+            log_row(4, status_code=201, response_time_ms=20000),
+            log_row(90, 'WARNING', response_time_ms=5, message='previous hour'),
+        ]
+        self.sink.write(rows)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(refresh_rollups(window_start(2)), 304)
+        self.assertEqual(sum(query['sql'].startswith('INSERT') for query in queries), 1)
+        self.assertEqual(sum(query['sql'].startswith('SELECT') for query in queries), 2)
+
+        fields = ('level', 'category', 'component', 'status_code', 'latency_bucket',
+                  'count', 'latency_sum_ms', 'last_message')
+        self.assertEqual(sorted(LogRollup.objects.values_list(*fields)), [
+            ('ERROR', 'system', 'unknown', 503, -1, 1, 0.0, 'blank names'),
+            ('INFO', 'api', 'api', 0, -1, 1, 0.0, 'ok'),
+            ('INFO', 'api', 'api', 200, 3, 300, 12000.0, 'ok'),
+            ('INFO', 'api', 'api', 201, 11, 1, 20000.0, 'ok'),
+            ('WARNING', 'api', 'api', 0, 0, 1, 5.0, 'previous hour'),
+        ])
+
+    def test_backfill_command_rebuilds_older_hours(self):
+        """backfill_log_rollups builds hours outside the periodic task's window"""
+        self.sink.write([log_row(60 * 30, 'ERROR', message='yesterday'), log_row(5, 'ERROR', message='now')])
+        refresh_rollups(window_start(2))
+        self.assertEqual(error_summary(48)['total_errors'], 1)
+
+        call_command('backfill_log_rollups', hours=48, chunk_hours=7, stdout=StringIO())
+        call_command('backfill_log_rollups', hours=48, stdout=StringIO())
+
+        self.assertEqual(error_summary(48)['total_errors'], 2)
+
+    def test_percentiles_from_histogram(self):
+        self.assertEqual(percentiles({}), {'p50': 0, 'p90': 0, 'p95': 0, 'p99': 0})
+        # All requests in the 10-25 ms bucket: the median is its midpoint
+        self.assertEqual(percentiles({2: 10}, points=(50,)), {'p50': 17.5})
+        # Beyond the last bound only the lower bound is known
+        self.assertEqual(percentiles({11: 1}, points=(99,)), {'p99': 10000})
+
+    def test_cost_independent_of_log_volume(self):
+        """Summaries read the same number of rollup rows however many logs were written"""
+        self.write([log_row(1, component='volume', status_code=200, response_time_ms=40)])
+        self.write([log_row(1, component='volume', status_code=200, response_time_ms=40)
+                         for _ in range(500)])
+        self.write(list(synthetic_logs(1000, hours=1)))
+
+        self.assertEqual(SystemLog.objects.count(), 1501)
+        self.assertLess(LogRollup.objects.count(), 1000)
+        self.assertEqual(LogRollup.objects.get(component='volume').count, 501)
+        with CaptureQueriesContext(connection) as queries:
+            api_performance(24)
+        self.assertEqual(len(queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            error_summary(24)
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('system_logs"', ' '.join(query['sql'] for query in queries))
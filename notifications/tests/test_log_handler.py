@@ -0,0 +1,108 @@
+import logging
+import os
+import tempfile
+import threading
+
+from django.test import TestCase
+
+from notifications.logging_config import DatabaseLogHandler, DjangoLogSink
+from notifications.models import SystemLog
+
+
+class RecordingSink:
+    """Log sink that records batches and can be told to fail"""
+    
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.written = threading.Event()
+    
+    def write(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        self.batches.append(list(rows))
+        self.written.set()
+    
+    @property
+    def messages(self):
+        return [row['message'] for batch in self.batches for row in batch]
+
+
+class DatabaseLogHandlerTestCase(TestCase):
+    """Test cases for the asynchronous database log handler"""
+    
+    def make_logger(self, handler):
+        logger = logging.getLogger(f'notifications.test_log_handler.{id(handler)}')
+        logger.handlers = [handler]
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        self.addCleanup(handler.close)
+        return logger
+    
+    def test_emit_only_queues(self):
+        """Logging never writes on the calling thread; flush writes in batches"""
+        sink = RecordingSink()
+        handler = DatabaseLogHandler(sink=sink, batch_size=2, autostart=False)
+        logger = self.make_logger(handler)
+        
+        for i in range(5):
+            logger.info(f"message {i}", extra={'category': 'api', 'component': 'test'})
+        self.assertEqual(sink.batches, [])
+        
+        handler.flush_batch()
+        self.assertEqual([len(batch) for batch in sink.batches], [2, 2, 1])
+        self.assertEqual(sink.batches[0][0]['category'], 'api')
+    
+    def test_full_queue_drops_oldest(self):
+        """A full queue keeps the newest records and counts the dropped ones"""
+        sink = RecordingSink()
+        handler = DatabaseLogHandler(sink=sink, max_queue_size=3, autostart=False)
+        logger = self.make_logger(handler)
+        
+        for i in range(5):
+            logger.info(f"message {i}")
+        handler.flush_batch()
+        
+        self.assertEqual(sink.messages, ['message 2', 'message 3', 'message 4'])
+        self.assertEqual(handler.stats['dropped'], 2)
+    
+    def test_failed_batch_retried_then_spilled_and_replayed(self):
+        """Failed writes back off and retry; batches that keep failing are spilled and replayed later"""
+        spill_path = os.path.join(tempfile.mkdtemp(), 'spill.ndjson')
+        sink = RecordingSink(failures=3)
+        handler = DatabaseLogHandler(sink=sink, spill_path=spill_path, max_retries=2,
+                                     retry_base_delay=0, autostart=False)
+        logger = self.make_logger(handler)
+        
+        logger.info("first")
+        handler.flush_batch()
+        self.assertEqual(handler.stats['retries'], 2)
+        self.assertEqual(handler.stats['spilled'], 1)
+        self.assertTrue(os.path.exists(spill_path))
+        
+        logger.info("second")
+        handler.flush_batch()
+        self.assertEqual(sink.messages, ['second', 'first'])
+        self.assertFalse(os.path.exists(spill_path))
+    
+    def test_background_thread_flushes_on_interval(self):
+        """The writer thread flushes a partial batch once the interval passes"""
+        sink = RecordingSink()
+        handler = DatabaseLogHandler(sink=sink, batch_size=100, flush_interval=0.05)
+        logger = self.make_logger(handler)
+        
+        logger.info("background")
+        self.assertTrue(sink.written.wait(5))
+        self.assertEqual(sink.messages, ['background'])
+    
+    def test_django_sink_bulk_creates(self):
+        """The ORM sink writes rows to SystemLog"""
+        handler = DatabaseLogHandler(sink=DjangoLogSink(), autostart=False)
+        logger = self.make_logger(handler)
+        
+        logger.error("stored", extra={'component': 'scheduler', 'metadata': {'status_code': 500}})
+        handler.flush_batch()
+        
+        log = SystemLog.objects.get()
+        self.assertEqual((log.level, log.component, log.metadata), ('ERROR', 'scheduler', {'status_code': 500}))
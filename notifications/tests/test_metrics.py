@@ -0,0 +1,319 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from notifications import metrics_exposition
+from notifications.management.commands.benchmark_metrics_exposition import write_workers
+from notifications.metric_sketches import QuantileSketch, WindowedSketch
+from notifications.metrics_exposition import MetricsFileWriter, collect, render_metrics
+from notifications.monitoring import MetricsCollector
+
+
+SAMPLE_SUFFIXES = {'counter': ('',), 'gauge': ('',), 'histogram': ('_bucket', '_sum', '_count')}
+
+
+def parse_exposition(text):
+    """
+    Families of Prometheus text output, checking that every sample belongs to
+    the family declared by the preceding TYPE line
+    """
+    families = {}
+    family = None
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            name, kind = line[len('# TYPE '):].split()
+            families[name] = {'type': kind, 'samples': {}}
+            family = name
+            continue
+        series, value = line.rsplit(' ', 1)
+        name = series.split('{', 1)[0]
+        suffixes = SAMPLE_SUFFIXES[families[family]['type']]
+        if not any(name == family + suffix for suffix in suffixes):
+            raise ValueError(f"Sample {name} does not belong to family {family}")
+        families[family]['samples'][series] = float(value)
+    return families
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+class QuantileSketchTestCase(SimpleTestCase):
+    """Test cases for the mergeable quantile sketch"""
+
+    def test_quantiles_within_relative_accuracy(self):
+        """p50 to p999 of a long-tailed distribution are within 1%"""
+        rng = random.Random(7)
+        values = [rng.lognormvariate(3, 1.5) for _ in range(50000)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        for q in (0.5, 0.95, 0.99, 0.999):
+            expected = exact_quantile(values, q)
+            self.assertAlmostEqual(sketch.quantile(q), expected, delta=expected * 0.0101)
+        self.assertEqual(sketch.count, 50000)
+        self.assertEqual(sketch.max, max(values))
+        self.assertLess(len(sketch.positive), 2048)
+
+    def test_merge_equals_single_sketch(self):
+        """Sketches merged (via their serialized form) match one sketch of all values"""
+        rng = random.Random(11)
+        values = [rng.expovariate(0.01) for _ in range(9000)] + [0.0, -5.0]
+        whole = QuantileSketch()
+        parts = [QuantileSketch() for _ in range(3)]
+        for i, value in enumerate(values):
+            whole.add(value)
+            parts[i % 3].add(value)
+
+        merged = QuantileSketch()
+        for part in parts:
+            merged.merge(QuantileSketch.from_dict(json.loads(json.dumps(part.to_dict()))))
+
+        self.assertEqual(merged.count, whole.count)
+        self.assertEqual(merged.min, -5.0)
+        for q in (0, 0.001, 0.5, 0.99, 0.999, 1):
+            self.assertEqual(merged.quantile(q), whole.quantile(q))
+
+    def test_memory_is_bounded(self):
+        """Collapsing the lowest buckets keeps the upper quantiles accurate"""
+        values = [10.0 ** (exponent / 3) for exponent in range(-300, 300)]
+        sketch = QuantileSketch(max_buckets=64)
+        for value in values:
+            sketch.add(value)
+        self.assertLessEqual(len(sketch.positive), 64)
+        self.assertEqual(sketch.count, 600)
+        expected = exact_quantile(values, 0.99)
+        self.assertAlmostEqual(sketch.quantile(0.99), expected, delta=expected * 0.0101)
+
+
+class WindowedSketchTestCase(SimpleTestCase):
+    """Test cases for time-windowed sketches"""
+
+    def test_window_covers_every_value_then_expires(self):
+        clock = FakeClock()
+        sketch = WindowedSketch(window_seconds=60, slots=6, clock=clock)
+        for i in range(1000):
+            sketch.add(i)
+            clock.now += 0.05  # 50 seconds in total
+        self.assertEqual(sketch.window().count, 1000)
+
+        clock.now += 30
+        self.assertLess(sketch.window().count, 1000)
+        clock.now += 60
+        sketch.add(1)
+        self.assertEqual(sketch.window().count, 1)
+        self.assertEqual(len(sketch.sketches), 1)
+
+
+class MetricsCollectorTestCase(SimpleTestCase):
+    """Test cases for the lock-striped metrics collector"""
+
+    def test_concurrent_counters_and_timers(self):
+        """No increments or samples are lost across threads"""
+        collector = MetricsCollector(stripes=4)
+
+        def work():
+            for i in range(2000):
+                collector.increment_counter('requests')
+                collector.record_timer('latency_ms', i % 100 + 1)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(collector.get_metric_summary('requests'), {'total': 16000})
+        summary = collector.get_metric_summary('latency_ms')
+        self.assertEqual(summary['count'], 16000)
+        self.assertAlmostEqual(summary['p50'], 50, delta=1)
+        self.assertAlmostEqual(summary['p99'], 99, delta=1)
+        self.assertIn('p999', summary)
+        self.assertEqual(summary['max'], 100)
+
+    def test_snapshots_merge_across_processes(self):
+        worker_a, worker_b = MetricsCollector(), MetricsCollector()
+        for value in range(1, 501):
+            worker_a.record_histogram('batch_size', value)
+            worker_b.record_histogram('batch_size', value + 500)
+        worker_a.increment_counter('sent', 3)
+        worker_b.increment_counter('sent', 4)
+
+        combined = MetricsCollector()
+        for worker in (worker_a, worker_b):
+            combined.merge_snapshot(json.loads(json.dumps(worker.snapshot())))
+
+        metrics = combined.get_all_metrics()
+        self.assertEqual(metrics['counters'], {'sent': 7})
+        self.assertEqual(metrics['histograms']['batch_size']['count'], 1000)
+        self.assertAlmostEqual(metrics['histograms']['batch_size']['p50'], 500, delta=5)
+
+    def test_gauges(self):
+        collector = MetricsCollector()
+        collector.record_gauge('cache.hit_rate', 0.9)
+        self.assertEqual(collector.get_metric_summary('cache.hit_rate'), {'current': 0.9})
+        self.assertEqual(collector.get_metric_summary('unknown'), {})
+
+    def test_latest_gauge_write_wins_across_threads(self):
+        """Gauges set from different threads (and stripes) read back as the last value set"""
+        collector = MetricsCollector(stripes=4)
+        for value in range(8):
+            thread = threading.Thread(target=collector.set_gauge, args=('queue.size', value))
+            thread.start()
+            thread.join()
+        self.assertEqual(collector.gauges, {'queue.size': 7})
+
+    def test_tags_are_separate_series(self):
+        collector = MetricsCollector()
+        collector.increment_counter('sync.calls', 2, {'provider': 'google'})
+        collector.increment_counter('sync.calls', 3, {'provider': 'outlook'})
+        collector.record_histogram('sync.lag', 4, {'provider': 'google'})
+
+        self.assertEqual(collector.counters, {'sync.calls{provider="google"}': 2,
+                                              'sync.calls{provider="outlook"}': 3})
+        self.assertEqual(collector.get_metric_summary('sync.lag{provider="google"}')['count'], 1)
+
+
+class MetricsExpositionTestCase(SimpleTestCase):
+    """Test cases for the multiprocess Prometheus exposition"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def write_worker(self, pid, collector):
+        writer = MetricsFileWriter(collector, self.directory)
+        writer.pid = pid
+        writer.path = os.path.join(self.directory, f'metrics_{pid}.json')
+        writer.write()
+        return writer.path
+
+    def test_aggregates_workers(self):
+        """Counters and histograms add up across workers; gauges are per process"""
+        for pid, latency in ((101, 3), (102, 300)):
+            collector = MetricsCollector()
+            collector.increment_counter('notifications.email.success', 2)
+            collector.record_timer('notifications.email.response_time', latency)
+            collector.set_gauge('cache.hit_rate', pid / 1000)
+            self.write_worker(pid, collector)
+
+        text = render_metrics(MetricsCollector(), self.directory)
+
+        self.assertIn('# TYPE mediremind_notifications_email_success_total counter\n'
+                      'mediremind_notifications_email_success_total 4\n', text)
+        self.assertIn('mediremind_cache_hit_rate{pid="101"} 0.101\n', text)
+        self.assertIn('mediremind_cache_hit_rate{pid="102"} 0.102\n', text)
+        self.assertIn('mediremind_notifications_email_response_time_bucket{le="5"} 1\n', text)
+        self.assertIn('mediremind_notifications_email_response_time_bucket{le="250"} 1\n', text)
+        self.assertIn('mediremind_notifications_email_response_time_bucket{le="500"} 2\n', text)
+        self.assertIn('mediremind_notifications_email_response_time_bucket{le="+Inf"} 2\n', text)
+        self.assertIn('mediremind_notifications_email_response_time_sum 303\n', text)
+        self.assertIn('mediremind_notifications_email_response_time_count 2\n', text)
+
+    def test_output_parses_as_declared_families(self):
+        """Every sample is named after the family its TYPE line declares"""
+        collector = MetricsCollector()
+        collector.increment_counter('notifications.sms.failure', 3)
+        collector.set_gauge('queue.size', 7)
+        collector.record_timer('notifications.sms.response_time', 12)
+        self.write_worker(301, collector)
+
+        families = parse_exposition(render_metrics(MetricsCollector(), self.directory))
+
+        self.assertEqual(families['mediremind_notifications_sms_failure_total'],
+                         {'type': 'counter', 'samples': {'mediremind_notifications_sms_failure_total': 3}})
+        self.assertEqual(families['mediremind_queue_size']['samples'], {'mediremind_queue_size{pid="301"}': 7})
+        histogram = families['mediremind_notifications_sms_response_time']
+        self.assertEqual(histogram['type'], 'histogram')
+        self.assertEqual(histogram['samples']['mediremind_notifications_sms_response_time_count'], 1)
+
+    def test_tags_render_as_labels(self):
+        """Tagged series of one metric share a family and carry their tags as labels"""
+        collector = MetricsCollector()
+        collector.increment_counter('calendar.sync.api_calls', 2, {'provider': 'google'})
+        collector.increment_counter('calendar.sync.api_calls', 1, {'provider': 'outlook'})
+        collector.increment_counter('calendar.sync.api_calls')
+        collector.set_gauge('calendar.sync.due', 3, {'provider': 'google'})
+        collector.record_histogram('calendar.sync.lag_seconds', 30, {'provider': 'say "hi"'})
+        self.write_worker(401, collector)
+
+        text = render_metrics(MetricsCollector(), self.directory)
+        families = parse_exposition(text)
+
+        self.assertEqual(text.count('# TYPE mediremind_calendar_sync_api_calls_total counter'), 1)
+        self.assertEqual(families['mediremind_calendar_sync_api_calls_total']['samples'], {
+            'mediremind_calendar_sync_api_calls_total': 1,
+            'mediremind_calendar_sync_api_calls_total{provider="google"}': 2,
+            'mediremind_calendar_sync_api_calls_total{provider="outlook"}': 1,
+        })
+        self.assertEqual(families['mediremind_calendar_sync_due']['samples'],
+                         {'mediremind_calendar_sync_due{provider="google",pid="401"}': 3})
+        self.assertIn('mediremind_calendar_sync_lag_seconds_bucket{provider="say \\"hi\\"",le="50"} 1\n', text)
+        self.assertIn('mediremind_calendar_sync_lag_seconds_count{provider="say \\"hi\\""} 1\n', text)
+
+    def test_exited_workers_are_archived(self):
+        """A stale worker file is folded into the archive; its gauges are dropped"""
+        collector = MetricsCollector()
+        collector.increment_counter('tasks.processed', 5)
+        collector.set_gauge('queue.size', 7)
+        path = self.write_worker(201, collector)
+        old = time.time() - metrics_exposition.STALE_SECONDS - 1
+        os.utime(path, (old, old))
+
+        totals, gauges = collect(self.directory)
+        self.assertEqual(totals['counters'], {'tasks.processed': 5})
+        self.assertEqual(gauges, {})
+        self.assertFalse(os.path.exists(path))
+
+        live = MetricsCollector()
+        live.increment_counter('tasks.processed', 1)
+        self.write_worker(202, live)
+        totals, _ = collect(self.directory)
+        self.assertEqual(totals['counters'], {'tasks.processed': 6})
+
+    def test_render_reuses_parsed_files_for_thousands_of_series(self):
+        """Unchanged worker files are parsed once; a rewritten file is the only one read again"""
+        write_workers(self.directory, workers=4, counters=1000, timers=100)
+
+        with patch('notifications.metrics_exposition.json.load', wraps=json.load) as load:
+            first = render_metrics(MetricsCollector(), self.directory)
+            self.assertEqual(load.call_count, 4)
+            second = render_metrics(MetricsCollector(), self.directory)
+            self.assertEqual(load.call_count, 4)
+
+            collector = MetricsCollector()
+            collector.increment_counter('counter.0')
+            self.write_worker(1000, collector)
+            render_metrics(MetricsCollector(), self.directory)
+            self.assertEqual(load.call_count, 5)
+
+        self.assertEqual(first, second)
+        families = parse_exposition(first)
+        counters = [name for name, family in families.items() if family['type'] == 'counter']
+        self.assertEqual(len(counters), 1000)
+        self.assertEqual({families[name]['samples'][name] for name in counters}, {4})
+
+    @patch.dict(os.environ, {'METRICS_SCRAPE_TOKEN': 'scrape-secret'})
+    def test_endpoint_requires_scrape_token(self):
+        response = self.client.get('/api/notifications/metrics/prometheus/', secure=True)
+        self.assertEqual(response.status_code, 401)
+
+        response = self.client.get('/api/notifications/metrics/prometheus/', secure=True,
+                                   HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
@@ -0,0 +1,267 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+from django.test import SimpleTestCase
+
+from notifications.backup_recovery import (
+    S3_MIN_PART_SIZE, BackupConfig, BackupManager, BackupStatus, BackupType, RecoveryManager,
+    S3StorageBackend, StorageProvider
+)
+
+MiB = 1024 * 1024
+
+
+class FakeS3Client:
+    """
+    In-memory stand-in for the boto3 S3 client. Every request costs
+    ``latency`` seconds plus its size over ``bandwidth`` (bytes per second per
+    connection), so parallel requests show up as higher throughput.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, page_size=1000):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.page_size = page_size
+        self.objects = {}  # key -> (data, etag)
+        self.modified = {}  # key -> LastModified
+        self.uploads = {}  # upload id -> {part number: (data, etag)}
+        self.fail_parts = set()
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _request(self, operation, size=0):
+        with self._lock:
+            self.calls[operation] += 1
+        time.sleep(self.latency + (size / self.bandwidth if self.bandwidth else 0))
+
+    @staticmethod
+    def _error(code, operation):
+        return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+    @staticmethod
+    def _check_md5(body, content_md5):
+        if content_md5 and base64.b64encode(hashlib.md5(body).digest()).decode() != content_md5:
+            raise FakeS3Client._error('BadDigest', 'PutObject')
+
+    def put_object(self, Bucket, Key, Body, ContentMD5=None):
+        self._check_md5(Body, ContentMD5)
+        self._request('put_object', len(Body))
+        self.objects[Key] = (bytes(Body), f'"{hashlib.md5(Body).hexdigest()}"')
+        self.modified[Key] = datetime.now(timezone.utc)
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._request('create_multipart_upload')
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentMD5=None):
+        self._request('upload_part', len(Body))
+        with self._lock:
+            if PartNumber in self.fail_parts:
+                self.fail_parts.discard(PartNumber)
+                raise self._error('InternalError', 'UploadPart')
+        if UploadId not in self.uploads:
+            raise self._error('NoSuchUpload', 'UploadPart')
+        self._check_md5(Body, ContentMD5)
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        self.uploads[UploadId][PartNumber] = (bytes(Body), etag)
+        return {'ETag': etag}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        self._request('list_parts')
+        if UploadId not in self.uploads:
+            raise self._error('NoSuchUpload', 'ListParts')
+        parts = self.uploads[UploadId]
+        numbers = sorted(number for number in parts if number > PartNumberMarker)
+        page = numbers[:self.page_size]
+        response = {
+            'Parts': [{'PartNumber': n, 'Size': len(parts[n][0]), 'ETag': parts[n][1]} for n in page],
+            'IsTruncated': len(numbers) > len(page),
+        }
+        if response['IsTruncated']:
+            response['NextPartNumberMarker'] = page[-1]
+        return response
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._request('complete_multipart_upload')
+        parts = self.uploads.pop(UploadId)
+        listed = MultipartUpload['Parts']
+        if [p['PartNumber'] for p in listed] != list(range(1, len(parts) + 1)):
+            raise self._error('InvalidPart', 'CompleteMultipartUpload')
+        if any(parts[p['PartNumber']][1] != p['ETag'] for p in listed):
+            raise self._error('InvalidPart', 'CompleteMultipartUpload')
+        data = b''.join(parts[p['PartNumber']][0] for p in listed)
+        digests = b''.join(hashlib.md5(parts[p['PartNumber']][0]).digest() for p in listed)
+        self.objects[Key] = (data, f'"{hashlib.md5(digests).hexdigest()}-{len(listed)}"')
+        self.modified[Key] = datetime.now(timezone.utc)
+
+    def head_object(self, Bucket, Key):
+        self._request('head_object')
+        if Key not in self.objects:
+            raise self._error('404', 'HeadObject')
+        data, etag = self.objects[Key]
+        return {'ContentLength': len(data), 'ETag': etag}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        if Key not in self.objects:
+            raise self._error('NoSuchKey', 'GetObject')
+        data, etag = self.objects[Key]
+        if IfMatch and IfMatch != etag:
+            raise self._error('PreconditionFailed', 'GetObject')
+        if Range:
+            start, end = (int(bound) for bound in Range[len('bytes='):].split('-'))
+            data = data[start:end + 1]
+        self._request('get_object', len(data))
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data), 'ETag': etag}
+
+    def delete_object(self, Bucket, Key):
+        self._request('delete_object')
+        self.objects.pop(Key, None)
+        self.modified.pop(Key, None)
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None):
+        self._request('list_objects_v2')
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + self.page_size]
+        response = {'Contents': [{'Key': key, 'LastModified': self.modified[key]} for key in page],
+                    'IsTruncated': start + len(page) < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + len(page))
+        return response
+
+
+class S3StorageBackendTestCase(SimpleTestCase):
+    """Test cases for multipart uploads and ranged downloads against a fake S3"""
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.state_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.work, 'backup.bin')
+        with open(self.source, 'wb') as f:
+            f.write(os.urandom(6 * S3_MIN_PART_SIZE + 12345))
+
+    def backend(self, client, max_concurrency=8):
+        return S3StorageBackend('backups', 'key', 'secret', part_size=S3_MIN_PART_SIZE,
+                                max_concurrency=max_concurrency, state_dir=self.state_dir, s3_client=client)
+
+    def assert_same_file(self, first, second):
+        with open(first, 'rb') as a, open(second, 'rb') as b:
+            self.assertTrue(a.read() == b.read(), 'files differ')
+
+    def transfer(self, max_concurrency):
+        """Upload and download the source; returns (upload, download) throughput in MiB/s"""
+        client = FakeS3Client(latency=0.002, bandwidth=20 * MiB)
+        backend = self.backend(client, max_concurrency)
+        size = os.path.getsize(self.source) / MiB
+        target = os.path.join(self.work, f'restored_{max_concurrency}.bin')
+
+        started = time.perf_counter()
+        self.assertTrue(asyncio.run(backend.upload_file(self.source, 'backups/full.bin')))
+        upload_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        self.assertTrue(asyncio.run(backend.download_file('backups/full.bin', target)))
+        download_seconds = time.perf_counter() - started
+
+        self.assert_same_file(self.source, target)
+        self.assertEqual(client.calls['upload_part'], 7)
+        self.assertEqual(client.calls['get_object'], 7)
+        return size / upload_seconds, size / download_seconds
+
+    def test_parallel_transfers_are_faster(self):
+        serial_upload, serial_download = self.transfer(max_concurrency=1)
+        parallel_upload, parallel_download = self.transfer(max_concurrency=8)
+
+        self.assertGreater(parallel_upload, serial_upload * 2)
+        self.assertGreater(parallel_download, serial_download * 2)
+
+    def test_failed_upload_resumes_missing_parts(self):
+        client = FakeS3Client()
+        client.fail_parts = {3}
+        backend = self.backend(client)
+
+        self.assertFalse(asyncio.run(backend.upload_file(self.source, 'backups/full.bin')))
+        self.assertNotIn('backups/full.bin', client.objects)
+        self.assertEqual(len(os.listdir(self.state_dir)), 1)
+
+        client.calls.clear()
+        self.assertTrue(asyncio.run(backend.upload_file(self.source, 'backups/full.bin')))
+        self.assertEqual(client.calls['upload_part'], 1)
+        self.assertEqual(client.calls['create_multipart_upload'], 0)
+        self.assertEqual(os.listdir(self.state_dir), [])
+
+        target = os.path.join(self.work, 'restored.bin')
+        self.assertTrue(asyncio.run(backend.download_file('backups/full.bin', target)))
+        self.assert_same_file(self.source, target)
+
+    def test_expired_upload_starts_over(self):
+        client = FakeS3Client()
+        client.fail_parts = {2}
+        backend = self.backend(client)
+        self.assertFalse(asyncio.run(backend.upload_file(self.source, 'backups/full.bin')))
+        client.uploads.clear()  # Aborted by a bucket lifecycle rule
+
+        self.assertTrue(asyncio.run(backend.upload_file(self.source, 'backups/full.bin')))
+        self.assertEqual(client.calls['create_multipart_upload'], 2)
+
+    def test_replaced_object_fails_download(self):
+        client = FakeS3Client()
+        backend = self.backend(client)
+        self.assertTrue(asyncio.run(backend.upload_file(self.source, 'backups/full.bin')))
+        original_get = client.get_object
+
+        def replace_then_get(**kwargs):
+            client.objects['backups/full.bin'] = (b'new', '"other"')
+            return original_get(**kwargs)
+
+        client.get_object = replace_then_get
+        target = os.path.join(self.work, 'restored.bin')
+        self.assertFalse(asyncio.run(backend.download_file('backups/full.bin', target)))
+        self.assertEqual(os.listdir(self.work), ['backup.bin'])
+
+    def test_small_files_and_listing(self):
+        client = FakeS3Client(page_size=2)
+        backend = self.backend(client)
+        small = os.path.join(self.work, 'small.json')
+        with open(small, 'w') as f:
+            f.write('{}')
+        for i in range(5):
+            self.assertTrue(asyncio.run(backend.upload_file(small, f'snapshots/chunks/{i}')))
+
+        self.assertEqual(client.calls['put_object'], 5)
+        self.assertEqual(len(asyncio.run(backend.list_files('snapshots/chunks'))), 5)
+        self.assertTrue(asyncio.run(backend.file_exists('snapshots/chunks/0')))
+        self.assertTrue(asyncio.run(backend.delete_file('snapshots/chunks/0')))
+        self.assertFalse(asyncio.run(backend.file_exists('snapshots/chunks/0')))
+
+    def test_incremental_backups_on_s3(self):
+        manager = BackupManager(BackupConfig(
+            backup_type=BackupType.INCREMENTAL,
+            storage_provider=StorageProvider.LOCAL,
+            destination_path=self.work,
+            encryption_key='backup-secret',
+        ))
+        manager.storage_backend = self.backend(FakeS3Client(page_size=10))
+        data_dir = os.path.join(self.work, 'data')
+        os.makedirs(data_dir)
+        os.rename(self.source, os.path.join(data_dir, 'backup.bin'))
+
+        backup_id = asyncio.run(manager.create_backup(data_dir, 'backup_s3'))
+        self.assertEqual(manager.backup_records[backup_id].status, BackupStatus.VERIFIED,
+                         manager.backup_records[backup_id].error_message)
+        recovery = RecoveryManager(manager)
+        target = os.path.join(self.work, 'restored')
+        recovery_id = asyncio.run(recovery.restore_backup(backup_id, target))
+        self.assertEqual(recovery.recovery_records[recovery_id].status, BackupStatus.COMPLETED)
+        self.assert_same_file(os.path.join(data_dir, 'backup.bin'), os.path.join(target, 'backup.bin'))
@@ -48,6 +48,7 @@ urlpatterns = [
     # Monitoring endpoints
     path('metrics/', views.get_notification_metrics, name='get_notification_metrics'),
     path('health/', views.get_system_health, name='get_system_health'),
+    path('metrics/prometheus/', views.prometheus_metrics, name='prometheus_metrics'),
     path('realtime/', views.get_realtime_stats, name='get_realtime_stats'),
     
     # Dead Letter Queue endpoints
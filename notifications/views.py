@@ -1,7 +1,9 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+import hmac
 import json
+import os
 from supabase_client import admin_client
 from authentication.utils import get_authenticated_user, get_user_profile
 from authentication.middleware import api_csrf_exempt, get_request_user
@@ -226,6 +228,26 @@ def get_notification_metrics(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@csrf_exempt
+def prometheus_metrics(request):
+    """Prometheus text exposition of the metrics of every worker process"""
+    if request.method != "GET":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    # Scrapers authenticate with METRICS_SCRAPE_TOKEN; without one, a logged-in user is required
+    scrape_token = os.getenv('METRICS_SCRAPE_TOKEN')
+    if scrape_token:
+        supplied = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), scrape_token.encode()):
+            return JsonResponse({"error": "Authentication required"}, status=401)
+    elif not get_request_user(request):
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    from .metrics_exposition import CONTENT_TYPE, render_metrics
+    from .monitoring import metrics_collector
+    return HttpResponse(render_metrics(metrics_collector), content_type=CONTENT_TYPE)
+
+
 @api_csrf_exempt
 def get_system_health(request):
     """Get system health status for all notification services"""